@@ -0,0 +1 @@
+"""内容寻址的产物存储：章节 JSONL 与 analysis/* 按内容哈希去重、压缩存进打包文件，SQLite 索引按书名/章序查找。"""
@@ -0,0 +1,478 @@
+from __future__ import annotations
+
+"""
+内容寻址的产物存储：第一阶段章节 JSONL 与第二阶段 analysis/* 不再每个产物一个小文件，而是压缩后追加进打包文件。
+
+- 布局（默认 <书库>/.artifacts/）：index.sqlite + packs/pack-000001.pack、pack-000002.pack ...
+- 键：(书名, 相对路径)，相对路径与目录布局一致，例如 1_妖魔乱世.jsonl、analysis/1_妖魔乱世.json；
+  键 -> sha256 -> (打包文件, 偏移, 长度) 都是 SQLite 主键查找；另有 (书名, 章序, 类别) 索引按章查找
+- 内容相同的产物（不同书之间、重复写入）只存一份
+- 打包文件只追加（O_APPEND），多个进程同时写入也不会互相覆盖；单个打包文件超过 PACK_SIZE 后换下一个
+- 每条记录 zlib 压缩（压不小时原样保存），记录头带 sha256 与长度，读取时校验
+- 覆盖或删除后不再被引用的内容留在打包文件里，compact 时清理
+
+export 把存储还原成 book/<书名>/ 目录布局；ingest 反向把已有目录导入存储。
+
+Command:
+  python -m artifacts.store ingest book                          # 导入书库下各书的章节 JSONL 与 analysis/*
+  python -m artifacts.store export book --out /tmp/book           # 还原目录布局（--book 只导出指定的书）
+  python -m artifacts.store ls book --book 书名
+  python -m artifacts.store stats book
+  python -m artifacts.store compact book                         # 重写打包文件，去掉不再被引用的内容
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import struct
+import threading
+import time
+import zlib
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Tuple, Union
+
+STORE_DIRNAME = ".artifacts"
+PACK_SIZE = 256 << 20
+COMPRESS_LEVEL = 3  # 章节 JSONL 上 6 级比 3 级慢约 3 倍，只小约 8%
+
+_MAGIC = b"TGA1"
+# magic, sha256, 原始长度, 存储长度, 编码（0 原样，1 zlib）
+_HEADER = struct.Struct("<4s32sIIB")
+_RAW, _ZLIB = 0, 1
+_PACK_RE = re.compile(r"^pack-(\d{6})\.pack$")
+_CHAPTER_NO_RE = re.compile(r"^(\d+)(?:[_.]|$)")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS blobs (
+    hash TEXT PRIMARY KEY,
+    pack INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    stored INTEGER NOT NULL,
+    size INTEGER NOT NULL,
+    codec INTEGER NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS artifacts (
+    book TEXT NOT NULL,
+    path TEXT NOT NULL,
+    chapter INTEGER,
+    kind TEXT NOT NULL,
+    hash TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (book, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS artifacts_chapter ON artifacts(book, chapter, kind);
+CREATE INDEX IF NOT EXISTS artifacts_hash ON artifacts(hash);
+"""
+
+
+def artifact_kind(path: str) -> Tuple[str, Optional[int]]:
+    """
+    相对路径 -> (类别, 章序)。类别：chapter（<章序>_<章节名>.jsonl）、analysis（analysis/<章序>_*.json）、
+    raw（*.raw.txt）、attempts（*.attempts.jsonl）、report（analysis/ 下其他文件）、other。
+    """
+    name = path.rsplit("/", 1)[-1]
+    m = _CHAPTER_NO_RE.match(name)
+    no = int(m.group(1)) if m else None
+    if "/" not in path:
+        return ("chapter" if name.endswith(".jsonl") and no is not None else "other"), no
+    if not path.startswith("analysis/"):
+        return "other", no
+    if name.endswith(".raw.txt"):
+        return "raw", no
+    if name.endswith(".attempts.jsonl"):
+        return "attempts", no
+    if name.endswith(".json") and no is not None:
+        return "analysis", no
+    return "report", None
+
+
+@dataclass(frozen=True)
+class ArtifactEntry:
+    book: str
+    path: str  # 相对 book/<书名>/ 的路径，分隔符统一为 /
+    chapter: Optional[int]
+    kind: str
+    hash: str
+    size: int
+
+    @property
+    def name(self) -> str:
+        return self.path.rsplit("/", 1)[-1]
+
+    @property
+    def stem(self) -> str:
+        """<章序>_<章节名>（去掉 .jsonl/.json/.raw.txt/.attempts.jsonl）。"""
+        name = self.name
+        for suffix in (".attempts.jsonl", ".raw.txt", ".jsonl", ".json"):
+            if name.endswith(suffix):
+                return name[: -len(suffix)]
+        return name
+
+
+class ArtifactStore:
+    """打包文件 + SQLite 索引；同一个对象可以在多个线程里共用（内部加锁）。"""
+
+    def __init__(self, root: Path, *, pack_size: int = PACK_SIZE) -> None:
+        self.root = root
+        self.pack_size = pack_size
+        self.pack_dir = root / "packs"
+        self.pack_dir.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(root / "index.sqlite"), check_same_thread=False, timeout=30)
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+        self._lock = threading.RLock()
+        self._readers: Dict[int, BinaryIO] = {}
+        self._write_fd: Optional[int] = None
+        self._write_pack = max(self._pack_numbers(), default=1)
+
+    @classmethod
+    def for_library(cls, library_dir: Path, path: Optional[Path] = None) -> "ArtifactStore":
+        return cls(path or (library_dir / STORE_DIRNAME))
+
+    def close(self) -> None:
+        with self._lock:
+            self._close_files()
+            self.conn.close()
+
+    def __enter__(self) -> "ArtifactStore":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def _close_files(self) -> None:
+        for f in self._readers.values():
+            f.close()
+        self._readers.clear()
+        if self._write_fd is not None:
+            os.close(self._write_fd)
+            self._write_fd = None
+
+    # -- 打包文件 --
+
+    def _pack_path(self, pack: int) -> Path:
+        return self.pack_dir / f"pack-{pack:06d}.pack"
+
+    def _pack_numbers(self) -> List[int]:
+        numbers = []
+        for p in self.pack_dir.iterdir():
+            m = _PACK_RE.match(p.name)
+            if m:
+                numbers.append(int(m.group(1)))
+        return sorted(numbers)
+
+    def _append(self, digest: bytes, data: bytes) -> Tuple[int, int, int, int]:
+        """追加一条记录，返回 (打包文件号, 内容偏移, 存储长度, 编码)。调用方持有锁。"""
+        payload = zlib.compress(data, COMPRESS_LEVEL)
+        codec = _ZLIB
+        if len(payload) >= len(data):
+            payload, codec = data, _RAW
+        record = _HEADER.pack(_MAGIC, digest, len(data), len(payload), codec) + payload
+        if self._write_fd is None:
+            flags = os.O_WRONLY | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0)
+            self._write_fd = os.open(self._pack_path(self._write_pack), flags, 0o644)
+        pack = self._write_pack
+        # O_APPEND：一次 write 整条写到文件末尾，写完后的位置减去记录长度即为本条的起点
+        written = os.write(self._write_fd, record)
+        if written != len(record):
+            raise OSError(f"写入打包文件不完整：{self._pack_path(pack)}")
+        end = os.lseek(self._write_fd, 0, os.SEEK_CUR)
+        if end >= self.pack_size:
+            os.close(self._write_fd)
+            self._write_fd = None
+            self._write_pack = max(self._pack_numbers() + [pack]) + 1
+        return pack, end - len(record) + _HEADER.size, len(payload), codec
+
+    def _read_blob(self, hash_hex: str, pack: int, offset: int, stored: int, size: int, codec: int) -> bytes:
+        with self._lock:
+            f = self._readers.get(pack)
+            if f is None:
+                f = self._readers[pack] = self._pack_path(pack).open("rb")
+            f.seek(offset)
+            payload = f.read(stored)
+        data = zlib.decompress(payload) if codec == _ZLIB else payload
+        if len(data) != size or hashlib.sha256(data).hexdigest() != hash_hex:
+            raise ValueError(f"产物内容校验失败：{hash_hex}（{self._pack_path(pack)} 偏移 {offset}）")
+        return data
+
+    # -- 写入 --
+
+    def put(self, book: str, path: str, data: Union[bytes, str], *, commit: bool = True) -> str:
+        """写入（或覆盖）book/<书名>/<path>，返回内容哈希；内容已存在时只登记键。"""
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        path = path.replace("\\", "/")
+        digest = hashlib.sha256(data)
+        hash_hex = digest.hexdigest()
+        kind, no = artifact_kind(path)
+        with self._lock:
+            conn = self.conn
+            if conn.execute("SELECT 1 FROM blobs WHERE hash = ?", (hash_hex,)).fetchone() is None:
+                pack, offset, stored, codec = self._append(digest.digest(), data)
+                conn.execute(
+                    "INSERT OR IGNORE INTO blobs(hash, pack, offset, stored, size, codec) VALUES (?, ?, ?, ?, ?, ?)",
+                    (hash_hex, pack, offset, stored, len(data), codec),
+                )
+            conn.execute(
+                "INSERT OR REPLACE INTO artifacts(book, path, chapter, kind, hash, size, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (book, path, no, kind, hash_hex, len(data), time.time()),
+            )
+            if commit:
+                conn.commit()
+        return hash_hex
+
+    def commit(self) -> None:
+        with self._lock:
+            self.conn.commit()
+
+    def remove(self, book: str, path: Optional[str] = None) -> int:
+        """删除一本书（path 为 None）或其中一个产物的键；内容留到 compact 时清理。"""
+        with self._lock:
+            if path is None:
+                cur = self.conn.execute("DELETE FROM artifacts WHERE book = ?", (book,))
+            else:
+                cur = self.conn.execute("DELETE FROM artifacts WHERE book = ? AND path = ?", (book, path))
+            self.conn.commit()
+            return cur.rowcount
+
+    # -- 读取 --
+
+    def _entry(self, row: Tuple[Any, ...]) -> ArtifactEntry:
+        return ArtifactEntry(book=row[0], path=row[1], chapter=row[2], kind=row[3], hash=row[4], size=row[5])
+
+    def stat(self, book: str, path: str) -> Optional[ArtifactEntry]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT book, path, chapter, kind, hash, size FROM artifacts WHERE book = ? AND path = ?", (book, path)
+            ).fetchone()
+        return self._entry(row) if row else None
+
+    def get(self, book: str, path: str) -> Optional[bytes]:
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT b.hash, b.pack, b.offset, b.stored, b.size, b.codec FROM artifacts a "
+                "JOIN blobs b ON b.hash = a.hash WHERE a.book = ? AND a.path = ?",
+                (book, path),
+            ).fetchone()
+        return self._read_blob(*row) if row else None
+
+    def get_text(self, book: str, path: str) -> Optional[str]:
+        data = self.get(book, path)
+        return None if data is None else data.decode("utf-8")
+
+    def chapter(self, book: str, chapter_no: int, kind: str = "analysis") -> Optional[ArtifactEntry]:
+        """按章序查找某一类产物（同一章有多个时取路径最小的一个）。"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT book, path, chapter, kind, hash, size FROM artifacts "
+                "WHERE book = ? AND chapter = ? AND kind = ? ORDER BY path LIMIT 1",
+                (book, chapter_no, kind),
+            ).fetchone()
+        return self._entry(row) if row else None
+
+    def entries(self, book: str, *, kind: Optional[str] = None) -> List[ArtifactEntry]:
+        """一本书的产物，按章序（无章序的排在最后）、路径排序。"""
+        sql = "SELECT book, path, chapter, kind, hash, size FROM artifacts WHERE book = ?"
+        params: Tuple[Any, ...] = (book,)
+        if kind is not None:
+            sql += " AND kind = ?"
+            params += (kind,)
+        with self._lock:
+            rows = self.conn.execute(sql + " ORDER BY chapter IS NULL, chapter, path", params).fetchall()
+        return [self._entry(r) for r in rows]
+
+    def books(self) -> List[str]:
+        with self._lock:
+            return [r[0] for r in self.conn.execute("SELECT DISTINCT book FROM artifacts ORDER BY book")]
+
+    def has_book(self, book: str) -> bool:
+        with self._lock:
+            return self.conn.execute("SELECT 1 FROM artifacts WHERE book = ? LIMIT 1", (book,)).fetchone() is not None
+
+    def fingerprint(self, book: str, kinds: Iterable[str] = ("chapter", "analysis")) -> str:
+        """指定类别产物的 (路径, 内容哈希) 摘要；内容或文件名变化时改变（第三阶段增量构建用）。"""
+        wanted = set(kinds)
+        h = hashlib.sha256()
+        for e in self.entries(book):
+            if e.kind in wanted:
+                h.update(f"{e.path}\0{e.hash}\n".encode("utf-8"))
+        return h.hexdigest()
+
+    # -- 与目录布局互转 --
+
+    def ingest(self, novel_dir: Path, book: Optional[str] = None) -> int:
+        """导入 <小说目录> 下的章节 JSONL 与 analysis/ 下的文件（不含 xlsx），返回导入的产物数。"""
+        book = book or novel_dir.name
+        files = sorted(novel_dir.glob("*.jsonl"))
+        analysis_dir = novel_dir / "analysis"
+        if analysis_dir.is_dir():
+            files += sorted(p for p in analysis_dir.iterdir() if p.is_file())
+        for p in files:
+            self.put(book, p.relative_to(novel_dir).as_posix(), p.read_bytes(), commit=False)
+        self.commit()
+        return len(files)
+
+    def export(self, book: str, out_dir: Path) -> int:
+        """把一本书的全部产物写成 <out_dir>/<相对路径>，返回写出的文件数。"""
+        entries = self.entries(book)
+        for e in entries:
+            target = out_dir.joinpath(*e.path.split("/"))
+            target.parent.mkdir(parents=True, exist_ok=True)
+            target.write_bytes(self.get(book, e.path) or b"")
+        return len(entries)
+
+    # -- 统计与清理 --
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            conn = self.conn
+            books, artifacts, logical = conn.execute(
+                "SELECT COUNT(DISTINCT book), COUNT(*), COALESCE(SUM(size), 0) FROM artifacts"
+            ).fetchone()
+            blobs, unique, stored = conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size), 0), COALESCE(SUM(stored + ?), 0) FROM blobs", (_HEADER.size,)
+            ).fetchone()
+            live = conn.execute(
+                "SELECT COALESCE(SUM(stored + ?), 0) FROM blobs WHERE hash IN (SELECT hash FROM artifacts)",
+                (_HEADER.size,),
+            ).fetchone()[0]
+        packs = self._pack_numbers()
+        on_disk = sum(self._pack_path(n).stat().st_size for n in packs)
+        return {
+            "books": books,
+            "artifacts": artifacts,
+            "blobs": blobs,
+            "packs": len(packs),
+            "logical_bytes": logical,  # 按目录布局展开后的总大小
+            "unique_bytes": unique,  # 去重后、压缩前
+            "stored_bytes": stored,
+            "pack_bytes": on_disk,
+            "garbage_bytes": max(on_disk - live, 0),  # compact 可回收
+        }
+
+    def compact(self) -> Dict[str, int]:
+        """
+        把仍被引用的内容重写进新的打包文件，删除旧打包文件与不再被引用的记录。
+        运行期间不能有其他进程写入同一个存储。
+        """
+        with self._lock:
+            conn = self.conn
+            old_packs = self._pack_numbers()
+            rows = conn.execute(
+                "SELECT hash, pack, offset, stored, size, codec FROM blobs "
+                "WHERE hash IN (SELECT hash FROM artifacts) ORDER BY pack, offset"
+            ).fetchall()
+            dropped = conn.execute("SELECT COUNT(*) FROM blobs").fetchone()[0] - len(rows)
+            self._close_files()
+            self._write_pack = max(old_packs, default=0) + 1
+            moved = []
+            for hash_hex, pack, offset, stored, size, codec in rows:
+                data = self._read_blob(hash_hex, pack, offset, stored, size, codec)
+                new_pack, new_offset, new_stored, new_codec = self._append(bytes.fromhex(hash_hex), data)
+                moved.append((hash_hex, new_pack, new_offset, new_stored, size, new_codec))
+            self._close_files()
+            conn.execute("DELETE FROM blobs")
+            conn.executemany(
+                "INSERT INTO blobs(hash, pack, offset, stored, size, codec) VALUES (?, ?, ?, ?, ?, ?)", moved
+            )
+            conn.commit()
+            for n in old_packs:
+                self._pack_path(n).unlink(missing_ok=True)
+        return {"kept": len(rows), "dropped": dropped, "packs_removed": len(old_packs)}
+
+
+def _book_dirs(library: Path) -> List[Path]:
+    """书库下含章节 JSONL 或 analysis/ 的书目录；library 本身就是一本书时只返回它。"""
+    def is_book(d: Path) -> bool:
+        return (d / "analysis").is_dir() or any(d.glob("*.jsonl"))
+
+    if is_book(library):
+        return [library]
+    return sorted(d for d in library.iterdir() if d.is_dir() and not d.name.startswith(".") and is_book(d))
+
+
+def _human(n: float) -> str:
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Content-addressed, compressed store for phase 1/2 artifacts.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    store_help = f"Store dir (default: <library>/{STORE_DIRNAME})"
+    p_ingest = sub.add_parser("ingest", help="Import chapter jsonl + analysis/* of every book under a library dir")
+    p_ingest.add_argument("library", type=Path, help='Library dir (e.g. "book") or one novel dir')
+    p_ingest.add_argument("--store", type=Path, default=None, help=store_help)
+    p_export = sub.add_parser("export", help="Materialize the book/<name>/ directory layout from the store")
+    p_export.add_argument("library", type=Path)
+    p_export.add_argument("--out", type=Path, default=None, help="Output library dir (default: the library dir)")
+    p_export.add_argument("--book", action="append", default=None, help="Only export this book (repeatable)")
+    p_export.add_argument("--store", type=Path, default=None, help=store_help)
+    p_ls = sub.add_parser("ls", help="List books, or the artifacts of one book")
+    p_ls.add_argument("library", type=Path)
+    p_ls.add_argument("--book", default=None)
+    p_ls.add_argument("--store", type=Path, default=None, help=store_help)
+    p_stats = sub.add_parser("stats", help="Show store size and deduplication")
+    p_stats.add_argument("library", type=Path)
+    p_stats.add_argument("--store", type=Path, default=None, help=store_help)
+    p_compact = sub.add_parser("compact", help="Rewrite packs without unreferenced content (no concurrent writers)")
+    p_compact.add_argument("library", type=Path)
+    p_compact.add_argument("--store", type=Path, default=None, help=store_help)
+    args = parser.parse_args(argv)
+
+    library: Path = args.library
+    if args.cmd == "ingest":
+        dirs = _book_dirs(library)
+        root = library.parent if dirs == [library] else library
+        t0 = time.perf_counter()
+        with ArtifactStore.for_library(root, args.store) as store:
+            total = sum(store.ingest(d) for d in dirs)
+            s = store.stats()
+            print(
+                f"[产物存储] 导入 {len(dirs)} 本书 {total} 个文件，用时 {time.perf_counter() - t0:.2f}s；"
+                f"展开 {_human(s['logical_bytes'])} -> 打包 {_human(s['pack_bytes'])}：{store.root}"
+            )
+        return 0
+
+    with ArtifactStore.for_library(library, args.store) as store:
+        if args.cmd == "export":
+            out = args.out or library
+            books = args.book or store.books()
+            missing = [b for b in books if not store.has_book(b)]
+            if missing:
+                raise SystemExit(f"存储中没有这些书：{'、'.join(missing)}")
+            files = sum(store.export(b, out / b) for b in books)
+            print(f"[产物存储] 导出 {len(books)} 本书 {files} 个文件到 {out}")
+        elif args.cmd == "ls":
+            if args.book is None:
+                for b in store.books():
+                    print(f"{b}\t{len(store.entries(b))}")
+            else:
+                for e in store.entries(args.book):
+                    print(f"{e.path}\t{e.kind}\t{e.size}\t{e.hash[:12]}")
+        elif args.cmd == "stats":
+            s = store.stats()
+            ratio = s["logical_bytes"] / s["pack_bytes"] if s["pack_bytes"] else 0.0
+            print(
+                f"[产物存储] 书目={s['books']} 产物={s['artifacts']} 去重后={s['blobs']} 打包文件={s['packs']}\n"
+                f"[产物存储] 展开={_human(s['logical_bytes'])} 去重后={_human(s['unique_bytes'])} "
+                f"打包={_human(s['pack_bytes'])}（{ratio:.1f}x） 可回收={_human(s['garbage_bytes'])}"
+            )
+        elif args.cmd == "compact":
+            r = store.compact()
+            print(f"[产物存储] 保留 {r['kept']} 条内容，清理 {r['dropped']} 条，重写 {r['packs_removed']} 个打包文件")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+"""End-to-end throughput benchmark: phase 2 + phase 3 against the offline mock LLM.
+
+Command:
+  python benchmarks/bench_e2e.py --books 20 --concurrency 4 --latency-ms 300 --rate-429 0.05 --rate-truncate 0.05
+
+Synthetic books (three chapter JSONL files each) are generated in a temporary
+directory, a mock Ark server (llm_provider/mock_ark_server.py) is started
+in-process, and `run_phase2.main` / `run_phase3.main` are called for every book.
+Reports books/minute, p50/p95 latency and how injected faults were recovered.
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+for _p in (_REPO_ROOT, _REPO_ROOT / "phase2_analysis", _REPO_ROOT / "phase3_excel"):
+    if str(_p) not in sys.path:
+        sys.path.insert(0, str(_p))
+
+from llm_provider.mock_ark_server import MockArkConfig, start_background
+from llm_provider.telemetry import iter_records
+
+_PHRASES = [
+    "夜色压得很低，城墙上的火把被风吹得东倒西歪。",
+    "“你再说一遍？”少年握紧了手里的刀。",
+    "他忽然想起三年前那场大雪，父亲就是在那天失踪的。",
+    "远处传来一声凄厉的嚎叫，众人脸色骤变！",
+    "掌柜的压低声音：“这东西，可不是你该碰的。”",
+    "系统提示音在脑海中响起：检测到宿主濒临死亡。",
+    "没人注意到，角落里那盏油灯的火苗变成了幽蓝色。",
+    "她笑了笑，却没有回答，只是把那枚玉佩推了回来。",
+]
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def make_synthetic_books(root: Path, *, books: int, paragraphs: int, seed: int = 7) -> List[Path]:
+    """Write book_<i>/<n>_第n章.jsonl files shaped like phase 1 output."""
+    rng = random.Random(seed)
+    out: List[Path] = []
+    for b in range(1, books + 1):
+        book_dir = root / f"bench_book_{b:04d}"
+        book_dir.mkdir(parents=True, exist_ok=True)
+        for ch in (1, 2, 3):
+            lines = []
+            for pid in range(1, paragraphs + 1):
+                text = "".join(rng.choice(_PHRASES) for _ in range(rng.randint(1, 3)))
+                lines.append(json.dumps({"paragraph_id": pid, "text": text}, ensure_ascii=False))
+            (book_dir / f"{ch}_第{ch}章.jsonl").write_text("\n".join(lines) + "\n", encoding="utf-8")
+        out.append(book_dir)
+    return out
+
+
+def write_llm_config(path: Path, base_url: str, *, max_retries: int, json_retries: int) -> None:
+    cfg = {
+        "default_profile": "bench",
+        "providers": {"mock": {"type": "volc_ark", "base_url": base_url, "api_key": "mock-key", "model": "mock-model"}},
+        "profiles": {
+            "bench": {
+                "provider": "mock",
+                "params": {"timeout_s": 30, "max_retries": max_retries, "json_retries": json_retries},
+            }
+        },
+    }
+    path.write_text(json.dumps(cfg, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def run_book(book_dir: Path, llm_config: Path, telemetry_log: Path, *, with_phase3: bool) -> Dict[str, Any]:
+    import run_phase2
+    import run_phase3
+
+    rec: Dict[str, Any] = {"book": book_dir.name, "ok": False}
+    t0 = time.perf_counter()
+    try:
+        rc = run_phase2.main(
+            [str(book_dir), "--llm-config", str(llm_config), "--telemetry-log", str(telemetry_log)]
+        )
+    except Exception as e:  # noqa: BLE001 - benchmark records every failure mode
+        rec["error"] = f"phase2: {type(e).__name__}: {e}"[:300]
+        rc = -1
+    rec["phase2_s"] = time.perf_counter() - t0
+    if rc != 0:
+        rec.setdefault("error", f"phase2 exit={rc}")
+        return rec
+
+    if with_phase3:
+        t1 = time.perf_counter()
+        try:
+            rc = run_phase3.main([str(book_dir)])
+        except (Exception, SystemExit) as e:  # noqa: BLE001
+            rec["error"] = f"phase3: {type(e).__name__}: {e}"[:300]
+            rc = -1
+        rec["phase3_s"] = time.perf_counter() - t1
+        if rc != 0:
+            rec.setdefault("error", f"phase3 exit={rc}")
+            return rec
+
+    rec["ok"] = True
+    rec["total_s"] = time.perf_counter() - t0
+    return rec
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline end-to-end benchmark (mock LLM -> phase2 -> phase3).")
+    parser.add_argument("--books", type=int, default=10)
+    parser.add_argument("--paragraphs", type=int, default=40, help="Paragraphs per chapter")
+    parser.add_argument("--concurrency", type=int, default=4, help="Books processed in parallel")
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=100.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--rate-truncate", type=float, default=0.0)
+    parser.add_argument("--rate-malformed", type=float, default=0.0)
+    parser.add_argument("--max-retries", type=int, default=2, help="Profile max_retries (429/5xx/transport)")
+    parser.add_argument("--json-retries", type=int, default=2, help="Profile json_retries (invalid JSON re-asks)")
+    parser.add_argument("--skip-phase3", action="store_true")
+    parser.add_argument("--workdir", type=Path, default=None, help="Keep generated books here (default: temp dir)")
+    parser.add_argument("--json", type=Path, default=None, help="Also write the report as JSON")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args(argv)
+
+    server = start_background(
+        MockArkConfig(
+            latency_ms=args.latency_ms,
+            jitter_ms=args.jitter_ms,
+            rate_429=args.rate_429,
+            rate_5xx=args.rate_5xx,
+            rate_truncate=args.rate_truncate,
+            rate_malformed=args.rate_malformed,
+            seed=args.seed,
+        )
+    )
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    with contextlib.ExitStack() as stack:
+        if args.workdir is None:
+            root = Path(stack.enter_context(tempfile.TemporaryDirectory(prefix="tgc_bench_")))
+        else:
+            root = args.workdir
+            root.mkdir(parents=True, exist_ok=True)
+
+        llm_config = root / "llm.bench.json"
+        telemetry_log = root / "telemetry.jsonl"
+        write_llm_config(llm_config, base_url, max_retries=args.max_retries, json_retries=args.json_retries)
+        books = make_synthetic_books(root, books=args.books, paragraphs=args.paragraphs, seed=args.seed)
+
+        print(f"[bench] {len(books)} books x 3 chapters, concurrency={args.concurrency}, mock={base_url}", file=sys.stderr)
+        # run_phase2/run_phase3 read prompt/ relative to the repo root.
+        prev_cwd = os.getcwd()
+        os.chdir(_REPO_ROOT)
+        stack.callback(os.chdir, prev_cwd)
+        t0 = time.perf_counter()
+        # Per-book progress lines would interleave across threads; keep them out of the report.
+        with contextlib.redirect_stdout(io.StringIO()):
+            with ThreadPoolExecutor(max_workers=max(1, args.concurrency)) as ex:
+                records = list(
+                    ex.map(lambda d: run_book(d, llm_config, telemetry_log, with_phase3=not args.skip_phase3), books)
+                )
+        wall = time.perf_counter() - t0
+        calls = list(iter_records([telemetry_log]))
+
+    server.shutdown()
+    stats = server.stats  # type: ignore[attr-defined]
+    faults = stats.as_dict()
+    injected = faults["http_429"] + faults["http_5xx"] + faults["truncated"] + faults["malformed"]
+    ok_books = [r for r in records if r["ok"]]
+    failed = [r for r in records if not r["ok"]]
+    phase2 = [r["phase2_s"] for r in records if r["ok"]]
+    phase3 = [r["phase3_s"] for r in ok_books if "phase3_s" in r]
+    # Client-side latency (includes retries/backoff), from the phase 2 telemetry log.
+    call_latency = [float(c["latency_s"]) for c in calls if c.get("status") == "ok" and "latency_s" in c]
+
+    report = {
+        "books": len(records),
+        "books_ok": len(ok_books),
+        "books_failed": len(failed),
+        "wall_s": round(wall, 3),
+        "books_per_min": round(len(ok_books) / wall * 60.0, 2) if wall > 0 else 0.0,
+        "llm_calls": len(calls),
+        "llm_retries": sum(int(c.get("retries") or 0) for c in calls),
+        "llm_call_p50_s": round(percentile(call_latency, 50), 3),
+        "llm_call_p95_s": round(percentile(call_latency, 95), 3),
+        "mock_service_p50_s": round(percentile(stats.latencies_s, 50), 3),
+        "phase2_book_p50_s": round(percentile(phase2, 50), 3),
+        "phase2_book_p95_s": round(percentile(phase2, 95), 3),
+        "phase3_book_p50_s": round(percentile(phase3, 50), 3),
+        "phase3_book_p95_s": round(percentile(phase3, 95), 3),
+        "mock": faults,
+        "faults_injected": injected,
+        "recovery_rate": round(len(ok_books) / len(records), 4) if records else 0.0,
+        "errors": [{"book": r["book"], "error": r.get("error")} for r in failed][:20],
+    }
+
+    print(f"books={report['books']} ok={report['books_ok']} failed={report['books_failed']} wall={report['wall_s']}s")
+    print(f"throughput: {report['books_per_min']} books/min")
+    print(
+        f"llm call latency: p50={report['llm_call_p50_s']}s p95={report['llm_call_p95_s']}s "
+        f"(calls={report['llm_calls']} retries={report['llm_retries']})"
+    )
+    print(f"phase2 per book: p50={report['phase2_book_p50_s']}s p95={report['phase2_book_p95_s']}s")
+    if phase3:
+        print(f"phase3 per book: p50={report['phase3_book_p50_s']}s p95={report['phase3_book_p95_s']}s")
+    print(
+        f"faults injected={injected} (429={faults['http_429']} 5xx={faults['http_5xx']} "
+        f"truncated={faults['truncated']} malformed={faults['malformed']}) "
+        f"-> books recovered {len(ok_books)}/{len(records)}"
+    )
+    for e in report["errors"]:
+        print(f"  FAILED {e['book']}: {e['error']}")
+
+    if args.json:
+        args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0 if not failed else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""Phase 1 extraction benchmark: spine read-ahead (prefetch) on large multi-file EPUBs.
+
+Command:
+  python benchmarks/bench_extract.py                                   # prefetch 0/1/2/4/8, latency 0/0.2/1 ms
+  python benchmarks/bench_extract.py --front 400 --parts 50 --latency-ms 0,2 --prefetch 0,4
+
+A synthetic EPUB is generated with `--front` front-matter XHTML files before
+chapter 1 and every chapter split across `--parts` files, so reaching the first
+three chapters touches several hundred spine items. `--latency-ms` adds a fixed
+delay to every read() on the zip file handles (simulating a network share or
+FUSE-mounted object storage); 0 measures the local page-cache case. Each
+prefetch setting must produce exactly the same chapters as prefetch=0.
+"""
+
+from __future__ import annotations
+
+import argparse
+import io
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+import zipfile
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+for _p in (_REPO_ROOT, _REPO_ROOT / "phase1_extract"):
+    if str(_p) not in sys.path:
+        sys.path.insert(0, str(_p))
+
+from extractor import extract_first_chapters
+
+_CHARS = "天地玄黄宇宙洪荒日月盈昃辰宿列张寒来暑往秋收冬藏闰余成岁律吕调阳云腾致雨露结为霜金生丽水玉出昆冈剑号巨阙珠称夜光"
+_CONTAINER = (
+    '<?xml version="1.0"?><container version="1.0" xmlns="urn:oasis:names:tc:opendocument:xmlns:container">'
+    '<rootfiles><rootfile full-path="OEBPS/content.opf" media-type="application/oebps-package+xml"/></rootfiles></container>'
+)
+
+
+def make_epub(path: Path, *, front: int, chapters: int, parts: int, paras: int, seed: int = 1) -> None:
+    rng = random.Random(seed)
+
+    def body(head: str = "") -> str:
+        ps = "".join(
+            f"<p>{''.join(rng.choice(_CHARS) for _ in range(rng.randint(40, 120)))}。</p>" for _ in range(paras)
+        )
+        return (
+            '<?xml version="1.0" encoding="utf-8"?><html xmlns="http://www.w3.org/1999/xhtml">'
+            f"<head><title>x</title></head><body>{head}{ps}</body></html>"
+        )
+
+    names: List[str] = []
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as z:
+        z.writestr(zipfile.ZipInfo("mimetype"), "application/epub+zip")
+        z.writestr("META-INF/container.xml", _CONTAINER)
+        for i in range(front):
+            names.append(f"front{i}.xhtml")
+            z.writestr(f"OEBPS/{names[-1]}", body())
+        for c in range(1, chapters + 1):
+            for p in range(parts):
+                names.append(f"c{c}_{p}.xhtml")
+                z.writestr(f"OEBPS/{names[-1]}", body(f"<h1>第{c}章 试炼{c}</h1>" if p == 0 else ""))
+        manifest = "".join(f'<item id="i{k}" href="{n}" media-type="application/xhtml+xml"/>' for k, n in enumerate(names))
+        spine = "".join(f'<itemref idref="i{k}"/>' for k in range(len(names)))
+        z.writestr(
+            "OEBPS/content.opf",
+            '<?xml version="1.0"?><package xmlns="http://www.idpf.org/2007/opf" version="2.0">'
+            f"<manifest>{manifest}</manifest><spine>{spine}</spine></package>",
+        )
+
+
+class _SlowFile(io.FileIO):
+    delay_s = 0.0
+
+    def read(self, size: int = -1) -> bytes:
+        time.sleep(self.delay_s)
+        return super().read(size)
+
+
+_open = zipfile.io.open
+
+
+def _slow_open(file: Any, mode: str = "r", *args: Any, **kwargs: Any) -> Any:
+    # zipfile 以 "rb" 打开路径时换成带延迟的文件对象（模拟网络存储）
+    if mode == "rb" and isinstance(file, (str, Path)):
+        return _SlowFile(file, "r")
+    return _open(file, mode, *args, **kwargs)
+
+
+def run_case(epub: Path, prefetch: int, latency_ms: float, repeat: int) -> Dict[str, Any]:
+    _SlowFile.delay_s = latency_ms / 1000.0
+    zipfile.io.open = _slow_open if latency_ms > 0 else _open
+    try:
+        times = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            chapters = extract_first_chapters(epub, prefetch=prefetch)
+            times.append(time.perf_counter() - t0)
+    finally:
+        zipfile.io.open = _open
+    return {
+        "prefetch": prefetch,
+        "latency_ms": latency_ms,
+        "median_s": round(statistics.median(times), 4),
+        "min_s": round(min(times), 4),
+        "chapters": [(c.no, c.title, len(c.paragraphs)) for c in chapters],
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark spine read-ahead in phase 1 extraction.")
+    parser.add_argument("--prefetch", default="0,1,2,4,8", help="Comma-separated read-ahead depths (0 = serial)")
+    parser.add_argument("--latency-ms", default="0,0.2,1", help="Comma-separated simulated per-read latencies")
+    parser.add_argument("--front", type=int, default=200, help="Front-matter files before chapter 1")
+    parser.add_argument("--parts", type=int, default=30, help="Files per chapter")
+    parser.add_argument("--paras", type=int, default=60, help="Paragraphs per file")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per case (median reported)")
+    parser.add_argument("--json", type=Path, default=None, help="Also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    prefetches = [int(x) for x in args.prefetch.split(",") if x.strip()]
+    if 0 not in prefetches:
+        prefetches.insert(0, 0)
+    latencies = [float(x) for x in args.latency_ms.split(",") if x.strip()]
+
+    with tempfile.TemporaryDirectory(prefix="tgc_bench_extract_") as tmp:
+        epub = Path(tmp) / "large.epub"
+        make_epub(epub, front=args.front, chapters=4, parts=args.parts, paras=args.paras)
+        with zipfile.ZipFile(epub) as z:
+            items = len(z.namelist()) - 3
+        print(f"epub: {epub.stat().st_size / 1e6:.1f} MB, {items} spine items")
+
+        results: List[Dict[str, Any]] = []
+        header = f"{'latency_ms':>10} {'prefetch':>8} {'median_s':>9} {'min_s':>8} {'speedup':>8}"
+        print(header)
+        print("-" * len(header))
+        for latency in latencies:
+            base = run_case(epub, 0, latency, args.repeat)
+            for k in prefetches:
+                r = base if k == 0 else run_case(epub, k, latency, args.repeat)
+                if r["chapters"] != base["chapters"]:
+                    raise SystemExit(f"prefetch={k} latency={latency}: chapters differ from prefetch=0")
+                r["speedup"] = round(base["median_s"] / r["median_s"], 2) if r["median_s"] else 0.0
+                results.append({k2: v for k2, v in r.items() if k2 != "chapters"})
+                print(f"{latency:>10} {k:>8} {r['median_s']:>9} {r['min_s']:>8} {r['speedup']:>8}")
+
+    if args.json is not None:
+        args.json.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
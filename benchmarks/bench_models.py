@@ -0,0 +1,326 @@
+#!/usr/bin/env python3
+"""Multi-model benchmark: the same chapters against several llm.json profiles.
+
+Command:
+  python benchmarks/bench_models.py book/书名 --profiles phase2_doubao,phase2_doubao_creative
+  python benchmarks/bench_models.py book --profiles fast,doubao,creative --max-books 10 --concurrency 4 --csv models.csv
+
+Every chapter JSONL of the given books (a library directory means every book in
+it) is rendered once with the phase 2 prompts and sent to each profile. Chapter
+2/3 prompts take their previous-chapter summary from the book's existing
+analysis/*.json (empty when missing), so every profile sees identical input.
+Outputs are validated like phase 2 (validation.py) and nothing is written into
+the books. Profiles run side by side, each with `--concurrency` chapters in
+flight; every call goes to the telemetry log.
+
+Per profile: chapter latency p50/p95, calls, retries, tokens, cost (from the
+llm.json `pricing` table), JSON validity rate (share of model outputs that
+parse), mean/min paragraph coverage, share of fully covered chapters, quality,
+and the pass rate against the bar (`--min-coverage`, `--min-quality`). The
+fastest profile whose pass rate reaches `--min-pass-rate` is recommended.
+"""
+
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+for _p in (_REPO_ROOT, _REPO_ROOT / "phase2_analysis"):
+    if str(_p) not in sys.path:
+        sys.path.insert(0, str(_p))
+
+from cascade import CascadeOutcome, ModelCascade
+from chapters import analysis_paths, iter_chapter_jsonl_files, load_analysis, read_jsonl_as_text, render_chapter_prompt
+from context_compactor import ContextCompactor
+from prompts import load_prompts
+from validation import parse_paragraph_ids
+
+from llm_provider.hedging import Hedger
+from llm_provider.llm_config import find_default_llm_config, load_chat_run_config
+from llm_provider.telemetry import TelemetryLog, format_table, iter_records, load_pricing, summarize
+
+
+@dataclass(frozen=True)
+class BenchChapter:
+    book: str
+    no: int
+    system: str
+    user_prompt: str
+    paragraph_ids: Tuple[int, ...]
+
+
+@dataclass
+class ChapterRun:
+    chapter: BenchChapter
+    latency_s: float
+    finished_at: float
+    outcome: Optional[CascadeOutcome] = None
+    error: str = ""
+
+
+def percentile(values: Sequence[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    k = max(0, min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1)))))
+    return ordered[k]
+
+
+def book_dirs(inputs: Sequence[Path]) -> List[Path]:
+    """Book directories with chapter JSONL; a library directory expands to its books."""
+    out: List[Path] = []
+    for p in inputs:
+        if any(p.glob("*.jsonl")):
+            out.append(p)
+        elif p.is_dir():
+            out.extend(sorted(d for d in p.iterdir() if d.is_dir() and any(d.glob("*.jsonl"))))
+    return out
+
+
+def load_chapters(books: Sequence[Path], *, prompt_dir: Path, context_budget: int) -> Tuple[List[BenchChapter], int]:
+    """(chapters, how many chapter 2/3 prompts lack a previous-chapter summary)."""
+    prompts = load_prompts(prompt_dir)
+    compactor = ContextCompactor(context_budget)
+    chapters: List[BenchChapter] = []
+    no_context = 0
+    for book in books:
+        previous: List[Dict[str, Any]] = []
+        complete = True
+        for no, jsonl_path in iter_chapter_jsonl_files(book):
+            jsonl_content = read_jsonl_as_text(jsonl_path)
+            summary = ""
+            if no > 1:
+                if complete and previous:
+                    summary, _ = compactor.build(previous, chapter_no=no)
+                else:
+                    no_context += 1
+            chapters.append(
+                BenchChapter(
+                    book=book.name,
+                    no=no,
+                    system=prompts.system_for(no),
+                    user_prompt=render_chapter_prompt(
+                        prompts, chapter_no=no, jsonl_content=jsonl_content, previous_summary=summary
+                    ),
+                    paragraph_ids=tuple(parse_paragraph_ids(jsonl_content.splitlines())),
+                )
+            )
+            obj = load_analysis(analysis_paths(book / "analysis", jsonl_path)[0])
+            if obj is None:
+                complete = False
+            else:
+                previous.append(obj)
+    return chapters, no_context
+
+
+def make_cascade(llm_config: Path, profile: str) -> ModelCascade:
+    run_cfg = load_chat_run_config(llm_config, profile=profile)
+    for tier_cfg in run_cfg.tiers:
+        for ep in tier_cfg.pool:
+            if ep.provider.type != "volc_ark":
+                raise SystemExit(f"{profile}: unsupported provider type {ep.provider.type} (only volc_ark)")
+    hedger = None
+    if run_cfg.params.adaptive_timeout or run_cfg.params.hedge_budget > 0:
+        hedger = Hedger(
+            budget_ratio=run_cfg.params.hedge_budget,
+            hedge_percentile=run_cfg.params.hedge_percentile,
+            adaptive_timeout=run_cfg.params.adaptive_timeout,
+        )
+    return ModelCascade(run_cfg, hedger=hedger)
+
+
+def run_chapter(cascade: ModelCascade, profile: str, ch: BenchChapter, telemetry: TelemetryLog) -> ChapterRun:
+    t0 = time.perf_counter()
+    try:
+        outcome = cascade.analyze(
+            system=ch.system,
+            user_prompt=ch.user_prompt,
+            paragraph_ids=ch.paragraph_ids,
+            telemetry=telemetry,
+            call_ctx={"book": ch.book, "chapter": ch.no, "candidate": profile},
+        )
+    except Exception as e:  # noqa: BLE001 - a failed chapter is a data point, not a crash
+        t1 = time.perf_counter()
+        return ChapterRun(ch, t1 - t0, t1, error=f"{type(e).__name__}: {e}"[:300])
+    t1 = time.perf_counter()
+    return ChapterRun(ch, t1 - t0, t1, outcome=outcome)
+
+
+def score_profile(
+    profile: str,
+    runs: Sequence[ChapterRun],
+    *,
+    wall_s: float,
+    usage: Dict[str, Any],
+    min_coverage: float,
+    min_quality: float,
+) -> Dict[str, Any]:
+    attempts = [a for r in runs if r.outcome is not None for a in r.outcome.attempts]
+    outputs = [a for a in attempts if a.status != "error"]
+    coverage: List[float] = []
+    quality: List[float] = []
+    passed = escalated = 0
+    for r in runs:
+        v = r.outcome.validation if r.outcome is not None and r.outcome.obj is not None else None
+        # A chapter without a usable result covers nothing.
+        coverage.append(v.coverage if v is not None else 0.0)
+        quality.append(v.quality if v is not None else 0.0)
+        if v is not None and v.passes(min_coverage=min_coverage, quality_threshold=min_quality):
+            passed += 1
+        if r.outcome is not None and r.outcome.escalated:
+            escalated += 1
+    latencies = [r.latency_s for r in runs]
+    valid = sum(1 for a in outputs if a.status != "invalid_json")
+    n = len(runs)
+    return {
+        "profile": profile,
+        "chapters": n,
+        "failed": sum(1 for r in runs if r.outcome is None or r.outcome.obj is None),
+        "pass_rate": round(passed / n, 4) if n else 0.0,
+        "json_valid_rate": round(valid / len(outputs), 4) if outputs else 0.0,
+        "coverage_mean": round(statistics.fmean(coverage), 4) if coverage else 0.0,
+        "coverage_min": round(min(coverage), 4) if coverage else 0.0,
+        "full_coverage_rate": round(sum(1 for c in coverage if c >= 1.0) / n, 4) if n else 0.0,
+        "quality_mean": round(statistics.fmean(quality), 4) if quality else 0.0,
+        "latency_p50_s": round(percentile(latencies, 50), 3),
+        "latency_p95_s": round(percentile(latencies, 95), 3),
+        "chapters_per_min": round(n / wall_s * 60.0, 2) if wall_s > 0 else 0.0,
+        "calls": usage.get("calls", len(attempts)),
+        "retries": usage.get("retries", 0),
+        "escalated": escalated,
+        "prompt_tokens": usage.get("prompt_tokens", 0),
+        "completion_tokens": usage.get("completion_tokens", 0),
+        "cost": usage.get("cost"),
+        "cost_per_chapter": round(usage["cost"] / n, 5) if usage.get("cost") is not None and n else None,
+    }
+
+
+def recommend(rows: Sequence[Dict[str, Any]], min_pass_rate: float) -> Optional[Dict[str, Any]]:
+    """Fastest (p50, then p95, then cost) profile whose pass rate meets the bar."""
+    ok = [r for r in rows if r["pass_rate"] >= min_pass_rate]
+    if not ok:
+        return None
+    return min(ok, key=lambda r: (r["latency_p50_s"], r["latency_p95_s"], r["cost"] or 0.0))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compare llm.json profiles on the same chapters.")
+    parser.add_argument("inputs", type=Path, nargs="+", help="Book directories with chapter JSONL, or a library")
+    parser.add_argument("--profiles", required=True, help="Comma-separated profile names in llm.json")
+    parser.add_argument("--llm-config", type=Path, default=None, help="Path to llm.json (default: auto-detect)")
+    parser.add_argument("--prompt-dir", type=Path, default=_REPO_ROOT / "prompt", help="Prompt templates directory")
+    parser.add_argument("--max-books", type=int, default=0, help="Only the first N books (0 = all)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Chapters in flight per profile")
+    parser.add_argument(
+        "--context-budget", type=int, default=1000, help="Token budget for the previous-chapter summary (0 = unlimited)"
+    )
+    parser.add_argument("--min-coverage", type=float, default=0.95, help="Bar: paragraph coverage per chapter")
+    parser.add_argument("--min-quality", type=float, default=0.0, help="Bar: validation quality score per chapter")
+    parser.add_argument("--min-pass-rate", type=float, default=0.95, help="Bar: share of chapters that must pass")
+    parser.add_argument("--telemetry-log", type=Path, default=None, help="Per-call telemetry JSONL")
+    parser.add_argument("--json", type=Path, default=None, help="Also write the comparison as JSON")
+    parser.add_argument("--csv", type=Path, default=None, help="Also write the comparison as CSV")
+    args = parser.parse_args(argv)
+
+    # Duplicates would share one telemetry key and report the combined calls twice.
+    profiles = list(dict.fromkeys(p.strip() for p in args.profiles.split(",") if p.strip()))
+    if not profiles:
+        parser.error("--profiles needs at least one profile name")
+    llm_config = args.llm_config or find_default_llm_config()
+    if llm_config is None:
+        raise SystemExit("llm.json not found (create one or pass --llm-config)")
+
+    books = book_dirs(args.inputs)
+    if args.max_books > 0:
+        books = books[: args.max_books]
+    chapters, no_context = load_chapters(books, prompt_dir=args.prompt_dir, context_budget=args.context_budget)
+    if not chapters:
+        raise SystemExit(f"no chapter JSONL found under: {' '.join(str(p) for p in args.inputs)}")
+    cascades = {p: make_cascade(llm_config, p) for p in profiles}
+    telemetry = TelemetryLog.for_run("bench_models", path=args.telemetry_log)
+
+    print(
+        f"[bench] {len(books)} books, {len(chapters)} chapters x {len(profiles)} profiles, "
+        f"concurrency={args.concurrency} per profile",
+        file=sys.stderr,
+    )
+    if no_context:
+        print(f"[bench] {no_context} chapter 2/3 prompts without a previous summary (no analysis)", file=sys.stderr)
+
+    pools = {p: ThreadPoolExecutor(max_workers=max(1, args.concurrency)) for p in profiles}
+    started = time.perf_counter()
+    futures = {
+        p: [pools[p].submit(run_chapter, cascades[p], p, ch, telemetry) for ch in chapters] for p in profiles
+    }
+    runs: Dict[str, List[ChapterRun]] = {}
+    for p in profiles:
+        runs[p] = [f.result() for f in futures[p]]
+        pools[p].shutdown()
+    # Profiles ran side by side: each one's span ends with its last chapter.
+    wall = {p: max(r.finished_at for r in runs[p]) - started for p in profiles}
+
+    pricing = load_pricing(llm_config)
+    usage = {
+        str(row["candidate"]): row
+        for row in summarize(iter_records([telemetry.path]), by=("candidate",), pricing=pricing)
+    }
+    rows = [
+        score_profile(
+            p,
+            runs[p],
+            wall_s=wall[p],
+            usage=usage.get(p, {}),
+            min_coverage=args.min_coverage,
+            min_quality=args.min_quality,
+        )
+        for p in profiles
+    ]
+
+    print(format_table(rows))
+    for p in profiles:
+        for r in runs[p]:
+            if r.error:
+                print(f"[{p}] {r.chapter.book} ch{r.chapter.no}: {r.error}", file=sys.stderr)
+    best = recommend(rows, args.min_pass_rate)
+    if best is None:
+        print(f"recommend: none (no profile reaches pass_rate >= {args.min_pass_rate})")
+    else:
+        print(
+            f"recommend: {best['profile']} (p50 {best['latency_p50_s']}s, pass_rate {best['pass_rate']}, "
+            f"coverage {best['coverage_mean']}, cost {best['cost']})"
+        )
+    print(f"telemetry: {telemetry.path}", file=sys.stderr)
+
+    if args.json is not None:
+        report = {
+            "profiles": rows,
+            "recommended": best["profile"] if best is not None else None,
+            "bar": {
+                "min_coverage": args.min_coverage,
+                "min_quality": args.min_quality,
+                "min_pass_rate": args.min_pass_rate,
+            },
+            "books": len(books),
+            "chapters": len(chapters),
+            "chapters_without_context": no_context,
+        }
+        args.json.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    if args.csv is not None:
+        with args.csv.open("w", encoding="utf-8-sig", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
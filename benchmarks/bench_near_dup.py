@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""Near-duplicate index benchmark: LSH lookup latency and recall at library scale.
+
+Command:
+  python benchmarks/bench_near_dup.py                        # 1k / 10k / 100k books
+  python benchmarks/bench_near_dup.py --books 100000 --queries 5000 --edit 0.2
+
+Book signatures are synthesized directly (random MinHash values), so building a
+100k-book index does not require 100k books on disk. Half of the queries are
+edited copies of indexed books (`--edit` = fraction of MinHash bins changed,
+i.e. roughly 1 - Jaccard similarity) and must be found; the other half are
+unrelated books and must not match. Signature time for one realistic chapter is
+reported separately.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(_REPO_ROOT / "phase2_analysis") not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT / "phase2_analysis"))
+
+from near_dup import NUM_PERM, BookSignature, NearDupIndex, minhash, shingles
+
+_CHARS = "天地玄黄宇宙洪荒日月盈昃辰宿列张寒来暑往秋收冬藏闰余成岁律吕调阳云腾致雨露结为霜金生丽水玉出昆冈剑号巨阙珠称夜光"
+
+
+def random_signature(rng: random.Random) -> Tuple[int, ...]:
+    return tuple(rng.getrandbits(57) for _ in range(NUM_PERM))
+
+
+def edited(sig: Tuple[int, ...], fraction: float, rng: random.Random) -> Tuple[int, ...]:
+    out = list(sig)
+    for b in rng.sample(range(NUM_PERM), int(round(NUM_PERM * fraction))):
+        out[b] = rng.getrandbits(57)
+    return tuple(out)
+
+
+def signature_ms(chars: int = 3000, repeat: int = 5) -> float:
+    rng = random.Random(1)
+    texts = ["".join(rng.choice(_CHARS) for _ in range(40)) + "。" for _ in range(chars // 40)]
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        minhash(shingles(texts))
+    return (time.perf_counter() - t0) * 1000 / repeat
+
+
+def run_case(books: int, queries: int, edit: float, workdir: Path, seed: int = 7) -> Dict[str, Any]:
+    rng = random.Random(seed)
+    path = workdir / f"near_dup_{books}.sqlite"
+    path.unlink(missing_ok=True)
+    sigs: List[Tuple[int, ...]] = []
+    with NearDupIndex(path) as index:
+        t0 = time.perf_counter()
+        for i in range(books):
+            sig = random_signature(rng)
+            sigs.append(sig)
+            book_sig = BookSignature(book=sig, chapters={1: sig}, usable=True)
+            index.add_signature(f"book{i}", Path(f"/library/book{i}"), book_sig, {1: "1_第1章"}, commit=False)
+        index.commit()
+        build_s = time.perf_counter() - t0
+
+        latencies: List[float] = []
+        found = missed = false_pos = 0
+        for q in range(queries):
+            if q % 2 == 0:
+                target = rng.randrange(books)
+                sig = edited(sigs[target], edit, rng)
+            else:
+                target, sig = -1, random_signature(rng)
+            t0 = time.perf_counter()
+            matches = index.query(sig, threshold=1.0 - edit - 0.1)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            names = {m.name for m in matches}
+            if target >= 0:
+                if f"book{target}" in names:
+                    found += 1
+                else:
+                    missed += 1
+                false_pos += len(names - {f"book{target}"})
+            else:
+                false_pos += len(names)
+
+    latencies.sort()
+    return {
+        "books": books,
+        "build_s": round(build_s, 2),
+        "index_mb": round(path.stat().st_size / 1e6, 1),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p95_ms": round(latencies[int(len(latencies) * 0.95) - 1], 3),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 3),
+        "recall": round(found / max(found + missed, 1), 4),
+        "false_pos": false_pos,
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the near-duplicate book index.")
+    parser.add_argument("--books", default="1000,10000,100000", help="Comma-separated index sizes")
+    parser.add_argument("--queries", type=int, default=2000, help="Queries per index size (half near-duplicates)")
+    parser.add_argument("--edit", type=float, default=0.1, help="Fraction of MinHash bins changed in near-duplicates")
+    parser.add_argument("--workdir", type=Path, default=None, help="Keep the index files here")
+    parser.add_argument("--json", type=Path, default=None, help="Also write the results as JSON")
+    args = parser.parse_args(argv)
+
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="tgc_bench_near_dup_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+    print(f"signature: {signature_ms():.1f} ms per 3000-char chapter")
+
+    results: List[Dict[str, Any]] = []
+    header = f"{'books':>8} {'build_s':>8} {'index_mb':>9} {'p50_ms':>8} {'p95_ms':>8} {'p99_ms':>8} {'recall':>7} {'false_pos':>9}"
+    print(header)
+    print("-" * len(header))
+    for books in [int(x) for x in args.books.split(",") if x.strip()]:
+        r = run_case(books, args.queries, args.edit, workdir)
+        results.append(r)
+        print(
+            f"{r['books']:>8} {r['build_s']:>8} {r['index_mb']:>9} {r['p50_ms']:>8} {r['p95_ms']:>8} "
+            f"{r['p99_ms']:>8} {r['recall']:>7} {r['false_pos']:>9}"
+        )
+        if args.workdir is None:
+            (workdir / f"near_dup_{books}.sqlite").unlink(missing_ok=True)
+
+    if args.json is not None:
+        args.json.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
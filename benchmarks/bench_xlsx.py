@@ -0,0 +1,151 @@
+#!/usr/bin/env python3
+"""Phase 3 xlsx backend benchmark: native (zipfile) vs openpyxl (write-only).
+
+Command:
+  python benchmarks/bench_xlsx.py                      # 10k / 100k / 1M rows, both engines
+  python benchmarks/bench_xlsx.py --rows 10000,100000 --engines native
+
+Every (engine, rows) case runs in its own subprocess so import time and peak RSS
+are measured in isolation. Rows are generated lazily in the shape produced by
+`analysis_loader.chapter_rows_from_analysis` (slices + two summary rows per chunk).
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+
+_TEXT = "夜色压得很低，城墙上的火把被风吹得东倒西歪。少年握紧了手里的刀，远处传来一声凄厉的嚎叫。"
+
+
+def synthetic_rows(n: int, *, slices_per_chunk: int = 6, chunks_per_chapter: int = 12, seed: int = 7) -> Iterator[Dict[str, Any]]:
+    """Yield exactly n rows: slice rows, then 剧情概述/节奏概述 rows at the end of every chunk."""
+    rng = random.Random(seed)
+    emitted = 0
+    chapter = 0
+    while True:
+        chapter += 1
+        chapter_label = f"第{chapter}章 合成章节{chapter}"
+        for chunk in range(1, chunks_per_chapter + 1):
+            chunk_label = f"{chunk} 剧情块{chunk}"
+            for s in range(slices_per_chunk):
+                if emitted >= n:
+                    return
+                emitted += 1
+                yield {
+                    "章节": chapter_label,
+                    "剧情块": chunk_label,
+                    "起始段落": s * 4 + 1,
+                    "结束段落": s * 4 + 4,
+                    "内容概述": _TEXT[: rng.randint(10, len(_TEXT))],
+                    "节奏分析": _TEXT[: rng.randint(5, 30)],
+                    "爆点提取": "" if rng.random() < 0.4 else _TEXT[: rng.randint(5, 20)],
+                }
+            for label in ("剧情概述", "节奏概述"):
+                if emitted >= n:
+                    return
+                emitted += 1
+                yield {
+                    "章节": chapter_label,
+                    "剧情块": chunk_label,
+                    "起始段落": label,
+                    "结束段落": "",
+                    "内容概述": _TEXT * rng.randint(1, 4),
+                    "节奏分析": "",
+                    "爆点提取": "",
+                }
+
+
+def _peak_rss_mb() -> float:
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is KiB on Linux, bytes on macOS.
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def run_case(engine: str, rows: int, out_path: Path) -> Dict[str, Any]:
+    sys.path[:0] = [str(_REPO_ROOT / "phase3_excel"), str(_REPO_ROOT)]
+    t0 = time.perf_counter()
+    if engine == "openpyxl":
+        from xlsx_writer import build_workbook
+    else:
+        from native_xlsx import build_workbook
+    t1 = time.perf_counter()
+    wb = build_workbook(rows=synthetic_rows(rows))
+    t2 = time.perf_counter()
+    wb.save(out_path)
+    t3 = time.perf_counter()
+    return {
+        "engine": engine,
+        "rows": rows,
+        "import_s": round(t1 - t0, 3),
+        "build_s": round(t2 - t1, 3),
+        "save_s": round(t3 - t2, 3),
+        "total_s": round(t3 - t0, 3),
+        "rows_per_s": round(rows / (t3 - t1)) if t3 > t1 else 0,
+        "peak_rss_mb": round(_peak_rss_mb(), 1),
+        "size_mb": round(out_path.stat().st_size / 1e6, 2),
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the phase 3 xlsx backends.")
+    parser.add_argument("--rows", default="10000,100000,1000000", help="Comma-separated row counts")
+    parser.add_argument("--engines", default="native,openpyxl", help="Comma-separated: native,openpyxl")
+    parser.add_argument("--workdir", type=Path, default=None, help="Keep the generated xlsx files here")
+    parser.add_argument("--json", type=Path, default=None, help="Also write the results as JSON")
+    parser.add_argument("--case", default=None, help=argparse.SUPPRESS)  # internal: engine:rows:out_path
+    args = parser.parse_args(argv)
+
+    if args.case:
+        engine, rows, out = args.case.split(":", 2)
+        print(json.dumps(run_case(engine, int(rows), Path(out))))
+        return 0
+
+    row_counts = [int(x) for x in args.rows.split(",") if x.strip()]
+    engines = [e.strip() for e in args.engines.split(",") if e.strip()]
+    workdir = args.workdir or Path(tempfile.mkdtemp(prefix="tgc_bench_xlsx_"))
+    workdir.mkdir(parents=True, exist_ok=True)
+
+    results: List[Dict[str, Any]] = []
+    header = f"{'engine':<9} {'rows':>9} {'import_s':>9} {'build_s':>9} {'save_s':>8} {'total_s':>8} {'rows/s':>8} {'rss_mb':>8} {'size_mb':>8}"
+    print(header)
+    print("-" * len(header))
+    for rows in row_counts:
+        for engine in engines:
+            out = workdir / f"bench_{engine}_{rows}.xlsx"
+            proc = subprocess.run(
+                [sys.executable, __file__, "--case", f"{engine}:{rows}:{out}"],
+                capture_output=True,
+                text=True,
+                env={**os.environ, "PYTHONIOENCODING": "utf-8"},
+            )
+            if proc.returncode != 0:
+                print(f"{engine:<9} {rows:>9} FAILED: {proc.stderr.strip().splitlines()[-1:]}")
+                continue
+            r = json.loads(proc.stdout.strip().splitlines()[-1])
+            results.append(r)
+            print(
+                f"{engine:<9} {rows:>9} {r['import_s']:>9} {r['build_s']:>9} {r['save_s']:>8} {r['total_s']:>8} "
+                f"{r['rows_per_s']:>8} {r['peak_rss_mb']:>8} {r['size_mb']:>8}"
+            )
+            if args.workdir is None:
+                out.unlink(missing_ok=True)
+
+    if args.json is not None:
+        args.json.write_text(json.dumps(results, ensure_ascii=False, indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""Behaviour checks for the endpoint pool (llm_provider.balancer) against local mock servers.
+
+Command:
+  python benchmarks/check_balancer.py
+  python benchmarks/check_balancer.py --requests 400 --concurrency 8
+
+Three in-process mock Ark servers (llm_provider/mock_ark_server.py) form one
+pool: a fast member, a slow one (`--slow-ms`) and a fast one that fails most
+requests with 5xx (`--fail-rate`). Requests go through
+`pooled_chat_completions` from several threads and must all succeed (failover);
+the fast member must carry most of the traffic and the slow and failing members
+only a small share. A second pool pairs a member that always answers 429 (with
+`Retry-After: 1`) with a healthy one: the 429 member must not be called again
+until its cooldown ends and must be probed again afterwards. Cooldown doubling
+without Retry-After and `NoHealthyEndpoint` are checked on a fake clock.
+Exits non-zero on the first failed check.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, List, Optional
+
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
+
+from llm_provider.balancer import EndpointPool, NoHealthyEndpoint, pooled_chat_completions
+from llm_provider.llm_config import EndpointConfig, ProviderConfig
+from llm_provider.mock_ark_server import MockArkConfig, start_background
+from llm_provider.volc_ark_chat import ChatHTTPError, ChatMessage
+
+_MESSAGES = [ChatMessage(role="user", content='{"paragraph_id": 1, "text": "夜色压得很低。"}')]
+
+
+def expect(ok: bool, message: str) -> None:
+    if not ok:
+        raise SystemExit(f"FAIL {message}")
+    print(f"ok   {message}")
+
+
+def endpoint(name: str, server: Any, *, weight: float = 1.0) -> EndpointConfig:
+    base_url = f"http://127.0.0.1:{server.server_port}"
+    provider = ProviderConfig("volc_ark", base_url, "mock-key")
+    return EndpointConfig(name=name, provider=provider, model="mock-model", weight=weight)
+
+
+def check_routing(requests: int, concurrency: int, slow_ms: float, fail_rate: float) -> None:
+    servers = {
+        "fast": start_background(MockArkConfig(latency_ms=10, jitter_ms=0, seed=1)),
+        "slow": start_background(MockArkConfig(latency_ms=slow_ms, jitter_ms=0, seed=2)),
+        "failing": start_background(MockArkConfig(latency_ms=10, jitter_ms=0, rate_5xx=fail_rate, seed=3)),
+    }
+    try:
+        pool = EndpointPool([endpoint(name, s) for name, s in servers.items()])
+
+        def one(_: int) -> str:
+            return pooled_chat_completions(pool, messages=_MESSAGES, timeout_s=10).endpoint
+
+        with ThreadPoolExecutor(max_workers=concurrency) as ex:
+            winners = list(ex.map(one, range(requests)))
+    finally:
+        for s in servers.values():
+            s.shutdown()
+
+    sent = {name: s.stats.as_dict()["requests"] for name, s in servers.items()}  # type: ignore[attr-defined]
+    answered = {name: winners.count(name) for name in servers}
+    total = sum(sent.values())
+    print(f"     sent={sent} answered={answered}")
+    expect(len(winners) == requests, f"all {requests} requests succeeded via failover")
+    expect(sent["fast"] / total >= 0.6, f"fast member carries most traffic ({sent['fast'] / total:.0%} >= 60%)")
+    expect(sent["slow"] / total <= 0.2, f"slow member gets little traffic ({sent['slow'] / total:.0%} <= 20%)")
+    share = sent["failing"] / total
+    expect(share <= 0.25, f"failing member gets little traffic ({share:.0%} <= 25%)")
+    expect(answered["failing"] <= sent["failing"], "failed attempts were retried on other members")
+
+
+def check_retry_after() -> None:
+    limited = start_background(MockArkConfig(latency_ms=5, jitter_ms=0, rate_429=1.0))
+    healthy = start_background(MockArkConfig(latency_ms=5, jitter_ms=0))
+    try:
+        # "limited" is weighted up so it is picked whenever it is not cooling down.
+        pool = EndpointPool([endpoint("limited", limited, weight=100.0), endpoint("healthy", healthy)])
+        t0 = time.monotonic()
+        first = pooled_chat_completions(pool, messages=_MESSAGES, timeout_s=10)
+        expect(first.endpoint == "healthy" and first.retries == 1, "429 fails over to the healthy member")
+        cooling = pool.snapshot()[0]["cooling_down_s"]
+        expect(0.5 <= cooling <= 1.0, f"Retry-After: 1 sets the cooldown ({cooling}s)")
+
+        while time.monotonic() - t0 < 0.8:
+            pooled_chat_completions(pool, messages=_MESSAGES, timeout_s=10)
+        hits = limited.stats.as_dict()["http_429"]  # type: ignore[attr-defined]
+        expect(hits == 1, f"no calls to the 429 member during its cooldown (429s seen: {hits})")
+
+        time.sleep(max(0.0, 1.1 - (time.monotonic() - t0)))
+        pooled_chat_completions(pool, messages=_MESSAGES, timeout_s=10)
+        hits = limited.stats.as_dict()["http_429"]  # type: ignore[attr-defined]
+        expect(hits == 2, "the 429 member is probed again after the cooldown")
+    finally:
+        limited.shutdown()
+        healthy.shutdown()
+
+
+def check_cooldown_clock() -> None:
+    now = [0.0]
+    a = EndpointConfig(name="a", provider=ProviderConfig("volc_ark", "http://a", "k"), model="m")
+    b = EndpointConfig(name="b", provider=ProviderConfig("volc_ark", "http://b", "k"), model="m")
+    pool = EndpointPool([a, b], cooldown_s=15.0, max_cooldown_s=40.0, clock=lambda: now[0])
+
+    def fail_429(index: int) -> None:
+        lease = pool.acquire(exclude=[i for i in (0, 1) if i != index])
+        pool.release(lease, error=ChatHTTPError(429, "slow down"))
+
+    fail_429(0)
+    expect(pool.snapshot()[0]["cooling_down_s"] == 15.0, "first 429 without Retry-After cools down for cooldown_s")
+    expect(all(pool.acquire().index == 1 for _ in range(5)), "a cooling member is skipped")
+    now[0] = 15.0
+    fail_429(0)
+    expect(pool.snapshot()[0]["cooling_down_s"] == 30.0, "consecutive 429s double the cooldown")
+    now[0] = 45.0
+    fail_429(0)
+    expect(pool.snapshot()[0]["cooling_down_s"] == 40.0, "cooldown is capped at max_cooldown_s")
+    fail_429(1)
+    try:
+        pool.acquire()
+    except NoHealthyEndpoint as e:
+        expect(e.retry_in_s == 15.0, f"all members cooling -> NoHealthyEndpoint(retry_in_s={e.retry_in_s})")
+    else:
+        expect(False, "all members cooling -> NoHealthyEndpoint")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Check endpoint pool routing, failover and 429 cooldowns.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests through the 3-member pool")
+    parser.add_argument("--concurrency", type=int, default=4, help="Threads issuing requests")
+    parser.add_argument("--slow-ms", type=float, default=150.0, help="Latency of the slow member")
+    parser.add_argument("--fail-rate", type=float, default=0.7, help="5xx rate of the failing member")
+    args = parser.parse_args(argv)
+
+    check_cooldown_clock()
+    check_retry_after()
+    check_routing(args.requests, args.concurrency, args.slow_ms, args.fail_rate)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
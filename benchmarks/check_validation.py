@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""Regression checks for phase 2 output validation (validation.validate_analysis).
+
+Command:
+  python benchmarks/check_validation.py
+
+Slice bounds come straight from the model, so validation must stay fast and
+exact for hallucinated ranges (e.g. `end` = 300 million against 3 paragraphs),
+ranges that only partly overlap the chapter, and overlapping slices.
+Exits non-zero on the first failed check.
+"""
+
+from __future__ import annotations
+
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(_REPO_ROOT / "phase2_analysis") not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT / "phase2_analysis"))
+
+from validation import validate_analysis
+
+
+def make_analysis(slices: List[Tuple[int, int]]) -> Dict[str, Any]:
+    return {
+        "chapter_id": 1,
+        "chunks": [
+            {
+                "chunk_id": 1,
+                "chunk_title": "t",
+                "start_paragraph": slices[0][0],
+                "end_paragraph": slices[-1][1],
+                "slices": [
+                    {
+                        "slice_id": i,
+                        "start": start,
+                        "end": end,
+                        "content_summary": "s",
+                        "pacing_analysis": "p",
+                        "hook_extraction": "无",
+                    }
+                    for i, (start, end) in enumerate(slices, start=1)
+                ],
+                "plot_summary": "p",
+                "pacing_summary": "q",
+            }
+        ],
+    }
+
+
+def check(name: str, slices: List[Tuple[int, int]], ids: List[int], **expected: Any) -> None:
+    t0 = time.perf_counter()
+    res = validate_analysis(make_analysis(slices), ids)
+    elapsed = time.perf_counter() - t0
+    got = res.as_dict()
+    for k, v in expected.items():
+        if got[k] != v:
+            raise SystemExit(f"FAIL {name}: {k}={got[k]!r}, expected {v!r}")
+    if elapsed > 0.5:
+        raise SystemExit(f"FAIL {name}: took {elapsed:.2f}s")
+    print(f"ok   {name} ({elapsed * 1000:.2f} ms)")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    check("exact cover", [(1, 2), (3, 3)], [1, 2, 3], coverage=1.0, missing=0, out_of_range=0, overlaps=0)
+    check("huge end", [(1, 300_000_000)], [1, 2, 3], coverage=1.0, out_of_range=300_000_000 - 3)
+    check("huge negative start", [(-10**12, 2)], [1, 2, 3], coverage=round(2 / 3, 4), out_of_range=10**12 + 1)
+    check("partly outside", [(2, 5)], [1, 2, 3], coverage=round(2 / 3, 4), missing=1, out_of_range=2)
+    check("gaps in ids", [(1, 10)], [1, 4, 7], coverage=1.0, out_of_range=7)
+    check("overlaps", [(1, 3), (2, 3)], [1, 2, 3], coverage=1.0, overlaps=2, out_of_range=0)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
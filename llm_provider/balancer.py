@@ -0,0 +1,268 @@
+"""Route chat requests across a pool of endpoints/keys.
+
+Every member keeps a small amount of live state: in-flight count, an EWMA of
+recent latency and an EWMA of the error rate. `EndpointPool.acquire()` picks the
+member with the lowest expected cost (load x latency x error penalty / weight);
+members that answered 429 are cooled down and skipped until the cooldown ends.
+"""
+
+from __future__ import annotations
+
+import random
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence
+
+from .context_cache import PrefixCache
+from .hedging import Hedger
+from .llm_config import EndpointConfig
+from .volc_ark_chat import CallHandle, ChatHTTPError, ChatMessage, ChatResult, ChatTransportError, chat_completions
+
+
+@dataclass
+class _MemberState:
+    endpoint: EndpointConfig
+    in_flight: int = 0
+    ewma_latency_s: Optional[float] = None
+    ewma_error: float = 0.0
+    cooldown_until: float = 0.0
+    consecutive_429: int = 0
+    requests: int = 0
+    failures: int = 0
+
+
+@dataclass(frozen=True)
+class Lease:
+    """Handle returned by `EndpointPool.acquire`; pass it back to `release`."""
+
+    index: int
+    endpoint: EndpointConfig
+    started_at: float
+
+
+class NoHealthyEndpoint(RuntimeError):
+    """All pool members are cooling down (or already tried for this request)."""
+
+    def __init__(self, retry_in_s: Optional[float]) -> None:
+        super().__init__("No healthy endpoint in pool" + (f" (next in {retry_in_s:.1f}s)" if retry_in_s else ""))
+        self.retry_in_s = retry_in_s
+
+
+class EndpointPool:
+    """Thread-safe least-loaded/healthiest selection over `EndpointConfig`s."""
+
+    def __init__(
+        self,
+        endpoints: Sequence[EndpointConfig],
+        *,
+        ewma_alpha: float = 0.3,
+        cooldown_s: float = 15.0,
+        max_cooldown_s: float = 300.0,
+        error_penalty: float = 4.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if not endpoints:
+            raise ValueError("EndpointPool needs at least one endpoint")
+        self._members = [_MemberState(endpoint=e) for e in endpoints]
+        self._alpha = ewma_alpha
+        self._cooldown_s = cooldown_s
+        self._max_cooldown_s = max_cooldown_s
+        self._error_penalty = error_penalty
+        self._clock = clock
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._members)
+
+    def _score(self, m: _MemberState, default_latency: float) -> float:
+        latency = m.ewma_latency_s if m.ewma_latency_s is not None else default_latency
+        return (m.in_flight + 1) * max(latency, 0.001) * (1.0 + self._error_penalty * m.ewma_error) / m.endpoint.weight
+
+    def acquire(self, *, exclude: Sequence[int] = ()) -> Lease:
+        """Reserve the best member right now; raises `NoHealthyEndpoint` if none is usable."""
+        with self._lock:
+            now = self._clock()
+            candidates = [
+                (i, m) for i, m in enumerate(self._members) if i not in exclude and m.cooldown_until <= now
+            ]
+            if not candidates:
+                waits = [m.cooldown_until - now for i, m in enumerate(self._members) if i not in exclude]
+                raise NoHealthyEndpoint(min(waits) if waits else None)
+
+            known = [m.ewma_latency_s for _, m in candidates if m.ewma_latency_s is not None]
+            # Unmeasured members are scored optimistically so they get probed early.
+            default_latency = min(known) if known else 1.0
+            # Random tie-break keeps equal members from always resolving to the first one.
+            idx, member = min(candidates, key=lambda im: (self._score(im[1], default_latency), random.random()))
+            member.in_flight += 1
+            member.requests += 1
+            return Lease(index=idx, endpoint=member.endpoint, started_at=now)
+
+    def release(self, lease: Lease, *, error: Optional[BaseException] = None, cancelled: bool = False) -> None:
+        """Record the outcome of a leased request and update the member's health.
+
+        `cancelled` (e.g. a hedge that lost the race) only frees the slot.
+        """
+        with self._lock:
+            now = self._clock()
+            m = self._members[lease.index]
+            m.in_flight = max(0, m.in_flight - 1)
+            if cancelled:
+                return
+            elapsed = max(0.0, now - lease.started_at)
+            a = self._alpha
+
+            if error is None:
+                m.ewma_latency_s = elapsed if m.ewma_latency_s is None else (1 - a) * m.ewma_latency_s + a * elapsed
+                m.ewma_error = (1 - a) * m.ewma_error
+                m.consecutive_429 = 0
+                return
+
+            m.failures += 1
+            m.ewma_error = (1 - a) * m.ewma_error + a
+            if isinstance(error, ChatHTTPError) and error.status == 429:
+                m.consecutive_429 += 1
+                if error.retry_after_s is not None:
+                    backoff = error.retry_after_s
+                else:
+                    backoff = self._cooldown_s * (2 ** (m.consecutive_429 - 1))
+                m.cooldown_until = now + min(self._max_cooldown_s, backoff)
+            elif isinstance(error, ChatTransportError):
+                # A dead endpoint should not keep winning on its (stale) low latency.
+                m.ewma_latency_s = max(m.ewma_latency_s or 0.0, elapsed)
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Per-member stats for progress/diagnostic output."""
+        with self._lock:
+            now = self._clock()
+            return [
+                {
+                    "name": m.endpoint.name,
+                    "weight": m.endpoint.weight,
+                    "in_flight": m.in_flight,
+                    "ewma_latency_s": None if m.ewma_latency_s is None else round(m.ewma_latency_s, 3),
+                    "error_rate": round(m.ewma_error, 3),
+                    "cooling_down_s": round(max(0.0, m.cooldown_until - now), 1),
+                    "requests": m.requests,
+                    "failures": m.failures,
+                }
+                for m in self._members
+            ]
+
+
+def _is_retryable(error: BaseException) -> bool:
+    if isinstance(error, ChatHTTPError):
+        return error.status == 429 or error.status >= 500
+    return isinstance(error, ChatTransportError)
+
+
+def pooled_chat_completions(
+    pool: EndpointPool,
+    *,
+    messages: List[ChatMessage],
+    temperature: float = 0.2,
+    max_tokens: int = 10000,
+    thinking: Optional[Dict[str, Any]] = None,
+    timeout_s: int = 120,
+    max_attempts: Optional[int] = None,
+    max_wait_s: float = 60.0,
+    hedger: Optional[Hedger] = None,
+    max_retries: int = 0,
+    retry_backoff_s: float = 1.0,
+    prefix: Sequence[ChatMessage] = (),
+    context_cache: Optional[PrefixCache] = None,
+) -> ChatResult:
+    """`chat_completions` over a pool: fail over on 429/5xx/transport errors.
+
+    Each member is tried at most once per round; `max_retries` adds further
+    rounds with exponential backoff. When every remaining member is cooling
+    down, waits (up to `max_wait_s` in total) for the earliest one.
+    With a `hedger`, the timeout adapts to the model's latency percentiles and a
+    silent attempt may be raced by a hedge on another member.
+    `prefix` messages go before `messages`; with a `context_cache` they are sent
+    as a server-side context of the chosen member instead of inline.
+    """
+
+    attempts = max_attempts or len(pool)
+    tried: List[int] = []
+    waited = 0.0
+    last_error: Optional[BaseException] = None
+    failures = 0
+    started = time.perf_counter()
+
+    def call_member(lease: Lease, handle: CallHandle) -> ChatResult:
+        ep = lease.endpoint
+        timeout = hedger.timeout_for(ep.model, timeout_s) if hedger is not None else timeout_s
+        try:
+            if context_cache is not None and prefix:
+                result = context_cache.chat(
+                    ep,
+                    prefix=prefix,
+                    messages=messages,
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    thinking=thinking,
+                    timeout_s=timeout,
+                    handle=handle,
+                )
+            else:
+                result = chat_completions(
+                    base_url=ep.provider.base_url,
+                    api_key=ep.provider.api_key,
+                    model=ep.model,
+                    messages=[*prefix, *messages],
+                    temperature=temperature,
+                    max_tokens=max_tokens,
+                    thinking=thinking,
+                    timeout_s=timeout,
+                    handle=handle,
+                )
+        except Exception as e:
+            # A cancelled hedge loser is not the member's fault.
+            pool.release(lease, error=e, cancelled=handle.cancelled.is_set())
+            raise
+        pool.release(lease)
+        return result.with_(endpoint=ep.name)
+
+    def call_hedge(handle: CallHandle) -> ChatResult:
+        try:
+            lease = pool.acquire(exclude=tried)
+        except NoHealthyEndpoint:
+            # Only one usable member: hedge against the same endpoint/key.
+            lease = pool.acquire()
+        return call_member(lease, handle).with_(hedged=True)
+
+    for round_no in range(max(0, max_retries) + 1):
+        if round_no:
+            time.sleep(min(30.0, retry_backoff_s * (2 ** (round_no - 1))))
+            tried.clear()
+        while len(tried) < attempts:
+            try:
+                lease = pool.acquire(exclude=tried)
+            except NoHealthyEndpoint as e:
+                if e.retry_in_s is None or waited + e.retry_in_s > max_wait_s:
+                    if last_error is not None:
+                        raise last_error
+                    raise
+                time.sleep(e.retry_in_s)
+                waited += e.retry_in_s
+                continue
+
+            tried.append(lease.index)
+            try:
+                if hedger is None:
+                    result = call_member(lease, CallHandle())
+                else:
+                    result = hedger.call(lease.endpoint.model, lambda h: call_member(lease, h), call_hedge)
+            except Exception as e:
+                if not _is_retryable(e):
+                    raise
+                last_error = e
+                failures += 1
+                continue
+            # Latency as the caller saw it: includes failed attempts, backoff and cooldown waits.
+            return result.with_(retries=failures, latency_s=time.perf_counter() - started)
+
+    assert last_error is not None
+    raise last_error
@@ -0,0 +1,211 @@
+"""Server-side prefix caching (Volc Ark Context API, `common_prefix` mode).
+
+Phase 2 sends the same system message (system.md + the static requirement and
+schema sections of the prompt template) with every chapter. `PrefixCache`
+creates one context per (endpoint, model, prefix), sends only the per-chapter
+messages with its id, and recreates it before it expires or when the server no
+longer knows it. Endpoints that reject the context API (4xx on create, or on a
+freshly created context) are remembered and served with plain calls instead.
+"""
+
+from __future__ import annotations
+
+import hashlib
+import threading
+import time
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+from .llm_config import EndpointConfig
+from .volc_ark_chat import (
+    CallHandle,
+    ChatHTTPError,
+    ChatMessage,
+    ChatResult,
+    ContextInfo,
+    chat_completions,
+    create_context,
+)
+
+
+def _rejected(error: BaseException) -> bool:
+    """4xx other than 429: the endpoint refuses this context (unknown, expired or unsupported)."""
+    return isinstance(error, ChatHTTPError) and 400 <= error.status < 500 and error.status != 429
+
+
+def prefix_key(ep: EndpointConfig, prefix: Sequence[ChatMessage]) -> Tuple[str, str, str, str]:
+    h = hashlib.sha256()
+    for m in prefix:
+        h.update(f"{m.role}\0{m.content}\0".encode("utf-8"))
+    key_id = hashlib.sha256(ep.provider.api_key.encode("utf-8")).hexdigest()[:12]
+    return ep.provider.base_url.rstrip("/"), key_id, ep.model, h.hexdigest()
+
+
+@dataclass
+class _Slot:
+    lock: threading.Lock
+    context: Optional[ContextInfo] = None
+    expires_at: float = 0.0
+    unsupported: bool = False
+    retry_at: float = 0.0  # after a transient create failure, plain calls until then
+
+
+class PrefixCache:
+    """Thread-safe map of prefixes to live context ids, with fallback to plain calls.
+
+    Contexts are refreshed `refresh_margin_s` before `ttl_s` runs out (counted from
+    creation, so a context is never used right at its expiry). After a transient
+    create failure (429/5xx/transport) the prefix is sent inline for `retry_after_s`.
+    """
+
+    def __init__(
+        self,
+        *,
+        ttl_s: int = 3600,
+        refresh_margin_s: float = 60.0,
+        retry_after_s: float = 60.0,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.ttl_s = ttl_s
+        self._margin = min(refresh_margin_s, ttl_s / 2)
+        self._retry_after_s = retry_after_s
+        self._clock = clock
+        self._slots: Dict[Tuple[str, str, str, str], _Slot] = {}
+        self._lock = threading.Lock()
+        self._stats = {
+            "cached_calls": 0,
+            "plain_calls": 0,
+            "creates": 0,
+            "refreshes": 0,
+            "create_failures": 0,
+            "create_tokens": 0,
+            "cached_tokens": 0,
+            "unreported_calls": 0,
+        }
+
+    def _slot(self, key: Tuple[str, str, str, str]) -> _Slot:
+        with self._lock:
+            slot = self._slots.get(key)
+            if slot is None:
+                slot = self._slots[key] = _Slot(lock=threading.Lock())
+            return slot
+
+    def _count(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self._stats[name] += n
+
+    def _context_for(
+        self, slot: _Slot, ep: EndpointConfig, prefix: Sequence[ChatMessage], *, stale: Optional[str], timeout_s: float
+    ) -> Optional[ContextInfo]:
+        """Live context for the slot (created/refreshed as needed); None means "send the prefix inline"."""
+        with slot.lock:
+            now = self._clock()
+            if slot.unsupported or now < slot.retry_at:
+                return None
+            ctx = slot.context
+            # A context other than `stale` may have been created meanwhile by another thread.
+            if ctx is not None and ctx.id != stale and now < slot.expires_at:
+                return ctx
+            refresh = ctx is not None
+            try:
+                ctx = create_context(
+                    base_url=ep.provider.base_url,
+                    api_key=ep.provider.api_key,
+                    model=ep.model,
+                    messages=list(prefix),
+                    ttl_s=self.ttl_s,
+                    timeout_s=timeout_s,
+                )
+            except Exception as e:
+                slot.context = None
+                self._count("create_failures")
+                if _rejected(e):
+                    slot.unsupported = True
+                else:
+                    slot.retry_at = now + self._retry_after_s
+                return None
+            slot.context = ctx
+            slot.expires_at = now + max(1.0, ctx.ttl_s - self._margin)
+            self._count("creates")
+            self._count("create_tokens", ctx.prompt_tokens)
+            if refresh:
+                self._count("refreshes")
+            return ctx
+
+    def chat(
+        self,
+        ep: EndpointConfig,
+        *,
+        prefix: Sequence[ChatMessage],
+        messages: Sequence[ChatMessage],
+        temperature: float = 0.2,
+        max_tokens: int = 10000,
+        thinking: Optional[Dict[str, Any]] = None,
+        timeout_s: float = 120,
+        handle: Optional[CallHandle] = None,
+    ) -> ChatResult:
+        """`chat_completions(prefix + messages)` on `ep`, with the prefix served from a context cache when possible."""
+        params: Dict[str, Any] = dict(
+            base_url=ep.provider.base_url,
+            api_key=ep.provider.api_key,
+            model=ep.model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            thinking=thinking,
+            timeout_s=timeout_s,
+            handle=handle,
+        )
+        slot = self._slot(prefix_key(ep, prefix))
+        stale: Optional[str] = None
+        for _ in range(2):
+            ctx = self._context_for(slot, ep, prefix, stale=stale, timeout_s=timeout_s)
+            if ctx is None:
+                break
+            try:
+                result = chat_completions(messages=list(messages), context_id=ctx.id, **params)
+            except Exception as e:
+                if not _rejected(e) or (handle is not None and handle.cancelled.is_set()):
+                    raise
+                if stale is not None:
+                    # Even a brand-new context is refused: this endpoint cannot use the context API.
+                    with slot.lock:
+                        slot.unsupported, slot.context = True, None
+                    break
+                stale = ctx.id
+                continue
+            self._count("cached_calls")
+            if result.cached_tokens is None:
+                # The server did not report cache usage: leave it unknown rather than assume a full hit.
+                self._count("unreported_calls")
+            else:
+                self._count("cached_tokens", result.cached_tokens)
+            return result
+
+        self._count("plain_calls")
+        return chat_completions(messages=[*prefix, *messages], **params)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters plus `saved_tokens` = prompt tokens read from cache minus tokens spent creating caches.
+
+        Only cache reads the server reported count; `unreported_calls` used a context but came back
+        without `prompt_tokens_details.cached_tokens`.
+        """
+        with self._lock:
+            out: Dict[str, Any] = dict(self._stats)
+            out["unsupported"] = sorted({f"{k[0]} {k[2]}" for k, s in self._slots.items() if s.unsupported})
+        out["saved_tokens"] = out["cached_tokens"] - out["create_tokens"]
+        return out
+
+
+def merge_stats(stats: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Sum `PrefixCache.stats()` of several caches (e.g. one per cascade tier)."""
+    out: Dict[str, Any] = {}
+    unsupported: List[str] = []
+    for s in stats:
+        for k, v in s.items():
+            if k == "unsupported":
+                unsupported.extend(v)
+            else:
+                out[k] = out.get(k, 0) + v
+    out["unsupported"] = sorted(set(unsupported))
+    return out
@@ -0,0 +1,175 @@
+"""Tail-latency control: per-model latency percentiles, adaptive timeouts, hedged requests.
+
+A hedge is a duplicate of a request that is still silent (no response bytes)
+after the model's observed p95 latency. Whichever copy answers first wins and
+the other is cancelled. Hedges are limited by `HedgeBudget` so the extra cost
+stays a bounded fraction of all requests.
+"""
+
+from __future__ import annotations
+
+import math
+import queue
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple, TypeVar
+
+from .volc_ark_chat import CallHandle
+
+T = TypeVar("T")
+
+
+class LatencyTracker:
+    """Sliding window of recent successful latencies, per model."""
+
+    def __init__(self, *, window: int = 200) -> None:
+        self._window = window
+        self._samples: Dict[str, Deque[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, model: str, latency_s: float) -> None:
+        with self._lock:
+            d = self._samples.get(model)
+            if d is None:
+                d = self._samples[model] = deque(maxlen=self._window)
+            d.append(latency_s)
+
+    def count(self, model: str) -> int:
+        with self._lock:
+            return len(self._samples.get(model) or ())
+
+    def percentile(self, model: str, p: float) -> Optional[float]:
+        """Nearest-rank percentile (p in 0..100); None without samples."""
+        with self._lock:
+            values = sorted(self._samples.get(model) or ())
+        if not values:
+            return None
+        rank = max(1, math.ceil(p / 100.0 * len(values)))
+        return values[min(rank, len(values)) - 1]
+
+
+class HedgeBudget:
+    """Allow at most `ratio` hedges per primary request (plus a small burst)."""
+
+    def __init__(self, ratio: float, *, burst: int = 1) -> None:
+        self.ratio = max(0.0, ratio)
+        self.burst = burst if ratio > 0 else 0
+        self.requests = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def on_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def try_acquire(self) -> bool:
+        with self._lock:
+            if self.hedges + 1 > self.ratio * self.requests + self.burst:
+                return False
+            self.hedges += 1
+            return True
+
+
+class Hedger:
+    """Runs calls with an adaptive timeout and, when allowed, one hedged duplicate."""
+
+    def __init__(
+        self,
+        *,
+        budget_ratio: float = 0.0,
+        hedge_percentile: float = 95.0,
+        adaptive_timeout: bool = False,
+        timeout_percentile: float = 99.0,
+        timeout_multiplier: float = 3.0,
+        min_timeout_s: float = 20.0,
+        min_samples: int = 8,
+        tracker: Optional[LatencyTracker] = None,
+    ) -> None:
+        self.tracker = tracker or LatencyTracker()
+        self.budget = HedgeBudget(budget_ratio)
+        self.hedge_percentile = hedge_percentile
+        self.adaptive_timeout = adaptive_timeout
+        self.timeout_percentile = timeout_percentile
+        self.timeout_multiplier = timeout_multiplier
+        self.min_timeout_s = min_timeout_s
+        self.min_samples = min_samples
+
+    def timeout_for(self, model: str, ceiling_s: float) -> float:
+        """p99 x multiplier, clamped to [min_timeout_s, ceiling_s]; the ceiling until warmed up."""
+        if not self.adaptive_timeout or self.tracker.count(model) < self.min_samples:
+            return ceiling_s
+        p = self.tracker.percentile(model, self.timeout_percentile) or ceiling_s
+        return min(ceiling_s, max(self.min_timeout_s, p * self.timeout_multiplier))
+
+    def hedge_delay(self, model: str) -> Optional[float]:
+        if self.budget.ratio <= 0 or self.tracker.count(model) < self.min_samples:
+            return None
+        return self.tracker.percentile(model, self.hedge_percentile)
+
+    def call(
+        self,
+        model: str,
+        primary: Callable[[CallHandle], T],
+        hedge: Callable[[CallHandle], T],
+    ) -> T:
+        """Run `primary`; if it is still silent after the hedge delay, race `hedge` against it."""
+        self.budget.on_request()
+        started = time.monotonic()
+        delay = self.hedge_delay(model)
+
+        if delay is None:
+            result = primary(CallHandle())
+            self.tracker.observe(model, time.monotonic() - started)
+            return result
+
+        results: "queue.Queue[Tuple[int, bool, object]]" = queue.Queue()
+        handles: List[CallHandle] = []
+
+        def launch(fn: Callable[[CallHandle], T]) -> None:
+            h = CallHandle()
+            idx = len(handles)
+            handles.append(h)
+
+            def run() -> None:
+                t0 = time.monotonic()
+                try:
+                    value = fn(h)
+                except BaseException as e:  # noqa: BLE001 - forwarded to the caller
+                    results.put((idx, False, e))
+                    return
+                self.tracker.observe(model, time.monotonic() - t0)
+                results.put((idx, True, value))
+
+            threading.Thread(target=run, name=f"llm-call-{idx}", daemon=True).start()
+
+        launch(primary)
+        pending = 1
+        hedged = False
+        first_error: Optional[BaseException] = None
+
+        while pending:
+            wait = None
+            if not hedged:
+                wait = max(0.0, delay - (time.monotonic() - started))
+            try:
+                idx, ok, value = results.get(timeout=wait)
+            except queue.Empty:
+                hedged = True
+                # Bytes already flowing means the primary is generating, not stalled.
+                if not handles[0].first_byte.is_set() and self.budget.try_acquire():
+                    launch(hedge)
+                    pending += 1
+                continue
+
+            pending -= 1
+            if ok:
+                for i, h in enumerate(handles):
+                    if i != idx:
+                        h.cancel()
+                return value  # type: ignore[return-value]
+            if first_error is None:
+                first_error = value  # type: ignore[assignment]
+
+        assert first_error is not None
+        raise first_error
@@ -2,9 +2,9 @@
 
 import json
 import os
-from dataclasses import dataclass, field
+from dataclasses import dataclass, field, replace
 from pathlib import Path
-from typing import Any, Dict, Optional, Tuple
+from typing import Any, Dict, List, Optional, Tuple
 
 
 @dataclass(frozen=True)
@@ -23,17 +23,50 @@ class ChatParams:
     temperature: float = 0.2
     max_tokens: int = 10000
     timeout_s: int = 120
+    max_retries: int = 0  # extra rounds for 429/5xx/transport errors
+    json_retries: int = 0  # phase 2 re-asks when the last tier's output is not valid JSON
     thinking: Dict[str, Any] = field(default_factory=lambda: {"type": "disabled"})
+    # Tail-latency control (see llm_provider.hedging). timeout_s stays the upper bound.
+    adaptive_timeout: bool = False
+    hedge_budget: float = 0.0
+    hedge_percentile: float = 95.0
+    # Server-side cache of the static prompt prefix (see llm_provider.context_cache).
+    context_cache: bool = False
+    context_ttl_s: int = 3600
+
+
+@dataclass(frozen=True)
+class EndpointConfig:
+    """One member of a profile's endpoint/key pool."""
+
+    name: str
+    provider: ProviderConfig
+    model: str
+    weight: float = 1.0
 
 
 @dataclass(frozen=True)
 class ChatRunConfig:
-    """Resolved runtime config for one chat invocation."""
+    """Resolved runtime config for one chat invocation.
+
+    `pool` always has at least one member; without a `pool` in the profile it is
+    just the resolved provider/model.
+    """
 
     provider_name: str
     provider: ProviderConfig
     model: str
     params: ChatParams
+    pool: Tuple[EndpointConfig, ...] = ()
+    profile_name: str = ""
+    # Model cascade: stronger tiers tried when this one's output fails validation.
+    escalation: Tuple["ChatRunConfig", ...] = ()
+    quality_threshold: float = 0.0
+    min_coverage: float = 0.95
+
+    @property
+    def tiers(self) -> Tuple["ChatRunConfig", ...]:
+        return (self,) + self.escalation
 
 
 def _load_json(path: Path) -> Dict[str, Any]:
@@ -75,6 +108,76 @@ def load_provider_config(path: Path, provider_name: str) -> Tuple[ProviderConfig
     return provider, default_model
 
 
+def _load_pool(
+    path: Path,
+    pool_obj: Any,
+    *,
+    profile_model: str,
+    override_model: str = "",
+) -> List[EndpointConfig]:
+    """Resolve profiles.<name>.pool entries into endpoints.
+
+    Each entry references a provider and may override base_url / api_key / model:
+
+      {"provider": "volc_doubao", "api_key": "VOLC_ARK_API_KEY_2", "weight": 2}
+
+    Member model: `override_model` (CLI --model), else the entry's model, else
+    the profile's model, else the provider default.
+    """
+
+    if not isinstance(pool_obj, list) or not pool_obj:
+        raise RuntimeError(f"profiles.<name>.pool must be a non-empty list in {path}")
+
+    endpoints: List[EndpointConfig] = []
+    for i, entry in enumerate(pool_obj, start=1):
+        if not isinstance(entry, dict) or not entry.get("provider"):
+            raise RuntimeError(f"pool[{i}] must be an object with a provider name in {path}")
+        provider_name = str(entry["provider"])
+        prov, provider_default_model = load_provider_config(path, provider_name)
+        if entry.get("base_url") or entry.get("api_key"):
+            api_key = _resolve_api_key(entry.get("api_key") or "") or prov.api_key
+            prov = ProviderConfig(
+                type=prov.type,
+                base_url=str(entry.get("base_url") or prov.base_url),
+                api_key=api_key,
+            )
+        member_model = override_model or str(entry.get("model") or "") or profile_model or provider_default_model
+        if not member_model:
+            raise RuntimeError(f"Missing model for pool[{i}] (provider={provider_name}) in {path}")
+        weight = float(entry.get("weight", 1.0))
+        if weight <= 0:
+            raise RuntimeError(f"pool[{i}].weight must be > 0 in {path}")
+        endpoints.append(
+            EndpointConfig(
+                name=str(entry.get("name") or f"{provider_name}#{i}"),
+                provider=prov,
+                model=member_model,
+                weight=weight,
+            )
+        )
+    return endpoints
+
+
+def _load_cascade(path: Path, name: str, profile_obj: Dict[str, Any], profiles: Dict[str, Any]) -> ChatRunConfig:
+    tier_names = profile_obj.get("cascade")
+    if not isinstance(tier_names, list) or not tier_names or not all(isinstance(t, str) and t for t in tier_names):
+        raise RuntimeError(f"profiles.{name}.cascade must be a non-empty list of profile names in {path}")
+    for t in tier_names:
+        tier_obj = profiles.get(t)
+        if not isinstance(tier_obj, dict):
+            raise RuntimeError(f"profiles.{name}.cascade references unknown profile {t} in {path}")
+        if "cascade" in tier_obj:
+            raise RuntimeError(f"profiles.{name}.cascade: nested cascade profile {t} in {path}")
+
+    tiers = [load_chat_run_config(path, profile=t) for t in tier_names]
+    return replace(
+        tiers[0],
+        escalation=tuple(tiers[1:]),
+        quality_threshold=float(profile_obj.get("quality_threshold", 0.0)),
+        min_coverage=float(profile_obj.get("min_coverage", ChatRunConfig.min_coverage)),
+    )
+
+
 def load_chat_run_config(
     path: Path,
     *,
@@ -98,6 +201,14 @@ def load_chat_run_config(
         "default_profile": "phase2"
       }
 
+    A profile may list `"pool": [{"provider": ..., "api_key": ..., "weight": ...}, ...]`
+    instead of a single provider; requests are then balanced across the members
+    (see llm_provider.balancer).
+
+    A profile may instead be a cascade of other profiles, cheapest first:
+    `{"cascade": ["phase2_fast", "phase2_doubao"], "quality_threshold": 0.8}`.
+    The first tier is returned with the rest in `escalation`.
+
     Backward compatible:
     - If profiles are missing, fall back to providers.<provider>.model.
     """
@@ -117,21 +228,54 @@ def load_chat_run_config(
 
     profile_obj = profiles.get(chosen_profile) if chosen_profile else None
 
+    if isinstance(profile_obj, dict) and "cascade" in profile_obj and not (provider or model):
+        return _load_cascade(path, str(chosen_profile), profile_obj, profiles)
+
     provider_name: Optional[str] = None
     chosen_model = ""
     params_obj: Dict[str, Any] = {}
+    pool_obj: Any = None
 
     if isinstance(profile_obj, dict):
         provider_name = str(profile_obj.get("provider") or "") or None
         chosen_model = str(profile_obj.get("model") or "")
         params_obj = profile_obj.get("params") or {}
+        pool_obj = profile_obj.get("pool")
 
     # CLI overrides (optional)
     if provider:
         provider_name = provider
+        pool_obj = None  # an explicit provider means "just this one"
     if model:
         chosen_model = model
 
+    params = ChatParams(
+        temperature=float(params_obj.get("temperature", ChatParams.temperature)),
+        max_tokens=int(params_obj.get("max_tokens", ChatParams.max_tokens)),
+        timeout_s=int(params_obj.get("timeout_s", ChatParams.timeout_s)),
+        max_retries=int(params_obj.get("max_retries", ChatParams.max_retries)),
+        json_retries=int(params_obj.get("json_retries", ChatParams.json_retries)),
+        thinking=dict(params_obj.get("thinking", ChatParams().thinking)),
+        adaptive_timeout=bool(params_obj.get("adaptive_timeout", ChatParams.adaptive_timeout)),
+        hedge_budget=float(params_obj.get("hedge_budget", ChatParams.hedge_budget)),
+        hedge_percentile=float(params_obj.get("hedge_percentile", ChatParams.hedge_percentile)),
+        context_cache=bool(params_obj.get("context_cache", ChatParams.context_cache)),
+        context_ttl_s=int(params_obj.get("context_ttl_s", ChatParams.context_ttl_s)),
+    )
+
+    if pool_obj is not None:
+        profile_model = str(profile_obj.get("model") or "") if isinstance(profile_obj, dict) else ""
+        pool = _load_pool(path, pool_obj, profile_model=profile_model, override_model=model or "")
+        first = pool[0]
+        return ChatRunConfig(
+            provider_name=first.name,
+            provider=first.provider,
+            model=first.model,
+            params=params,
+            pool=tuple(pool),
+            profile_name=str(chosen_profile or ""),
+        )
+
     # Provider fallback
     if not provider_name:
         default_provider = data.get("default_provider")
@@ -153,16 +297,12 @@ def load_chat_run_config(
             f"Missing model. Set providers.{provider_name}.model or profiles.<name>.model in {path}"
         )
 
-    params = ChatParams(
-        temperature=float(params_obj.get("temperature", ChatParams.temperature)),
-        max_tokens=int(params_obj.get("max_tokens", ChatParams.max_tokens)),
-        timeout_s=int(params_obj.get("timeout_s", ChatParams.timeout_s)),
-        thinking=dict(params_obj.get("thinking", ChatParams().thinking)),
-    )
-
     return ChatRunConfig(
         provider_name=provider_name,
         provider=prov,
         model=chosen_model,
         params=params,
+        pool=(EndpointConfig(name=provider_name, provider=prov, model=chosen_model),),
+        profile_name=str(chosen_profile or ""),
     )
+
@@ -0,0 +1,378 @@
+"""Offline stand-in for the Volc Ark `/api/v3/chat/completions` endpoint.
+
+Answers with a schema-valid chapter analysis built from the JSONL paragraphs in
+the user prompt (chunks of ~8 paragraphs, slices of ~3), so phase 2/3 can run
+without network access. Faults can be injected per request: latency, 429, 5xx,
+truncated content and malformed JSON.
+
+The context API (`/api/v3/context/create`, `/api/v3/context/chat/completions`) is
+emulated too: contexts live in memory until their TTL (capped by
+`--context-ttl-s`) runs out, cached prefix tokens are reported in
+`usage.prompt_tokens_details.cached_tokens`, and `--prefill-ms-per-1k` charges
+latency only for uncached prompt tokens. `--no-context-api` answers 404 instead.
+
+Command:
+  python -m llm_provider.mock_ark_server --port 8765 --latency-ms 300 --rate-429 0.05
+  python -m llm_provider.mock_ark_server --port 8765 --prefill-ms-per-1k 50 --context-ttl-s 30
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+_CHAPTER_ID_RE = re.compile(r"chapter_id\s*必须为\s*(\d+)")
+
+
+@dataclass
+class MockArkConfig:
+    """Latency and fault injection knobs (rates are per-request probabilities)."""
+
+    latency_ms: float = 200.0
+    jitter_ms: float = 100.0
+    rate_429: float = 0.0
+    rate_5xx: float = 0.0
+    rate_truncate: float = 0.0
+    rate_malformed: float = 0.0
+    chunk_size: int = 8
+    slice_size: int = 3
+    seed: Optional[int] = None
+    context_api: bool = True
+    context_ttl_s: float = 0.0  # > 0 caps the TTL requested on context/create
+    prefill_ms_per_1k: float = 0.0  # extra latency per 1k uncached prompt tokens
+
+
+@dataclass
+class MockArkStats:
+    """Counters updated by the handler threads (read them after a run)."""
+
+    requests: int = 0
+    ok: int = 0
+    http_429: int = 0
+    http_5xx: int = 0
+    truncated: int = 0
+    malformed: int = 0
+    contexts_created: int = 0
+    context_calls: int = 0
+    context_missing: int = 0
+    cached_tokens: int = 0
+    latencies_s: List[float] = field(default_factory=list)
+    lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def as_dict(self) -> Dict[str, int]:
+        with self.lock:
+            return {
+                "requests": self.requests,
+                "ok": self.ok,
+                "http_429": self.http_429,
+                "http_5xx": self.http_5xx,
+                "truncated": self.truncated,
+                "malformed": self.malformed,
+                "contexts_created": self.contexts_created,
+                "context_calls": self.context_calls,
+                "context_missing": self.context_missing,
+                "cached_tokens": self.cached_tokens,
+            }
+
+
+def parse_prompt_paragraphs(prompt: str) -> List[Tuple[int, str]]:
+    """Pick the `{"paragraph_id": .., "text": ..}` lines out of a rendered prompt."""
+    out: List[Tuple[int, str]] = []
+    for line in prompt.splitlines():
+        line = line.strip()
+        if not (line.startswith("{") and '"paragraph_id"' in line):
+            continue
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if isinstance(obj, dict) and isinstance(obj.get("paragraph_id"), int):
+            out.append((obj["paragraph_id"], str(obj.get("text") or "")))
+    return out
+
+
+def _clip(text: str, n: int = 24) -> str:
+    text = text.strip()
+    return text if len(text) <= n else text[:n] + "…"
+
+
+def build_mock_analysis(
+    paragraphs: List[Tuple[int, str]],
+    *,
+    chapter_id: int,
+    chunk_size: int = 8,
+    slice_size: int = 3,
+) -> Dict[str, Any]:
+    """Chapter analysis that covers every paragraph exactly once (the prompt_1/prompt_23 schema)."""
+    chunks: List[Dict[str, Any]] = []
+    for ci, c_start in enumerate(range(0, len(paragraphs), chunk_size), start=1):
+        block = paragraphs[c_start : c_start + chunk_size]
+        slices = []
+        for si, s_start in enumerate(range(0, len(block), slice_size), start=1):
+            part = block[s_start : s_start + slice_size]
+            text = "".join(t for _, t in part)
+            hook = "无"
+            if "！" in text or "?" in text or "？" in text:
+                hook = f"情绪爆发：{_clip(text, 16)}"
+            slices.append(
+                {
+                    "slice_id": si,
+                    "start": part[0][0],
+                    "end": part[-1][0],
+                    "content_summary": _clip(text),
+                    "pacing_analysis": "对话推进" if "“" in text else "叙述铺垫",
+                    "hook_extraction": hook,
+                }
+            )
+        chunks.append(
+            {
+                "chunk_id": ci,
+                "chunk_title": _clip(block[0][1], 8) or f"剧情块{ci}",
+                "start_paragraph": block[0][0],
+                "end_paragraph": block[-1][0],
+                "slices": slices,
+                "plot_summary": _clip("".join(t for _, t in block), 60),
+                "pacing_summary": f"{len(slices)} 个片段，平均 {len(block) / max(1, len(slices)):.1f} 段",
+            }
+        )
+    return {"chapter_id": chapter_id, "chunks": chunks}
+
+
+def _estimate_tokens(text: str) -> int:
+    # Rough: CJK ~1 token per char, other text ~4 chars per token.
+    cjk = sum(1 for ch in text if ord(ch) > 0x2E80)
+    return cjk + (len(text) - cjk) // 4
+
+
+def make_handler(cfg: MockArkConfig, stats: MockArkStats, rng: random.Random):
+    rng_lock = threading.Lock()
+    contexts: Dict[str, Tuple[List[Dict[str, Any]], int, float]] = {}  # id -> (messages, tokens, expires_at)
+    contexts_lock = threading.Lock()
+
+    def roll(rate: float) -> bool:
+        with rng_lock:
+            return rate > 0 and rng.random() < rate
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+        # Headers and body go out in separate writes; without TCP_NODELAY a kept-alive
+        # client would wait on delayed ACK (~40ms) for every response.
+        disable_nagle_algorithm = True
+
+        def log_message(self, format: str, *args: Any) -> None:  # noqa: A002 - stdlib signature
+            pass
+
+        def _send(self, status: int, obj: Any, *, headers: Optional[Dict[str, str]] = None) -> None:
+            body = (obj if isinstance(obj, str) else json.dumps(obj, ensure_ascii=False)).encode("utf-8")
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                for k, v in (headers or {}).items():
+                    self.send_header(k, v)
+                self.end_headers()
+                self.wfile.write(body)
+            except OSError:
+                pass  # client hung up (e.g. a cancelled hedge)
+
+        def _create_context(self, req: Dict[str, Any]) -> None:
+            messages = list(req.get("messages") or [])
+            ttl = float(req.get("ttl") or 3600)
+            if cfg.context_ttl_s > 0:
+                ttl = min(ttl, cfg.context_ttl_s)
+            tokens = sum(_estimate_tokens(str(x.get("content") or "")) for x in messages)
+            context_id = f"ctx-{uuid.uuid4().hex[:16]}"
+            with contexts_lock:
+                contexts[context_id] = (messages, tokens, time.monotonic() + ttl)
+            with stats.lock:
+                stats.contexts_created += 1
+            time.sleep(cfg.prefill_ms_per_1k * tokens / 1e6)
+            self._send(
+                200,
+                {
+                    "id": context_id,
+                    "model": str(req.get("model") or ""),
+                    "mode": str(req.get("mode") or "common_prefix"),
+                    "ttl": int(ttl),
+                    "usage": {"prompt_tokens": tokens, "completion_tokens": 0, "total_tokens": tokens},
+                },
+            )
+
+        def do_POST(self) -> None:  # noqa: N802 - stdlib naming
+            t0 = time.monotonic()
+            length = int(self.headers.get("Content-Length") or 0)
+            raw = self.rfile.read(length)
+            route = self.path.rstrip("/")
+            is_context = "/context/" in route
+            if not (route.endswith("/chat/completions") or route.endswith("/context/create")) or (
+                is_context and not cfg.context_api
+            ):
+                self._send(404, {"error": {"code": "NotFound", "message": self.path}})
+                return
+            try:
+                req = json.loads(raw.decode("utf-8"))
+                messages = req.get("messages") or []
+                prompt = str(messages[-1].get("content") or "") if messages else ""
+            except Exception:
+                self._send(400, {"error": {"code": "InvalidParameter", "message": "bad json body"}})
+                return
+            if route.endswith("/context/create"):
+                self._create_context(req)
+                return
+
+            cached_tokens = 0
+            if is_context:
+                with contexts_lock:
+                    ctx = contexts.get(str(req.get("context_id") or ""))
+                    if ctx is not None and ctx[2] <= time.monotonic():
+                        contexts.pop(str(req.get("context_id")), None)
+                        ctx = None
+                if ctx is None:
+                    with stats.lock:
+                        stats.context_missing += 1
+                    error = {"code": "NotFound.ContextId", "message": "context not found or expired"}
+                    self._send(404, {"error": error})
+                    return
+                cached_tokens = ctx[1]
+                with stats.lock:
+                    stats.context_calls += 1
+                    stats.cached_tokens += cached_tokens
+
+            with stats.lock:
+                stats.requests += 1
+
+            new_tokens = sum(_estimate_tokens(str(x.get("content") or "")) for x in messages)
+            with rng_lock:
+                delay = max(0.0, cfg.latency_ms + rng.uniform(-cfg.jitter_ms, cfg.jitter_ms)) / 1000.0
+            delay += cfg.prefill_ms_per_1k * new_tokens / 1e6
+
+            if roll(cfg.rate_429):
+                with stats.lock:
+                    stats.http_429 += 1
+                self._send(429, {"error": {"code": "RateLimitExceeded", "message": "mock 429"}}, headers={"Retry-After": "1"})
+                return
+            time.sleep(delay)
+            if roll(cfg.rate_5xx):
+                with stats.lock:
+                    stats.http_5xx += 1
+                self._send(503, {"error": {"code": "ServiceUnavailable", "message": "mock 5xx"}})
+                return
+
+            m = _CHAPTER_ID_RE.search(prompt)
+            chapter_id = int(m.group(1)) if m else 1
+            analysis = build_mock_analysis(
+                parse_prompt_paragraphs(prompt),
+                chapter_id=chapter_id,
+                chunk_size=cfg.chunk_size,
+                slice_size=cfg.slice_size,
+            )
+            content = json.dumps(analysis, ensure_ascii=False, indent=2)
+            finish_reason = "stop"
+            if roll(cfg.rate_truncate):
+                with stats.lock:
+                    stats.truncated += 1
+                content = content[: max(1, len(content) // 2)]
+                finish_reason = "length"
+            elif roll(cfg.rate_malformed):
+                with stats.lock:
+                    stats.malformed += 1
+                content = content.replace('"slices":', '"slices"', 1)
+
+            prompt_tokens = cached_tokens + new_tokens
+            completion_tokens = _estimate_tokens(content)
+            self._send(
+                200,
+                {
+                    "id": f"mock-{uuid.uuid4().hex[:16]}",
+                    "object": "chat.completion",
+                    "created": int(time.time()),
+                    "model": str(req.get("model") or ""),
+                    "choices": [
+                        {
+                            "index": 0,
+                            "message": {"role": "assistant", "content": content},
+                            "finish_reason": finish_reason,
+                        }
+                    ],
+                    "usage": {
+                        "prompt_tokens": prompt_tokens,
+                        "completion_tokens": completion_tokens,
+                        "total_tokens": prompt_tokens + completion_tokens,
+                        "prompt_tokens_details": {"cached_tokens": cached_tokens},
+                    },
+                },
+            )
+            with stats.lock:
+                stats.ok += 1
+                stats.latencies_s.append(time.monotonic() - t0)
+
+    return Handler
+
+
+def make_server(host: str = "127.0.0.1", port: int = 0, cfg: Optional[MockArkConfig] = None) -> ThreadingHTTPServer:
+    """Create (not start) a threaded mock server; `server.stats` holds the counters."""
+    cfg = cfg or MockArkConfig()
+    stats = MockArkStats()
+    server = ThreadingHTTPServer((host, port), make_handler(cfg, stats, random.Random(cfg.seed)))
+    server.daemon_threads = True
+    server.stats = stats  # type: ignore[attr-defined]
+    return server
+
+
+def start_background(cfg: Optional[MockArkConfig] = None, *, host: str = "127.0.0.1", port: int = 0) -> ThreadingHTTPServer:
+    """Start a mock server on a daemon thread; base_url is f"http://{host}:{server.server_port}"."""
+    server = make_server(host, port, cfg)
+    threading.Thread(target=server.serve_forever, name="mock-ark", daemon=True).start()
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Offline mock of the Volc Ark chat completions API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency-ms", type=float, default=200.0)
+    parser.add_argument("--jitter-ms", type=float, default=100.0)
+    parser.add_argument("--rate-429", type=float, default=0.0)
+    parser.add_argument("--rate-5xx", type=float, default=0.0)
+    parser.add_argument("--rate-truncate", type=float, default=0.0)
+    parser.add_argument("--rate-malformed", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--no-context-api", action="store_true", help="Answer 404 on the context API endpoints")
+    parser.add_argument("--context-ttl-s", type=float, default=0.0, help="Cap context TTLs (0 = as requested)")
+    parser.add_argument("--prefill-ms-per-1k", type=float, default=0.0, help="Latency per 1k uncached prompt tokens")
+    args = parser.parse_args(argv)
+
+    cfg = MockArkConfig(
+        latency_ms=args.latency_ms,
+        jitter_ms=args.jitter_ms,
+        rate_429=args.rate_429,
+        rate_5xx=args.rate_5xx,
+        rate_truncate=args.rate_truncate,
+        rate_malformed=args.rate_malformed,
+        seed=args.seed,
+        context_api=not args.no_context_api,
+        context_ttl_s=args.context_ttl_s,
+        prefill_ms_per_1k=args.prefill_ms_per_1k,
+    )
+    server = make_server(args.host, args.port, cfg)
+    print(f"mock ark listening on http://{args.host}:{server.server_port} (base_url for llm.json)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(json.dumps(server.stats.as_dict(), ensure_ascii=False))  # type: ignore[attr-defined]
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,221 @@
+"""Per-call LLM telemetry: one JSONL record per call, plus a summary command.
+
+Record fields (written by `TelemetryLog.record`):
+  ts, run_id, status (ok|invalid_json|error), model, endpoint, book, chapter,
+  prompt_tokens, completion_tokens, cached_tokens, ttfb_s, latency_s, retries, hedged,
+  response_id, request_id, finish_reason, error
+
+Command:
+  python -m llm_provider.telemetry logs/telemetry --by model
+  python -m llm_provider.telemetry logs/telemetry/phase2_20260101-120000_123.jsonl --by book --llm-config llm.json
+
+Cost uses the optional top-level `pricing` table in llm.json (per million tokens):
+  "pricing": {"doubao-seed-1-8-251228": {"prompt_per_million": 0.8, "completion_per_million": 8.0}}
+Prompt tokens served from a context cache (`cached_tokens`) use `cached_per_million`
+when given, else the prompt price. `cached_tokens` is null when the server did not
+report cache usage; such calls are priced entirely at the prompt rate.
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import threading
+import time
+from collections import defaultdict
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence
+
+from .volc_ark_chat import ChatResult
+
+DEFAULT_TELEMETRY_DIR = Path("logs") / "telemetry"
+
+
+def new_run_id(prefix: str) -> str:
+    return f"{prefix}_{time.strftime('%Y%m%d-%H%M%S')}_{os.getpid()}"
+
+
+class TelemetryLog:
+    """Thread-safe JSONL appender (one line per call, flushed immediately)."""
+
+    def __init__(self, path: Path, *, run_id: str) -> None:
+        self.path = path
+        self.run_id = run_id
+        self._lock = threading.Lock()
+        path.parent.mkdir(parents=True, exist_ok=True)
+
+    @classmethod
+    def for_run(cls, prefix: str, *, path: Optional[Path] = None) -> "TelemetryLog":
+        run_id = new_run_id(prefix)
+        return cls(path or (DEFAULT_TELEMETRY_DIR / f"{run_id}.jsonl"), run_id=run_id)
+
+    def write(self, rec: Dict[str, Any]) -> None:
+        line = json.dumps(rec, ensure_ascii=False)
+        with self._lock:
+            with self.path.open("a", encoding="utf-8") as f:
+                f.write(line + "\n")
+
+    def record(
+        self,
+        result: Optional[ChatResult] = None,
+        *,
+        status: str = "ok",
+        error: Optional[BaseException] = None,
+        latency_s: Optional[float] = None,
+        **context: Any,
+    ) -> None:
+        """Append one call. `context` carries book/chapter/profile etc."""
+        rec: Dict[str, Any] = {"ts": round(time.time(), 3), "run_id": self.run_id, "status": status}
+        rec.update(context)
+        if result is not None:
+            rec.update(
+                {
+                    "model": result.model,
+                    "endpoint": result.endpoint,
+                    "prompt_tokens": result.prompt_tokens,
+                    "completion_tokens": result.completion_tokens,
+                    "cached_tokens": result.cached_tokens,
+                    "ttfb_s": round(result.ttfb_s, 4),
+                    "latency_s": round(result.latency_s, 4),
+                    "retries": result.retries,
+                    "hedged": result.hedged,
+                    "response_id": result.response_id,
+                    "request_id": result.request_id,
+                    "finish_reason": result.finish_reason,
+                }
+            )
+        if latency_s is not None:
+            rec["latency_s"] = round(latency_s, 4)
+        if error is not None:
+            rec["error"] = f"{type(error).__name__}: {error}"[:500]
+        self.write(rec)
+
+
+def iter_records(paths: Sequence[Path]) -> Iterator[Dict[str, Any]]:
+    """Records from JSONL files and/or directories of them (bad lines are skipped)."""
+    for p in paths:
+        files = sorted(p.glob("*.jsonl")) if p.is_dir() else [p]
+        for f in files:
+            with f.open("r", encoding="utf-8") as fh:
+                for line in fh:
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        yield json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+
+
+def load_pricing(llm_config: Optional[Path]) -> Dict[str, Dict[str, float]]:
+    if llm_config is None or not llm_config.exists():
+        return {}
+    data = json.loads(llm_config.read_text(encoding="utf-8"))
+    pricing = data.get("pricing") or {}
+    return {str(k): dict(v) for k, v in pricing.items() if isinstance(v, dict)}
+
+
+def _pct(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(p / 100.0 * len(ordered)) - 1))]
+
+
+def summarize(
+    records: Iterable[Dict[str, Any]],
+    *,
+    by: Sequence[str] = ("model",),
+    pricing: Optional[Dict[str, Dict[str, float]]] = None,
+) -> List[Dict[str, Any]]:
+    """Aggregate records into one row per group key (e.g. by=("model",) or ("book", "chapter"))."""
+    pricing = pricing or {}
+    groups: Dict[tuple, List[Dict[str, Any]]] = defaultdict(list)
+    for r in records:
+        groups[tuple(r.get(k, "") for k in by)].append(r)
+
+    rows: List[Dict[str, Any]] = []
+    for key, recs in sorted(groups.items(), key=lambda kv: tuple(str(x) for x in kv[0])):
+        ok = [r for r in recs if r.get("status") == "ok"]
+        latencies = [float(r["latency_s"]) for r in recs if "latency_s" in r]
+        ttfbs = [float(r["ttfb_s"]) for r in ok if "ttfb_s" in r]
+        prompt_tokens = sum(int(r.get("prompt_tokens") or 0) for r in recs)
+        completion_tokens = sum(int(r.get("completion_tokens") or 0) for r in recs)
+        # ts is written when a call finishes; the window starts at the earliest call start.
+        ends = [float(r["ts"]) for r in recs if "ts" in r]
+        starts = [float(r["ts"]) - float(r.get("latency_s") or 0.0) for r in recs if "ts" in r]
+        span = (max(ends) - min(starts)) if ends else 0.0
+
+        cost = 0.0
+        priced = True
+        for r in recs:
+            price = pricing.get(str(r.get("model") or ""))
+            if price is None:
+                priced = False
+                continue
+            prompt_rate = float(price.get("prompt_per_million", 0.0))
+            cached = int(r.get("cached_tokens") or 0)
+            cost += (int(r.get("prompt_tokens") or 0) - cached) / 1e6 * prompt_rate
+            cost += cached / 1e6 * float(price.get("cached_per_million", prompt_rate))
+            cost += int(r.get("completion_tokens") or 0) / 1e6 * float(price.get("completion_per_million", 0.0))
+
+        row: Dict[str, Any] = dict(zip(by, key))
+        row.update(
+            {
+                "calls": len(recs),
+                "ok": len(ok),
+                "failed": len(recs) - len(ok),
+                "retries": sum(int(r.get("retries") or 0) for r in recs),
+                "hedged": sum(1 for r in recs if r.get("hedged")),
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": completion_tokens,
+                "cached_tokens": sum(int(r.get("cached_tokens") or 0) for r in recs),
+                "latency_p50_s": round(_pct(latencies, 50), 3),
+                "latency_p95_s": round(_pct(latencies, 95), 3),
+                "ttfb_p50_s": round(_pct(ttfbs, 50), 3),
+                "calls_per_min": round(len(recs) / span * 60.0, 2) if span > 0 else 0.0,
+                "completion_tokens_per_s": round(completion_tokens / sum(latencies), 1) if sum(latencies) > 0 else 0.0,
+                "cost": round(cost, 4) if pricing else None,
+                "cost_complete": priced if pricing else None,
+            }
+        )
+        rows.append(row)
+    return rows
+
+
+def format_table(rows: List[Dict[str, Any]]) -> str:
+    if not rows:
+        return "(no records)"
+    headers = list(rows[0].keys())
+    cells = [[("" if r.get(h) is None else str(r.get(h))) for h in headers] for r in rows]
+    widths = [max(len(h), *(len(c[i]) for c in cells)) for i, h in enumerate(headers)]
+    lines = ["  ".join(h.ljust(w) for h, w in zip(headers, widths))]
+    lines.append("  ".join("-" * w for w in widths))
+    lines.extend("  ".join(c.ljust(w) for c, w in zip(row, widths)) for row in cells)
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Summarize LLM telemetry JSONL into throughput/cost reports.")
+    parser.add_argument("paths", type=Path, nargs="*", default=[DEFAULT_TELEMETRY_DIR], help="JSONL files or directories")
+    parser.add_argument("--by", default="model", help="Comma-separated group keys: model,endpoint,book,chapter,run_id")
+    parser.add_argument("--llm-config", type=Path, default=None, help="llm.json with a top-level pricing table")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of a text table")
+    args = parser.parse_args(argv)
+
+    from .llm_config import find_default_llm_config
+
+    by = [k.strip() for k in args.by.split(",") if k.strip()]
+    pricing = load_pricing(args.llm_config or find_default_llm_config())
+    rows = summarize(iter_records(args.paths), by=by, pricing=pricing)
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print(format_table(rows))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
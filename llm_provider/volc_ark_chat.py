@@ -1,10 +1,14 @@
 ﻿from __future__ import annotations
 
+import http.client
 import json
-import urllib.error
+import socket
+import threading
+import time
+import urllib.parse
 import urllib.request
-from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from dataclasses import dataclass, replace
+from typing import Any, Dict, List, Optional, Tuple
 
 
 @dataclass(frozen=True)
@@ -13,11 +17,218 @@ class ChatMessage:
     content: str
 
 
-def _build_url(base_url: str) -> str:
+@dataclass(frozen=True)
+class ChatResult:
+    """Assistant content plus the usage/timing metadata of the call that produced it.
+
+    `retries` and `endpoint` are filled in by the pool layer (llm_provider.balancer).
+    """
+
+    content: str
+    model: str = ""
+    response_id: str = ""
+    request_id: str = ""
+    finish_reason: str = ""
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: Optional[int] = None  # part of prompt_tokens served from a context cache; None = not reported
+    ttfb_s: float = 0.0
+    latency_s: float = 0.0
+    retries: int = 0
+    endpoint: str = ""
+    hedged: bool = False
+
+    def with_(self, **changes: Any) -> "ChatResult":
+        return replace(self, **changes)
+
+
+class ChatHTTPError(RuntimeError):
+    """Non-2xx response from the endpoint (keeps the status for retry/cooldown decisions)."""
+
+    def __init__(self, status: int, body: str, *, retry_after_s: Optional[float] = None) -> None:
+        super().__init__(f"HTTPError {status}: {body}")
+        self.status = status
+        self.body = body
+        self.retry_after_s = retry_after_s
+
+
+class ChatTransportError(RuntimeError):
+    """Connection-level failure (DNS, refused, timeout) before a response was read."""
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        return None
+
+
+class CallHandle:
+    """Observe/abort one in-flight call from another thread (used by request hedging).
+
+    `first_byte` is set as soon as the response status line arrives; `cancel()`
+    closes the socket so a blocked read fails fast instead of running to timeout.
+    """
+
+    def __init__(self) -> None:
+        self.first_byte = threading.Event()
+        self.cancelled = threading.Event()
+        self._conn: Optional[http.client.HTTPConnection] = None
+        self._lock = threading.Lock()
+
+    def _attach(self, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            self._conn = conn
+            if not self.cancelled.is_set():
+                return
+        _shutdown(conn)
+
+    def cancel(self) -> None:
+        with self._lock:
+            self.cancelled.set()
+            conn = self._conn
+        if conn is not None:
+            _shutdown(conn)
+
+    def _detach(self) -> bool:
+        """Forget the finished call's connection; False if it was cancelled meanwhile."""
+        with self._lock:
+            self._conn = None
+            return not self.cancelled.is_set()
+
+
+def _shutdown(conn: http.client.HTTPConnection) -> None:
+    sock = conn.sock
+    if sock is not None:
+        try:
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+    conn.close()
+
+
+def _open_connection(url: str, timeout_s: float) -> http.client.HTTPConnection:
+    """HTTP(S) connection for url, tunnelling through https_proxy/http_proxy like urllib does."""
+    parts = urllib.parse.urlsplit(url)
+    scheme = parts.scheme.lower()
+    host = parts.hostname or ""
+    port = parts.port
+    proxy = None if urllib.request.proxy_bypass(host) else urllib.request.getproxies().get(scheme)
+
+    if proxy:
+        pp = urllib.parse.urlsplit(proxy if "://" in proxy else f"http://{proxy}")
+        conn: http.client.HTTPConnection
+        if scheme == "https":
+            conn = http.client.HTTPSConnection(pp.hostname or "", pp.port or 80, timeout=timeout_s)
+            conn.set_tunnel(host, port or 443)
+        else:
+            conn = http.client.HTTPConnection(pp.hostname or "", pp.port or 80, timeout=timeout_s)
+        return conn
+
+    if scheme == "https":
+        return http.client.HTTPSConnection(host, port or 443, timeout=timeout_s)
+    return http.client.HTTPConnection(host, port or 80, timeout=timeout_s)
+
+
+_keep_alive = False
+_idle = threading.local()  # per-thread {(scheme, netloc): connection}
+
+
+def set_keep_alive(enabled: bool) -> None:
+    """Keep one idle connection per thread and host between calls (for long-running processes).
+
+    Off by default: one-shot scripts open and close a connection per call.
+    """
+    global _keep_alive
+    _keep_alive = enabled
+    if not enabled:
+        for conn in getattr(_idle, "conns", {}).values():
+            conn.close()
+        _idle.conns = {}
+
+
+def _checkout(url: str, timeout_s: float) -> Tuple[http.client.HTTPConnection, bool]:
+    """(connection, reused): an idle kept-alive connection for url's host, else a new one."""
+    if _keep_alive:
+        parts = urllib.parse.urlsplit(url)
+        conn = getattr(_idle, "conns", {}).pop((parts.scheme, parts.netloc), None)
+        if conn is not None:
+            conn.timeout = timeout_s
+            if conn.sock is not None:
+                conn.sock.settimeout(timeout_s)
+            return conn, True
+    return _open_connection(url, timeout_s), False
+
+
+def _checkin(url: str, conn: http.client.HTTPConnection, *, reusable: bool) -> None:
+    if not (_keep_alive and reusable):
+        conn.close()
+        return
+    parts = urllib.parse.urlsplit(url)
+    conns = _idle.__dict__.setdefault("conns", {})
+    old = conns.get((parts.scheme, parts.netloc))
+    if old is not None and old is not conn:
+        old.close()
+    conns[(parts.scheme, parts.netloc)] = conn
+
+
+def _build_url(base_url: str, path: str = "chat/completions") -> str:
     base = base_url.rstrip("/")
     if base.endswith("/api/v3"):
-        return f"{base}/chat/completions"
-    return f"{base}/api/v3/chat/completions"
+        return f"{base}/{path}"
+    return f"{base}/api/v3/{path}"
+
+
+def _post_json(
+    url: str, api_key: str, payload: Dict[str, Any], *, timeout_s: float, handle: Optional[CallHandle] = None
+) -> Tuple[str, str, float, float]:
+    """POST payload as JSON -> (body, request_id, ttfb_s, latency_s); raises ChatHTTPError/ChatTransportError."""
+
+    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Bearer {api_key}",
+    }
+    parts = urllib.parse.urlsplit(url)
+    path = parts.path + (f"?{parts.query}" if parts.query else "")
+
+    conn, reused = _checkout(url, timeout_s)
+    reusable = False
+    t0 = time.perf_counter()
+    try:
+        while True:
+            if handle is not None:
+                handle._attach(conn)
+            try:
+                conn.request("POST", path, body=data, headers=headers)
+                resp = conn.getresponse()
+                break
+            except (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError):
+                # The server closed an idle kept-alive connection: retry once on a fresh one.
+                if not reused or (handle is not None and handle.cancelled.is_set()):
+                    raise
+                conn.close()
+                conn, reused = _open_connection(url, timeout_s), False
+                t0 = time.perf_counter()
+        ttfb = time.perf_counter() - t0
+        if handle is not None:
+            handle.first_byte.set()
+        raw = resp.read().decode("utf-8", errors="replace")
+        latency = time.perf_counter() - t0
+        reusable = not resp.will_close
+        request_id = resp.getheader("X-Request-Id") or resp.getheader("X-Tt-Logid") or ""
+        if not 200 <= resp.status < 300:
+            retry_after = _parse_retry_after(resp.getheader("Retry-After"))
+            raise ChatHTTPError(resp.status, raw, retry_after_s=retry_after)
+    except (OSError, http.client.HTTPException) as e:
+        if handle is not None and handle.cancelled.is_set():
+            raise ChatTransportError("Cancelled") from e
+        raise ChatTransportError(f"{type(e).__name__}: {e}") from e
+    finally:
+        _checkin(url, conn, reusable=reusable and (handle is None or handle._detach()))
+    return raw, request_id, ttfb, latency
 
 
 def chat_completions(
@@ -29,11 +240,18 @@ def chat_completions(
     temperature: float = 0.2,
     max_tokens: int = 10000,
     thinking: Optional[Dict[str, Any]] = None,
-    timeout_s: int = 120,
-) -> str:
-    """Call Volc Ark Chat Completions API and return assistant.message.content."""
+    timeout_s: float = 120,
+    handle: Optional[CallHandle] = None,
+    context_id: Optional[str] = None,
+) -> ChatResult:
+    """Call Volc Ark Chat Completions API; `ChatResult.content` is assistant.message.content.
+
+    `timeout_s` bounds connect and each socket read (i.e. a stall with no bytes).
+    With `context_id` the call goes to the context API and `messages` are appended
+    to the cached prefix (see `create_context`).
+    """
 
-    url = _build_url(base_url)
+    url = _build_url(base_url, "context/chat/completions" if context_id else "chat/completions")
     if thinking is None:
         thinking = {"type": "disabled"}
 
@@ -44,29 +262,76 @@ def chat_completions(
         "max_tokens": max_tokens,
         "thinking": thinking,
     }
+    if context_id:
+        payload["context_id"] = context_id
 
-    data = json.dumps(payload, ensure_ascii=False).encode("utf-8")
-    req = urllib.request.Request(
-        url=url,
-        data=data,
-        method="POST",
-        headers={
-            "Content-Type": "application/json",
-            "Authorization": f"Bearer {api_key}",
-        },
-    )
+    raw, request_id, ttfb, latency = _post_json(url, api_key, payload, timeout_s=timeout_s, handle=handle)
 
     try:
-        with urllib.request.urlopen(req, timeout=timeout_s) as resp:
-            raw = resp.read().decode("utf-8", errors="replace")
-    except urllib.error.HTTPError as e:
-        body = e.read().decode("utf-8", errors="replace") if hasattr(e, "read") else ""
-        raise RuntimeError(f"HTTPError {e.code}: {body}") from e
-    except urllib.error.URLError as e:
-        raise RuntimeError(f"URLError: {e}") from e
+        obj = json.loads(raw)
+        choice = obj["choices"][0]
+        content = str(choice["message"]["content"])
+    except Exception as e:
+        raise RuntimeError(f"Unexpected response: {raw[:500]}") from e
+
+    usage = obj.get("usage") or {}
+    details = usage.get("prompt_tokens_details") or {}
+    cached = details.get("cached_tokens") if isinstance(details, dict) else None
+    return ChatResult(
+        content=content,
+        model=str(obj.get("model") or model),
+        response_id=str(obj.get("id") or ""),
+        request_id=request_id,
+        finish_reason=str(choice.get("finish_reason") or ""),
+        prompt_tokens=int(usage.get("prompt_tokens") or 0),
+        completion_tokens=int(usage.get("completion_tokens") or 0),
+        cached_tokens=None if cached is None else int(cached),
+        ttfb_s=ttfb,
+        latency_s=latency,
+    )
 
+
+@dataclass(frozen=True)
+class ContextInfo:
+    """A server-side prefix cache created by `create_context`."""
+
+    id: str
+    model: str
+    ttl_s: int
+    prompt_tokens: int = 0
+
+
+def create_context(
+    *,
+    base_url: str,
+    api_key: str,
+    model: str,
+    messages: List[ChatMessage],
+    ttl_s: int = 3600,
+    timeout_s: float = 60,
+) -> ContextInfo:
+    """Create a `common_prefix` context cache holding `messages` (Volc Ark Context API).
+
+    Reference it with `chat_completions(context_id=...)` until it expires (`ttl_s`);
+    endpoints without the context API answer 4xx (raised as ChatHTTPError).
+    """
+
+    payload: Dict[str, Any] = {
+        "model": model,
+        "messages": [{"role": m.role, "content": m.content} for m in messages],
+        "mode": "common_prefix",
+        "ttl": int(ttl_s),
+    }
+    raw, _, _, _ = _post_json(_build_url(base_url, "context/create"), api_key, payload, timeout_s=timeout_s)
     try:
         obj = json.loads(raw)
-        return str(obj["choices"][0]["message"]["content"])
+        context_id = str(obj["id"])
     except Exception as e:
-        raise RuntimeError(f"Unexpected response: {raw[:500]}") from e
\ No newline at end of file
+        raise RuntimeError(f"Unexpected response: {raw[:500]}") from e
+    usage = obj.get("usage") or {}
+    return ContextInfo(
+        id=context_id,
+        model=model,
+        ttl_s=int(obj.get("ttl") or ttl_s),
+        prompt_tokens=int(usage.get("prompt_tokens") or 0),
+    )
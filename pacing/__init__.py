@@ -0,0 +1 @@
+"""本地节奏指标（对话占比、句长、感叹/疑问密度、段长波动），不调用模型，基于 NumPy 批量计算。"""
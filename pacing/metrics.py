@@ -0,0 +1,279 @@
+from __future__ import annotations
+
+"""
+向量化的本地节奏指标：整个书库的段落拼成一个码点数组，一次 NumPy 计算得到所有段落的计数。
+
+每段的基础计数：字数、对话字数（“”「」『』及成对 " 之间的字符，含引号）、句数（句末标点串计一句，
+无句末标点的非空段落算一句）、感叹号数、问号数。任意段落区间（剧情块 / 切片 / 全章）的指标由
+前缀和一次求出：段落数、字数、对话占比、平均句长、每百字感叹/疑问数、段长标准差。
+
+Command:
+  python -m pacing.metrics book --output logs/pacing.jsonl            # 全书库，每章一行
+  python -m pacing.metrics "book/书名" --per-paragraph                 # 每段一行
+"""
+
+import argparse
+import json
+import sys
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    import numpy as np
+except ModuleNotFoundError as e:  # pragma: no cover
+    raise ModuleNotFoundError("缺少依赖 numpy，请先安装：pip install numpy") from e
+
+_OPEN, _CLOSE, _ASCII_QUOTE, _TERMINATOR, _EXCLAIM, _QUESTION = (1 << i for i in range(6))
+
+
+def _class_table() -> np.ndarray:
+    """码点 -> 字符类别位：一次查表得到所有类别，不必逐类 np.isin 扫描整个数组。"""
+    table = np.zeros(0x110000, dtype=np.uint8)
+    for chars, bit in (
+        ("“「『", _OPEN),
+        ("”」』", _CLOSE),
+        ('"', _ASCII_QUOTE),
+        ("。！？!?…；;", _TERMINATOR),
+        ("！!", _EXCLAIM),
+        ("？?", _QUESTION),
+    ):
+        for c in chars:
+            table[ord(c)] |= bit
+    return table
+
+
+_CLASSES = _class_table()
+
+
+@dataclass
+class ParagraphMetrics:
+    """一组段落（通常是一章）的逐段计数，各数组等长。"""
+
+    chars: np.ndarray
+    dialogue: np.ndarray
+    sentences: np.ndarray
+    exclaims: np.ndarray
+    questions: np.ndarray
+
+    def __len__(self) -> int:
+        return int(self.chars.shape[0])
+
+    def slice(self, start: int, end: int) -> "ParagraphMetrics":
+        return ParagraphMetrics(*(a[start:end] for a in self._arrays()))
+
+    def _arrays(self) -> Tuple[np.ndarray, ...]:
+        return self.chars, self.dialogue, self.sentences, self.exclaims, self.questions
+
+    def per_paragraph(self) -> Dict[str, np.ndarray]:
+        chars = self.chars.astype(np.float64)
+        safe = np.maximum(chars, 1.0)
+        return {
+            "chars": self.chars,
+            "dialogue_ratio": self.dialogue / safe,
+            "avg_sentence_len": chars / np.maximum(self.sentences, 1),
+            "exclaims_per_100": 100.0 * self.exclaims / safe,
+            "questions_per_100": 100.0 * self.questions / safe,
+        }
+
+    def ranges(self, starts: Sequence[int], ends: Sequence[int]) -> Dict[str, np.ndarray]:
+        """段落下标区间 [start, end) 的汇总指标（向量化，一次算完所有区间）。"""
+        s = np.asarray(starts, dtype=np.int64)
+        e = np.maximum(np.asarray(ends, dtype=np.int64), s)
+
+        def total(a: np.ndarray) -> np.ndarray:
+            c = np.concatenate(([0], np.cumsum(a, dtype=np.float64)))
+            return c[e] - c[s]
+
+        n = (e - s).astype(np.float64)
+        chars = total(self.chars)
+        sq = total(self.chars.astype(np.float64) ** 2)
+        safe_chars = np.maximum(chars, 1.0)
+        safe_n = np.maximum(n, 1.0)
+        mean = chars / safe_n
+        return {
+            "paragraphs": n,
+            "chars": chars,
+            "dialogue_ratio": total(self.dialogue) / safe_chars,
+            "avg_sentence_len": chars / np.maximum(total(self.sentences), 1.0),
+            "exclaims_per_100": 100.0 * total(self.exclaims) / safe_chars,
+            "questions_per_100": 100.0 * total(self.questions) / safe_chars,
+            "para_len_std": np.sqrt(np.maximum(sq / safe_n - mean**2, 0.0)),
+        }
+
+
+def _segment_counts(mask: np.ndarray, bounds: np.ndarray) -> np.ndarray:
+    """每段内 mask 为真的字符数（按命中位置二分，标点这类稀疏掩码不必对整个数组求前缀和）。"""
+    c = np.searchsorted(np.flatnonzero(mask), bounds)
+    return c[1:] - c[:-1]
+
+
+def measure(texts: Sequence[str]) -> ParagraphMetrics:
+    """一次性计算所有段落的计数（段落数不限，整个书库也可以一次传入）。"""
+    lengths = np.fromiter(map(len, texts), dtype=np.int64, count=len(texts))
+    bounds = np.concatenate(([0], np.cumsum(lengths)))
+    codes = np.frombuffer("".join(texts).encode("utf-32-le"), dtype=np.uint32)
+    if codes.size == 0:
+        z = np.zeros(len(texts), dtype=np.int64)
+        return ParagraphMetrics(lengths, z, z.copy(), z.copy(), z.copy())
+
+    cls = _CLASSES[codes]
+    nonempty = lengths > 0
+    # 累计值减去各段段首之前的累计值，引号深度/奇偶只在段内累计
+    heads = bounds[:-1][nonempty]
+    reps = lengths[nonempty]
+
+    opens = (cls & _OPEN) != 0
+    closes = (cls & _CLOSE) != 0
+    step = opens.astype(np.int32) - closes.astype(np.int32)
+    depth = np.cumsum(step)
+    depth -= np.repeat(depth[heads] - step[heads], reps)
+    ascii_q = (cls & _ASCII_QUOTE) != 0
+    aq = np.cumsum(ascii_q, dtype=np.int32)
+    aq -= np.repeat(aq[heads] - ascii_q[heads], reps)
+    # 引号内（含左引号）为 depth > 0；右引号本身也计入对话
+    dialogue = (depth > 0) | closes | ((aq & 1) == 1) | ascii_q
+
+    # 连续的句末标点只在最后一个处计一句（跨段不相连：段尾的标点总是句末）
+    term = (cls & _TERMINATOR) != 0
+    sentence_end = term.copy()
+    sentence_end[:-1] &= ~term[1:]
+    sentence_end[bounds[1:][nonempty] - 1] = term[bounds[1:][nonempty] - 1]
+    sentences = np.where(nonempty, np.maximum(_segment_counts(sentence_end, bounds), 1), 0)
+
+    return ParagraphMetrics(
+        chars=lengths,
+        dialogue=_segment_counts(dialogue, bounds),
+        sentences=sentences,
+        exclaims=_segment_counts((cls & _EXCLAIM) != 0, bounds),
+        questions=_segment_counts((cls & _QUESTION) != 0, bounds),
+    )
+
+
+def measure_many(chapters: Sequence[Sequence[str]]) -> List[ParagraphMetrics]:
+    """多章一起算（只做一次 NumPy 计算），再按章切开。"""
+    flat: List[str] = []
+    offsets = [0]
+    for texts in chapters:
+        flat.extend(texts)
+        offsets.append(len(flat))
+    m = measure(flat)
+    return [m.slice(offsets[i], offsets[i + 1]) for i in range(len(chapters))]
+
+
+def read_chapter_paragraphs(jsonl_text: str) -> Tuple[List[int], List[str]]:
+    """第一阶段章节 JSONL -> (paragraph_id 列表, 段落文本列表)。"""
+    ids: List[int] = []
+    texts: List[str] = []
+    for line in jsonl_text.splitlines():
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        pid = obj.get("paragraph_id") if isinstance(obj, dict) else None
+        if isinstance(pid, int):
+            ids.append(pid)
+            texts.append(str(obj.get("text") or ""))
+    return ids, texts
+
+
+def id_ranges(ids: Sequence[int], spans: Iterable[Tuple[Any, Any]]) -> Tuple[List[int], List[int]]:
+    """paragraph_id 闭区间 [start, end] -> 段落下标区间 [s, e)（ids 升序，允许有空缺）；非法区间为空区间。"""
+    arr = np.asarray(ids, dtype=np.int64)
+    starts: List[int] = []
+    ends: List[int] = []
+    for a, b in spans:
+        if isinstance(a, int) and isinstance(b, int) and not isinstance(a, bool) and b >= a:
+            starts.append(int(np.searchsorted(arr, a, side="left")))
+            ends.append(int(np.searchsorted(arr, b, side="right")))
+        else:
+            starts.append(0)
+            ends.append(0)
+    return starts, ends
+
+
+def format_hint(ids: Sequence[int], m: ParagraphMetrics, *, window: int = 10) -> str:
+    """给模型参考的本地统计（全章一行 + 每 window 段一行），追加在章节提示词末尾。"""
+    if not len(m):
+        return ""
+    starts = list(range(0, len(m), window))
+    ends = [min(s + window, len(m)) for s in starts]
+    r = m.ranges([0] + starts, [len(m)] + ends)
+
+    def line(i: int) -> str:
+        return (
+            f"字数 {int(r['chars'][i])}，对话占比 {r['dialogue_ratio'][i]:.0%}，平均句长 {r['avg_sentence_len'][i]:.1f} 字，"
+            f"感叹 {r['exclaims_per_100'][i]:.1f}/百字，疑问 {r['questions_per_100'][i]:.1f}/百字，段长标准差 {r['para_len_std'][i]:.1f}"
+        )
+
+    out = ["# 本地统计（程序计算，可作为节奏分析的参考）", f"- 全章（{len(m)} 段）：{line(0)}"]
+    for k, (s, e) in enumerate(zip(starts, ends), start=1):
+        out.append(f"- 段落 {ids[s]}-{ids[e - 1]}：{line(k)}")
+    return "\n".join(out)
+
+
+def chapter_hint(jsonl_text: str, *, window: int = 10) -> str:
+    """章节 JSONL -> format_hint 文本（第二阶段 --pacing-hints）。"""
+    ids, texts = read_chapter_paragraphs(jsonl_text)
+    return format_hint(ids, measure(texts), window=window)
+
+
+def _value(name: str, v: Any) -> Any:
+    return int(v) if name in ("paragraphs", "chars") else round(float(v), 4)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compute local pacing metrics for chapter JSONL files (no LLM).")
+    parser.add_argument("input", type=Path, help='Library dir (e.g. "book") or one novel dir')
+    parser.add_argument("--output", type=Path, default=None, help="Write JSONL here (default: stdout)")
+    parser.add_argument("--per-paragraph", action="store_true", help="One record per paragraph instead of per chapter")
+    args = parser.parse_args(argv)
+
+    root: Path = args.input
+    if any(root.glob("*.jsonl")):
+        chapter_files = sorted(root.glob("*.jsonl"))
+    else:
+        chapter_files = sorted(root.glob("*/*.jsonl"))
+    chapter_files = sorted(
+        (p for p in chapter_files if p.name.split("_", 1)[0].isdigit()),
+        key=lambda p: (p.parent.name, int(p.name.split("_", 1)[0])),
+    )
+
+    t0 = time.perf_counter()
+    parsed = [read_chapter_paragraphs(p.read_text(encoding="utf-8")) for p in chapter_files]
+    t1 = time.perf_counter()
+    # 全书库一次计算；每章汇总也是一次 ranges 调用
+    m = measure([t for _, texts in parsed for t in texts])
+    offsets = np.cumsum([0] + [len(ids) for ids, _ in parsed])
+    per = m.per_paragraph() if args.per_paragraph else m.ranges(offsets[:-1], offsets[1:])
+    t2 = time.perf_counter()
+
+    out = args.output.open("w", encoding="utf-8") if args.output else sys.stdout
+    try:
+        for n, (path, (ids, _)) in enumerate(zip(chapter_files, parsed)):
+            base = {"book": path.parent.name, "chapter": path.stem}
+            if args.per_paragraph:
+                for i, pid in enumerate(ids, start=int(offsets[n])):
+                    rec = {**base, "paragraph_id": pid, **{k: _value(k, v[i]) for k, v in per.items()}}
+                    out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+            else:
+                rec = {**base, **{k: _value(k, v[n]) for k, v in per.items()}}
+                out.write(json.dumps(rec, ensure_ascii=False) + "\n")
+    finally:
+        if args.output:
+            out.close()
+    paragraphs = len(m)
+    rate = len(chapter_files) / (t2 - t0) if t2 > t0 else 0.0
+    print(
+        f"[节奏指标] 章节={len(chapter_files)} 段落={paragraphs} 读取={t1 - t0:.3f}s 计算={t2 - t1:.3f}s "
+        f"（{rate:.0f} 章/秒）",
+        file=sys.stderr,
+    )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -5,12 +5,19 @@ import sys
 from pathlib import Path
 from typing import List, Optional
 
-from extractor import extract_first_chapters
-from writer import write_chapters_jsonl
-
 # 在某些环境/目录下写入会被拒绝（我们只需要读写 book/ 输出），禁用 .pyc 生成避免报错。
 sys.dont_write_bytecode = True
 
+# 允许从仓库根目录导入 profiling/（脚本从 phase1_extract/ 直接运行时默认不会包含父目录）
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
+
+from artifacts.store import ArtifactStore
+from extractor import extract_first_chapters
+from profiling import perf
+from writer import chapter_file_names, chapter_jsonl, write_chapters_jsonl
+
 
 def main(argv: Optional[List[str]] = None) -> int:
     parser = argparse.ArgumentParser(
@@ -18,8 +25,22 @@ def main(argv: Optional[List[str]] = None) -> int:
         usage="python phase1_extract/extract_three_chapters.py <path-to-book.epub>",
     )
     parser.add_argument("input", type=Path)
+    parser.add_argument(
+        "--prefetch", type=int, default=4, help="Spine items to read/inflate ahead on worker threads (0 = serial)"
+    )
+    parser.add_argument(
+        "--store",
+        type=Path,
+        default=None,
+        help="Write chapters into this artifact store (e.g. book/.artifacts) instead of book/<name>/*.jsonl",
+    )
+    perf.add_perf_arguments(parser)
     args = parser.parse_args(argv)
+    with perf.profile_run("phase1", args):
+        return _run(args)
+
 
+def _run(args: argparse.Namespace) -> int:
     epub_path: Path = args.input
     if not epub_path.exists():
         print("Input not found", file=sys.stderr)
@@ -31,12 +52,21 @@ def main(argv: Optional[List[str]] = None) -> int:
     # 约定：无论输入 epub 路径在哪里，输出都固定写到 book/<小说名>/ 下。
     out_dir = Path("book") / epub_path.stem
     # 只抽取前三章。
-    chapters = extract_first_chapters(epub_path, max_chapters=3)
+    with perf.stage("extract"):
+        chapters = extract_first_chapters(epub_path, max_chapters=3, prefetch=args.prefetch)
     if not chapters:
         print("No chapters extracted", file=sys.stderr)
         return 1
 
     # 每章独立写文件：<章序>_<章节名>.jsonl，段落从 1 开始编号。
-    files = write_chapters_jsonl(chapters, out_dir)
+    with perf.stage("write"):
+        if args.store is not None:
+            with ArtifactStore(args.store) as store:
+                for ch, name in zip(chapters, chapter_file_names(chapters)):
+                    store.put(out_dir.name, name, chapter_jsonl(ch), commit=False)
+                store.commit()
+            files = len(chapters)
+        else:
+            files = write_chapters_jsonl(chapters, out_dir)
     print(f"OK ({files} chapter files)")
     return 0
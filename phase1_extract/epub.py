@@ -7,10 +7,13 @@ EPUB 读取与 OPF(spine) 解析。
 最后按 OPF 的 spine 顺序读取 XHTML/HTML 内容。
 """
 
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
-from typing import Dict, List
+from typing import Deque, Dict, Iterable, Iterator, List, Optional
 
+import threading
 import zipfile
 from xml.etree import ElementTree as ET
 
@@ -33,6 +36,52 @@ def read_text_from_zip(zf: zipfile.ZipFile, name: str) -> str:
     return data.decode("utf-8", errors="replace")
 
 
+def iter_texts_from_zip(zf: zipfile.ZipFile, names: Iterable[str], *, prefetch: int = 0) -> Iterator[Optional[str]]:
+    """
+    按顺序读取 zip 内各文件的文本；zip 中不存在的文件产出 None。
+
+    prefetch > 0 时由 prefetch 个后台线程提前读取、解压、解码后面的文件，与调用方对当前文件的解析重叠
+    （文件读取与 zlib 解压期间释放 GIL）。每个线程各自打开一个 ZipFile，读取互不排队。
+    调用方提前结束时应关闭生成器（contextlib.closing）：尚未开始的读取随即取消，进行中的读取结束后才返回。
+    """
+    present = set(zf.namelist())
+    if prefetch <= 0:
+        for name in names:
+            yield read_text_from_zip(zf, name) if name in present else None
+        return
+
+    local = threading.local()
+    handles: List[zipfile.ZipFile] = []
+    handles_lock = threading.Lock()
+
+    def load(name: str) -> Optional[str]:
+        if name not in present:
+            return None
+        z = getattr(local, "zf", None)
+        if z is None:
+            # 内存中的 zip（没有文件名）只能共用调用方的句柄
+            z = zipfile.ZipFile(zf.filename, "r") if zf.filename else zf
+            local.zf = z
+            if z is not zf:
+                with handles_lock:
+                    handles.append(z)
+        return read_text_from_zip(z, name)
+
+    pool = ThreadPoolExecutor(max_workers=prefetch, thread_name_prefix="epub-prefetch")
+    pending: Deque[Future] = deque()
+    try:
+        for name in names:
+            pending.append(pool.submit(load, name))
+            if len(pending) > prefetch:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        pool.shutdown(wait=True, cancel_futures=True)
+        for z in handles:
+            z.close()
+
+
 def resolve_path(base: str, href: str) -> str:
     base_dir = str(Path(base).parent).replace("\\", "/")
     if base_dir in {"", "."}:
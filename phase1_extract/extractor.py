@@ -1,21 +1,34 @@
 ﻿from __future__ import annotations
 
+from contextlib import closing
 from pathlib import Path
 from typing import List, Optional
 
 import zipfile
 
 from chapter import parse_chapter_heading
-from epub import parse_container_rootfile, parse_opf_spine, read_text_from_zip
+from epub import iter_texts_from_zip, parse_container_rootfile, parse_opf_spine
 from model import Chapter
+from profiling import perf
 from text_utils import norm_text
 from xhtml import iter_text_blocks_from_xhtml
 
 
-def extract_first_chapters(epub_path: Path, *, max_chapters: int = 3) -> List[Chapter]:
+def _report_scan(counts: List[int]) -> None:
+    # 循环内只累加局部计数，每次扫描结束时一次性上报（未开启 --perf-profile 时为空操作）。
+    if perf.active() is None:
+        return
+    names = ("spine_items", "spine_missing", "xhtml_chars", "blocks_parsed", "headings_matched", "paragraphs")
+    perf.add("scans")
+    for name, n in zip(names, counts):
+        perf.add(name, n)
+
+
+def extract_first_chapters(epub_path: Path, *, max_chapters: int = 3, prefetch: int = 4) -> List[Chapter]:
     """从 EPUB 中抽取前 max_chapters 章。
 
     返回值：每章一个 Chapter，其中 paragraphs 只包含正文段落；章节标题不计入 paragraph_id。
+    prefetch：后台线程提前解压/解码的 spine 文件数（0 表示在当前线程中逐个读取）；找够章节即停止预读。
 
     为了减少误判，这里采用“两段式”策略：
     - 优先以“第x章/节/回 ...”作为分章起点（避免在书前信息/目录/设定里把“2、xxx”误当章节）。
@@ -26,55 +39,65 @@ def extract_first_chapters(epub_path: Path, *, max_chapters: int = 3) -> List[Ch
         out: List[Chapter] = []
         current: Optional[Chapter] = None
         started = 0
+        # spine_items, spine_missing, xhtml_chars, blocks_parsed, headings_matched, paragraphs
+        counts = [0, 0, 0, 0, 0, 0]
 
         with zipfile.ZipFile(epub_path, "r") as zf:
             opf_path = parse_container_rootfile(zf)
             spine = parse_opf_spine(zf, opf_path)
+            # closing：提前 return 时先取消预读并等待后台读取结束，再关闭 zip
+            with closing(iter_texts_from_zip(zf, (item.href for item in spine), prefetch=prefetch)) as texts:
+                for xhtml in texts:
+                    counts[0] += 1
+                    if xhtml is None:
+                        # 少数 EPUB 的 spine 引用可能缺失文件：直接跳过。
+                        counts[1] += 1
+                        continue
 
-            for item in spine:
-                if item.href not in zf.namelist():
-                    # 少数 EPUB 的 spine 引用可能缺失文件：直接跳过。
-                    continue
-
-                xhtml = read_text_from_zip(zf, item.href)
-
-                for block in iter_text_blocks_from_xhtml(xhtml):
-                    # allow_numbered_before_start=False 时：在进入正文前不允许用“x、标题/x.标题”触发开始；
-                    # 一旦开始后仍允许用它匹配后续章节（兼容不同排版）。
-                    parsed = parse_chapter_heading(
-                        block,
-                        allow_numbered=(allow_numbered_before_start or started > 0),
-                    )
-                    if parsed:
-                        ch_no, ch_title = parsed
-
-                        if started == 0:
-                            started = 1
-                            current = Chapter(no=ch_no, title=ch_title, paragraphs=[])
-                            continue
+                    counts[2] += len(xhtml)
+
+                    for block in iter_text_blocks_from_xhtml(xhtml):
+                        counts[3] += 1
+                        # allow_numbered_before_start=False 时：在进入正文前不允许用“x、标题/x.标题”触发开始；
+                        # 一旦开始后仍允许用它匹配后续章节（兼容不同排版）。
+                        parsed = parse_chapter_heading(
+                            block,
+                            allow_numbered=(allow_numbered_before_start or started > 0),
+                        )
+                        if parsed:
+                            counts[4] += 1
+                            ch_no, ch_title = parsed
+
+                            if started == 0:
+                                started = 1
+                                current = Chapter(no=ch_no, title=ch_title, paragraphs=[])
+                                continue
+
+                            if started >= max_chapters:
+                                # 遇到第 (max_chapters+1) 个章节标题：结束并返回。
+                                if current is not None:
+                                    out.append(current)
+                                _report_scan(counts)
+                                return out
 
-                        if started >= max_chapters:
-                            # 遇到第 (max_chapters+1) 个章节标题：结束并返回。
                             if current is not None:
                                 out.append(current)
-                            return out
-
-                        if current is not None:
-                            out.append(current)
-                        started += 1
-                        current = Chapter(no=ch_no, title=ch_title, paragraphs=[])
-                        continue
+                            started += 1
+                            current = Chapter(no=ch_no, title=ch_title, paragraphs=[])
+                            continue
 
-                    if current is None:
-                        continue
+                        if current is None:
+                            continue
 
-                    t = norm_text(block)
-                    if t:
-                        current.paragraphs.append(t)
+                        t = norm_text(block)
+                        if t:
+                            counts[5] += 1
+                            current.paragraphs.append(t)
 
         if current is not None:
             out.append(current)
 
+        _report_scan(counts)
         return out[:max_chapters]
 
     # 优先以“第x章/节/回 ...”作为起点；若失败，再退化允许从头用“x、标题/x.标题”。
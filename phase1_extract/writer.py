@@ -8,12 +8,10 @@ from chapter import sanitize_filename_component
 from model import Chapter
 
 
-def write_chapters_jsonl(chapters: List[Chapter], out_dir: Path) -> int:
-    """把多个章节写成多个 jsonl 文件：<章序>_<章节名>.jsonl。"""
-    out_dir.mkdir(parents=True, exist_ok=True)
-
+def chapter_file_names(chapters: List[Chapter]) -> List[str]:
+    """每章的输出文件名：<章序>_<章节名>.jsonl。"""
     used: set[str] = set()
-    files = 0
+    names: List[str] = []
 
     for ch in chapters:
         safe_title = sanitize_filename_component(ch.title)
@@ -26,11 +24,25 @@ def write_chapters_jsonl(chapters: List[Chapter], out_dir: Path) -> int:
             name = f"{ch.no}_{safe_title}_{k}.jsonl"
             k += 1
         used.add(name.lower())
+        names.append(name)
+
+    return names
+
 
-        out_path = out_dir / name
-        with out_path.open("w", encoding="utf-8") as f:
-            for i, p in enumerate(ch.paragraphs, start=1):
-                f.write(json.dumps({"paragraph_id": i, "text": p}, ensure_ascii=False) + "\n")
+def chapter_jsonl(ch: Chapter) -> str:
+    """章节的 jsonl 文本（与写出的文件内容一致），段落从 1 开始编号。"""
+    return "".join(
+        json.dumps({"paragraph_id": i, "text": p}, ensure_ascii=False) + "\n" for i, p in enumerate(ch.paragraphs, start=1)
+    )
+
+
+def write_chapters_jsonl(chapters: List[Chapter], out_dir: Path) -> int:
+    """把多个章节写成多个 jsonl 文件：<章序>_<章节名>.jsonl。"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    files = 0
+    for ch, name in zip(chapters, chapter_file_names(chapters)):
+        (out_dir / name).write_text(chapter_jsonl(ch), encoding="utf-8")
         files += 1
 
     return files
@@ -0,0 +1,252 @@
+from __future__ import annotations
+
+"""
+批量推理（Batch）模式：导出请求文件 / 导入结果文件，完全基于本地文件离线工作。
+
+流程（第 2/3 章依赖上一章总结，因此按“轮次”推进）：
+1) 导出：对每本书找出“下一个待分析章节”（第 1 章，或上一章已有分析的后续章节），
+   渲染提示词后写入一个批量请求 JSONL（每行一个请求，custom_id 稳定可复现），
+   同时写出 manifest（custom_id -> 书目录/章节/输出路径）。
+2) 把请求文件提交到 provider 的批量接口，拿到结果文件。
+3) 导入：按 custom_id 把结果写成 analysis/*.json（与实时调用的输出完全一致）。
+4) 重复 1~3，直到没有待导出的请求（通常 3 轮）。
+"""
+
+import hashlib
+import json
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from chapters import (
+    analysis_paths,
+    iter_chapter_jsonl_files,
+    load_analysis,
+    read_jsonl_as_text,
+    render_chapter_prompt,
+    save_analysis,
+    summarize_previous,
+)
+from boilerplate import ParagraphFilter, write_filter_report
+from context_compactor import ContextCompactor, ContextStats
+from prompts import PromptBundle
+
+BATCH_URL = "/api/v3/chat/completions"
+MAX_CHAPTER = 3
+
+
+@dataclass(frozen=True)
+class PendingChapter:
+    book_dir: Path
+    chapter_no: int
+    jsonl_path: Path
+    previous_summary: str
+    context: Optional[ContextStats] = None
+
+
+@dataclass
+class ImportReport:
+    written: List[str] = field(default_factory=list)
+    invalid_json: List[str] = field(default_factory=list)
+    failed: List[str] = field(default_factory=list)
+    unknown: List[str] = field(default_factory=list)
+
+
+def find_book_dirs(root: Path) -> List[Path]:
+    """root 本身是书目录（含 <章序>_*.jsonl）则返回 [root]；否则把 root 当作书库，返回其下所有书目录。"""
+    if iter_chapter_jsonl_files(root):
+        return [root]
+    return sorted(p for p in root.iterdir() if p.is_dir() and iter_chapter_jsonl_files(p))
+
+
+def next_pending_chapter(book_dir: Path, *, compactor: Optional[ContextCompactor] = None) -> Optional[PendingChapter]:
+    """找出该书下一个可以分析的章节；全部完成（或缺少上一章结果）时返回 None。"""
+    out_dir = book_dir / "analysis"
+    previous: List[Dict[str, Any]] = []
+    for chapter_no, jsonl_path in iter_chapter_jsonl_files(book_dir):
+        if not 1 <= chapter_no <= MAX_CHAPTER:
+            continue
+        json_path, _ = analysis_paths(out_dir, jsonl_path)
+        obj = load_analysis(json_path)
+        if obj is not None:
+            previous.append(obj)
+            continue
+        if chapter_no > 1 and not previous:
+            return None
+        summary, context = "", None
+        if previous:
+            if compactor is not None:
+                summary, context = compactor.build(previous, chapter_no=chapter_no)
+            else:
+                summary = summarize_previous(previous[-1])
+        return PendingChapter(
+            book_dir=book_dir,
+            chapter_no=chapter_no,
+            jsonl_path=jsonl_path,
+            previous_summary=summary,
+            context=context,
+        )
+    return None
+
+
+def make_custom_id(book_name: str, chapter_no: int, user_prompt: str) -> str:
+    """同一本书、同一章、同一份提示词 => 同一个 id（提示词变化时 id 随之变化）。"""
+    book_key = hashlib.sha1(book_name.encode("utf-8")).hexdigest()[:12]
+    prompt_key = hashlib.sha1(user_prompt.encode("utf-8")).hexdigest()[:12]
+    return f"tgc-{book_key}-c{chapter_no}-{prompt_key}"
+
+
+def manifest_path_for(requests_path: Path) -> Path:
+    return requests_path.with_name(f"{requests_path.stem}.manifest.json")
+
+
+def export_batch(
+    book_dirs: List[Path],
+    prompts: PromptBundle,
+    *,
+    out_path: Path,
+    model: str,
+    temperature: float,
+    max_tokens: int,
+    thinking: Dict[str, Any],
+    compactor: Optional[ContextCompactor] = None,
+    para_filter: Optional[ParagraphFilter] = None,
+    hint_fn: Optional[Callable[[str], str]] = None,
+) -> Tuple[List[PendingChapter], int]:
+    """
+    写出本轮的批量请求文件和 manifest，返回 (本轮请求, 已全部完成的书本数)。
+    para_filter 不为 None 时先去掉水印/广告/重复段落，并更新各书的 analysis/filter_report.json；
+    hint_fn（章节 JSONL -> 提示文本，如 pacing.metrics.chapter_hint）的结果追加在提示词末尾。
+    """
+    pending: List[PendingChapter] = []
+    done_books = 0
+    items: Dict[str, Dict[str, Any]] = {}
+
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    with out_path.open("w", encoding="utf-8") as f:
+        for book_dir in book_dirs:
+            p = next_pending_chapter(book_dir, compactor=compactor)
+            if p is None:
+                done_books += 1
+                continue
+            jsonl_content = read_jsonl_as_text(p.jsonl_path)
+            if para_filter is not None:
+                fr = para_filter.apply_book_chapter(book_dir, p.chapter_no)
+                if fr is not None:
+                    jsonl_content = fr.jsonl
+                    write_filter_report(book_dir / "analysis", [fr])
+            user_prompt = render_chapter_prompt(
+                prompts,
+                chapter_no=p.chapter_no,
+                jsonl_content=jsonl_content,
+                previous_summary=p.previous_summary,
+                hints=hint_fn(jsonl_content) if hint_fn is not None else "",
+            )
+            custom_id = make_custom_id(book_dir.name, p.chapter_no, user_prompt)
+            body = {
+                "model": model,
+                "messages": [
+                    {"role": "system", "content": prompts.system_for(p.chapter_no)},
+                    {"role": "user", "content": user_prompt},
+                ],
+                "temperature": temperature,
+                "max_tokens": max_tokens,
+                "thinking": thinking,
+            }
+            f.write(
+                json.dumps({"custom_id": custom_id, "method": "POST", "url": BATCH_URL, "body": body}, ensure_ascii=False)
+                + "\n"
+            )
+            json_path, raw_path = analysis_paths(book_dir / "analysis", p.jsonl_path)
+            items[custom_id] = {
+                "book": book_dir.name,
+                "book_dir": str(book_dir),
+                "chapter_no": p.chapter_no,
+                "jsonl": str(p.jsonl_path),
+                "json": str(json_path),
+                "raw": str(raw_path),
+            }
+            if p.context is not None:
+                items[custom_id]["context"] = p.context.as_dict()
+            pending.append(p)
+
+    manifest = {"version": 1, "created": int(time.time()), "model": model, "items": items}
+    manifest_path_for(out_path).write_text(json.dumps(manifest, ensure_ascii=False, indent=2), encoding="utf-8")
+    return pending, done_books
+
+
+def _result_body(rec: Dict[str, Any]) -> Tuple[Optional[Dict[str, Any]], str]:
+    """兼容常见批量结果格式：{"response": {"status_code", "body"}} 或直接 {"body"}。返回 (body, 错误描述)。"""
+    if rec.get("error"):
+        return None, json.dumps(rec["error"], ensure_ascii=False)[:300]
+    resp = rec.get("response")
+    if isinstance(resp, dict):
+        status = int(resp.get("status_code") or 200)
+        body = resp.get("body")
+        if status >= 300:
+            return None, f"status_code={status}"
+    else:
+        body = rec.get("body")
+    if isinstance(body, str):
+        try:
+            body = json.loads(body)
+        except json.JSONDecodeError:
+            return None, "body is not JSON"
+    if not isinstance(body, dict):
+        return None, "missing body"
+    return body, ""
+
+
+def import_batch_results(results_path: Path, manifest_path: Path, *, telemetry: Any = None) -> ImportReport:
+    """把批量结果文件写回各书的 analysis/ 目录；失败或非法 JSON 的章节保持待处理，下一轮会重新导出。"""
+    manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+    items: Dict[str, Dict[str, Any]] = manifest.get("items") or {}
+    report = ImportReport()
+
+    with results_path.open("r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                rec = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            custom_id = str(rec.get("custom_id") or "")
+            item = items.get(custom_id)
+            if item is None:
+                report.unknown.append(custom_id)
+                continue
+
+            ctx = {"book": item["book"], "chapter": item["chapter_no"], "custom_id": custom_id, "source": "batch"}
+            body, err = _result_body(rec)
+            content = None
+            if body is not None:
+                try:
+                    content = str(body["choices"][0]["message"]["content"])
+                except (KeyError, IndexError, TypeError):
+                    err = "unexpected body"
+            if content is None:
+                report.failed.append(custom_id)
+                if telemetry is not None:
+                    telemetry.write({"ts": round(time.time(), 3), "run_id": telemetry.run_id, "status": "error", "error": err, **ctx})
+                continue
+
+            obj = save_analysis(content, Path(item["json"]), Path(item["raw"]))
+            (report.written if obj is not None else report.invalid_json).append(custom_id)
+            if telemetry is not None:
+                usage = body.get("usage") or {}
+                telemetry.write(
+                    {
+                        "ts": round(time.time(), 3),
+                        "run_id": telemetry.run_id,
+                        "status": "ok" if obj is not None else "invalid_json",
+                        "model": str(body.get("model") or manifest.get("model") or ""),
+                        "prompt_tokens": int(usage.get("prompt_tokens") or 0),
+                        "completion_tokens": int(usage.get("completion_tokens") or 0),
+                        "response_id": str(body.get("id") or ""),
+                        **ctx,
+                    }
+                )
+    return report
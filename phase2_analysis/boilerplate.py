@@ -0,0 +1,322 @@
+from __future__ import annotations
+
+"""
+模型调用前的段落过滤：去掉盗版/聚合站 EPUB 里的水印、求票、“本章完”、广告行，以及跨章重复的段落。
+
+- 规则：正则（默认规则见 DEFAULT_PATTERNS，可用 JSON 规则文件替换或追加），只作用于短段落（<= max_chars）
+- 学习：在整个书库上统计“书内重复出现的短段落”的字符 n-gram，被足够多的书共有的 n-gram 视为水印/广告模板；
+  某段落的 n-gram 大部分命中即判定为模板（数字统一归一，能覆盖带章节号/日期的水印）
+- 去重：同一本书里与前文（包括前几章）完全相同的段落只保留第一次出现（章节切分处常见）
+
+保留下来的段落沿用第一阶段的原始 paragraph_id（不重新编号），所以模型输出与分析结果里的
+paragraph_id 仍然指向原文；被去掉的段落及原因记录在 analysis/filter_report.json 中。
+
+Command:
+  python phase2_analysis/boilerplate.py book                      # 学习书库模板，写出 book/.boilerplate.json
+  python phase2_analysis/boilerplate.py book --preview book/书名   # 预览某本书会被去掉的段落
+"""
+
+import argparse
+import json
+import math
+import re
+import time
+from collections import Counter
+from dataclasses import dataclass, field, fields
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from chapters import iter_chapter_jsonl_files, read_jsonl_as_text
+
+MODEL_FILENAME = ".boilerplate.json"
+REPORT_FILENAME = "filter_report.json"
+
+DEFAULT_PATTERNS = (
+    r"(求|跪求|拜求|再求).{0,8}(月票|推荐票|保底|收藏|订阅|打赏)",
+    r"^[（(【\[]?(本章完|未完待续|待续|本章结束)[）)】\]]?[。！!]*$",
+    r"(www\.|https?://|\.com\b|\.net\b|\.cc\b|\.org\b)",
+    r"(天才一秒记住|一秒记住|请记住本书首发|本书首发|最新章节|手机阅读|手机版阅读|无弹窗|全文阅读|免费阅读|笔趣阁|顶点小说)",
+    r"^(PS|Ps|ps|P\.S\.)[:：\s]",
+    r"^(作者有话说|作者的话)",
+)
+
+_NORM_DROP = re.compile(r"[\W_]+", re.UNICODE)
+_DIGITS = re.compile(r"\d+")
+
+
+def normalize(text: str) -> str:
+    """比较用的归一化：去掉空白与标点，数字统一为 0，英文小写。"""
+    return _DIGITS.sub("0", _NORM_DROP.sub("", text)).lower()
+
+
+def char_ngrams(norm: str, n: int) -> Set[str]:
+    return {norm[i : i + n] for i in range(len(norm) - n + 1)}
+
+
+@dataclass
+class FilterRules:
+    patterns: List[str] = field(default_factory=lambda: list(DEFAULT_PATTERNS))
+    max_chars: int = 60  # 只有不超过该长度的段落才可能被当作模板去掉（正文长段落永远保留）
+    dup_min_chars: int = 10  # 归一化后至少这么长的段落才参与去重（避免误删“嗯。”之类的短对白）
+    ngram: int = 6
+    min_books: int = 3  # 模板 n-gram 至少出现在这么多本书里
+    min_book_ratio: float = 0.2  # 且至少占书库的这个比例
+    min_repeats: int = 2  # 某本书内至少有这么多段落包含该 n-gram，才算这本书“有”这个模板
+    gram_share: float = 0.8  # 段落的 n-gram 中命中模板的比例达到该值即判定为模板
+    max_learned_share: float = 0.3  # 学习结果要去掉一章中超过该比例的段落时视为误判，该章只用规则与去重
+
+    @classmethod
+    def load(cls, path: Optional[Path]) -> "FilterRules":
+        """JSON 规则文件：与字段同名的键覆盖默认值；"patterns" 替换默认正则，"extra_patterns" 追加在默认正则后。"""
+        rules = cls()
+        if path is None:
+            return rules
+        obj = json.loads(path.read_text(encoding="utf-8"))
+        if not isinstance(obj, dict):
+            raise ValueError(f"filter rules must be a JSON object: {path}")
+        for f in fields(cls):
+            if f.name == "patterns" and "patterns" in obj:
+                rules.patterns = [str(p) for p in obj["patterns"]]
+            elif f.name in obj:
+                # 数值字段按默认值的类型转换（int / float）
+                setattr(rules, f.name, type(getattr(rules, f.name))(obj[f.name]))
+        rules.patterns.extend(str(p) for p in obj.get("extra_patterns") or [])
+        for p in rules.patterns:
+            re.compile(p)
+        return rules
+
+
+@dataclass
+class BoilerplateModel:
+    """书库学习结果：被足够多本书共有、且在书内重复出现的短段落 n-gram。"""
+
+    ngram: int
+    books: int
+    grams: Set[str]
+
+    def save(self, path: Path) -> None:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        obj = {"version": 1, "created": int(time.time()), "ngram": self.ngram, "books": self.books, "grams": sorted(self.grams)}
+        path.write_text(json.dumps(obj, ensure_ascii=False), encoding="utf-8")
+
+    @classmethod
+    def load(cls, path: Path) -> Optional["BoilerplateModel"]:
+        try:
+            obj = json.loads(path.read_text(encoding="utf-8"))
+        except (OSError, json.JSONDecodeError):
+            return None
+        return cls(ngram=int(obj.get("ngram") or 6), books=int(obj.get("books") or 0), grams=set(obj.get("grams") or []))
+
+
+def _iter_paragraphs(jsonl_text: str) -> Iterable[Tuple[str, Optional[int], str]]:
+    """(原始行, paragraph_id, text)；无法解析的行 paragraph_id 为 None，原样保留。"""
+    for line in jsonl_text.splitlines(keepends=True):
+        if not line.strip():
+            continue
+        try:
+            obj = json.loads(line)
+        except json.JSONDecodeError:
+            yield line, None, ""
+            continue
+        pid = obj.get("paragraph_id") if isinstance(obj, dict) else None
+        if not isinstance(pid, int):
+            yield line, None, ""
+            continue
+        yield line, pid, str(obj.get("text") or "")
+
+
+def learn(book_dirs: Sequence[Path], rules: FilterRules) -> BoilerplateModel:
+    """统计每本书“书内重复”的短段落 n-gram，保留被至少 max(min_books, min_book_ratio*书数) 本书共有的 n-gram。"""
+    df: Counter = Counter()
+    for book_dir in book_dirs:
+        per_book: Counter = Counter()
+        for _, path in iter_chapter_jsonl_files(book_dir):
+            for _, pid, text in _iter_paragraphs(read_jsonl_as_text(path)):
+                if pid is None or len(text) > rules.max_chars:
+                    continue
+                per_book.update(char_ngrams(normalize(text), rules.ngram))
+        df.update(g for g, n in per_book.items() if n >= rules.min_repeats)
+    threshold = max(rules.min_books, math.ceil(rules.min_book_ratio * len(book_dirs)))
+    return BoilerplateModel(ngram=rules.ngram, books=len(book_dirs), grams={g for g, n in df.items() if n >= threshold})
+
+
+@dataclass
+class FilterResult:
+    chapter_no: int
+    jsonl: str  # 过滤后的章节 JSONL（保留行与原文件逐字节相同）
+    paragraph_ids: List[int]  # 保留段落的原始 paragraph_id
+    total: int
+    dropped: List[Dict[str, Any]] = field(default_factory=list)
+    chars_before: int = 0
+    chars_after: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "chapter": self.chapter_no,
+            "paragraphs": self.total,
+            "kept": len(self.paragraph_ids),
+            "chars_before": self.chars_before,
+            "chars_after": self.chars_after,
+            "dropped": self.dropped,
+        }
+
+
+class ParagraphFilter:
+    def __init__(self, rules: FilterRules, model: Optional[BoilerplateModel] = None) -> None:
+        self.rules = rules
+        self.model = model if model is not None and model.ngram == rules.ngram and model.grams else None
+        self._patterns = [re.compile(p) for p in rules.patterns]
+
+    def reason(self, text: str, *, learned: bool = True) -> Optional[str]:
+        """短段落命中规则返回 "rule"，命中书库模板返回 "learned"，否则 None。"""
+        s = text.strip()
+        if not s or len(s) > self.rules.max_chars:
+            return None
+        if any(p.search(s) for p in self._patterns):
+            return "rule"
+        if learned and self.model is not None:
+            grams = char_ngrams(normalize(s), self.rules.ngram)
+            if grams and sum(1 for g in grams if g in self.model.grams) >= self.rules.gram_share * len(grams):
+                return "learned"
+        return None
+
+    def apply(self, jsonl_text: str, *, chapter_no: int, seen: Dict[str, Tuple[int, int]]) -> FilterResult:
+        """
+        过滤一章。seen 为同一本书的去重状态（归一化文本 -> (章序, paragraph_id)），按章节顺序调用时会被更新。
+        整章都会被去掉时原样返回（宁可多花 token，也不给模型一个空章节）。
+        """
+        paras = list(_iter_paragraphs(jsonl_text))
+        learned = self.model is not None
+        if learned:
+            hits = sum(1 for _, pid, text in paras if pid is not None and self.reason(text) == "learned")
+            learned = hits <= self.rules.max_learned_share * sum(1 for _, pid, _ in paras if pid is not None)
+        return self._apply(jsonl_text, paras, chapter_no=chapter_no, seen=seen, learned=learned)
+
+    def _apply(
+        self,
+        jsonl_text: str,
+        paras: List[Tuple[str, Optional[int], str]],
+        *,
+        chapter_no: int,
+        seen: Dict[str, Tuple[int, int]],
+        learned: bool,
+    ) -> FilterResult:
+        kept_lines: List[str] = []
+        kept_ids: List[int] = []
+        dropped: List[Dict[str, Any]] = []
+        total = chars_before = chars_after = 0
+        for line, pid, text in paras:
+            if pid is None:
+                kept_lines.append(line)
+                continue
+            total += 1
+            chars_before += len(text)
+            why = self.reason(text, learned=learned)
+            same_as = None
+            if why is None:
+                norm = normalize(text)
+                if len(norm) >= self.rules.dup_min_chars:
+                    same_as = seen.get(norm)
+                    if same_as is None:
+                        seen[norm] = (chapter_no, pid)
+                    else:
+                        why = "duplicate"
+            if why is not None:
+                rec: Dict[str, Any] = {"paragraph_id": pid, "reason": why, "text": text[:40]}
+                if same_as is not None:
+                    rec["same_as"] = {"chapter": same_as[0], "paragraph_id": same_as[1]}
+                dropped.append(rec)
+                continue
+            kept_lines.append(line)
+            kept_ids.append(pid)
+            chars_after += len(text)
+
+        if not kept_ids:
+            ids = [pid for _, pid, _ in paras if pid is not None]
+            return FilterResult(chapter_no, jsonl_text, ids, total, chars_before=chars_before, chars_after=chars_before)
+        return FilterResult(chapter_no, "".join(kept_lines), kept_ids, total, dropped, chars_before, chars_after)
+
+    def apply_book_chapter(self, book_dir: Path, chapter_no: int) -> Optional[FilterResult]:
+        """只过滤某一章（批量导出用）：按顺序重放前面各章以恢复跨章去重状态。"""
+        seen: Dict[str, Tuple[int, int]] = {}
+        for no, path in iter_chapter_jsonl_files(book_dir):
+            if no > chapter_no:
+                break
+            result = self.apply(read_jsonl_as_text(path), chapter_no=no, seen=seen)
+            if no == chapter_no:
+                return result
+        return None
+
+
+def load_filter(rules_path: Optional[Path], library_dir: Path) -> ParagraphFilter:
+    """规则文件 + 书库目录下的学习结果（<library>/.boilerplate.json，不存在时只用规则与去重）。"""
+    return ParagraphFilter(FilterRules.load(rules_path), BoilerplateModel.load(library_dir / MODEL_FILENAME))
+
+
+def filter_report_json(results: Sequence[FilterResult], previous: Optional[str] = None) -> str:
+    """filter_report.json 的内容：previous（已有报告）中的章节记录被本次同章的结果替换。"""
+    chapters: Dict[int, Dict[str, Any]] = {}
+    try:
+        for c in json.loads(previous or "{}").get("chapters") or []:
+            chapters[int(c["chapter"])] = c
+    except (json.JSONDecodeError, KeyError, TypeError, ValueError, AttributeError):
+        pass
+    for r in results:
+        chapters[r.chapter_no] = r.as_dict()
+    return json.dumps({"chapters": [chapters[k] for k in sorted(chapters)]}, ensure_ascii=False, indent=2)
+
+
+def write_filter_report(out_dir: Path, results: Sequence[FilterResult]) -> Path:
+    """按章节合并写入 analysis/filter_report.json（批量模式每轮只过滤一章，保留其余章节的记录）。"""
+    path = out_dir / REPORT_FILENAME
+    try:
+        previous: Optional[str] = path.read_text(encoding="utf-8")
+    except OSError:
+        previous = None
+    out_dir.mkdir(parents=True, exist_ok=True)
+    path.write_text(filter_report_json(results, previous), encoding="utf-8")
+    return path
+
+
+def format_filter_line(r: FilterResult) -> str:
+    reasons = Counter(d["reason"] for d in r.dropped)
+    detail = "，".join(f"{k} {v}" for k, v in sorted(reasons.items())) or "无"
+    return (
+        f"第{r.chapter_no}章 去掉 {len(r.dropped)}/{r.total} 段（{detail}），"
+        f"字数 {r.chars_before} -> {r.chars_after}"
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    from batch import find_book_dirs
+
+    parser = argparse.ArgumentParser(description="Learn library-wide boilerplate for the pre-LLM paragraph filter.")
+    parser.add_argument("library", type=Path, help='Library dir, e.g. "book"')
+    parser.add_argument("--rules", type=Path, default=None, help="Filter rules JSON (see FilterRules)")
+    parser.add_argument("--output", type=Path, default=None, help=f"Model path (default: <library>/{MODEL_FILENAME})")
+    parser.add_argument("--preview", type=Path, default=None, help="Only print what would be dropped for this book dir")
+    args = parser.parse_args(argv)
+
+    rules = FilterRules.load(args.rules)
+    model_path = args.output or (args.library / MODEL_FILENAME)
+    if args.preview is not None:
+        flt = ParagraphFilter(rules, BoilerplateModel.load(model_path))
+        seen: Dict[str, Tuple[int, int]] = {}
+        for no, path in iter_chapter_jsonl_files(args.preview):
+            r = flt.apply(read_jsonl_as_text(path), chapter_no=no, seen=seen)
+            print(f"[预览] {format_filter_line(r)}")
+            for d in r.dropped:
+                print(f"    #{d['paragraph_id']:<4} {d['reason']:<9} {d['text']}")
+        return 0
+
+    book_dirs = find_book_dirs(args.library)
+    model = learn(book_dirs, rules)
+    model.save(model_path)
+    print(f"[学习] 书目={len(book_dirs)} 模板 n-gram={len(model.grams)} -> {model_path}")
+    if len(book_dirs) < rules.min_books:
+        print(f"[学习] 书目少于 min_books={rules.min_books}，只会使用正则规则与去重")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,269 @@
+from __future__ import annotations
+
+"""
+模型级联：先用快速/便宜的模型分析，只有结果不合格时才升级到更强的模型。
+
+- 每一级对应 llm.json 中的一个 profile（见 LLM_CONFIG.md 的 cascade）
+- 合格 = JSON 可解析 + schema 正确 + 段落覆盖率 >= min_coverage + 质量分 >= quality_threshold
+- 非最后一级：不合格（或调用失败）直接升级，不在本级重试
+- 最后一级：保留原有的“非法 JSON 重试”逻辑；仍不合格（或调用失败）时取所有尝试中质量最高的可解析结果，
+  没有任何可解析结果时才把最后一级的调用异常抛给调用方
+- 每次尝试都会记录下来（写入 analysis/<章节>.attempts.jsonl，并带 tier 写入调用记录）
+"""
+
+import json
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence
+
+from chapters import save_analysis
+from io_utils import extract_json_object, safe_print
+from validation import ValidationResult, validate_analysis
+
+from llm_provider.balancer import EndpointPool, pooled_chat_completions
+from llm_provider.context_cache import PrefixCache, merge_stats
+from llm_provider.hedging import Hedger
+from llm_provider.llm_config import ChatRunConfig
+from llm_provider.volc_ark_chat import ChatMessage
+
+
+@dataclass
+class Attempt:
+    tier: int
+    profile: str
+    model: str
+    status: str  # accepted | rejected | invalid_json | error
+    latency_s: float = 0.0
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    retries: int = 0
+    validation: Optional[Dict[str, Any]] = None
+    error: str = ""
+
+    def as_dict(self) -> Dict[str, Any]:
+        d: Dict[str, Any] = {
+            "tier": self.tier,
+            "profile": self.profile,
+            "model": self.model,
+            "status": self.status,
+            "latency_s": round(self.latency_s, 4),
+            "prompt_tokens": self.prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "retries": self.retries,
+        }
+        if self.validation is not None:
+            d["validation"] = self.validation
+        if self.error:
+            d["error"] = self.error
+        return d
+
+
+@dataclass
+class CascadeOutcome:
+    obj: Optional[Dict[str, Any]]
+    tier: int = -1
+    validation: Optional[ValidationResult] = None
+    attempts: List[Attempt] = field(default_factory=list)
+    content: Optional[str] = None  # 被采用（或最后一次）的模型原始输出，不落盘时由调用方保存
+
+    @property
+    def escalated(self) -> bool:
+        return self.tier > 0
+
+
+@dataclass
+class _Candidate:
+    content: str
+    obj: Dict[str, Any]
+    validation: ValidationResult
+    tier: int
+    attempt: Attempt
+
+
+class ModelCascade:
+    """按 run_cfg.tiers 顺序调用各级模型；每一级有独立的端点池，对冲器共用。"""
+
+    def __init__(
+        self,
+        run_cfg: ChatRunConfig,
+        *,
+        hedger: Optional[Hedger] = None,
+        temperature: Optional[float] = None,
+        max_tokens: Optional[int] = None,
+    ) -> None:
+        self.tiers: List[ChatRunConfig] = list(run_cfg.tiers)
+        self.pools = [EndpointPool(cfg.pool) for cfg in self.tiers]
+        # 开启 context_cache 的级别把 system 消息（静态前缀）建成服务端缓存，按 id 引用
+        self.context_caches: List[Optional[PrefixCache]] = [
+            PrefixCache(ttl_s=cfg.params.context_ttl_s) if cfg.params.context_cache else None for cfg in self.tiers
+        ]
+        self.hedger = hedger
+        self.temperature = temperature
+        self.max_tokens = max_tokens
+        self.min_coverage = run_cfg.min_coverage
+        self.quality_threshold = run_cfg.quality_threshold
+
+    def __len__(self) -> int:
+        return len(self.tiers)
+
+    def describe(self) -> str:
+        return " -> ".join(f"{cfg.profile_name or cfg.provider_name}({cfg.model})" for cfg in self.tiers)
+
+    def _call(self, tier: int, system: str, user_prompt: str):
+        cfg = self.tiers[tier]
+        return pooled_chat_completions(
+            self.pools[tier],
+            prefix=[ChatMessage(role="system", content=system)],
+            messages=[ChatMessage(role="user", content=user_prompt)],
+            context_cache=self.context_caches[tier],
+            temperature=self.temperature if self.temperature is not None else cfg.params.temperature,
+            max_tokens=self.max_tokens if self.max_tokens is not None else cfg.params.max_tokens,
+            thinking=cfg.params.thinking,
+            timeout_s=cfg.params.timeout_s,
+            hedger=self.hedger,
+            max_retries=cfg.params.max_retries,
+        )
+
+    def cache_stats(self) -> Optional[Dict[str, Any]]:
+        """各级上下文缓存的合计统计；没有任何一级开启时为 None。"""
+        caches = [c for c in self.context_caches if c is not None]
+        return merge_stats([c.stats() for c in caches]) if caches else None
+
+    def analyze(
+        self,
+        *,
+        system: str,
+        user_prompt: str,
+        paragraph_ids: Sequence[int],
+        json_path: Optional[Path] = None,
+        raw_path: Optional[Path] = None,
+        telemetry: Any = None,
+        call_ctx: Optional[Dict[str, Any]] = None,
+    ) -> CascadeOutcome:
+        """
+        分析一章；返回被采用的结果（全部失败时 obj 为 None，原始输出仍会保存到 raw_path）。
+        json_path/raw_path 为 None 时不落盘，结果只在返回值里。
+        """
+        call_ctx = dict(call_ctx or {})
+        outcome = CascadeOutcome(obj=None)
+        best: Optional[_Candidate] = None
+        last_content: Optional[str] = None
+        last_tier = len(self.tiers) - 1
+
+        for tier, cfg in enumerate(self.tiers):
+            tries = cfg.params.json_retries + 1 if tier == last_tier else 1
+            for attempt_no in range(tries):
+                attempt = Attempt(tier=tier, profile=cfg.profile_name, model=cfg.model, status="error")
+                outcome.attempts.append(attempt)
+                ctx = {**call_ctx, "profile": cfg.profile_name or call_ctx.get("profile", ""), "tier": tier}
+                t_call = time.perf_counter()
+                try:
+                    result = self._call(tier, system, user_prompt)
+                except Exception as e:
+                    attempt.latency_s = time.perf_counter() - t_call
+                    attempt.error = f"{type(e).__name__}: {e}"[:300]
+                    if telemetry is not None:
+                        telemetry.record(status="error", error=e, latency_s=attempt.latency_s, model=cfg.model, **ctx)
+                    if tier == last_tier:
+                        if best is None:
+                            raise
+                        safe_print(f"WARN tier={tier} ({cfg.model}) 调用失败，改用此前级别的结果：{attempt.error}")
+                        break
+                    safe_print(f"WARN tier={tier} ({cfg.model}) 调用失败，升级：{attempt.error}")
+                    break
+
+                attempt.latency_s = result.latency_s
+                attempt.prompt_tokens = result.prompt_tokens
+                attempt.completion_tokens = result.completion_tokens
+                attempt.retries = result.retries
+                last_content = result.content
+
+                obj = extract_json_object(result.content)
+                if not isinstance(obj, dict):
+                    attempt.status = "invalid_json"
+                    if telemetry is not None:
+                        telemetry.record(result, status="invalid_json", **ctx)
+                    if attempt_no < tries - 1:
+                        safe_print(f"WARN tier={tier}: invalid JSON, retry {attempt_no + 1}/{tries - 1}")
+                    continue
+
+                v = validate_analysis(obj, paragraph_ids)
+                attempt.validation = v.as_dict()
+                ok = v.passes(min_coverage=self.min_coverage, quality_threshold=self.quality_threshold)
+                attempt.status = "accepted" if ok else "rejected"
+                if telemetry is not None:
+                    telemetry.record(
+                        result, status="ok", accepted=ok, coverage=attempt.validation["coverage"],
+                        quality=attempt.validation["quality"], **ctx
+                    )
+                cand = _Candidate(result.content, obj, v, tier, attempt)
+                if best is None or v.quality > best.validation.quality:
+                    best = cand
+                if ok:
+                    best = cand
+                    break
+                safe_print(
+                    f"WARN tier={tier} ({cfg.model}) 结果不合格：schema错误={len(v.schema_errors)} "
+                    f"覆盖率={v.coverage:.2%} 质量={v.quality:.2f}"
+                )
+                # 已可解析但不合格：最后一级不再重试（重试只针对非法 JSON）
+                break
+
+            if best is not None and best.attempt.status == "accepted":
+                break
+
+        persist = json_path is not None and raw_path is not None
+        outcome.content = best.content if best is not None else last_content
+        if best is None:
+            if last_content is not None and persist:
+                save_analysis(last_content, json_path, raw_path)
+            return outcome
+
+        if best.attempt.status != "accepted":
+            best.attempt.status = "accepted_best_effort"
+            safe_print(f"WARN 所有级别均未通过校验，采用质量最高的结果（tier={best.tier}，质量={best.validation.quality:.2f}）")
+        if persist:
+            save_analysis(best.content, json_path, raw_path)
+        outcome.obj = best.obj
+        outcome.tier = best.tier
+        outcome.validation = best.validation
+        return outcome
+
+
+def attempts_path(json_path: Path) -> Path:
+    """1_妖魔乱世.json -> 1_妖魔乱世.attempts.jsonl（.jsonl 不会被第三阶段当作分析结果读取）。"""
+    return json_path.with_name(f"{json_path.stem}.attempts.jsonl")
+
+
+def attempts_jsonl(attempts: Sequence[Attempt], *, book: str, chapter: int) -> str:
+    ts = round(time.time(), 3)
+    rows = [{"ts": ts, "book": book, "chapter": chapter, **a.as_dict()} for a in attempts]
+    return "".join(json.dumps(row, ensure_ascii=False) + "\n" for row in rows)
+
+
+def write_attempts(path: Path, attempts: Sequence[Attempt], *, book: str, chapter: int) -> None:
+    path.write_text(attempts_jsonl(attempts, book=book, chapter=chapter), encoding="utf-8")
+
+
+def format_cache_report(stats: Dict[str, Any]) -> str:
+    line = (
+        f"命中 {stats['cached_calls']} 次、未走缓存 {stats['plain_calls']} 次；"
+        f"缓存读取 {stats['cached_tokens']} prompt tokens，创建 {stats['creates']} 次"
+        f"（刷新 {stats['refreshes']}，{stats['create_tokens']} tokens）；节省约 {stats['saved_tokens']} prompt tokens"
+    )
+    if stats.get("unreported_calls"):
+        line += f"（另有 {stats['unreported_calls']} 次命中服务端未返回缓存用量，未计入）"
+    if stats.get("unsupported"):
+        line += "；不支持（已回退）：" + ", ".join(stats["unsupported"])
+    return line
+
+
+def format_tier_report(tier_counts: Dict[int, int], tiers: Sequence[ChatRunConfig]) -> str:
+    total = sum(tier_counts.values())
+    parts = []
+    for i, cfg in enumerate(tiers):
+        n = tier_counts.get(i, 0)
+        share = (n / total) if total else 0.0
+        parts.append(f"tier{i} {cfg.model}: {n} 章（{share:.0%}）")
+    return "；".join(parts)
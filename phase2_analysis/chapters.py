@@ -0,0 +1,111 @@
+from __future__ import annotations
+
+"""章节文件与分析结果的读写工具（实时调用与批量模式共用）。"""
+
+import json
+import re
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from io_utils import extract_json_object
+from prompts import PromptBundle, render_prompt_1, render_prompt_23
+
+
+def iter_chapter_jsonl_files(novel_dir: Path) -> List[Tuple[int, Path]]:
+    files: List[Tuple[int, Path]] = []
+    for p in novel_dir.glob("*.jsonl"):
+        # 期望格式：<章序>_<章节名>.jsonl
+        try:
+            no = int(p.name.split("_", 1)[0])
+        except Exception:
+            continue
+        files.append((no, p))
+    files.sort(key=lambda x: x[0])
+    return files
+
+
+def read_jsonl_as_text(path: Path) -> str:
+    # 直接把 jsonl 原样作为 prompt 的输入（保证 paragraph_id 严格对应）。
+    return path.read_text(encoding="utf-8")
+
+
+def sanitize_filename_component(name: str) -> str:
+    """用于输出文件名的安全清洗（主要兼容 Windows 文件名限制）。"""
+    name = name.strip()
+    name = name.replace("\u00a0", " ").replace("\u3000", " ")
+    # Windows forbidden characters: <>:"/\|?*
+    name = re.sub(r'[<>:"/\\\\|?*]+', "_", name)
+    name = re.sub(r"\s{2,}", " ", name).strip()
+    # 避免极端情况下文件名过长
+    return (name[:80] or "untitled")
+
+
+def analysis_paths(out_dir: Path, jsonl_path: Path) -> Tuple[Path, Path]:
+    """章节 jsonl 对应的 (分析 json, 模型原始输出) 路径，例如 1_妖魔乱世.json / 1_妖魔乱世.raw.txt。"""
+    out_stem = sanitize_filename_component(jsonl_path.stem)
+    return out_dir / f"{out_stem}.json", out_dir / f"{out_stem}.raw.txt"
+
+
+def summarize_previous(result: Dict) -> str:
+    """
+    为第 2/3 章生成“上一章总结”占位内容。
+    这里从模型输出的 chunks 中提取 plot_summary + pacing_summary 简要拼接。
+    """
+    chunks = result.get("chunks") or []
+    parts: List[str] = []
+    for c in chunks:
+        title = (c.get("chunk_title") or "").strip()
+        if title:
+            parts.append(f"- 小节：{title}")
+        ps = (c.get("plot_summary") or "").strip()
+        pace = (c.get("pacing_summary") or "").strip()
+        if ps:
+            parts.append(f"- 剧情：{ps}")
+        if pace:
+            parts.append(f"- 节奏：{pace}")
+    return "\n".join(parts).strip() or "无"
+
+
+def render_chapter_prompt(
+    prompts: PromptBundle, *, chapter_no: int, jsonl_content: str, previous_summary: str, hints: str = ""
+) -> str:
+    """第 1 章用 prompt_1，第 2/3 章用 prompt_23（需要上一章总结）；hints（如本地节奏统计）追加在末尾。"""
+    if chapter_no == 1:
+        prompt = render_prompt_1(prompts.prompt_1, jsonl_content=jsonl_content, chapter_id=1)
+    else:
+        prompt = render_prompt_23(
+            prompts.prompt_23,
+            jsonl_content=jsonl_content,
+            previous_summary=previous_summary,
+            chapter_id=chapter_no,
+        )
+    if hints:
+        prompt = f"{prompt.rstrip()}\n\n{hints}\n"
+    return prompt
+
+
+def analysis_json_text(obj: Any) -> str:
+    """分析 json 的写出格式（文件与产物存储共用）。"""
+    return json.dumps(obj, ensure_ascii=False, indent=2)
+
+
+def save_analysis(content: str, json_path: Path, raw_path: Path) -> Optional[Any]:
+    """保存模型原始输出；能解析出 JSON 时同时写分析 json 并返回该对象，否则返回 None。"""
+    raw_path.parent.mkdir(parents=True, exist_ok=True)
+    raw_path.write_text(content, encoding="utf-8")
+    obj = extract_json_object(content)
+    if obj is None:
+        return None
+    json_path.write_text(analysis_json_text(obj), encoding="utf-8")
+    return obj
+
+
+def load_analysis(json_path: Path) -> Optional[Dict[str, Any]]:
+    """读取已有的分析 json；不存在或损坏时返回 None。"""
+    if not json_path.exists():
+        return None
+    try:
+        obj = json.loads(json_path.read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError):
+        return None
+    return obj if isinstance(obj, dict) else None
@@ -0,0 +1,194 @@
+from __future__ import annotations
+
+"""
+上一章上下文压缩：在 token 预算内为第 2/3 章挑选最重要的“上一章总结”内容。
+
+- 候选条目：每个 chunk 的标题 / 剧情总结 / 节奏总结（与 summarize_previous 的格式一致）
+- 重要性：剧情 > 标题 > 节奏；越靠近章末的 chunk 越重要（衔接下一章）；含爆点/钩子的 chunk 加权
+- 预算不足时按重要性贪心保留，放不下的长条目会被截断，其余丢弃；输出仍按原顺序排列
+- 可选滚动摘要（rolling）：把更早章节也压缩进来，占预算的一部分
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from chapters import summarize_previous
+
+_KIND_LABEL = {"title": "小节", "plot": "剧情", "pace": "节奏"}
+_KIND_WEIGHT = {"plot": 3.0, "title": 2.0, "pace": 1.0}
+_MIN_TRUNCATED_TOKENS = 12
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数：中日韩字符约 1 token/字，其余约 4 字符/token。"""
+    cjk = sum(1 for ch in text if ord(ch) > 0x2E80)
+    return cjk + (len(text) - cjk + 3) // 4
+
+
+@dataclass(frozen=True)
+class _Item:
+    order: Tuple[int, int, int]  # (章节序, chunk 序, 字段序) 用于还原原始顺序
+    kind: str
+    text: str
+    score: float
+
+
+@dataclass(frozen=True)
+class ContextStats:
+    """某一章提示词实际拿到的上下文规模。"""
+
+    chapter_no: int
+    full_tokens: int
+    context_tokens: int
+    items_total: int
+    items_kept: int
+    items_truncated: int
+
+    @property
+    def saved_tokens(self) -> int:
+        return max(0, self.full_tokens - self.context_tokens)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "chapter": self.chapter_no,
+            "full_tokens": self.full_tokens,
+            "context_tokens": self.context_tokens,
+            "saved_tokens": self.saved_tokens,
+            "items_total": self.items_total,
+            "items_kept": self.items_kept,
+            "items_truncated": self.items_truncated,
+        }
+
+
+def _chunk_has_hook(chunk: Dict[str, Any]) -> bool:
+    for s in chunk.get("slices") or []:
+        if not isinstance(s, dict):
+            continue
+        hook = str(s.get("hook_extraction") or "").strip()
+        if hook and hook not in {"无", "无。", "none", "None"}:
+            return True
+    return False
+
+
+def _items_for(result: Dict[str, Any], *, chapter_idx: int, recency: float) -> List[_Item]:
+    chunks = [c for c in (result.get("chunks") or []) if isinstance(c, dict)]
+    items: List[_Item] = []
+    n = len(chunks)
+    for ci, c in enumerate(chunks):
+        position = (ci + 1) / n if n else 1.0
+        hook = 1.3 if _chunk_has_hook(c) else 1.0
+        for fi, (kind, key) in enumerate((("title", "chunk_title"), ("plot", "plot_summary"), ("pace", "pacing_summary"))):
+            text = str(c.get(key) or "").strip()
+            if not text:
+                continue
+            score = _KIND_WEIGHT[kind] * (0.6 + 0.4 * position) * hook * recency
+            items.append(_Item(order=(chapter_idx, ci, fi), kind=kind, text=text, score=score))
+    return items
+
+
+def _render(items: Sequence[_Item]) -> str:
+    return "\n".join(f"- {_KIND_LABEL[it.kind]}：{it.text}" for it in sorted(items, key=lambda it: it.order))
+
+
+def _truncate_to(text: str, budget: int) -> str:
+    """按 token 预算截断文本（末尾加省略号）。"""
+    lo, hi = 0, len(text)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if estimate_tokens(text[:mid]) + 1 <= budget:
+            lo = mid
+        else:
+            hi = mid - 1
+    return text[:lo].rstrip() + "…"
+
+
+def _select(items: List[_Item], budget: int) -> Tuple[List[_Item], int]:
+    """贪心选择：按重要性从高到低放入预算；返回 (保留条目, 被截断的条目数)。"""
+    kept: List[_Item] = []
+    truncated = 0
+    remaining = budget
+    for it in sorted(items, key=lambda it: -it.score):
+        cost = estimate_tokens(f"- {_KIND_LABEL[it.kind]}：{it.text}") + 1
+        if cost <= remaining:
+            kept.append(it)
+            remaining -= cost
+            continue
+        overhead = estimate_tokens(f"- {_KIND_LABEL[it.kind]}：") + 1
+        if it.kind != "title" and remaining - overhead >= _MIN_TRUNCATED_TOKENS:
+            text = _truncate_to(it.text, remaining - overhead)
+            kept.append(_Item(order=it.order, kind=it.kind, text=text, score=it.score))
+            truncated += 1
+            remaining -= estimate_tokens(f"- {_KIND_LABEL[it.kind]}：{text}") + 1
+    return kept, truncated
+
+
+class ContextCompactor:
+    """在 token 预算内构造 previous_chapter_summary。budget_tokens<=0 表示不限制（与旧行为一致）。"""
+
+    def __init__(self, budget_tokens: int = 1000, *, rolling: bool = False, rolling_share: float = 0.35) -> None:
+        self.budget_tokens = budget_tokens
+        self.rolling = rolling
+        self.rolling_share = min(0.9, max(0.0, rolling_share))
+
+    def build(self, previous_results: Sequence[Dict[str, Any]], *, chapter_no: int) -> Tuple[str, ContextStats]:
+        """previous_results：本章之前各章的分析结果（按章序）；最后一个即“上一章”。"""
+        if not previous_results:
+            return "", ContextStats(chapter_no, 0, 0, 0, 0, 0)
+
+        last = previous_results[-1]
+        older: List[Dict[str, Any]] = list(previous_results[:-1]) if self.rolling else []
+
+        last_full = summarize_previous(last)
+        older_full = [summarize_previous(r) for r in older]
+        full_text = "\n".join(older_full + [last_full])
+        full_tokens = estimate_tokens(full_text)
+
+        last_items = _items_for(last, chapter_idx=len(older), recency=1.0)
+        older_items: List[_Item] = []
+        for i, r in enumerate(older):
+            # 越早的章节越不重要
+            older_items.extend(_items_for(r, chapter_idx=i, recency=0.5 ** (len(older) - i)))
+        items_total = len(last_items) + len(older_items)
+
+        if self.budget_tokens <= 0 or full_tokens <= self.budget_tokens:
+            text = self._join(older_full, last_full)
+            return text, ContextStats(chapter_no, full_tokens, estimate_tokens(text), items_total, items_total, 0)
+
+        older_budget = int(self.budget_tokens * self.rolling_share) if older_items else 0
+        kept_older, trunc_older = _select(older_items, older_budget)
+        # 更早章节没用完的预算留给上一章
+        used_older = estimate_tokens(_render(kept_older)) if kept_older else 0
+        kept_last, trunc_last = _select(last_items, self.budget_tokens - used_older)
+
+        text = self._join([_render(kept_older)] if kept_older else [], _render(kept_last) or "无")
+        stats = ContextStats(
+            chapter_no=chapter_no,
+            full_tokens=full_tokens,
+            context_tokens=estimate_tokens(text),
+            items_total=items_total,
+            items_kept=len(kept_older) + len(kept_last),
+            items_truncated=trunc_older + trunc_last,
+        )
+        return text, stats
+
+    @staticmethod
+    def _join(older_parts: Sequence[str], last_part: str) -> str:
+        older_parts = [p for p in older_parts if p and p != "无"]
+        if not older_parts:
+            return last_part
+        return "【更早章节】\n" + "\n".join(older_parts) + "\n【上一章】\n" + last_part
+
+
+def format_context_report(stats: Sequence[ContextStats]) -> List[str]:
+    """每章一行的上下文报告（用于控制台输出）。"""
+    lines = []
+    for s in stats:
+        lines.append(
+            f"第{s.chapter_no}章 上下文={s.context_tokens} tokens（原始 {s.full_tokens}，节省 {s.saved_tokens}） "
+            f"条目 {s.items_kept}/{s.items_total}，截断 {s.items_truncated}"
+        )
+    return lines
+
+
+def total_saved(stats: Optional[Sequence[ContextStats]]) -> int:
+    return sum(s.saved_tokens for s in stats or ())
@@ -0,0 +1,514 @@
+from __future__ import annotations
+
+"""
+近重复书目检测：同一本小说换了文件名或略有修订时，复用已有的 analysis/*.json，不再调用模型。
+
+- 签名：章节正文（归一化后）的字符 n-gram 集合上的 MinHash（单次哈希分桶，NUM_PERM 个桶，每桶取最小值）；
+  书的签名取前几章（已有分析结果的章节）n-gram 的并集
+- 索引：SQLite（默认 <书库>/.near_dup.sqlite）；书签名按 LSH 切成 BANDS 段，每段一个桶键，
+  查询时只比较落在同一个桶里的候选书目（主键查找，书库规模 10 万本时仍在亚毫秒级）
+- 复用：新书每一章找旧书中相似度最高的章节，按段落文本对齐，把分析结果里的段落编号映射到新书的 paragraph_id，
+  再用 validation.py 校验覆盖率；对不齐或校验不通过的章节照常调用模型
+
+复用记录写入 analysis/reuse_report.json。
+
+Command:
+  python phase2_analysis/near_dup.py index book                  # 把书库中已完成第二阶段的书加入索引
+  python phase2_analysis/near_dup.py query "book/书名"            # 查询与某本书近重复的已分析书目
+  python phase2_analysis/near_dup.py stats book
+"""
+
+import argparse
+import copy
+import difflib
+import hashlib
+import json
+import sqlite3
+import struct
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+
+from boilerplate import normalize
+from chapters import analysis_paths, iter_chapter_jsonl_files, load_analysis, read_jsonl_as_text
+from validation import validate_analysis
+
+INDEX_FILENAME = ".near_dup.sqlite"
+REPORT_FILENAME = "reuse_report.json"
+
+NUM_PERM = 128
+BANDS = 16  # 每段 ROWS 个桶；相似度约 (1/BANDS) ** (1/ROWS) ≈ 0.71 以上的书大概率成为候选
+ROWS = NUM_PERM // BANDS
+NGRAM = 5
+MIN_SHINGLES = 200  # n-gram 太少（章节过短）的签名不可靠，不参与索引与查询
+
+_EMPTY = (1 << 57) - 1  # 空桶（桶内值只用哈希的高 57 位）
+_SIG = struct.Struct(f"<{NUM_PERM}Q")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    added_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chapters (
+    book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+    chapter_no INTEGER NOT NULL,
+    stem TEXT NOT NULL,
+    signature BLOB NOT NULL,
+    PRIMARY KEY (book_id, chapter_no)
+);
+CREATE TABLE IF NOT EXISTS bands (
+    band INTEGER NOT NULL,
+    bucket INTEGER NOT NULL,
+    book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+    PRIMARY KEY (band, bucket, book_id)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS idx_bands_book ON bands(book_id);
+"""
+
+
+def shingles(texts: Sequence[str], n: int = NGRAM) -> Set[int]:
+    """段落文本 -> 归一化后整章字符 n-gram 的 64 位哈希集合。"""
+    norm = "".join(normalize(t) for t in texts)
+    out: Set[int] = set()
+    for i in range(len(norm) - n + 1):
+        out.add(int.from_bytes(hashlib.blake2b(norm[i : i + n].encode("utf-8"), digest_size=8).digest(), "little"))
+    return out
+
+
+def minhash(hashes: Set[int]) -> Tuple[int, ...]:
+    """单次哈希分桶的 MinHash：低 7 位选桶，桶内取高位的最小值（每个 n-gram 只算一次哈希）。"""
+    sig = [_EMPTY] * NUM_PERM
+    for h in hashes:
+        b = h & (NUM_PERM - 1)
+        v = h >> 7
+        if v < sig[b]:
+            sig[b] = v
+    return tuple(sig)
+
+
+def similarity(a: Sequence[int], b: Sequence[int]) -> float:
+    """两个签名估计的 Jaccard 相似度（两边都为空的桶不计）。"""
+    same = used = 0
+    for x, y in zip(a, b):
+        if x == _EMPTY and y == _EMPTY:
+            continue
+        used += 1
+        same += x == y
+    return same / used if used else 0.0
+
+
+def band_buckets(sig: Sequence[int]) -> List[int]:
+    """LSH：每 ROWS 个桶值哈希成一个 64 位有符号整数（SQLite INTEGER）。"""
+    out = []
+    for band in range(BANDS):
+        raw = struct.pack(f"<{ROWS}Q", *sig[band * ROWS : (band + 1) * ROWS])
+        out.append(int.from_bytes(hashlib.blake2b(raw, digest_size=8).digest(), "little", signed=True))
+    return out
+
+
+def _pack(sig: Sequence[int]) -> bytes:
+    return _SIG.pack(*sig)
+
+
+def _unpack(blob: bytes) -> Tuple[int, ...]:
+    return _SIG.unpack(blob)
+
+
+@dataclass
+class ChapterText:
+    """第一阶段的一章：段落编号与文本（顺序一致）。"""
+
+    no: int
+    stem: str
+    ids: List[int]
+    texts: List[str]
+
+    @classmethod
+    def from_jsonl(cls, no: int, stem: str, jsonl_text: str) -> "ChapterText":
+        ids: List[int] = []
+        texts: List[str] = []
+        for line in jsonl_text.splitlines():
+            if not line.strip():
+                continue
+            try:
+                obj = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            if isinstance(obj, dict) and isinstance(obj.get("paragraph_id"), int):
+                ids.append(obj["paragraph_id"])
+                texts.append(str(obj.get("text") or ""))
+        return cls(no=no, stem=stem, ids=ids, texts=texts)
+
+
+def book_chapters(novel_dir: Path, *, max_chapters: int = 3) -> List[ChapterText]:
+    """读取 <小说目录> 下前 max_chapters 章的第一阶段 JSONL。"""
+    return [
+        ChapterText.from_jsonl(no, p.stem, read_jsonl_as_text(p))
+        for no, p in iter_chapter_jsonl_files(novel_dir)
+        if 1 <= no <= max_chapters
+    ]
+
+
+@dataclass
+class BookSignature:
+    book: Tuple[int, ...]
+    chapters: Dict[int, Tuple[int, ...]]
+    usable: bool  # n-gram 足够多，签名可靠
+
+    @classmethod
+    def of(cls, chapters: Sequence[ChapterText]) -> "BookSignature":
+        union: Set[int] = set()
+        per: Dict[int, Tuple[int, ...]] = {}
+        for ch in chapters:
+            hs = shingles(ch.texts)
+            union |= hs
+            per[ch.no] = minhash(hs)
+        return cls(book=minhash(union), chapters=per, usable=len(union) >= MIN_SHINGLES)
+
+
+@dataclass
+class Match:
+    book_id: int
+    name: str
+    path: Path
+    similarity: float
+
+
+@dataclass
+class ReusedChapter:
+    """一章复用结果：映射后的分析结果与来源。"""
+
+    chapter_no: int
+    stem: str
+    obj: Dict[str, Any]
+    source_book: str
+    source_chapter: int
+    similarity: float
+    matched: float  # 新章节中按文本对齐到旧章节的段落比例
+    coverage: float
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "chapter_no": self.chapter_no,
+            "source_book": self.source_book,
+            "source_chapter": self.source_chapter,
+            "similarity": round(self.similarity, 4),
+            "matched": round(self.matched, 4),
+            "coverage": round(self.coverage, 4),
+        }
+
+
+class NearDupIndex:
+    """已分析书目的 MinHash/LSH 索引（SQLite 单文件）。"""
+
+    def __init__(self, path: Path) -> None:
+        self.path = path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(path))
+        self.conn.execute("PRAGMA foreign_keys = ON")
+        self.conn.execute("PRAGMA journal_mode = WAL")
+        self.conn.execute("PRAGMA synchronous = NORMAL")
+        self.conn.executescript(_SCHEMA)
+        self.conn.commit()
+
+    @classmethod
+    def for_library(cls, library_dir: Path, path: Optional[Path] = None) -> "NearDupIndex":
+        return cls(path or (library_dir / INDEX_FILENAME))
+
+    def close(self) -> None:
+        self.conn.close()
+
+    def __enter__(self) -> "NearDupIndex":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def __len__(self) -> int:
+        return int(self.conn.execute("SELECT COUNT(*) FROM books").fetchone()[0])
+
+    def add(self, name: str, novel_dir: Path, chapters: Sequence[ChapterText]) -> bool:
+        """登记（或替换）一本已完成分析的书；签名不可靠（正文过短）时不登记，返回 False。"""
+        sig = BookSignature.of(chapters)
+        if not sig.usable:
+            return False
+        self.add_signature(name, novel_dir.resolve(), sig, {ch.no: ch.stem for ch in chapters})
+        return True
+
+    def add_signature(
+        self, name: str, path: Path, sig: BookSignature, stems: Dict[int, str], *, commit: bool = True
+    ) -> None:
+        """直接登记签名（stems：章序 -> 第一阶段文件名主干）；批量写入时可 commit=False 最后统一提交。"""
+        conn = self.conn
+        conn.execute("DELETE FROM books WHERE name = ?", (name,))
+        cur = conn.execute(
+            "INSERT INTO books(name, path, signature, added_at) VALUES (?, ?, ?, ?)",
+            (name, str(path), _pack(sig.book), time.time()),
+        )
+        book_id = cur.lastrowid
+        conn.executemany(
+            "INSERT INTO chapters(book_id, chapter_no, stem, signature) VALUES (?, ?, ?, ?)",
+            [(book_id, no, stems[no], _pack(chapter_sig)) for no, chapter_sig in sig.chapters.items()],
+        )
+        conn.executemany(
+            "INSERT OR IGNORE INTO bands(band, bucket, book_id) VALUES (?, ?, ?)",
+            [(band, bucket, book_id) for band, bucket in enumerate(band_buckets(sig.book))],
+        )
+        if commit:
+            conn.commit()
+
+    def commit(self) -> None:
+        self.conn.commit()
+
+    def remove(self, name: str) -> None:
+        self.conn.execute("DELETE FROM books WHERE name = ?", (name,))
+        self.conn.commit()
+
+    def query(self, sig: Sequence[int], *, threshold: float = 0.8, exclude: Optional[str] = None) -> List[Match]:
+        """相似度不低于 threshold 的已分析书目（相似度降序）。"""
+        candidates: Set[int] = set()
+        for band, bucket in enumerate(band_buckets(sig)):
+            for (book_id,) in self.conn.execute("SELECT book_id FROM bands WHERE band = ? AND bucket = ?", (band, bucket)):
+                candidates.add(book_id)
+        matches: List[Match] = []
+        for book_id in candidates:
+            row = self.conn.execute("SELECT name, path, signature FROM books WHERE id = ?", (book_id,)).fetchone()
+            if row is None or row[0] == exclude:
+                continue
+            s = similarity(sig, _unpack(row[2]))
+            if s >= threshold:
+                matches.append(Match(book_id=book_id, name=row[0], path=Path(row[1]), similarity=s))
+        matches.sort(key=lambda m: -m.similarity)
+        return matches
+
+    def chapter_signatures(self, book_id: int) -> List[Tuple[int, str, Tuple[int, ...]]]:
+        rows = self.conn.execute(
+            "SELECT chapter_no, stem, signature FROM chapters WHERE book_id = ? ORDER BY chapter_no", (book_id,)
+        )
+        return [(no, stem, _unpack(blob)) for no, stem, blob in rows]
+
+
+# -- 段落对齐与编号映射 --
+
+
+def align_paragraphs(old: ChapterText, new: ChapterText) -> Dict[int, int]:
+    """按归一化文本对齐两章的段落，返回 旧 paragraph_id -> 新 paragraph_id（只含对得上的段落）。"""
+    a = [normalize(t) for t in old.texts]
+    b = [normalize(t) for t in new.texts]
+    mapping: Dict[int, int] = {}
+    sm = difflib.SequenceMatcher(None, a, b, autojunk=False)
+    for tag, i1, i2, j1, j2 in sm.get_opcodes():
+        if tag == "equal":
+            for k in range(i2 - i1):
+                mapping[old.ids[i1 + k]] = new.ids[j1 + k]
+        elif tag == "replace" and i2 - i1 == j2 - j1:
+            # 逐段改了几个字：一一对应，但要求足够相似
+            for k in range(i2 - i1):
+                if difflib.SequenceMatcher(None, a[i1 + k], b[j1 + k], autojunk=False).ratio() >= 0.6:
+                    mapping[old.ids[i1 + k]] = new.ids[j1 + k]
+    return mapping
+
+
+def _map_range(start: Any, end: Any, old_ids: Sequence[int], mapping: Dict[int, int]) -> Optional[Tuple[int, int]]:
+    if not (isinstance(start, int) and isinstance(end, int)) or end < start:
+        return None
+    mapped = [mapping[pid] for pid in old_ids if start <= pid <= end and pid in mapping]
+    if not mapped:
+        return None
+    return min(mapped), max(mapped)
+
+
+def remap_analysis(
+    obj: Dict[str, Any], old: ChapterText, new: ChapterText, mapping: Dict[int, int], *, chapter_no: int
+) -> Optional[Dict[str, Any]]:
+    """
+    把旧章节的分析结果映射到新章节的 paragraph_id。
+
+    每个切片取其区间内对得上的段落映射后的 [最小, 最大]；对不上的切片丢弃（所在剧情块没有切片时整块丢弃）。
+    之后切片首尾相接补齐新章节中新增的段落，剧情块区间取其切片的并集。无法映射时返回 None。
+    """
+    out = copy.deepcopy(obj)
+    chunks = out.get("chunks")
+    if not isinstance(chunks, list):
+        return None
+    kept_chunks: List[Dict[str, Any]] = []
+    slices: List[Dict[str, Any]] = []
+    for c in chunks:
+        if not isinstance(c, dict) or not isinstance(c.get("slices"), list):
+            return None
+        kept = []
+        for s in c["slices"]:
+            r = _map_range(s.get("start"), s.get("end"), old.ids, mapping) if isinstance(s, dict) else None
+            if r is not None:
+                s["start"], s["end"] = r
+                kept.append(s)
+        if kept:
+            c["slices"] = kept
+            kept_chunks.append(c)
+            slices.extend(kept)
+    if not slices or not new.ids:
+        return None
+    # 映射后的切片必须仍按原顺序排列，否则说明段落顺序被大幅调整，放弃复用
+    for prev, cur in zip(slices, slices[1:]):
+        if cur["start"] < prev["start"]:
+            return None
+    slices[0]["start"] = new.ids[0]
+    for prev, cur in zip(slices, slices[1:]):
+        gap = [pid for pid in new.ids if prev["end"] < pid < cur["start"]]
+        if gap:
+            prev["end"] = gap[-1]
+    slices[-1]["end"] = new.ids[-1]
+    for c in kept_chunks:
+        c["start_paragraph"] = c["slices"][0]["start"]
+        c["end_paragraph"] = c["slices"][-1]["end"]
+    out["chunks"] = kept_chunks
+    if "chapter_id" in out:
+        out["chapter_id"] = chapter_no
+    return out
+
+
+def find_reusable(
+    index: NearDupIndex,
+    name: str,
+    chapters: Sequence[ChapterText],
+    *,
+    threshold: float = 0.8,
+    min_matched: float = 0.9,
+    min_coverage: float = 0.95,
+) -> Dict[int, ReusedChapter]:
+    """
+    在索引中查找与本书近重复的已分析书目，逐章映射其分析结果；返回 章序 -> 复用结果。
+
+    某章在相似书中找不到相似度不低于 threshold 的章节、对齐到的段落比例低于 min_matched、
+    或映射后的覆盖率低于 min_coverage 时不复用（该章照常调用模型）。
+    """
+    sig = BookSignature.of(chapters)
+    if not sig.usable:
+        return {}
+    reused: Dict[int, ReusedChapter] = {}
+    for match in index.query(sig.book, threshold=threshold, exclude=name):
+        old_chapters = index.chapter_signatures(match.book_id)
+        for ch in chapters:
+            if ch.no in reused or not ch.ids:
+                continue
+            scored = [(similarity(sig.chapters[ch.no], s), no, stem) for no, stem, s in old_chapters]
+            best = max(scored, default=None)
+            if best is None or best[0] < threshold:
+                continue
+            s, old_no, old_stem = best
+            old_jsonl = match.path / f"{old_stem}.jsonl"
+            json_path, _ = analysis_paths(match.path / "analysis", old_jsonl)
+            if not (old_jsonl.exists() and json_path.exists()):
+                continue
+            old = ChapterText.from_jsonl(old_no, old_stem, read_jsonl_as_text(old_jsonl))
+            mapping = align_paragraphs(old, ch)
+            matched = len(set(mapping.values())) / len(ch.ids)
+            if matched < min_matched:
+                continue
+            obj = load_analysis(json_path)
+            new_obj = remap_analysis(obj, old, ch, mapping, chapter_no=ch.no) if isinstance(obj, dict) else None
+            if new_obj is None:
+                continue
+            v = validate_analysis(new_obj, ch.ids)
+            if not v.passes(min_coverage=min_coverage):
+                continue
+            reused[ch.no] = ReusedChapter(
+                chapter_no=ch.no,
+                stem=ch.stem,
+                obj=new_obj,
+                source_book=match.name,
+                source_chapter=old_no,
+                similarity=s,
+                matched=matched,
+                coverage=v.coverage,
+            )
+        if len(reused) == len(chapters):
+            break
+    return reused
+
+
+def write_reused(out_dir: Path, reused: Sequence[ReusedChapter]) -> None:
+    """写出复用的 analysis/<章节>.json（与模型输出同名）和 reuse_report.json。"""
+    out_dir.mkdir(parents=True, exist_ok=True)
+    for r in reused:
+        json_path, _ = analysis_paths(out_dir, Path(f"{r.stem}.jsonl"))
+        json_path.write_text(json.dumps(r.obj, ensure_ascii=False, indent=2), encoding="utf-8")
+    (out_dir / REPORT_FILENAME).write_text(
+        json.dumps({"chapters": [r.as_dict() for r in reused]}, ensure_ascii=False, indent=2), encoding="utf-8"
+    )
+
+
+def format_reuse_line(r: ReusedChapter) -> str:
+    return (
+        f"第{r.chapter_no}章 复用《{r.source_book}》第{r.source_chapter}章 "
+        f"相似度={r.similarity:.2f} 对齐段落={r.matched:.0%} 覆盖率={r.coverage:.0%}"
+    )
+
+
+def register_book(index: NearDupIndex, novel_dir: Path, *, max_chapters: int = 3) -> bool:
+    """把 <小说目录> 登记到索引；前 max_chapters 章须都已有分析结果（analysis/<章节>.json）。"""
+    chapters = book_chapters(novel_dir, max_chapters=max_chapters)
+    out_dir = novel_dir / "analysis"
+    if not chapters or not all(analysis_paths(out_dir, Path(f"{ch.stem}.jsonl"))[0].exists() for ch in chapters):
+        return False
+    return index.add(novel_dir.name, novel_dir, chapters)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Near-duplicate book index for reusing phase 2 analyses.")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+    p_index = sub.add_parser("index", help="Add every analyzed book in a library to the index")
+    p_index.add_argument("library", type=Path, help='Library dir (e.g. "book")')
+    p_index.add_argument("--index", type=Path, default=None, help=f"Index path (default: <library>/{INDEX_FILENAME})")
+    p_query = sub.add_parser("query", help="List analyzed books similar to one novel dir")
+    p_query.add_argument("novel_dir", type=Path)
+    p_query.add_argument("--index", type=Path, default=None, help=f"Index path (default: <library>/{INDEX_FILENAME})")
+    p_query.add_argument("--threshold", type=float, default=0.8, help="Minimum estimated Jaccard similarity")
+    p_stats = sub.add_parser("stats", help="Show index size")
+    p_stats.add_argument("library", type=Path)
+    p_stats.add_argument("--index", type=Path, default=None)
+    args = parser.parse_args(argv)
+
+    if args.cmd == "index":
+        t0 = time.perf_counter()
+        added = skipped = 0
+        with NearDupIndex.for_library(args.library, args.index) as index:
+            for d in sorted(p for p in args.library.iterdir() if p.is_dir()):
+                if register_book(index, d):
+                    added += 1
+                else:
+                    skipped += 1
+            print(
+                f"[近重复索引] 登记 {added} 本，跳过 {skipped} 本（未完成第二阶段或正文过短），"
+                f"索引共 {len(index)} 本，用时 {time.perf_counter() - t0:.2f}s：{index.path}"
+            )
+        return 0
+
+    if args.cmd == "query":
+        novel_dir: Path = args.novel_dir
+        with NearDupIndex.for_library(novel_dir.parent, args.index) as index:
+            sig = BookSignature.of(book_chapters(novel_dir))
+            if not sig.usable:
+                print("[近重复索引] 正文过短，无法计算可靠的签名")
+                return 1
+            t0 = time.perf_counter()
+            matches = index.query(sig.book, threshold=args.threshold, exclude=novel_dir.name)
+            elapsed = (time.perf_counter() - t0) * 1000
+            for m in matches:
+                print(f"{m.similarity:.3f}\t{m.name}\t{m.path}")
+            print(f"[近重复索引] 命中 {len(matches)} 本，查询 {elapsed:.2f} ms（索引 {len(index)} 本）")
+        return 0
+
+    with NearDupIndex.for_library(args.library, args.index) as index:
+        (n_bands,) = index.conn.execute("SELECT COUNT(*) FROM bands").fetchone()
+        print(f"[近重复索引] 书目 {len(index)} 本，LSH 桶记录 {n_bands} 条：{index.path}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
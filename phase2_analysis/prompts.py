@@ -2,6 +2,7 @@ from __future__ import annotations
 
 from dataclasses import dataclass
 from pathlib import Path
+from typing import List, Tuple
 
 from io_utils import read_text
 
@@ -12,6 +13,11 @@ class PromptBundle:
     prompt_1: str
     prompt_23: str
 
+    def system_for(self, chapter_no: int) -> str:
+        """system.md + 该章模板的静态部分（分析要求、输出 schema）：同一模板的各章完全相同，作为可缓存的前缀。"""
+        static, _ = split_template(self.prompt_1 if chapter_no == 1 else self.prompt_23)
+        return f"{self.system.rstrip()}\n\n{static}" if static else self.system
+
 
 def load_prompts(dir_path: Path) -> PromptBundle:
     """从指定目录读取提示词文件（system.md / prompt_1.md / prompt_23.md）。"""
@@ -22,14 +28,42 @@ def load_prompts(dir_path: Path) -> PromptBundle:
     )
 
 
+_PLACEHOLDERS = ("{jsonl_content}", "{previous_chapter_summary}")
+
+
+def _sections(template: str) -> List[str]:
+    """按一级标题（"# "开头的行）切段；代码块内的 # 不算标题。"""
+    sections: List[List[str]] = [[]]
+    in_fence = False
+    for line in template.splitlines(keepends=True):
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        elif not in_fence and line.startswith("# ") and any(x.strip() for x in sections[-1]):
+            sections.append([])
+        sections[-1].append(line)
+    return ["".join(x).strip("\n") for x in sections if any(y.strip() for y in x)]
+
+
+def split_template(template: str) -> Tuple[str, str]:
+    """(静态部分, 逐章部分)：不含占位符的段归入静态部分，各自保持原顺序。"""
+    static: List[str] = []
+    dynamic: List[str] = []
+    for sec in _sections(template):
+        (dynamic if any(p in sec for p in _PLACEHOLDERS) else static).append(sec)
+    return "\n\n".join(static), "\n\n".join(dynamic) + "\n"
+
+
 def render_prompt_1(template: str, *, jsonl_content: str, chapter_id: int) -> str:
     # 注意：模板内包含大量 JSON 花括号，不能用 str.format；这里只做定向替换。
+    # 静态段（分析要求、schema）由 PromptBundle.system_for 放进 system 消息，这里只渲染逐章部分。
+    _, template = split_template(template)
     s = template.replace("{jsonl_content}", jsonl_content)
     s += f"\n\n# 注意\n本次输出中的 chapter_id 必须为 {chapter_id}。\n"
     return s
 
 
 def render_prompt_23(template: str, *, jsonl_content: str, previous_summary: str, chapter_id: int) -> str:
+    _, template = split_template(template)
     s = template.replace("{jsonl_content}", jsonl_content).replace("{previous_chapter_summary}", previous_summary)
     s += f"\n\n# 注意\n本次输出中的 chapter_id 必须为 {chapter_id}。\n"
     return s
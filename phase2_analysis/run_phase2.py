@@ -2,21 +2,52 @@ from __future__ import annotations
 
 import argparse
 import json
-import re
 import sys
 from pathlib import Path
-from typing import Dict, List, Optional, Tuple
-
-from io_utils import extract_json_object, safe_print
-from prompts import load_prompts, render_prompt_1, render_prompt_23
+from typing import Any, Dict, List, Optional
+
+from chapters import (
+    analysis_json_text,
+    analysis_paths,
+    iter_chapter_jsonl_files,
+    read_jsonl_as_text,
+    render_chapter_prompt,
+)
+from batch import export_batch, find_book_dirs, import_batch_results, manifest_path_for
+from boilerplate import REPORT_FILENAME as FILTER_REPORT_FILENAME
+from boilerplate import FilterResult, filter_report_json, format_filter_line, load_filter, write_filter_report
+from context_compactor import ContextCompactor, ContextStats, format_context_report, total_saved
+from io_utils import safe_print
+from near_dup import (
+    NearDupIndex,
+    ReusedChapter,
+    book_chapters,
+    find_reusable,
+    format_reuse_line,
+    register_book,
+    write_reused,
+)
+from prompts import load_prompts
+from validation import parse_paragraph_ids
 
 # 允许从仓库根目录导入 llm_provider/（脚本从 phase2_analysis/ 直接运行时默认不会包含父目录）
 _REPO_ROOT = Path(__file__).resolve().parent.parent
 if str(_REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(_REPO_ROOT))
 
+from artifacts.store import ArtifactStore
+from cascade import (
+    ModelCascade,
+    attempts_jsonl,
+    attempts_path,
+    format_cache_report,
+    format_tier_report,
+    write_attempts,
+)
+from llm_provider.hedging import Hedger
 from llm_provider.llm_config import find_default_llm_config, load_chat_run_config
-from llm_provider.volc_ark_chat import ChatMessage, chat_completions
+from llm_provider.telemetry import TelemetryLog
+from profiling import perf
 
 
 def _progress_bar(done: int, total: int, width: int = 20) -> str:
@@ -66,53 +97,34 @@ def _find_novel_dir(input_path: Path) -> Path:
     )
 
 
-def _iter_chapter_jsonl_files(novel_dir: Path) -> List[Tuple[int, Path]]:
-    files: List[Tuple[int, Path]] = []
-    for p in novel_dir.glob("*.jsonl"):
-        # 期望格式：<章序>_<章节名>.jsonl
-        try:
-            no = int(p.name.split("_", 1)[0])
-        except Exception:
-            continue
-        files.append((no, p))
-    files.sort(key=lambda x: x[0])
-    return files
-
+def _store_book_name(input_path: Path) -> str:
+    """--store：输入可以是 书名、book/书名 或 book/书名.epub，只取书名作为存储里的键。"""
+    p = Path(str(input_path).strip().strip("\"'"))
+    return p.stem if p.suffix.lower() == ".epub" else p.name
 
-def _read_jsonl_as_text(path: Path) -> str:
-    # 直接把 jsonl 原样作为 prompt 的输入（保证 paragraph_id 严格对应）。
-    return path.read_text(encoding="utf-8")
 
+def _run_batch_import(args: argparse.Namespace) -> int:
+    results_path: Path = args.batch_import
+    if not results_path.exists():
+        raise SystemExit(f"未找到批量结果文件：{results_path}")
+    manifest_path = args.batch_manifest
+    if manifest_path is None:
+        candidates = [manifest_path_for(results_path)] + sorted(results_path.parent.glob("*.manifest.json"))
+        found = [p for p in dict.fromkeys(candidates) if p.exists()]
+        if len(found) != 1:
+            raise SystemExit("请用 --batch-manifest 指定导出时生成的 manifest（<请求文件名>.manifest.json）")
+        manifest_path = found[0]
 
-def _sanitize_filename_component(name: str) -> str:
-    """用于输出文件名的安全清洗（主要兼容 Windows 文件名限制）。"""
-    name = name.strip()
-    name = name.replace("\u00a0", " ").replace("\u3000", " ")
-    # Windows forbidden characters: <>:"/\|?*
-    name = re.sub(r'[<>:"/\\\\|?*]+', "_", name)
-    name = re.sub(r"\s{2,}", " ", name).strip()
-    # 避免极端情况下文件名过长
-    return (name[:80] or "untitled")
-
-
-def _summarize_previous(result: Dict) -> str:
-    """
-    为第 2/3 章生成“上一章总结”占位内容。
-    这里从模型输出的 chunks 中提取 plot_summary + pacing_summary 简要拼接。
-    """
-    chunks = result.get("chunks") or []
-    parts: List[str] = []
-    for c in chunks:
-        title = (c.get("chunk_title") or "").strip()
-        if title:
-            parts.append(f"- 小节：{title}")
-        ps = (c.get("plot_summary") or "").strip()
-        pace = (c.get("pacing_summary") or "").strip()
-        if ps:
-            parts.append(f"- 剧情：{ps}")
-        if pace:
-            parts.append(f"- 节奏：{pace}")
-    return "\n".join(parts).strip() or "无"
+    telemetry = None if args.no_telemetry else TelemetryLog.for_run("phase2_batch", path=args.telemetry_log)
+    report = import_batch_results(results_path, manifest_path, telemetry=telemetry)
+    safe_print(
+        f"[批量导入] 写入={len(report.written)} 非法JSON={len(report.invalid_json)} "
+        f"失败={len(report.failed)} 未知custom_id={len(report.unknown)}"
+    )
+    if report.invalid_json or report.failed:
+        safe_print("[批量导入] 未成功的章节会在下一次 --batch-export 时重新导出。")
+    safe_print("[批量导入] 继续下一轮：重新运行 --batch-export（第 2/3 章依赖上一章结果）。")
+    return 0
 
 
 def main(argv: Optional[List[str]] = None) -> int:
@@ -120,7 +132,12 @@ def main(argv: Optional[List[str]] = None) -> int:
         description="Phase2: send extracted chapter jsonl to LLM for story analysis (Volc Ark).",
         usage="python phase2_analysis/run_phase2.py book/小说名 或 python phase2_analysis/run_phase2.py book/书名.epub",
     )
-    parser.add_argument("input", type=Path, help="Novel dir (book/<name>) or .epub file path")
+    parser.add_argument(
+        "input",
+        type=Path,
+        nargs="?",
+        help="Novel dir (book/<name>) or .epub file path; with --batch-export also a library dir (e.g. book)",
+    )
     parser.add_argument("--profile", default=None, help="Profile name in llm.json (preferred when you have many models)")
     parser.add_argument("--provider", default=None, help="Override provider name in llm.json/profile")
     parser.add_argument("--model", default=None, help="Override model id")
@@ -128,38 +145,211 @@ def main(argv: Optional[List[str]] = None) -> int:
     parser.add_argument("--max-tokens", type=int, default=None, help="Override max_tokens")
     parser.add_argument("--llm-config", type=Path, default=None, help="Path to llm.json (default: auto-detect)")
     parser.add_argument("--dry-run", action="store_true", help="Render prompts only; do not call LLM")
+    parser.add_argument(
+        "--telemetry-log",
+        type=Path,
+        default=None,
+        help="Per-call telemetry JSONL (default: logs/telemetry/phase2_<time>_<pid>.jsonl)",
+    )
+    parser.add_argument("--no-telemetry", action="store_true", help="Do not write the telemetry log")
+    parser.add_argument(
+        "--batch-export",
+        type=Path,
+        default=None,
+        help="Write the next round of pending chapter requests to a batch JSONL (plus <name>.manifest.json); no LLM call",
+    )
+    parser.add_argument(
+        "--batch-import",
+        type=Path,
+        default=None,
+        help="Ingest a batch results JSONL and write analysis/*.json as if called live",
+    )
+    parser.add_argument("--batch-manifest", type=Path, default=None, help="Manifest for --batch-import")
+    parser.add_argument(
+        "--context-budget",
+        type=int,
+        default=1000,
+        help="Token budget for the previous-chapter summary in chapter 2/3 prompts (0 = unlimited)",
+    )
+    parser.add_argument(
+        "--context-rolling",
+        action="store_true",
+        help="Also carry a compacted summary of earlier chapters (not just the previous one)",
+    )
+    parser.add_argument(
+        "--strip-boilerplate",
+        action="store_true",
+        help="Drop watermark/ad/duplicate paragraphs before the LLM call (original paragraph_ids are kept)",
+    )
+    parser.add_argument(
+        "--filter-rules",
+        type=Path,
+        default=None,
+        help="Filter rules JSON for --strip-boilerplate (default: built-in patterns + <library>/.boilerplate.json)",
+    )
+    parser.add_argument(
+        "--pacing-hints",
+        action="store_true",
+        help="Append locally computed pacing metrics (dialogue ratio, sentence length, ...) to each prompt (requires numpy)",
+    )
+    parser.add_argument(
+        "--reuse-similar",
+        action="store_true",
+        help="Reuse analyses of near-duplicate books found in the MinHash index instead of calling the LLM",
+    )
+    parser.add_argument(
+        "--dedup-index",
+        type=Path,
+        default=None,
+        help="Near-duplicate index for --reuse-similar (default: <library>/.near_dup.sqlite)",
+    )
+    parser.add_argument(
+        "--reuse-threshold", type=float, default=0.8, help="Minimum estimated Jaccard similarity for --reuse-similar"
+    )
+    parser.add_argument(
+        "--store",
+        type=Path,
+        default=None,
+        help="Read chapters from / write analysis/* into this artifact store (e.g. book/.artifacts), not book/<name>/",
+    )
+    perf.add_perf_arguments(parser)
     args = parser.parse_args(argv)
 
+    if args.batch_import is None and args.input is None:
+        parser.error("the following arguments are required: input")
+    if args.store is not None and (args.batch_export or args.batch_import or args.reuse_similar):
+        parser.error("--store cannot be combined with --batch-export/--batch-import/--reuse-similar")
+    store = ArtifactStore(args.store) if args.store is not None else None
+    try:
+        with perf.profile_run("phase2", args):
+            return _run(args, store)
+    finally:
+        if store is not None:
+            store.close()
+
+
+def _reuse_similar(args: argparse.Namespace, novel_dir: Path, *, skip_done: bool) -> Dict[int, ReusedChapter]:
+    """--reuse-similar：从近重复书目映射分析结果并写出；skip_done 时已有分析结果的章节不处理（批量导出）。"""
+    chapters = book_chapters(novel_dir)
+    if skip_done:
+        out_dir = novel_dir / "analysis"
+        chapters = [ch for ch in chapters if not analysis_paths(out_dir, Path(f"{ch.stem}.jsonl"))[0].exists()]
+    if not chapters:
+        return {}
+    with perf.stage("reuse"), NearDupIndex.for_library(novel_dir.parent, args.dedup_index) as index:
+        reused = find_reusable(index, novel_dir.name, chapters, threshold=args.reuse_threshold)
+    if reused:
+        write_reused(novel_dir / "analysis", [reused[no] for no in sorted(reused)])
+        for no in sorted(reused):
+            safe_print(f"[复用] 《{novel_dir.name}》{format_reuse_line(reused[no])}")
+    perf.add("chapters_reused", len(reused))
+    return reused
+
+
+def _run(args: argparse.Namespace, store: Optional[ArtifactStore] = None) -> int:
+    if args.batch_import is not None:
+        return _run_batch_import(args)
+
     safe_print("[阶段 1/4] 读取 LLM 配置")
     llm_config_path = args.llm_config or find_default_llm_config()
     if llm_config_path is None:
         raise SystemExit("llm.json not found (create one or pass --llm-config)")
 
-    run_cfg = load_chat_run_config(
-        llm_config_path,
-        profile=args.profile,
-        provider=args.provider,
-        model=args.model,
-    )
-    if run_cfg.provider.type != "volc_ark":
-        raise SystemExit(f"Unsupported provider type: {run_cfg.provider.type} (only volc_ark is implemented)")
+    with perf.stage("load_config"):
+        run_cfg = load_chat_run_config(
+            llm_config_path,
+            profile=args.profile,
+            provider=args.provider,
+            model=args.model,
+        )
+    for tier_cfg in run_cfg.tiers:
+        for ep in tier_cfg.pool:
+            if ep.provider.type != "volc_ark":
+                raise SystemExit(f"Unsupported provider type: {ep.provider.type} (only volc_ark is implemented)")
+    hedger = None
+    if run_cfg.params.adaptive_timeout or run_cfg.params.hedge_budget > 0:
+        hedger = Hedger(
+            budget_ratio=run_cfg.params.hedge_budget,
+            hedge_percentile=run_cfg.params.hedge_percentile,
+            adaptive_timeout=run_cfg.params.adaptive_timeout,
+        )
 
     temperature = args.temperature if args.temperature is not None else run_cfg.params.temperature
     max_tokens = args.max_tokens if args.max_tokens is not None else run_cfg.params.max_tokens
     thinking = run_cfg.params.thinking
-    timeout_s = run_cfg.params.timeout_s
+    cascade = ModelCascade(run_cfg, hedger=hedger, temperature=args.temperature, max_tokens=args.max_tokens)
 
     safe_print(
         f"[阶段 1/4] 选择模型：provider={run_cfg.provider_name} model={run_cfg.model} "
         f"temperature={temperature} max_tokens={max_tokens}"
     )
+    if len(run_cfg.pool) > 1:
+        safe_print(f"[阶段 1/4] 负载均衡：pool={len(run_cfg.pool)} 个端点 " + ", ".join(ep.name for ep in run_cfg.pool))
+    if len(cascade) > 1:
+        safe_print(
+            f"[阶段 1/4] 模型级联：{cascade.describe()} "
+            f"（min_coverage={run_cfg.min_coverage} quality_threshold={run_cfg.quality_threshold}）"
+        )
 
     safe_print("[阶段 2/4] 读取提示词")
-    prompts = load_prompts(Path("prompt"))
+    with perf.stage("load_prompts"):
+        prompts = load_prompts(Path("prompt"))
+
+    compactor = ContextCompactor(args.context_budget, rolling=args.context_rolling)
+    chapter_hint = None
+    if args.pacing_hints:
+        try:
+            from pacing.metrics import chapter_hint
+        except ModuleNotFoundError as e:
+            raise SystemExit(f"{e}（--pacing-hints 需要）") from e
+
+    if args.batch_export is not None:
+        book_dirs = find_book_dirs(_find_novel_dir(args.input))
+        para_filter = None
+        if args.strip_boilerplate and book_dirs:
+            para_filter = load_filter(args.filter_rules, book_dirs[0].parent)
+        if args.reuse_similar:
+            # 先写出可复用的章节，导出时它们已有分析结果，不会进入批量请求
+            for d in book_dirs:
+                _reuse_similar(args, d, skip_done=True)
+        pending, done_books = export_batch(
+            book_dirs,
+            prompts,
+            out_path=args.batch_export,
+            model=run_cfg.model,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            thinking=thinking,
+            compactor=compactor,
+            para_filter=para_filter,
+            hint_fn=chapter_hint,
+        )
+        by_chapter = {no: sum(1 for p in pending if p.chapter_no == no) for no in (1, 2, 3)}
+        safe_print(
+            f"[批量导出] 书目={len(book_dirs)} 本轮请求={len(pending)} "
+            f"（第1章 {by_chapter[1]} / 第2章 {by_chapter[2]} / 第3章 {by_chapter[3]}） 已完成={done_books}"
+        )
+        contexts = [p.context for p in pending if p.context is not None]
+        if contexts:
+            safe_print(f"[批量导出] 上一章上下文共节省 {total_saved(contexts)} tokens（预算 {args.context_budget}/章）")
+        if pending:
+            safe_print(f"[批量导出] 请求文件：{args.batch_export}  manifest：{manifest_path_for(args.batch_export)}")
+        else:
+            safe_print("[批量导出] 没有待处理的章节，全部完成。")
+        return 0
 
     safe_print("[阶段 3/4] 扫描章节文件")
-    novel_dir = _find_novel_dir(args.input)
-    chapter_files = _iter_chapter_jsonl_files(novel_dir)
+    if store is not None:
+        # 存储里的章节按 book/<书名>/<文件名> 的虚拟路径处理，输出同样以 analysis/<文件名> 为键写回存储
+        novel_dir = Path("book") / _store_book_name(args.input)
+        with perf.stage("scan"):
+            chapter_files = [(e.chapter, novel_dir / e.path) for e in store.entries(novel_dir.name, kind="chapter")]
+        if not chapter_files:
+            raise SystemExit(f"产物存储中没有《{novel_dir.name}》的章节：{store.root}\n请先用 --store 运行第一阶段")
+    else:
+        novel_dir = _find_novel_dir(args.input)
+        with perf.stage("scan"):
+            chapter_files = iter_chapter_jsonl_files(novel_dir)
     if not chapter_files:
         raise SystemExit(
             f"在目录中未找到章节 jsonl：{novel_dir}\n"
@@ -172,58 +362,130 @@ def main(argv: Optional[List[str]] = None) -> int:
         raise SystemExit("No chapter jsonl files in range 1..3")
 
     out_dir = novel_dir / "analysis"
-    out_dir.mkdir(parents=True, exist_ok=True)
+    if store is None:
+        out_dir.mkdir(parents=True, exist_ok=True)
+
+    def put_output(name: str, text: str) -> None:
+        if store is not None:
+            store.put(novel_dir.name, f"analysis/{name}", text)
+        else:
+            (out_dir / name).write_text(text, encoding="utf-8")
+
+    telemetry = None
+    if not (args.dry_run or args.no_telemetry):
+        telemetry = TelemetryLog.for_run("phase2", path=args.telemetry_log)
+
+    para_filter = load_filter(args.filter_rules, novel_dir.parent) if args.strip_boilerplate else None
+    seen: Dict[str, Any] = {}
+    filter_results: List[FilterResult] = []
+    reused = _reuse_similar(args, novel_dir, skip_done=False) if args.reuse_similar and not args.dry_run else {}
 
     safe_print("[阶段 4/4] 调用模型生成分析")
-    previous_summary = ""
+    previous_results: List[Dict[str, Any]] = []
+    context_stats: List[ContextStats] = []
+    tier_counts: Dict[int, int] = {}
     total = len(chapter_files)
     for idx, (chapter_no, jsonl_path) in enumerate(chapter_files, start=1):
-        jsonl_content = _read_jsonl_as_text(jsonl_path)
         # 输出文件名带上章节标题，便于人工对齐（例如：1_妖魔乱世.json / 1_妖魔乱世.raw.txt）
-        out_stem = _sanitize_filename_component(jsonl_path.stem)
+        out_json_path, out_raw_path = analysis_paths(out_dir, jsonl_path)
+        if chapter_no in reused:
+            previous_results.append(reused[chapter_no].obj)
+            safe_print(f"{_progress_bar(idx, total)} 复用：第{chapter_no}章 输出={out_json_path.name}")
+            continue
         safe_print(f"{_progress_bar(idx - 1, total)} 开始：第{chapter_no}章 输入={jsonl_path.name}")
 
-        if chapter_no == 1:
-            user_prompt = render_prompt_1(prompts.prompt_1, jsonl_content=jsonl_content, chapter_id=1)
-        else:
-            user_prompt = render_prompt_23(
-                prompts.prompt_23,
+        with perf.stage("render_prompt"):
+            if store is not None:
+                jsonl_content = store.get_text(novel_dir.name, jsonl_path.name) or ""
+            else:
+                jsonl_content = read_jsonl_as_text(jsonl_path)
+            paragraph_ids = parse_paragraph_ids(jsonl_content.splitlines())
+            if para_filter is not None:
+                # 去掉水印/广告/重复段落；保留的段落沿用原始 paragraph_id，校验也只针对保留的段落。
+                fr = para_filter.apply(jsonl_content, chapter_no=chapter_no, seen=seen)
+                jsonl_content, paragraph_ids = fr.jsonl, fr.paragraph_ids
+                filter_results.append(fr)
+                safe_print(f"[过滤] {format_filter_line(fr)}")
+            previous_summary = ""
+            if previous_results:
+                previous_summary, ctx = compactor.build(previous_results, chapter_no=chapter_no)
+                context_stats.append(ctx)
+
+            user_prompt = render_chapter_prompt(
+                prompts,
+                chapter_no=chapter_no,
                 jsonl_content=jsonl_content,
                 previous_summary=previous_summary,
-                chapter_id=chapter_no,
+                hints=chapter_hint(jsonl_content) if chapter_hint is not None else "",
             )
+        perf.add("chapters")
+        perf.add("prompt_chars", len(user_prompt))
 
         if args.dry_run:
             safe_print(f"{_progress_bar(idx, total)} 跳过调用（dry-run）：第{chapter_no}章 提示词长度={len(user_prompt)}")
             continue
 
-        content = chat_completions(
-            base_url=run_cfg.provider.base_url,
-            api_key=run_cfg.provider.api_key,
-            model=run_cfg.model,
-            messages=[
-                ChatMessage(role="system", content=prompts.system),
-                ChatMessage(role="user", content=user_prompt),
-            ],
-            temperature=temperature,
-            max_tokens=max_tokens,
-            thinking=thinking,
-            timeout_s=timeout_s,
-        )
-
-        out_json_path = out_dir / f"{out_stem}.json"
-        out_raw_path = out_dir / f"{out_stem}.raw.txt"
-        out_raw_path.write_text(content, encoding="utf-8")
-
-        obj = extract_json_object(content)
+        call_ctx = {"book": novel_dir.name, "chapter": chapter_no, "profile": args.profile or ""}
+        with perf.stage("llm"):
+            outcome = cascade.analyze(
+                system=prompts.system_for(chapter_no),
+                user_prompt=user_prompt,
+                paragraph_ids=paragraph_ids,
+                json_path=out_json_path if store is None else None,
+                raw_path=out_raw_path if store is None else None,
+                telemetry=telemetry,
+                call_ctx=call_ctx,
+            )
+        perf.add("llm_attempts", len(outcome.attempts))
+        obj = outcome.obj
+        with perf.stage("write"):
+            if store is None:
+                write_attempts(attempts_path(out_json_path), outcome.attempts, book=novel_dir.name, chapter=chapter_no)
+            else:
+                if outcome.content is not None:
+                    put_output(out_raw_path.name, outcome.content)
+                if obj is not None:
+                    put_output(out_json_path.name, analysis_json_text(obj))
+                put_output(
+                    attempts_path(out_json_path).name,
+                    attempts_jsonl(outcome.attempts, book=novel_dir.name, chapter=chapter_no),
+                )
         if obj is None:
             safe_print(f"ERROR chapter={chapter_no}: invalid JSON (saved raw)")
             return 1
+        tier_counts[outcome.tier] = tier_counts.get(outcome.tier, 0) + 1
 
-        out_json_path.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
-        previous_summary = _summarize_previous(obj)
+        previous_results.append(obj)
         safe_print(f"{_progress_bar(idx, total)} 完成：第{chapter_no}章 输出={out_json_path.name}")
 
+    if filter_results and not args.dry_run:
+        if store is not None:
+            previous = store.get_text(novel_dir.name, f"analysis/{FILTER_REPORT_FILENAME}")
+            put_output(FILTER_REPORT_FILENAME, filter_report_json(filter_results, previous))
+        else:
+            write_filter_report(out_dir, filter_results)
+    if context_stats and not args.dry_run:
+        for line in format_context_report(context_stats):
+            safe_print(f"[上下文] {line}")
+        put_output(
+            "context_report.json",
+            json.dumps(
+                {"budget_tokens": args.context_budget, "rolling": args.context_rolling, "chapters": [s.as_dict() for s in context_stats]},
+                ensure_ascii=False,
+                indent=2,
+            ),
+        )
+    if args.reuse_similar and not args.dry_run:
+        # 本书分析完成后登记到索引，之后到来的近重复版本可以直接复用
+        with NearDupIndex.for_library(novel_dir.parent, args.dedup_index) as index:
+            register_book(index, novel_dir)
+    if len(cascade) > 1 and tier_counts:
+        safe_print(f"[级联] {format_tier_report(tier_counts, cascade.tiers)}")
+    cache_stats = cascade.cache_stats()
+    if cache_stats is not None:
+        safe_print(f"[上下文缓存] {format_cache_report(cache_stats)}")
+    if telemetry is not None:
+        safe_print(f"[完成] 调用记录：{telemetry.path}")
     return 0
 
 
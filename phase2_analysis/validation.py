@@ -0,0 +1,140 @@
+from __future__ import annotations
+
+"""
+分析结果校验：schema、段落覆盖率与一个简单的质量分。
+
+- schema：chunks/slices 的必需字段与类型（对应 prompt_1.md / prompt_23.md 的输出结构）
+- 覆盖率：slices 覆盖到的 paragraph_id 占输入段落的比例（越界的 id 不计入）
+- 质量分（0~1）：覆盖率、文本字段填写率、重叠程度的加权
+"""
+
+import json
+from bisect import bisect_left, bisect_right
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Sequence
+
+_SLICE_TEXT_FIELDS = ("content_summary", "pacing_analysis", "hook_extraction")
+_CHUNK_TEXT_FIELDS = ("chunk_title", "plot_summary", "pacing_summary")
+
+
+@dataclass
+class ValidationResult:
+    schema_errors: List[str] = field(default_factory=list)
+    coverage: float = 0.0
+    missing: int = 0
+    out_of_range: int = 0
+    overlaps: int = 0
+    fill_rate: float = 0.0
+    quality: float = 0.0
+
+    @property
+    def schema_ok(self) -> bool:
+        return not self.schema_errors
+
+    def passes(self, *, min_coverage: float = 0.95, quality_threshold: float = 0.0) -> bool:
+        return self.schema_ok and self.coverage >= min_coverage and self.quality >= quality_threshold
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "schema_errors": self.schema_errors[:10],
+            "coverage": round(self.coverage, 4),
+            "missing": self.missing,
+            "out_of_range": self.out_of_range,
+            "overlaps": self.overlaps,
+            "fill_rate": round(self.fill_rate, 4),
+            "quality": round(self.quality, 4),
+        }
+
+
+def read_paragraph_ids(jsonl_path: Path) -> List[int]:
+    """读取第一阶段 JSONL 中的 paragraph_id 列表。"""
+    with jsonl_path.open("r", encoding="utf-8") as f:
+        return parse_paragraph_ids(f)
+
+
+def parse_paragraph_ids(lines: Iterable[str]) -> List[int]:
+    """JSONL 各行中的 paragraph_id 列表（空行、无法解析的行跳过）。"""
+    ids: List[int] = []
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            pid = json.loads(line).get("paragraph_id")
+        except (json.JSONDecodeError, AttributeError):
+            continue
+        if isinstance(pid, int):
+            ids.append(pid)
+    return ids
+
+
+def _is_int(v: Any) -> bool:
+    return isinstance(v, int) and not isinstance(v, bool)
+
+
+def validate_analysis(obj: Any, paragraph_ids: Sequence[int]) -> ValidationResult:
+    res = ValidationResult()
+    if not isinstance(obj, dict):
+        res.schema_errors.append("top-level is not an object")
+        return res
+    chunks = obj.get("chunks")
+    if not isinstance(chunks, list) or not chunks:
+        res.schema_errors.append("chunks missing or empty")
+        return res
+
+    valid_ids = set(paragraph_ids)
+    sorted_ids = sorted(valid_ids)
+    covered: Dict[int, int] = {}
+    text_total = 0
+    text_filled = 0
+
+    for ci, c in enumerate(chunks, start=1):
+        if not isinstance(c, dict):
+            res.schema_errors.append(f"chunks[{ci}] is not an object")
+            continue
+        for k in ("start_paragraph", "end_paragraph"):
+            if not _is_int(c.get(k)):
+                res.schema_errors.append(f"chunks[{ci}].{k} is not an int")
+        for k in _CHUNK_TEXT_FIELDS:
+            text_total += 1
+            v = c.get(k)
+            if not isinstance(v, str):
+                res.schema_errors.append(f"chunks[{ci}].{k} is not a string")
+            elif v.strip():
+                text_filled += 1
+        slices = c.get("slices")
+        if not isinstance(slices, list) or not slices:
+            res.schema_errors.append(f"chunks[{ci}].slices missing or empty")
+            continue
+        for si, s in enumerate(slices, start=1):
+            if not isinstance(s, dict):
+                res.schema_errors.append(f"chunks[{ci}].slices[{si}] is not an object")
+                continue
+            start, end = s.get("start"), s.get("end")
+            if not (_is_int(start) and _is_int(end)) or end < start:
+                res.schema_errors.append(f"chunks[{ci}].slices[{si}] start/end invalid")
+                continue
+            for k in _SLICE_TEXT_FIELDS:
+                text_total += 1
+                v = s.get(k)
+                if not isinstance(v, str):
+                    res.schema_errors.append(f"chunks[{ci}].slices[{si}].{k} is not a string")
+                elif v.strip():
+                    text_filled += 1
+            # 只遍历落在 [start, end] 内的真实段落：模型给出的 end 可能大得离谱，不能逐个 id 枚举
+            lo, hi = bisect_left(sorted_ids, start), bisect_right(sorted_ids, end)
+            for pid in sorted_ids[lo:hi]:
+                covered[pid] = covered.get(pid, 0) + 1
+            res.out_of_range += (end - start + 1) - (hi - lo)
+
+    total = len(valid_ids)
+    res.coverage = (len(covered) / total) if total else 1.0
+    res.missing = total - len(covered)
+    res.overlaps = sum(n - 1 for n in covered.values() if n > 1)
+    res.fill_rate = (text_filled / text_total) if text_total else 0.0
+    overlap_ratio = min(1.0, res.overlaps / total) if total else 0.0
+    res.quality = 0.5 * res.coverage + 0.3 * res.fill_rate + 0.2 * (1.0 - overlap_ratio)
+    if res.schema_errors:
+        res.quality *= 0.5
+    return res
@@ -16,6 +16,9 @@ class ChapterMeta:
     source_path: Path
 
 
+# hook_extraction 取这些值（去掉首尾空白后）表示“没有爆点”；书库报表和 SQLite 查询共用
+NO_HOOK_VALUES: Tuple[str, ...] = ("", "无", "无。", "none", "None")
+
 _CHAPTER_STEM_RE = re.compile(r"^(?P<no>\d+)(?:_(?P<title>.+))?$")
 
 
@@ -40,10 +43,13 @@ def iter_analysis_json_files(analysis_dir: Path) -> List[Path]:
     return [p for _, p in files]
 
 
-def load_chapter_analysis(path: Path) -> Tuple[ChapterMeta, Dict[str, Any]]:
-    """Load one chapter analysis json and infer chapter_no/title from filename."""
+def load_chapter_analysis(path: Path, text: Optional[str] = None) -> Tuple[ChapterMeta, Dict[str, Any]]:
+    """
+    Load one chapter analysis json and infer chapter_no/title from filename.
+    text: the json content when it was already read elsewhere (e.g. from the artifact store).
+    """
     no, title = _parse_chapter_from_stem(path.stem)
-    obj = json.loads(path.read_text(encoding="utf-8"))
+    obj = json.loads(path.read_text(encoding="utf-8") if text is None else text)
 
     # 兼容旧文件名（例如 1.json），优先用文件名序号；兜底使用内容里的 chapter_id。
     if no is None:
@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+"""
+第三阶段增量构建：记录输入指纹，输入与写出逻辑都未变化时跳过生成。
+
+- 指纹文件与 xlsx 放在一起：<输出>.xlsx.fingerprint.json
+- 每本书的指纹 = analysis/*.json 的文件名 + sha256，以及第一阶段 *.jsonl 的文件名（章节标题可能取自这里）；
+  --pacing 的节奏表由 *.jsonl 的正文计算，此时同时记录 *.jsonl 的 sha256
+- 文件大小与 mtime 未变时沿用上次的 sha256，不必重新读文件
+- WRITER_VERSION 随表格布局/写出逻辑一起改动，改动后旧输出全部失效
+- 输出文件本身的大小与 mtime 也会记录：xlsx 被删除或在 Excel 中另存过，就重新生成
+"""
+
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Any, Dict, Optional, Tuple
+
+from analysis_loader import iter_analysis_json_files
+
+# 修改 table_layout / native_xlsx / xlsx_writer 的输出时递增。
+WRITER_VERSION = 1
+STATE_VERSION = 1
+
+
+def sidecar_path(out_path: Path) -> Path:
+    return out_path.with_name(out_path.name + ".fingerprint.json")
+
+
+def load_state(out_path: Path) -> Dict[str, Any]:
+    """读取上次的指纹；不存在或已损坏时返回空字典（即全部重建）。"""
+    try:
+        state = json.loads(sidecar_path(out_path).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    if not isinstance(state, dict) or state.get("state_version") != STATE_VERSION:
+        return {}
+    return state
+
+
+def save_state(out_path: Path, state: Dict[str, Any]) -> None:
+    """写入指纹（先写临时文件再替换，中断时不会留下半个 JSON）。"""
+    st = out_path.stat()
+    state = {**state, "state_version": STATE_VERSION, "output": {"size": st.st_size, "mtime_ns": st.st_mtime_ns}}
+    path = sidecar_path(out_path)
+    tmp = path.with_name(path.name + ".tmp")
+    tmp.write_text(json.dumps(state, ensure_ascii=False, indent=1), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def output_unchanged(out_path: Path, state: Dict[str, Any]) -> bool:
+    """上次写出的 xlsx 还在，且没有被其他程序改写过。"""
+    recorded = state.get("output") or {}
+    try:
+        st = out_path.stat()
+    except OSError:
+        return False
+    return recorded.get("size") == st.st_size and recorded.get("mtime_ns") == st.st_mtime_ns
+
+
+def _file_sha256(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _cached_sha256(p: Path, previous: Dict[str, Any], files: Dict[str, Any]) -> str:
+    """大小和 mtime 都没变时沿用 previous 里的 sha256；结果记入 files。"""
+    st = p.stat()
+    old = previous.get(p.name)
+    if isinstance(old, list) and len(old) == 3 and old[0] == st.st_size and old[1] == st.st_mtime_ns:
+        digest = old[2]
+    else:
+        digest = _file_sha256(p)
+    files[p.name] = [st.st_size, st.st_mtime_ns, digest]
+    return digest
+
+
+def book_fingerprint(
+    book_dir: Path, previous: Optional[Dict[str, Any]] = None, *, chapter_content: bool = False
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    返回 (指纹, 文件记录)。previous 为上次的文件记录 {文件名: [size, mtime_ns, sha256]}，
+    大小和 mtime 都没变的文件直接沿用记录里的 sha256。
+    chapter_content=True（--pacing）时 *.jsonl 也按内容计入，否则只计文件名。
+    """
+    previous = previous or {}
+    files: Dict[str, Any] = {}
+    h = hashlib.sha256()
+    for p in iter_analysis_json_files(book_dir / "analysis"):
+        digest = _cached_sha256(p, previous, files)
+        h.update(f"{p.name}\0{digest}\n".encode("utf-8"))
+    for p in sorted(book_dir.glob("*.jsonl")):
+        if chapter_content:
+            h.update(f"{p.name}\0{_cached_sha256(p, previous, files)}\n".encode("utf-8"))
+        else:
+            h.update(f"{p.name}\n".encode("utf-8"))
+    return h.hexdigest(), files
+
+
+def run_key(engine: str, mode: str, *, pacing: bool = False) -> Dict[str, Any]:
+    """与输入无关、但会影响输出的参数；任何一项变化都要全部重建。"""
+    key: Dict[str, Any] = {"writer_version": WRITER_VERSION, "engine": engine, "mode": mode}
+    if pacing:
+        # 只在开启时写入，已有的指纹记录保持有效
+        key["pacing"] = True
+    return key
@@ -0,0 +1,243 @@
+from __future__ import annotations
+
+"""
+书库汇总报表：多本书写入同一个 Excel（每本书一个工作表 + 首页“索引”统计表）。
+
+- 各书的 analysis/*.json 在进程池中加载并转换为表格行（chapter_rows_from_analysis）
+- 主进程按书目顺序把结果流式写入工作簿；同时在途的书目数量有上限，内存不随书库规模增长
+- 每本书输出一行进度：行数、加载耗时、写入耗时
+- 增量：未变化的书（reuse）直接从上次的 xlsx 复制工作表，只有变化的书重新加载和写入
+"""
+
+import re
+import time
+import zipfile
+from concurrent.futures import Future, ProcessPoolExecutor
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Set, Tuple
+
+from analysis_loader import NO_HOOK_VALUES, chapter_rows_from_analysis, iter_analysis_json_files, load_chapter_analysis
+from table_layout import ANALYSIS_HEADERS
+
+INDEX_TITLE = "索引"
+INDEX_HEADERS = ["书名", "工作表", "章节数", "剧情块", "切片", "爆点", "行数", "加载耗时(s)", "写入耗时(s)"]
+_SHEET_TITLE_BAD = re.compile(r"[\[\]:*?/\\]")
+
+
+@dataclass
+class BookRows:
+    """一本书的转换结果（在工作进程中生成，传回主进程写入）。"""
+
+    name: str
+    rows: List[Dict[str, Any]] = field(default_factory=list)
+    chapters: int = 0
+    chunks: int = 0
+    slices: int = 0
+    hooks: int = 0
+    load_s: float = 0.0
+    error: str = ""
+
+
+def find_analysis_books(root: Path) -> List[Path]:
+    """root 下所有含 analysis/*.json 的书目录（root 本身是书目录时返回 [root]）。"""
+    if (root / "analysis").is_dir() and iter_analysis_json_files(root / "analysis"):
+        return [root]
+    books = []
+    for p in sorted(root.iterdir()):
+        analysis_dir = p / "analysis"
+        if p.is_dir() and analysis_dir.is_dir() and iter_analysis_json_files(analysis_dir):
+            books.append(p)
+    return books
+
+
+def load_book_rows(book_dir: Path) -> BookRows:
+    """读取一本书的全部章节分析并转换为表格行（进程池任务，需可 pickle）。"""
+    t0 = time.perf_counter()
+    res = BookRows(name=book_dir.name)
+    try:
+        for p in iter_analysis_json_files(book_dir / "analysis"):
+            meta, obj = load_chapter_analysis(p)
+            res.chapters += 1
+            for c in obj.get("chunks") or []:
+                if not isinstance(c, dict):
+                    continue
+                res.chunks += 1
+                for s in c.get("slices") or []:
+                    if not isinstance(s, dict):
+                        continue
+                    res.slices += 1
+                    if str(s.get("hook_extraction") or "").strip() not in NO_HOOK_VALUES:
+                        res.hooks += 1
+            res.rows.extend(chapter_rows_from_analysis(meta, obj))
+    except Exception as e:  # noqa: BLE001 - one broken book must not stop the library report
+        res.error = f"{type(e).__name__}: {e}"[:300]
+        res.rows = []
+    res.load_s = time.perf_counter() - t0
+    return res
+
+
+def sheet_title(name: str, used: Set[str]) -> str:
+    """Excel 工作表名：最长 31 个字符、不能含 []:*?/\\、不区分大小写唯一。"""
+    base = _SHEET_TITLE_BAD.sub("_", name).strip().strip("'") or "book"
+    base = base[:31]
+    title = base
+    n = 2
+    while title.lower() in used:
+        suffix = f"~{n}"
+        title = base[: 31 - len(suffix)] + suffix
+        n += 1
+    used.add(title.lower())
+    return title
+
+
+def _ordered_results(
+    fn: Callable[[Path], BookRows], items: Sequence[Path], *, workers: int, window: int
+) -> Iterator[BookRows]:
+    """按输入顺序产出结果；最多 window 个任务在途（限制已完成但未写入的结果占用的内存）。"""
+    if workers <= 1:
+        for item in items:
+            yield fn(item)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending: List[Future] = []
+        it = iter(items)
+        for item in it:
+            pending.append(pool.submit(fn, item))
+            if len(pending) >= window:
+                break
+        while pending:
+            fut = pending.pop(0)
+            nxt = next(it, None)
+            if nxt is not None:
+                pending.append(pool.submit(fn, nxt))
+            yield fut.result()
+
+
+def new_workbook(engine: str) -> Tuple[Any, Callable[..., None]]:
+    """
+    返回 (空工作簿, write_table_sheet(wb, **kw))；engine 为 native 或 openpyxl。
+    native 使用内联字符串，每个工作表自成一体，下次运行可以原样复制（见 reuse）。
+    """
+    if engine == "openpyxl":
+        from openpyxl import Workbook
+        from xlsx_writer import write_table_sheet
+
+        return Workbook(write_only=True), write_table_sheet
+
+    from native_xlsx import NativeWorkbook
+
+    return NativeWorkbook(inline_strings=True), lambda wb, **kw: wb.write_table_sheet(**kw)
+
+
+def build_library_workbook(
+    book_dirs: Sequence[Path],
+    *,
+    engine: str = "native",
+    workers: int = 4,
+    log: Callable[[str], None] = print,
+    reuse: Optional[Dict[str, Dict[str, Any]]] = None,
+    reuse_from: Optional[zipfile.ZipFile] = None,
+) -> Tuple[Any, Dict[str, Dict[str, Any]]]:
+    """
+    写出书库汇总工作簿，返回 (工作簿, {书名: 统计})（调用方负责 save）。
+
+    reuse：{书名: 上次的统计（含 "sheet"，即 NativeWorkbook.manifest() 的条目）}，这些书的工作表
+    从 reuse_from（上次的 xlsx）复制，不再加载 JSON；仅 native 后端支持。上次解析失败、输入也
+    没变的书（统计里有 "error"）直接沿用失败记录。
+    """
+    wb, write_sheet = new_workbook(engine)
+    reuse = reuse or {}
+    if reuse and (engine != "native" or reuse_from is None):
+        raise ValueError("reuse requires the native engine and reuse_from")
+    used: Set[str] = {INDEX_TITLE.lower()}
+    index_rows: List[Dict[str, Any]] = []
+    books: Dict[str, Dict[str, Any]] = {}
+    total = len(book_dirs)
+    t_all = time.perf_counter()
+    changed = [b for b in book_dirs if b.name not in reuse]
+    loaded = _ordered_results(load_book_rows, changed, workers=workers, window=max(2, workers * 2))
+    for i, book_dir in enumerate(book_dirs, 1):
+        cached = reuse.get(book_dir.name)
+        title = sheet_title(book_dir.name, used)
+        if cached is not None:
+            t0 = time.perf_counter()
+            sheet = cached.get("sheet")
+            if sheet and not cached.get("error"):
+                wb.copy_sheet(
+                    reuse_from, sheet["part"], title=title, auto_filter_ref=sheet["auto_filter_ref"], styles=sheet["styles"]
+                )
+            stat = {k: cached[k] for k in ("chapters", "chunks", "slices", "hooks", "rows")}
+            stat.update(error=cached.get("error") or "", load_s=0.0)
+        else:
+            book = next(loaded)
+            t0 = time.perf_counter()  # 只计写入：等待加载进程的时间已记在 load_s 里
+            if not book.error:
+                write_sheet(
+                    wb,
+                    title=title,
+                    headers=ANALYSIS_HEADERS,
+                    rows=book.rows,
+                    merge_same_value_cols=(1, 2),
+                    center_cols=(3, 4),
+                    bold_center_cols=(1, 2),
+                )
+            stat = {
+                "chapters": book.chapters,
+                "chunks": book.chunks,
+                "slices": book.slices,
+                "hooks": book.hooks,
+                "rows": len(book.rows),
+                "error": book.error,
+                "load_s": book.load_s,
+            }
+            book.rows = []
+        write_s = time.perf_counter() - t0
+        error = stat.pop("error")
+        load_s = stat.pop("load_s")
+        books[book_dir.name] = {"title": title, **stat, **({"error": error} if error else {})}
+        index_rows.append(
+            {
+                "书名": book_dir.name,
+                "工作表": title if not error else f"（失败）{error}",
+                "章节数": stat["chapters"],
+                "剧情块": stat["chunks"],
+                "切片": stat["slices"],
+                "爆点": stat["hooks"],
+                "行数": stat["rows"],
+                "加载耗时(s)": round(load_s, 3),
+                "写入耗时(s)": round(write_s, 3),
+            }
+        )
+        if cached is not None:
+            status = f"未变化，沿用上次的失败记录 {error}" if error else f"未变化，复用工作表 行数={stat['rows']}"
+        else:
+            status = f"ERROR {error}" if error else f"行数={stat['rows']}"
+        log(f"[{i}/{total}] {book_dir.name} {status} 加载={load_s:.3f}s 写入={write_s:.3f}s")
+
+    index_rows.append(
+        {
+            "书名": f"合计 {total} 本",
+            "工作表": "",
+            "章节数": sum(r["章节数"] for r in index_rows),
+            "剧情块": sum(r["剧情块"] for r in index_rows),
+            "切片": sum(r["切片"] for r in index_rows),
+            "爆点": sum(r["爆点"] for r in index_rows),
+            "行数": sum(r["行数"] for r in index_rows),
+            "加载耗时(s)": round(sum(r["加载耗时(s)"] for r in index_rows), 3),
+            "写入耗时(s)": round(sum(r["写入耗时(s)"] for r in index_rows), 3),
+        }
+    )
+    write_sheet(
+        wb,
+        title=INDEX_TITLE,
+        headers=INDEX_HEADERS,
+        rows=index_rows,
+        center_cols=tuple(range(3, len(INDEX_HEADERS) + 1)),
+        index=0,
+        chapter_gap_rows=0,
+        chapter_fill=False,
+        footer=False,
+    )
+    log(f"[书库] {total} 本书（重建 {len(changed)}，复用 {total - len(changed)}），总耗时 {time.perf_counter() - t_all:.2f}s")
+    return wb, books
@@ -0,0 +1,416 @@
+from __future__ import annotations
+
+"""
+Dependency-free XLSX writer: SpreadsheetML written directly with zipfile.
+
+Produces the same layout as `xlsx_writer.build_workbook` (both are driven by
+`table_layout.TableLayout`): shared string table, a small style sheet built from the
+distinct `CellStyle`s, merge ranges, frozen header row and an auto-filter.
+
+Sheet XML streams to a temp file while rows are appended; `save()` assembles the zip.
+With `inline_strings=True` every sheet part is self-contained (no shared string
+indexes), so `copy_sheet` can reuse a sheet from a previously saved workbook.
+"""
+
+import re
+import shutil
+import tempfile
+import zipfile
+from pathlib import Path
+from dataclasses import astuple
+from typing import Any, BinaryIO, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from xml.sax.saxutils import escape, quoteattr
+
+from profiling import perf
+from table_layout import (
+    ANALYSIS_HEADERS,
+    BORDER_COLOR,
+    PACING_HEADERS,
+    PACING_SHEET,
+    CellStyle,
+    TableLayout,
+    column_letter,
+    column_widths,
+    peek_rows,
+    range_ref,
+)
+
+_NS_MAIN = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+_NS_REL = "http://schemas.openxmlformats.org/officeDocument/2006/relationships"
+_NS_PKG_REL = "http://schemas.openxmlformats.org/package/2006/relationships"
+_XML_DECL = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+# XML 1.0 does not allow most control characters (openpyxl raises on them; we drop them).
+_ILLEGAL_XML_CHARS = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f]")
+_CELL_STYLE_ATTR = re.compile(rb'(<c r="[A-Z]+[0-9]+") s="([0-9]+)"')
+
+
+def _xml_text(s: str) -> str:
+    return escape(_ILLEGAL_XML_CHARS.sub("", s))
+
+
+class _StyleSheet:
+    """Distinct CellStyles -> cellXfs indexes (0 is the default style)."""
+
+    def __init__(self) -> None:
+        self._xf: Dict[CellStyle, int] = {}
+        self._fills: List[str] = []
+
+    def index(self, style: Optional[CellStyle]) -> int:
+        if style is None:
+            return 0
+        idx = self._xf.get(style)
+        if idx is None:
+            idx = len(self._xf) + 1
+            self._xf[style] = idx
+            if style.fill and style.fill not in self._fills:
+                self._fills.append(style.fill)
+        return idx
+
+    def snapshot(self) -> List[List[Any]]:
+        """[[xf index, *CellStyle fields], ...] for every style registered so far."""
+        return [[idx, *astuple(style)] for style, idx in self._xf.items()]
+
+    def to_xml(self) -> str:
+        fills = [
+            '<fill><patternFill patternType="none"/></fill>',
+            '<fill><patternFill patternType="gray125"/></fill>',
+        ]
+        fills += [
+            f'<fill><patternFill patternType="solid"><fgColor rgb="00{rgb}"/><bgColor indexed="64"/></patternFill></fill>'
+            for rgb in self._fills
+        ]
+        side = f'style="medium"><color rgb="00{BORDER_COLOR}"/>'
+        borders = [
+            "<border><left/><right/><top/><bottom/><diagonal/></border>",
+            f"<border><left {side}</left><right {side}</right><top {side}</top><bottom {side}</bottom><diagonal/></border>",
+        ]
+        xfs = ['<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>']
+        for style in sorted(self._xf, key=self._xf.__getitem__):
+            font_id = 1 if style.bold else 0
+            fill_id = (self._fills.index(style.fill) + 2) if style.fill else 0
+            border_id = 1 if style.border else 0
+            attrs = f'numFmtId="0" fontId="{font_id}" fillId="{fill_id}" borderId="{border_id}" xfId="0"'
+            if font_id:
+                attrs += ' applyFont="1"'
+            if fill_id:
+                attrs += ' applyFill="1"'
+            if border_id:
+                attrs += ' applyBorder="1"'
+            align = ""
+            if style.horizontal:
+                align += f' horizontal="{style.horizontal}"'
+            if style.vertical:
+                align += f' vertical="{style.vertical}"'
+            if style.wrap:
+                align += ' wrapText="1"'
+            if align:
+                xfs.append(f'<xf {attrs} applyAlignment="1"><alignment{align}/></xf>')
+            else:
+                xfs.append(f"<xf {attrs}/>")
+        return (
+            _XML_DECL
+            + f'<styleSheet xmlns="{_NS_MAIN}">'
+            + '<fonts count="2">'
+            + '<font><sz val="11"/><color theme="1"/><name val="Calibri"/><family val="2"/><scheme val="minor"/></font>'
+            + '<font><b/><sz val="11"/><color theme="1"/><name val="Calibri"/><family val="2"/><scheme val="minor"/></font>'
+            + "</fonts>"
+            + f'<fills count="{len(fills)}">{"".join(fills)}</fills>'
+            + f'<borders count="{len(borders)}">{"".join(borders)}</borders>'
+            + '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+            + f'<cellXfs count="{len(xfs)}">{"".join(xfs)}</cellXfs>'
+            + '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+            + "</styleSheet>"
+        )
+
+
+class _SharedStrings:
+    def __init__(self) -> None:
+        self._index: Dict[str, int] = {}
+        self.refs = 0
+
+    def index(self, s: str) -> int:
+        self.refs += 1
+        idx = self._index.get(s)
+        if idx is None:
+            idx = len(self._index)
+            self._index[s] = idx
+        return idx
+
+    def write(self, f: BinaryIO) -> None:
+        f.write(
+            (_XML_DECL + f'<sst xmlns="{_NS_MAIN}" count="{self.refs}" uniqueCount="{len(self._index)}">').encode("utf-8")
+        )
+        for s in self._index:
+            f.write(f"<si>{_text_element(s)}</si>".encode("utf-8"))
+        f.write(b"</sst>")
+
+
+def _text_element(s: str) -> str:
+    space = ' xml:space="preserve"' if (s != s.strip() or "\n" in s) else ""
+    return f"<t{space}>{_xml_text(s)}</t>"
+
+
+class _Sheet:
+    def __init__(self, title: str, tmp: BinaryIO) -> None:
+        self.title = title
+        self.tmp = tmp
+        self.auto_filter_ref = ""
+        self.styles: List[List[Any]] = []
+
+
+class NativeWorkbook:
+    """Minimal write-only workbook: add sheets (streamed to temp files), then save once."""
+
+    def __init__(self, *, inline_strings: bool = False) -> None:
+        self._styles = _StyleSheet()
+        self._strings = _SharedStrings()
+        self._sheets: List[_Sheet] = []
+        self._inline_strings = inline_strings
+
+    def write_table_sheet(
+        self,
+        *,
+        title: str,
+        headers: Sequence[str],
+        rows: Iterable[Dict[str, Any]],
+        merge_same_value_cols: Sequence[int] = (),
+        center_cols: Sequence[int] = (),
+        bold_center_cols: Sequence[int] = (),
+        index: Optional[int] = None,
+        **layout_options: Any,
+    ) -> None:
+        """Stream one table sheet; `index` places it among the sheets (default: last)."""
+        layout = TableLayout(
+            headers=headers,
+            merge_same_value_cols=merge_same_value_cols,
+            center_cols=center_cols,
+            bold_center_cols=bold_center_cols,
+            **layout_options,
+        )
+        sample, rows = peek_rows(rows)
+        letters = [column_letter(i) for i in range(1, len(headers) + 1)]
+
+        tmp = tempfile.TemporaryFile()
+        sheet = _Sheet(title, tmp)
+        head = [
+            _XML_DECL,
+            f'<worksheet xmlns="{_NS_MAIN}" xmlns:r="{_NS_REL}">',
+            '<sheetViews><sheetView workbookViewId="0">'
+            '<pane ySplit="1" topLeftCell="A2" activePane="bottomLeft" state="frozen"/>'
+            '<selection pane="bottomLeft" activeCell="A2" sqref="A2"/>'
+            "</sheetView></sheetViews>",
+            '<sheetFormatPr baseColWidth="8" defaultRowHeight="15"/>',
+            "<cols>",
+        ]
+        for i, width in enumerate(column_widths(headers, sample), start=1):
+            head.append(f'<col min="{i}" max="{i}" width="{width}" customWidth="1"/>')
+        head.append("</cols><sheetData>")
+        tmp.write("".join(head).encode("utf-8"))
+
+        style_index = self._styles.index
+        string_index = self._strings.index
+        inline = self._inline_strings
+        counting = perf.active() is not None
+        n_rows = n_styled = 0
+        buf: List[str] = []
+        for row in layout.emit(rows):
+            r = row.index
+            if counting:
+                n_rows += 1
+                n_styled += len(row.styles) - row.styles.count(None)
+            if row.height is not None:
+                buf.append(f'<row r="{r}" ht="{row.height}" customHeight="1">')
+            else:
+                buf.append(f'<row r="{r}">')
+            for letter, value, style in zip(letters, row.values, row.styles):
+                if value is None and style is None:
+                    continue
+                s = style_index(style)
+                s_attr = f' s="{s}"' if s else ""
+                if value is None:
+                    buf.append(f'<c r="{letter}{r}"{s_attr}/>')
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    buf.append(f'<c r="{letter}{r}"{s_attr}><v>{value}</v></c>')
+                elif inline:
+                    buf.append(f'<c r="{letter}{r}"{s_attr} t="inlineStr"><is>{_text_element(str(value))}</is></c>')
+                else:
+                    buf.append(f'<c r="{letter}{r}"{s_attr} t="s"><v>{string_index(str(value))}</v></c>')
+            buf.append("</row>")
+            if len(buf) >= 4096:
+                tmp.write("".join(buf).encode("utf-8"))
+                buf.clear()
+        buf.append("</sheetData>")
+        if layout.auto_filter_ref:
+            buf.append(f"<autoFilter ref=\"{layout.auto_filter_ref}\"/>")
+        if layout.merges:
+            buf.append(f'<mergeCells count="{len(layout.merges)}">')
+            for m in layout.merges:
+                buf.append(f'<mergeCell ref="{range_ref(*m)}"/>')
+                if len(buf) >= 4096:
+                    tmp.write("".join(buf).encode("utf-8"))
+                    buf.clear()
+            buf.append("</mergeCells>")
+        buf.append(
+            '<pageMargins left="0.75" right="0.75" top="1" bottom="1" header="0.5" footer="0.5"/></worksheet>'
+        )
+        tmp.write("".join(buf).encode("utf-8"))
+        if counting:
+            perf.add("rows", n_rows)
+            perf.add("cells_styled", n_styled)
+            perf.add("merges", len(layout.merges))
+        sheet.auto_filter_ref = layout.auto_filter_ref
+        sheet.styles = self._styles.snapshot()
+        self._add(sheet, index)
+
+    def copy_sheet(
+        self,
+        source: zipfile.ZipFile,
+        part: str,
+        *,
+        title: str,
+        auto_filter_ref: str,
+        styles: Sequence[Sequence[Any]],
+        index: Optional[int] = None,
+    ) -> None:
+        """
+        Reuse a sheet part from a workbook saved with inline strings (see `manifest`).
+
+        `styles` is the saved [[xf index, *CellStyle fields], ...]; the cell `s=` indexes are
+        rewritten only when this workbook numbered those styles differently.
+        """
+        remap = {int(old): self._styles.index(CellStyle(*fields)) for old, *fields in styles}
+        data = source.read(part)
+        if any(old != new for old, new in remap.items()):
+            data = _CELL_STYLE_ATTR.sub(lambda m: b'%s s="%d"' % (m.group(1), remap[int(m.group(2))]), data)
+        tmp = tempfile.TemporaryFile()
+        tmp.write(data)
+        sheet = _Sheet(title, tmp)
+        sheet.auto_filter_ref = auto_filter_ref
+        sheet.styles = self._styles.snapshot()
+        self._add(sheet, index)
+
+    def _add(self, sheet: _Sheet, index: Optional[int]) -> None:
+        if index is None:
+            self._sheets.append(sheet)
+        else:
+            self._sheets.insert(index, sheet)
+
+    def manifest(self) -> Dict[str, Dict[str, Any]]:
+        """title -> what `copy_sheet` needs to reuse that sheet from the saved file (inline_strings only)."""
+        return {
+            s.title: {"part": f"xl/worksheets/sheet{i}.xml", "auto_filter_ref": s.auto_filter_ref, "styles": s.styles}
+            for i, s in enumerate(self._sheets, start=1)
+        }
+
+    def _workbook_xml(self) -> str:
+        sheets = "".join(
+            f'<sheet name={quoteattr(s.title)} sheetId="{i}" r:id="rId{i}"/>' for i, s in enumerate(self._sheets, start=1)
+        )
+        names = "".join(
+            f'<definedName name="_xlnm._FilterDatabase" localSheetId="{i}" hidden="1">'
+            f"{_xml_text(self._quote_sheet(s.title))}!{self._absolute(s.auto_filter_ref)}</definedName>"
+            for i, s in enumerate(self._sheets)
+            if s.auto_filter_ref
+        )
+        return (
+            _XML_DECL
+            + f'<workbook xmlns="{_NS_MAIN}" xmlns:r="{_NS_REL}">'
+            + '<bookViews><workbookView activeTab="0"/></bookViews>'
+            + f"<sheets>{sheets}</sheets>"
+            + (f"<definedNames>{names}</definedNames>" if names else "")
+            + "</workbook>"
+        )
+
+    @staticmethod
+    def _quote_sheet(title: str) -> str:
+        return "'" + title.replace("'", "''") + "'"
+
+    @staticmethod
+    def _absolute(ref: str) -> str:
+        return ":".join(re.sub(r"^([A-Z]+)(\d+)$", r"$\1$\2", part) for part in ref.split(":"))
+
+    def _content_types_xml(self) -> str:
+        overrides = "".join(
+            f'<Override PartName="/xl/worksheets/sheet{i}.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+            for i in range(1, len(self._sheets) + 1)
+        )
+        return (
+            _XML_DECL
+            + '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+            + '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+            + '<Default Extension="xml" ContentType="application/xml"/>'
+            + '<Override PartName="/xl/workbook.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+            + '<Override PartName="/xl/styles.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+            + '<Override PartName="/xl/sharedStrings.xml" '
+            'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/>'
+            + overrides
+            + "</Types>"
+        )
+
+    def _workbook_rels_xml(self) -> str:
+        rels: List[Tuple[str, str, str]] = [
+            (f"rId{i}", "worksheet", f"worksheets/sheet{i}.xml") for i in range(1, len(self._sheets) + 1)
+        ]
+        n = len(self._sheets)
+        rels.append((f"rId{n + 1}", "styles", "styles.xml"))
+        rels.append((f"rId{n + 2}", "sharedStrings", "sharedStrings.xml"))
+        body = "".join(
+            f'<Relationship Id="{rid}" Type="{_NS_REL}/{kind}" Target="{target}"/>' for rid, kind, target in rels
+        )
+        return _XML_DECL + f'<Relationships xmlns="{_NS_PKG_REL}">{body}</Relationships>'
+
+    def save(self, path: Union[str, Path]) -> None:
+        if not self._sheets:
+            raise ValueError("workbook has no sheets")
+        root_rels = (
+            _XML_DECL
+            + f'<Relationships xmlns="{_NS_PKG_REL}">'
+            + f'<Relationship Id="rId1" Type="{_NS_REL}/officeDocument" Target="xl/workbook.xml"/>'
+            + "</Relationships>"
+        )
+        with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("[Content_Types].xml", self._content_types_xml())
+            zf.writestr("_rels/.rels", root_rels)
+            zf.writestr("xl/workbook.xml", self._workbook_xml())
+            zf.writestr("xl/_rels/workbook.xml.rels", self._workbook_rels_xml())
+            for i, sheet in enumerate(self._sheets, start=1):
+                sheet.tmp.seek(0)
+                with zf.open(f"xl/worksheets/sheet{i}.xml", "w", force_zip64=True) as out:
+                    shutil.copyfileobj(sheet.tmp, out, 1 << 20)
+            zf.writestr("xl/styles.xml", self._styles.to_xml())
+            with zf.open("xl/sharedStrings.xml", "w", force_zip64=True) as out:
+                self._strings.write(out)
+
+    def close(self) -> None:
+        for sheet in self._sheets:
+            sheet.tmp.close()
+
+
+def build_workbook(
+    *, rows: Iterable[Dict[str, Any]], pacing_rows: Optional[Iterable[Dict[str, Any]]] = None
+) -> NativeWorkbook:
+    """Same sheets as `xlsx_writer.build_workbook`, without openpyxl."""
+    wb = NativeWorkbook()
+    wb.write_table_sheet(
+        title="分析",
+        headers=ANALYSIS_HEADERS,
+        rows=rows,
+        merge_same_value_cols=(1, 2),
+        center_cols=(3, 4),
+        bold_center_cols=(1, 2),
+    )
+    if pacing_rows is not None:
+        wb.write_table_sheet(
+            title=PACING_SHEET,
+            headers=PACING_HEADERS,
+            rows=pacing_rows,
+            merge_same_value_cols=(1, 2),
+            center_cols=tuple(range(3, len(PACING_HEADERS) + 1)),
+            bold_center_cols=(1, 2),
+            footer=False,
+        )
+    return wb
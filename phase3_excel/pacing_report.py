@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+"""
+“节奏指标”工作表：按分析结果里的剧情块/切片区间汇总本地节奏指标（pacing.metrics，需要 numpy）。
+
+每章：每个切片一行、每个剧情块一行（整块区间），章末一行全章汇总。
+段落文本取自第一阶段的 <章序>_<章节名>.jsonl；找不到 JSONL 的章节跳过。
+"""
+
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from analysis_loader import ChapterMeta
+
+from artifacts.store import ArtifactStore
+from pacing.metrics import id_ranges, measure_many, read_chapter_paragraphs
+
+
+def chapter_jsonl_text(novel_dir: Path, meta: ChapterMeta, store: Optional[ArtifactStore] = None) -> Optional[str]:
+    """分析文件对应的第一阶段 JSONL（同名主干优先，其次按章序匹配）；给出 store 时从产物存储读取。"""
+    if store is not None:
+        book = novel_dir.name
+        e = store.stat(book, f"{meta.source_path.stem}.jsonl") or store.chapter(book, meta.chapter_no, kind="chapter")
+        return store.get_text(book, e.path) if e is not None else None
+    cand = novel_dir / f"{meta.source_path.stem}.jsonl"
+    if not cand.exists():
+        matches = sorted(novel_dir.glob(f"{meta.chapter_no}_*.jsonl"))
+        if not matches:
+            return None
+        cand = matches[0]
+    return cand.read_text(encoding="utf-8")
+
+
+def _spans(obj: Dict[str, Any]) -> Tuple[List[Tuple[str, str, Any, Any]], List[Tuple[Any, Any]]]:
+    """(剧情块标签, 范围, 起, 止) 列表与对应的 paragraph_id 区间。"""
+    labels: List[Tuple[str, str, Any, Any]] = []
+    spans: List[Tuple[Any, Any]] = []
+    chunks = obj.get("chunks") or []
+    if not isinstance(chunks, list):
+        return labels, spans
+    for c in chunks:
+        if not isinstance(c, dict):
+            continue
+        # 与“分析”表的剧情块标签一致
+        title = c.get("chunk_title")
+        chunk_label = f"{c.get('chunk_id')} {'' if title is None else title}".strip()
+        for s in c.get("slices") or []:
+            if isinstance(s, dict):
+                labels.append((chunk_label, "切片", s.get("start"), s.get("end")))
+                spans.append((s.get("start"), s.get("end")))
+        labels.append((chunk_label, "剧情块", c.get("start_paragraph"), c.get("end_paragraph")))
+        spans.append((c.get("start_paragraph"), c.get("end_paragraph")))
+    return labels, spans
+
+
+def pacing_rows(chapters: Sequence[Tuple[ChapterMeta, Dict[str, Any], Optional[str]]]) -> Iterator[Dict[str, Any]]:
+    """chapters: (章节信息, 分析结果, 章节 JSONL 文本)；所有章节的段落一次性计算。"""
+    usable = [(meta, obj, read_chapter_paragraphs(text)) for meta, obj, text in chapters if text]
+    metrics = measure_many([texts for _, _, (_, texts) in usable])
+    for (meta, obj, (ids, _)), m in zip(usable, metrics):
+        if not ids:
+            continue
+        chapter_label = f"第{meta.chapter_no}章 {meta.chapter_title.strip() or '（无标题）'}".strip()
+        labels, spans = _spans(obj)
+        labels.append(("（全章）", "全章", ids[0], ids[-1]))
+        spans.append((ids[0], ids[-1]))
+        starts, ends = id_ranges(ids, spans)
+        r = m.ranges(starts, ends)
+        for i, (chunk_label, kind, a, b) in enumerate(labels):
+            yield {
+                "章节": chapter_label,
+                "剧情块": chunk_label,
+                "范围": kind,
+                "起始段落": a,
+                "结束段落": b,
+                "段落数": int(r["paragraphs"][i]),
+                "字数": int(r["chars"][i]),
+                "对话占比": round(float(r["dialogue_ratio"][i]), 3),
+                "平均句长": round(float(r["avg_sentence_len"][i]), 1),
+                "感叹/百字": round(float(r["exclaims_per_100"][i]), 2),
+                "疑问/百字": round(float(r["questions_per_100"][i]), 2),
+                "段长标准差": round(float(r["para_len_std"][i]), 1),
+            }
@@ -3,11 +3,19 @@ from __future__ import annotations
 import argparse
 import re
 import sys
+import zipfile
 from pathlib import Path
-from typing import List, Optional
+from typing import Any, Dict, Iterator, List, Optional
+
+# 允许从仓库根目录导入 profiling/（脚本从 phase3_excel/ 直接运行时默认不会包含父目录）
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+if str(_REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(_REPO_ROOT))
 
 from analysis_loader import chapter_rows_from_analysis, iter_analysis_json_files, load_chapter_analysis
-from xlsx_writer import build_workbook
+from artifacts.store import ArtifactStore
+from fingerprint import book_fingerprint, load_state, output_unchanged, run_key, save_state
+from profiling import perf
 
 
 def _strip_quotes(s: str) -> str:
@@ -32,60 +40,231 @@ def _find_novel_dir(input_path: Path) -> Path:
     raise SystemExit(f"未找到小说目录：{p}\n请传入类似：python3 phase3_excel/run_phase3.py 书名")
 
 
+def _save_workbook(wb: Any, out_path: Path) -> Path:
+    try:
+        wb.save(out_path)
+        print(f"[完成] 输出：{out_path}")
+        return out_path
+    except PermissionError:
+        # Common: file is open in Excel so we cannot overwrite it.
+        alt_path = out_path.with_name(f"{out_path.stem}_new{out_path.suffix}")
+        wb.save(alt_path)
+        print(f"[提示] 目标文件正在被占用，已改为输出到：{alt_path}")
+        return alt_path
+
+
+def _run_library(args: argparse.Namespace) -> int:
+    from library_report import build_library_workbook, find_analysis_books
+
+    root = Path(_strip_quotes(str(args.input)))
+    if not root.is_dir():
+        raise SystemExit(f"未找到书库目录：{root}")
+    print("[书库 1/2] 扫描含 analysis/*.json 的书目")
+    with perf.stage("scan"):
+        book_dirs = find_analysis_books(root)
+    if not book_dirs:
+        raise SystemExit(f"在书库中未找到分析结果：{root}\n请先对各书运行第二阶段")
+    print(f"[书库 1/2] 找到 {len(book_dirs)} 本书，workers={args.workers}")
+
+    out_path = args.output or (root / "library_report.xlsx")
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+
+    # 增量：指纹未变化的书沿用上次的工作表（native 后端），全部未变化则直接跳过。
+    key = run_key(args.engine, "library")
+    state = {} if args.force else load_state(out_path)
+    old_books: Dict[str, Any] = state.get("books") or {}
+    fingerprints = {}
+    with perf.stage("fingerprint"):
+        for b in book_dirs:
+            old = old_books.get(b.name) or {}
+            fingerprints[b.name] = book_fingerprint(b, old.get("files"))
+    reusable = state.get("run") == key and output_unchanged(out_path, state)
+    reuse = {
+        name: rec
+        for name, rec in old_books.items()
+        if reusable
+        and name in fingerprints
+        and rec.get("fingerprint") == fingerprints[name][0]
+        and (rec.get("sheet") or rec.get("error"))
+    }
+    if reusable and len(reuse) == len(book_dirs) == len(old_books):
+        print(f"[跳过] 所有书的分析结果均未变化：{out_path}（--force 强制重建）")
+        return 0
+    if args.engine != "native":
+        reuse = {}
+
+    print(f"[书库 2/2] 并行加载并逐本写入工作表（需重建 {len(book_dirs) - len(reuse)} 本）")
+    source = zipfile.ZipFile(out_path) if reuse else None
+    try:
+        with perf.stage("build"):
+            wb, books = build_library_workbook(
+                book_dirs, engine=args.engine, workers=args.workers, reuse=reuse, reuse_from=source
+            )
+    finally:
+        if source is not None:
+            source.close()
+    with perf.stage("save"):
+        saved = _save_workbook(wb, out_path)
+    manifest = wb.manifest() if args.engine == "native" else {}
+    for name, rec in books.items():
+        rec["fingerprint"], rec["files"] = fingerprints[name]
+        if rec["title"] in manifest:
+            rec["sheet"] = manifest[rec["title"]]
+    save_state(saved, {"run": key, "books": books})
+    return 0
+
+
 def main(argv: Optional[List[str]] = None) -> int:
     parser = argparse.ArgumentParser(
         description="Phase3: convert phase2 analysis json to a single Excel (.xlsx).",
         usage='python3 phase3_excel/run_phase3.py "book/书名"',
     )
-    parser.add_argument("input", type=Path, help='Novel dir, e.g. "book/书名"')
+    parser.add_argument("input", type=Path, help='Novel dir, e.g. "book/书名"; with --library a library dir, e.g. "book"')
     parser.add_argument(
         "--output",
         type=Path,
         default=None,
         help='Output xlsx path (default: "<book_dir>/<book_name>.xlsx")',
     )
+    parser.add_argument(
+        "--engine",
+        choices=("native", "openpyxl"),
+        default="native",
+        help="xlsx backend: native (zipfile, no dependency, default) or openpyxl",
+    )
+    parser.add_argument(
+        "--library",
+        action="store_true",
+        help='One workbook for every book under input (one sheet per book + index sheet; default output "<input>/library_report.xlsx")',
+    )
+    parser.add_argument("--workers", type=int, default=4, help="Processes loading books in --library mode (1 = no pool)")
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Rebuild even if the inputs match <output>.fingerprint.json",
+    )
+    parser.add_argument(
+        "--pacing",
+        action="store_true",
+        help="Add a pacing-metrics sheet computed locally from the phase1 chapter jsonl (requires numpy)",
+    )
+    parser.add_argument(
+        "--store",
+        type=Path,
+        default=None,
+        help="Read analysis/* (and chapter jsonl for --pacing) from this artifact store instead of book/<name>/",
+    )
+    perf.add_perf_arguments(parser)
     args = parser.parse_args(argv)
-
+    if args.store is not None and args.library:
+        parser.error("--store cannot be combined with --library")
+    store = ArtifactStore(args.store) if args.store is not None else None
     try:
-        import openpyxl  # noqa: F401
-    except Exception as e:
-        raise SystemExit("缺少依赖 openpyxl，请先安装：pip install openpyxl") from e
+        with perf.profile_run("phase3", args):
+            return _run(args, store)
+    finally:
+        if store is not None:
+            store.close()
+
 
-    novel_dir = _find_novel_dir(args.input)
-    analysis_dir = novel_dir / "analysis"
-    if not analysis_dir.exists():
-        raise SystemExit(f"未找到分析目录：{analysis_dir}\n请先运行第二阶段生成 analysis/*.json")
+def _run(args: argparse.Namespace, store: Optional[ArtifactStore] = None) -> int:
+    # 只有 openpyxl 后端才需要（并导入）openpyxl；native 后端只用标准库。
+    if args.engine == "openpyxl":
+        try:
+            import openpyxl  # noqa: F401
+        except Exception as e:
+            raise SystemExit("缺少依赖 openpyxl，请先安装：pip install openpyxl") from e
+        from xlsx_writer import build_workbook
+    else:
+        from native_xlsx import build_workbook
+    if args.pacing and not args.library:
+        try:
+            import numpy  # noqa: F401
+        except Exception as e:
+            raise SystemExit("缺少依赖 numpy，请先安装：pip install numpy（--pacing 需要）") from e
 
-    print("[阶段 1/3] 扫描分析 JSON 文件")
-    json_files = iter_analysis_json_files(analysis_dir)
+    if args.library:
+        if args.pacing:
+            print("[提示] --pacing 暂不支持 --library，书库汇总不含节奏指标表")
+        return _run_library(args)
+
+    if store is not None:
+        # 存储里的分析结果按 book/<书名>/analysis/<文件名> 的虚拟路径处理（章序、标题同样取自文件名）
+        novel_dir = Path("book") / Path(_strip_quotes(str(args.input))).name
+        analysis_dir = novel_dir / "analysis"
+        print("[阶段 1/3] 扫描产物存储中的分析结果")
+        with perf.stage("scan"):
+            json_files = [novel_dir / e.path for e in store.entries(novel_dir.name, kind="analysis")]
+        if not json_files:
+            raise SystemExit(f"产物存储中没有《{novel_dir.name}》的分析结果：{store.root}\n请先用 --store 运行第二阶段")
+    else:
+        novel_dir = _find_novel_dir(args.input)
+        analysis_dir = novel_dir / "analysis"
+        if not analysis_dir.exists():
+            raise SystemExit(f"未找到分析目录：{analysis_dir}\n请先运行第二阶段生成 analysis/*.json")
+
+        print("[阶段 1/3] 扫描分析 JSON 文件")
+        with perf.stage("scan"):
+            json_files = iter_analysis_json_files(analysis_dir)
     if not json_files:
         raise SystemExit(f"在目录中未找到分析 JSON：{analysis_dir}\n请确认已运行第二阶段（会生成 analysis/1_*.json 等）")
 
     # 通常只有前三章；如果有额外文件，这里仍按序合并。
     print(f"[阶段 1/3] 找到 {len(json_files)} 个文件，将合并到同一个 Excel 中")
 
-    print("[阶段 2/3] 解析 JSON 并生成表格行")
-    rows = []
-    for p in json_files:
-        meta, obj = load_chapter_analysis(p)
-        rows.extend(chapter_rows_from_analysis(meta, obj))
-
-    print(f"[阶段 2/3] 共 {len(rows)} 行")
-
     # 默认输出文件名使用“书名.xlsx”
     out_path = args.output or (novel_dir / f"{novel_dir.name}.xlsx")
     out_path.parent.mkdir(parents=True, exist_ok=True)
 
+    key = run_key(args.engine, "book", pacing=args.pacing)
+    state = {} if args.force else load_state(out_path)
+    old = (state.get("books") or {}).get(novel_dir.name) or {}
+    with perf.stage("fingerprint"):
+        if store is not None:
+            fingerprint, files = store.fingerprint(novel_dir.name), {}
+        else:
+            fingerprint, files = book_fingerprint(novel_dir, old.get("files"), chapter_content=args.pacing)
+    if state.get("run") == key and old.get("fingerprint") == fingerprint and output_unchanged(out_path, state):
+        print(f"[跳过] 分析结果未变化：{out_path}（--force 强制重建）")
+        return 0
+
+    print("[阶段 2/3] 解析 JSON 并流式写入表格行")
+    row_count = 0
+    analyses: List[Any] = []  # --pacing：写完分析表后再按同样的剧情块区间算节奏指标
+
+    def iter_rows() -> Iterator[Dict[str, Any]]:
+        # 逐章读取、逐行写出，不在内存中保留整张表。
+        nonlocal row_count
+        for p in json_files:
+            text = store.get_text(novel_dir.name, f"analysis/{p.name}") if store is not None else None
+            meta, obj = load_chapter_analysis(p, text)
+            perf.add("json_files")
+            if args.pacing:
+                analyses.append((meta, obj))
+            for row in chapter_rows_from_analysis(meta, obj):
+                row_count += 1
+                yield row
+
+    pacing_rows = None
+    if args.pacing:
+        from pacing_report import chapter_jsonl_text, pacing_rows as build_pacing_rows
+
+        def iter_pacing_rows() -> Iterator[Dict[str, Any]]:
+            # 生成器在分析表写完后才开始执行，此时 analyses 已收集完整。
+            with perf.stage("pacing"):
+                rows = list(build_pacing_rows([(m, o, chapter_jsonl_text(novel_dir, m, store)) for m, o in analyses]))
+            yield from rows
+
+        pacing_rows = iter_pacing_rows()
+
+    with perf.stage("build"):
+        wb = build_workbook(rows=iter_rows(), pacing_rows=pacing_rows)
+    print(f"[阶段 2/3] 共 {row_count} 行")
+
     print("[阶段 3/3] 写入 Excel")
-    wb = build_workbook(rows=rows)
-    try:
-        wb.save(out_path)
-        print(f"[完成] 输出：{out_path}")
-    except PermissionError:
-        # Common: file is open in Excel so we cannot overwrite it.
-        alt_path = out_path.with_name(f"{out_path.stem}_new{out_path.suffix}")
-        wb.save(alt_path)
-        print(f"[提示] 目标文件正在被占用，已改为输出到：{alt_path}")
+    with perf.stage("save"):
+        saved = _save_workbook(wb, out_path)
+    save_state(saved, {"run": key, "books": {novel_dir.name: {"fingerprint": fingerprint, "files": files}}})
     return 0
 
 
@@ -0,0 +1,436 @@
+from __future__ import annotations
+
+"""
+SQLite 分析库：把各书的 analysis/*.json 规范化导入 books / chapters / chunks / slices 四张表。
+
+- 增量导入：按章节文件内容的 sha256 判断，未变化的章节直接跳过；变化的章节整章替换
+- 索引：书名、(书, 章序)、段落范围；FTS5 全文检索 slices（内容/节奏/爆点）与 chunks（标题/剧情/节奏总结）
+- 中文检索使用 trigram 分词（SQLite >= 3.34），不足 3 个字的关键词退回 LIKE
+- 每本书一个事务：某本书导入失败（文件损坏、同一章序重复等）只回滚这本书，其余照常导入
+- meta.schema_version 与 SCHEMA_VERSION 不一致的库拒绝打开，需删除后重新导入
+
+命令：
+  python phase3_excel/sqlite_store.py load book                     # 导入整个书库（默认写 book/analysis.sqlite）
+  python phase3_excel/sqlite_store.py search 系统 --field hook --chapter 1
+  python phase3_excel/sqlite_store.py hooks --chapter 1 --chunk 1  # 第 1 章开篇剧情块的全部爆点
+  python phase3_excel/sqlite_store.py sql "SELECT COUNT(*) FROM slices"
+  python phase3_excel/sqlite_store.py stats
+"""
+
+import argparse
+import hashlib
+import json
+import sqlite3
+import time
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from analysis_loader import NO_HOOK_VALUES, iter_analysis_json_files, load_chapter_analysis
+
+DEFAULT_DB = Path("book") / "analysis.sqlite"
+SCHEMA_VERSION = 1
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS books (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    loaded_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS chapters (
+    id INTEGER PRIMARY KEY,
+    book_id INTEGER NOT NULL REFERENCES books(id) ON DELETE CASCADE,
+    chapter_no INTEGER NOT NULL,
+    title TEXT NOT NULL,
+    source TEXT NOT NULL,
+    content_hash TEXT NOT NULL,
+    UNIQUE (book_id, chapter_no)
+);
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    chapter_id INTEGER NOT NULL REFERENCES chapters(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    chunk_id TEXT,
+    title TEXT,
+    start_paragraph INTEGER,
+    end_paragraph INTEGER,
+    plot_summary TEXT,
+    pacing_summary TEXT
+);
+CREATE TABLE IF NOT EXISTS slices (
+    id INTEGER PRIMARY KEY,
+    chunk_id INTEGER NOT NULL REFERENCES chunks(id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    start_paragraph INTEGER,
+    end_paragraph INTEGER,
+    content_summary TEXT,
+    pacing_analysis TEXT,
+    hook_extraction TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_chapters_book ON chapters(book_id, chapter_no);
+CREATE INDEX IF NOT EXISTS idx_chapters_no ON chapters(chapter_no);
+CREATE INDEX IF NOT EXISTS idx_chunks_chapter ON chunks(chapter_id, seq);
+CREATE INDEX IF NOT EXISTS idx_chunks_range ON chunks(start_paragraph, end_paragraph);
+CREATE INDEX IF NOT EXISTS idx_slices_chunk ON slices(chunk_id, seq);
+CREATE INDEX IF NOT EXISTS idx_slices_range ON slices(start_paragraph, end_paragraph);
+
+CREATE VIRTUAL TABLE IF NOT EXISTS slices_fts USING fts5(
+    content_summary, pacing_analysis, hook_extraction,
+    content='slices', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS slices_ai AFTER INSERT ON slices BEGIN
+    INSERT INTO slices_fts(rowid, content_summary, pacing_analysis, hook_extraction)
+    VALUES (new.id, new.content_summary, new.pacing_analysis, new.hook_extraction);
+END;
+CREATE TRIGGER IF NOT EXISTS slices_ad AFTER DELETE ON slices BEGIN
+    INSERT INTO slices_fts(slices_fts, rowid, content_summary, pacing_analysis, hook_extraction)
+    VALUES ('delete', old.id, old.content_summary, old.pacing_analysis, old.hook_extraction);
+END;
+
+CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+    title, plot_summary, pacing_summary,
+    content='chunks', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS chunks_ai AFTER INSERT ON chunks BEGIN
+    INSERT INTO chunks_fts(rowid, title, plot_summary, pacing_summary)
+    VALUES (new.id, new.title, new.plot_summary, new.pacing_summary);
+END;
+CREATE TRIGGER IF NOT EXISTS chunks_ad AFTER DELETE ON chunks BEGIN
+    INSERT INTO chunks_fts(chunks_fts, rowid, title, plot_summary, pacing_summary)
+    VALUES ('delete', old.id, old.title, old.plot_summary, old.pacing_summary);
+END;
+
+CREATE VIEW IF NOT EXISTS slice_view AS
+SELECT s.id AS slice_id, b.name AS book, c.chapter_no, c.title AS chapter_title,
+       k.seq AS chunk_seq, k.chunk_id, k.title AS chunk_title,
+       s.seq AS slice_seq, s.start_paragraph, s.end_paragraph,
+       s.content_summary, s.pacing_analysis, s.hook_extraction
+FROM slices s
+JOIN chunks k ON k.id = s.chunk_id
+JOIN chapters c ON c.id = k.chapter_id
+JOIN books b ON b.id = c.book_id;
+"""
+
+_FIELDS = {"summary": "content_summary", "pacing": "pacing_analysis", "hook": "hook_extraction"}
+
+
+@dataclass
+class LoadReport:
+    books: int = 0
+    chapters_loaded: int = 0
+    chapters_skipped: int = 0
+    chapters_removed: int = 0
+    chunks: int = 0
+    slices: int = 0
+    seconds: float = 0.0
+
+
+def connect(db_path: Path, *, readonly: bool = False) -> sqlite3.Connection:
+    if readonly:
+        conn = sqlite3.connect(f"{db_path.resolve().as_uri()}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        _check_schema_version(conn, db_path)
+        return conn
+    db_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(str(db_path))
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA foreign_keys = ON")
+    conn.execute("PRAGMA journal_mode = WAL")
+    conn.execute("PRAGMA synchronous = NORMAL")
+    conn.execute("PRAGMA temp_store = MEMORY")
+    conn.execute("PRAGMA cache_size = -65536")  # 64 MiB
+    conn.executescript(_SCHEMA)
+    conn.execute("INSERT OR IGNORE INTO meta(key, value) VALUES ('schema_version', ?)", (str(SCHEMA_VERSION),))
+    conn.commit()
+    _check_schema_version(conn, db_path)
+    return conn
+
+
+def _check_schema_version(conn: sqlite3.Connection, db_path: Path) -> None:
+    """库是由其他版本的表结构建立的：拒绝打开（增量导入会写出不一致的数据），需删除后重新 load。"""
+    try:
+        row = conn.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+    except sqlite3.Error:
+        row = None
+    version = row[0] if row is not None else None
+    if version != str(SCHEMA_VERSION):
+        conn.close()
+        raise ValueError(f"数据库表结构版本为 {version}，当前需要 {SCHEMA_VERSION}：{db_path}（删除后重新运行 load）")
+
+
+def find_books(root: Path) -> List[Path]:
+    """root 本身是书目录（含 analysis/）则返回 [root]，否则返回其下所有含 analysis/ 的书目录。"""
+    if (root / "analysis").is_dir():
+        return [root]
+    return sorted(p for p in root.iterdir() if p.is_dir() and (p / "analysis").is_dir())
+
+
+def _int_or_none(v: Any) -> Optional[int]:
+    return v if isinstance(v, int) and not isinstance(v, bool) else None
+
+
+def _text(v: Any) -> str:
+    return "" if v is None else str(v)
+
+
+def _insert_chapter(conn: sqlite3.Connection, chapter_id: int, obj: Dict[str, Any]) -> Tuple[int, int]:
+    n_chunks = n_slices = 0
+    for seq, c in enumerate(obj.get("chunks") or [], start=1):
+        if not isinstance(c, dict):
+            continue
+        cur = conn.execute(
+            "INSERT INTO chunks(chapter_id, seq, chunk_id, title, start_paragraph, end_paragraph, plot_summary, pacing_summary)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                chapter_id,
+                seq,
+                _text(c.get("chunk_id")),
+                _text(c.get("chunk_title")),
+                _int_or_none(c.get("start_paragraph")),
+                _int_or_none(c.get("end_paragraph")),
+                _text(c.get("plot_summary")),
+                _text(c.get("pacing_summary")),
+            ),
+        )
+        chunk_row = cur.lastrowid
+        n_chunks += 1
+        slices = [s for s in (c.get("slices") or []) if isinstance(s, dict)]
+        conn.executemany(
+            "INSERT INTO slices(chunk_id, seq, start_paragraph, end_paragraph, content_summary, pacing_analysis, hook_extraction)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    chunk_row,
+                    i,
+                    _int_or_none(s.get("start")),
+                    _int_or_none(s.get("end")),
+                    _text(s.get("content_summary")),
+                    _text(s.get("pacing_analysis")),
+                    _text(s.get("hook_extraction")),
+                )
+                for i, s in enumerate(slices, start=1)
+            ],
+        )
+        n_slices += len(slices)
+    return n_chunks, n_slices
+
+
+def load_book(conn: sqlite3.Connection, book_dir: Path, report: LoadReport) -> None:
+    """导入一本书（单个事务）：新增/变化的章节重新写入，已删除的章节从库中移除。"""
+    with conn:
+        row = conn.execute("SELECT id FROM books WHERE name = ?", (book_dir.name,)).fetchone()
+        if row is None:
+            book_id = conn.execute(
+                "INSERT INTO books(name, path, loaded_at) VALUES (?, ?, ?)", (book_dir.name, str(book_dir), time.time())
+            ).lastrowid
+        else:
+            book_id = row["id"]
+            conn.execute("UPDATE books SET path = ?, loaded_at = ? WHERE id = ?", (str(book_dir), time.time(), book_id))
+        existing = {
+            r["chapter_no"]: (r["id"], r["content_hash"])
+            for r in conn.execute("SELECT id, chapter_no, content_hash FROM chapters WHERE book_id = ?", (book_id,))
+        }
+
+        seen = set()
+        for path in iter_analysis_json_files(book_dir / "analysis"):
+            content_hash = hashlib.sha256(path.read_bytes()).hexdigest()
+            meta, obj = load_chapter_analysis(path)
+            seen.add(meta.chapter_no)
+            old = existing.get(meta.chapter_no)
+            if old is not None and old[1] == content_hash:
+                report.chapters_skipped += 1
+                continue
+            if old is not None:
+                conn.execute("DELETE FROM chapters WHERE id = ?", (old[0],))
+            chapter_id = conn.execute(
+                "INSERT INTO chapters(book_id, chapter_no, title, source, content_hash) VALUES (?, ?, ?, ?, ?)",
+                (book_id, meta.chapter_no, meta.chapter_title, path.name, content_hash),
+            ).lastrowid
+            n_chunks, n_slices = _insert_chapter(conn, chapter_id, obj if isinstance(obj, dict) else {})
+            report.chapters_loaded += 1
+            report.chunks += n_chunks
+            report.slices += n_slices
+
+        for chapter_no, (chapter_id, _) in existing.items():
+            if chapter_no not in seen:
+                conn.execute("DELETE FROM chapters WHERE id = ?", (chapter_id,))
+                report.chapters_removed += 1
+    report.books += 1
+
+
+def load_library(db_path: Path, root: Path, *, prune: bool = False, log=print) -> LoadReport:
+    report = LoadReport()
+    t0 = time.perf_counter()
+    conn = connect(db_path)
+    try:
+        books = find_books(root)
+        for i, book_dir in enumerate(books, start=1):
+            before = replace(report)
+            try:
+                load_book(conn, book_dir, report)
+            except (OSError, ValueError, sqlite3.Error) as e:
+                # load_book 的事务已回滚（例如同一章序有两个文件时的 IntegrityError），统计也回退到导入前
+                report = before
+                log(f"[{i}/{len(books)}] {book_dir.name} ERROR {type(e).__name__}: {e}")
+                continue
+            if i % 100 == 0 or i == len(books):
+                log(f"[{i}/{len(books)}] 导入章节={report.chapters_loaded} 跳过={report.chapters_skipped} 切片={report.slices}")
+        if prune:
+            names = {b.name for b in books}
+            with conn:
+                for r in conn.execute("SELECT id, name FROM books").fetchall():
+                    if r["name"] not in names:
+                        conn.execute("DELETE FROM books WHERE id = ?", (r["id"],))
+        conn.execute("PRAGMA optimize")
+    finally:
+        conn.close()
+    report.seconds = time.perf_counter() - t0
+    return report
+
+
+def search(
+    conn: sqlite3.Connection,
+    query: str,
+    *,
+    field: Optional[str] = None,
+    book: Optional[str] = None,
+    chapter: Optional[int] = None,
+    limit: int = 20,
+) -> List[sqlite3.Row]:
+    """全文检索切片；field 为 summary / pacing / hook（默认三者都搜）。"""
+    where: List[str] = []
+    params: List[Any] = []
+    if len(query) >= 3:
+        fts_query = '"' + query.replace('"', '""') + '"'
+        if field:
+            fts_query = f"{_FIELDS[field]} : {fts_query}"
+        where.append("v.slice_id IN (SELECT rowid FROM slices_fts WHERE slices_fts MATCH ?)")
+        params.append(fts_query)
+    else:
+        # trigram 需要至少 3 个字符，短关键词退回 LIKE（全表扫描）
+        cols = [_FIELDS[field]] if field else list(_FIELDS.values())
+        where.append("(" + " OR ".join(f"v.{c} LIKE ?" for c in cols) + ")")
+        params.extend(f"%{query}%" for _ in cols)
+    if book:
+        where.append("v.book = ?")
+        params.append(book)
+    if chapter is not None:
+        where.append("v.chapter_no = ?")
+        params.append(chapter)
+    sql = f"SELECT * FROM slice_view v WHERE {' AND '.join(where)} ORDER BY v.book, v.chapter_no, v.chunk_seq, v.slice_seq LIMIT ?"
+    return conn.execute(sql, (*params, limit)).fetchall()
+
+
+def hooks(
+    conn: sqlite3.Connection,
+    *,
+    chapter: Optional[int] = None,
+    chunk: Optional[int] = None,
+    book: Optional[str] = None,
+    limit: int = 100,
+) -> List[sqlite3.Row]:
+    """爆点列表，例如 chapter=1, chunk=1：所有书第 1 章开篇剧情块的爆点。"""
+    where = [f"TRIM(v.hook_extraction) NOT IN ({', '.join('?' * len(NO_HOOK_VALUES))})"]
+    params: List[Any] = list(NO_HOOK_VALUES)
+    if chapter is not None:
+        where.append("v.chapter_no = ?")
+        params.append(chapter)
+    if chunk is not None:
+        where.append("v.chunk_seq = ?")
+        params.append(chunk)
+    if book:
+        where.append("v.book = ?")
+        params.append(book)
+    sql = f"SELECT * FROM slice_view v WHERE {' AND '.join(where)} ORDER BY v.book, v.chapter_no, v.chunk_seq, v.slice_seq LIMIT ?"
+    return conn.execute(sql, (*params, limit)).fetchall()
+
+
+def stats(conn: sqlite3.Connection) -> Dict[str, int]:
+    return {t: conn.execute(f"SELECT COUNT(*) FROM {t}").fetchone()[0] for t in ("books", "chapters", "chunks", "slices")}
+
+
+def _print_rows(rows: Sequence[sqlite3.Row], columns: Optional[Sequence[str]] = None, *, as_json: bool = False) -> None:
+    if not rows:
+        print("(no rows)")
+        return
+    cols = list(columns or rows[0].keys())
+    if as_json:
+        print(json.dumps([{c: r[c] for c in cols} for r in rows], ensure_ascii=False, indent=2))
+        return
+    for r in rows:
+        print(" | ".join(_text(r[c]).replace("\n", " ") for c in cols))
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Load analysis JSON into SQLite and query it.")
+    parser.add_argument("--db", type=Path, default=None, help=f"SQLite file (default: {DEFAULT_DB}; load: <input>/analysis.sqlite)")
+    sub = parser.add_subparsers(dest="cmd", required=True)
+
+    p_load = sub.add_parser("load", help="Incrementally load a library dir (e.g. book) or one book dir")
+    p_load.add_argument("input", type=Path)
+    p_load.add_argument("--prune", action="store_true", help="Remove books that no longer exist under input")
+
+    p_search = sub.add_parser("search", help="Full-text search over slice summaries / pacing / hooks")
+    p_search.add_argument("query")
+    p_search.add_argument("--field", choices=sorted(_FIELDS), default=None)
+    p_search.add_argument("--book", default=None)
+    p_search.add_argument("--chapter", type=int, default=None)
+    p_search.add_argument("--limit", type=int, default=20)
+    p_search.add_argument("--json", action="store_true")
+
+    p_hooks = sub.add_parser("hooks", help="List hook_extraction values (e.g. --chapter 1 --chunk 1)")
+    p_hooks.add_argument("--chapter", type=int, default=None)
+    p_hooks.add_argument("--chunk", type=int, default=None, help="Chunk position within the chapter (1 = opening chunk)")
+    p_hooks.add_argument("--book", default=None)
+    p_hooks.add_argument("--limit", type=int, default=100)
+    p_hooks.add_argument("--json", action="store_true")
+
+    p_sql = sub.add_parser("sql", help="Run a read-only SQL query (tables: books/chapters/chunks/slices, view: slice_view)")
+    p_sql.add_argument("sql")
+    p_sql.add_argument("--json", action="store_true")
+
+    sub.add_parser("stats", help="Row counts")
+    args = parser.parse_args(argv)
+
+    if args.cmd == "load":
+        # 书库目录 -> <书库>/analysis.sqlite；单本书目录 -> 与书库共用 <上级目录>/analysis.sqlite
+        db_path = args.db or ((args.input.parent if (args.input / "analysis").is_dir() else args.input) / "analysis.sqlite")
+        try:
+            r = load_library(db_path, args.input, prune=args.prune)
+        except ValueError as e:
+            raise SystemExit(str(e)) from None
+        print(
+            f"[完成] {db_path}：书目={r.books} 导入章节={r.chapters_loaded} 跳过(未变化)={r.chapters_skipped} "
+            f"移除={r.chapters_removed} 剧情块={r.chunks} 切片={r.slices} 耗时={r.seconds:.2f}s"
+        )
+        return 0
+
+    db_path = args.db or DEFAULT_DB
+    if not db_path.exists():
+        raise SystemExit(f"未找到数据库：{db_path}（先运行 load 子命令）")
+    try:
+        conn = connect(db_path, readonly=True)
+    except ValueError as e:
+        raise SystemExit(str(e)) from None
+    try:
+        if args.cmd == "stats":
+            for k, v in stats(conn).items():
+                print(f"{k}: {v}")
+        elif args.cmd == "search":
+            rows = search(conn, args.query, field=args.field, book=args.book, chapter=args.chapter, limit=args.limit)
+            _print_rows(rows, ["book", "chapter_no", "chunk_title", "start_paragraph", "end_paragraph", _FIELDS[args.field or "summary"]], as_json=args.json)
+        elif args.cmd == "hooks":
+            rows = hooks(conn, chapter=args.chapter, chunk=args.chunk, book=args.book, limit=args.limit)
+            _print_rows(rows, ["book", "chapter_no", "chunk_title", "start_paragraph", "end_paragraph", "hook_extraction"], as_json=args.json)
+        elif args.cmd == "sql":
+            # 连接以只读方式打开，写语句会直接报错
+            _print_rows(conn.execute(args.sql).fetchall(), as_json=args.json)
+    finally:
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
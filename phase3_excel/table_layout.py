@@ -0,0 +1,229 @@
+from __future__ import annotations
+
+"""
+Row model for the analysis sheet: decides every cell's value/style/merge while rows stream by.
+
+The writer backends (openpyxl write-only, native SpreadsheetML) only translate
+`LayoutRow`s into XML; nothing is revisited after a row has been emitted, so memory
+stays bounded by the merge list (a few ranges per chunk) rather than by the sheet.
+"""
+
+import itertools
+from dataclasses import dataclass, field, replace
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+ANALYSIS_HEADERS = ["章节", "剧情块", "起始段落", "结束段落", "内容概述", "节奏分析", "爆点提取"]
+LABEL_PLOT = "剧情概述"
+LABEL_PACE = "节奏概述"
+FOOTER_TEXT = "内容由 AI 产生"
+PACING_SHEET = "节奏指标"
+PACING_HEADERS = [
+    "章节",
+    "剧情块",
+    "范围",
+    "起始段落",
+    "结束段落",
+    "段落数",
+    "字数",
+    "对话占比",
+    "平均句长",
+    "感叹/百字",
+    "疑问/百字",
+    "段长标准差",
+]
+
+BORDER_COLOR = "808080"
+CHAPTER_FILL = "FFF2CC"
+HEADER_HEIGHT = 28
+WIDTH_SAMPLE_ROWS = 200
+
+
+@dataclass(frozen=True)
+class CellStyle:
+    bold: bool = False
+    horizontal: Optional[str] = None
+    vertical: Optional[str] = None
+    wrap: bool = False
+    fill: Optional[str] = None  # RGB, solid fill
+    border: bool = False  # medium BORDER_COLOR on all four sides
+
+
+STYLE_HEADER = CellStyle(bold=True, horizontal="center", vertical="center", wrap=True, border=True)
+STYLE_WRAP = CellStyle(vertical="top", wrap=True, border=True)
+STYLE_CENTER = CellStyle(horizontal="center", vertical="center", wrap=True, border=True)
+STYLE_BOLD_CENTER = CellStyle(bold=True, horizontal="center", vertical="center", wrap=True, border=True)
+# 汇总行内容垂直居中（“行居中”），并保持左对齐便于阅读
+STYLE_SUMMARY_TEXT = CellStyle(horizontal="left", vertical="center", wrap=True, border=True)
+STYLE_FOOTER = CellStyle(bold=True, horizontal="center", vertical="center", border=True)
+STYLE_BORDER = CellStyle(border=True)
+
+
+@dataclass
+class LayoutRow:
+    index: int  # 1-based sheet row
+    values: List[Any]  # None = empty cell (including cells hidden by a merge)
+    styles: List[Optional[CellStyle]]
+    height: Optional[float] = None
+
+
+def column_letter(col: int) -> str:
+    """1 -> A, 27 -> AA."""
+    s = ""
+    while col > 0:
+        col, rem = divmod(col - 1, 26)
+        s = chr(65 + rem) + s
+    return s
+
+
+def range_ref(min_row: int, min_col: int, max_row: int, max_col: int) -> str:
+    return f"{column_letter(min_col)}{min_row}:{column_letter(max_col)}{max_row}"
+
+
+def peek_rows(rows: Iterable[Dict[str, Any]], n: int = WIDTH_SAMPLE_ROWS) -> Tuple[List[Dict[str, Any]], Iterator[Dict[str, Any]]]:
+    """Take the first n rows (for column widths) without losing them from the stream."""
+    it = iter(rows)
+    head = list(itertools.islice(it, n))
+    return head, itertools.chain(head, it)
+
+
+def column_widths(headers: Sequence[str], sample: Sequence[Dict[str, Any]]) -> List[float]:
+    # 按前 N 行做一个简单估算，避免 O(n*m) 的宽度计算太慢；宽度给一个上限，避免超宽。
+    widths: List[float] = []
+    for h in headers:
+        max_len = len(str(h))
+        for r in sample:
+            v = r.get(h, "")
+            max_len = max(max_len, len("" if v is None else str(v)))
+        widths.append(min(max(max_len + 2, 10), 60))
+    return widths
+
+
+def _blank(v: Any) -> bool:
+    return v is None or v == ""
+
+
+def _summary_row_height(text: Any) -> Optional[float]:
+    # Excel won't auto-fit row height for merged cells; set a larger height so wrapping is visible.
+    if _blank(text):
+        return None
+    lines = max(2, (len(str(text)) + 79) // 80)  # rough estimate
+    return min(180, 18 * lines)
+
+
+@dataclass
+class TableLayout:
+    """
+    One table sheet: header, data rows (blank separator row between chapters),
+    chunk summary rows (C:D label + E:G text merges), then the AI footer.
+
+    Iterate `emit(rows)` once; `merges` and `auto_filter_ref` are complete afterwards.
+    """
+
+    headers: Sequence[str]
+    merge_same_value_cols: Sequence[int] = ()
+    center_cols: Sequence[int] = ()
+    bold_center_cols: Sequence[int] = ()
+    chapter_gap_rows: int = 1
+    chunk_gap_rows: int = 0
+    footer_blank_rows: int = 3
+    chapter_fill: bool = True
+    footer: bool = True
+    merges: List[Tuple[int, int, int, int]] = field(default_factory=list)
+    auto_filter_ref: str = ""
+
+    def emit(self, rows: Iterable[Dict[str, Any]]) -> Iterator[LayoutRow]:
+        ncols = len(self.headers)
+        if not ncols:
+            return
+        col_style = self._column_styles(ncols)
+        # Per merge column: [run start row, run value]
+        runs: Dict[int, List[Any]] = {c: [0, None] for c in self.merge_same_value_cols}
+
+        yield LayoutRow(1, list(self.headers), [STYLE_HEADER] * ncols, HEADER_HEIGHT)
+        row_no = 1
+
+        chapter_key = self.headers[0]
+        chunk_key = self.headers[1] if ncols > 1 else None
+        last_chapter = None
+        last_chunk = None
+        for r in rows:
+            chapter_val = r.get(chapter_key, "")
+            chunk_val = r.get(chunk_key, "") if chunk_key else ""
+            cur_chunk = (chapter_val, chunk_val)
+            # Only insert gaps when we have a meaningful chapter/chunk key.
+            gap = 0
+            if not _blank(chunk_val):
+                if last_chapter is not None and chapter_val != last_chapter:
+                    gap = self.chapter_gap_rows
+                elif last_chunk is not None and cur_chunk != last_chunk:
+                    gap = self.chunk_gap_rows
+                last_chapter = chapter_val
+                last_chunk = cur_chunk
+            for _ in range(max(0, int(gap))):
+                row_no += 1
+                self._advance_runs(runs, row_no, [None] * ncols)
+                yield LayoutRow(row_no, [None] * ncols, [None] * ncols)
+
+            row_no += 1
+            values = [r.get(h, "") for h in self.headers]
+            yield self._data_row(row_no, values, col_style, runs)
+
+        data_end = row_no
+        self._close_runs(runs, data_end)
+        self.auto_filter_ref = range_ref(1, 1, data_end, ncols)
+
+        if not self.footer:
+            return
+        for _ in range(max(0, int(self.footer_blank_rows))):
+            row_no += 1
+            yield LayoutRow(row_no, [None] * ncols, [None] * ncols)
+        row_no += 1
+        if ncols > 1:
+            self.merges.append((row_no, 1, row_no, ncols))
+        yield LayoutRow(row_no, [FOOTER_TEXT] + [None] * (ncols - 1), [STYLE_FOOTER] + [STYLE_BORDER] * (ncols - 1))
+
+    def _column_styles(self, ncols: int) -> List[CellStyle]:
+        styles = [STYLE_WRAP] * ncols
+        for c in self.center_cols:
+            styles[c - 1] = STYLE_CENTER
+        for c in self.bold_center_cols:
+            styles[c - 1] = STYLE_BOLD_CENTER
+        return styles
+
+    def _advance_runs(self, runs: Dict[int, List[Any]], row_no: int, values: List[Any]) -> None:
+        """Track runs of equal values; a cell continuing a run is blanked (it sits under the merge)."""
+        for col, run in runs.items():
+            v = values[col - 1]
+            if not _blank(v) and v == run[1]:
+                values[col - 1] = None
+                continue
+            self._close_run(col, run, row_no - 1)
+            run[0], run[1] = row_no, v
+
+    def _close_run(self, col: int, run: List[Any], end_row: int) -> None:
+        if not _blank(run[1]) and end_row > run[0]:
+            self.merges.append((run[0], col, end_row, col))
+
+    def _close_runs(self, runs: Dict[int, List[Any]], end_row: int) -> None:
+        for col, run in runs.items():
+            self._close_run(col, run, end_row)
+
+    def _data_row(self, row_no: int, values: List[Any], col_style: List[CellStyle], runs: Dict[int, List[Any]]) -> LayoutRow:
+        ncols = len(values)
+        self._advance_runs(runs, row_no, values)
+        values = [None if _blank(v) else v for v in values]
+        styles: List[Optional[CellStyle]] = list(col_style)
+        if self.chapter_fill and values[0] is not None:
+            styles[0] = replace(styles[0], fill=CHAPTER_FILL)
+        height = None
+        if ncols >= 7 and values[2] in (LABEL_PLOT, LABEL_PACE):
+            # Merge "起始段落"+"结束段落" for the label and the last 3 columns for the summary text.
+            self.merges.append((row_no, 3, row_no, 4))
+            self.merges.append((row_no, 5, row_no, 7))
+            styles[2] = STYLE_BOLD_CENTER
+            styles[4] = STYLE_SUMMARY_TEXT
+            height = _summary_row_height(values[4])
+        if all(v is None for v in values):
+            # A fully blank row stays borderless as a visual separator.
+            styles = [replace(s, border=False) if s else None for s in styles]
+        return LayoutRow(row_no, values, styles, height)
@@ -0,0 +1,37 @@
+"""
+进程内流水线：EPUB -> 章节 -> 大模型分析 -> Excel，三个阶段在同一个进程里完成。
+
+- 各阶段之间直接传递对象（章节段落、分析结果），不再经由 JSONL/JSON 文件中转
+- 落盘（第一阶段 JSONL、第二阶段 analysis/*.json）是可选项，默认保留，与分阶段运行的产物一致
+- LLM 配置、提示词、端点池只加载一次，多本书共用
+
+用法：
+    from pipeline import Pipeline, PipelineOptions
+
+    pipe = Pipeline(PipelineOptions(profile="fast"))
+    for result in pipe.run(["book/甲.epub", "book/乙.epub"]):
+        print(result.name, result.ok, result.timings.as_dict())
+"""
+
+import sys
+from pathlib import Path
+
+# 三个阶段目录沿用各自的扁平导入（from chapters import ...），在这里统一加入 sys.path。
+_REPO_ROOT = Path(__file__).resolve().parent.parent
+for _p in (_REPO_ROOT, _REPO_ROOT / "phase1_extract", _REPO_ROOT / "phase2_analysis", _REPO_ROOT / "phase3_excel"):
+    if str(_p) not in sys.path:
+        sys.path.insert(0, str(_p))
+
+from pipeline.core import BookChapter, BookResult, Pipeline, PipelineOptions, StageTimings, resolve_input  # noqa: E402
+from pipeline.streaming import StreamingPipeline, library_sources  # noqa: E402
+
+__all__ = [
+    "BookChapter",
+    "BookResult",
+    "Pipeline",
+    "PipelineOptions",
+    "StageTimings",
+    "StreamingPipeline",
+    "library_sources",
+    "resolve_input",
+]
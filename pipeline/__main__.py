@@ -0,0 +1,119 @@
+"""
+一键运行全流程（单进程）：EPUB -> 章节 -> 大模型分析 -> Excel。
+
+Command:
+  python -m pipeline book/书名.epub
+  python -m pipeline 书名甲 书名乙 book/书名丙.epub --profile fast --timings-json timings.json
+  python -m pipeline book/书名.epub --no-persist      # 只写 Excel，不写中间 JSONL/JSON
+  python -m pipeline book --stream --concurrency 8   # 整个书库：提取/分析/报表同时进行（见 streaming.py）
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import time
+from pathlib import Path
+from typing import List, Optional
+
+from pipeline import Pipeline, StageTimings, StreamingPipeline, library_sources
+from pipeline.core import add_option_arguments, options_from_args
+
+from cascade import format_cache_report
+
+
+def _expand_inputs(inputs: List[str]) -> List[str]:
+    """书库目录（自身没有章节 JSONL）展开为其中的每一本书。"""
+    out: List[str] = []
+    for s in inputs:
+        p = Path(s)
+        if p.is_dir() and not any(p.glob("*.jsonl")) and p.suffix.lower() != ".epub":
+            out.extend(str(b) for b in library_sources(p))
+        else:
+            out.append(s)
+    return out
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m pipeline",
+        description="Run extract -> analyze -> report for one or more books in a single process.",
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help='book/书名.epub, book/书名, 书名, or a library dir such as "book" (all books share one warm process)',
+    )
+    add_option_arguments(parser)
+    parser.add_argument("--timings-json", type=Path, default=None, help="Write per-book stage timings as JSON")
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Run extract/analyze/report concurrently with bounded queues (for many books)",
+    )
+    parser.add_argument("--extract-workers", type=int, default=2, help="--stream: extraction threads")
+    parser.add_argument("--concurrency", type=int, default=4, help="--stream: books analyzed (LLM calls) in parallel")
+    parser.add_argument("--report-workers", type=int, default=1, help="--stream: xlsx writer threads")
+    parser.add_argument("--queue-size", type=int, default=8, help="--stream: capacity of each inter-stage queue (books)")
+    parser.add_argument("--status-interval", type=float, default=2.0, help="--stream: seconds between status lines")
+    args = parser.parse_args(argv)
+    inputs = _expand_inputs(args.inputs)
+    if not inputs:
+        raise SystemExit(f"未找到任何书：{' '.join(args.inputs)}")
+
+    pipe = Pipeline(options_from_args(args))
+    t_start = time.perf_counter()
+    try:
+        pipe.warm_up()
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"[流水线] 初始化失败：{e}") from e
+    warm_s = time.perf_counter() - t_start
+
+    if args.stream:
+        results = StreamingPipeline(
+            pipe,
+            extract_workers=args.extract_workers,
+            llm_concurrency=args.concurrency,
+            report_workers=args.report_workers,
+            queue_size=args.queue_size,
+            interval=args.status_interval,
+        ).run(inputs)
+        for r in results:
+            if r.error:
+                print(f"[{r.name}] ERROR {r.error}")
+    else:
+        results = pipe.run(inputs)
+
+    total = StageTimings()
+    for r in results:
+        total.add(r.timings)
+    ok = sum(1 for r in results if r.ok)
+    wall_s = time.perf_counter() - t_start
+    print(
+        f"[完成] {ok}/{len(results)} 本  预热={warm_s:.3f}s "
+        f"提取={total.extract_s:.3f}s 分析={total.analyze_s:.3f}s 报表={total.report_s:.3f}s 总耗时={wall_s:.3f}s"
+    )
+    cache_stats = pipe.cascade.cache_stats()
+    if cache_stats is not None:
+        print(f"[上下文缓存] {format_cache_report(cache_stats)}")
+    if pipe.telemetry is not None:
+        print(f"[完成] 调用记录：{pipe.telemetry.path}")
+    if args.timings_json is not None:
+        args.timings_json.write_text(
+            json.dumps(
+                {
+                    "warm_up_s": round(warm_s, 4),
+                    "wall_s": round(wall_s, 4),
+                    "stages": total.as_dict(),
+                    "books": [r.as_dict() for r in results],
+                },
+                ensure_ascii=False,
+                indent=2,
+            ),
+            encoding="utf-8",
+        )
+    return 0 if ok == len(results) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,654 @@
+from __future__ import annotations
+
+"""
+流水线的三个阶段（extract / analyze / report）与 Pipeline 对象。
+
+每个阶段都是普通方法，输入输出是 BookChapter 列表，可以单独调用（例如只跑 analyze + report）。
+"""
+
+import argparse
+import json
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from extractor import extract_first_chapters
+from writer import chapter_file_names, chapter_jsonl
+
+from boilerplate import REPORT_FILENAME as FILTER_REPORT_FILENAME
+from boilerplate import FilterResult, ParagraphFilter, filter_report_json, load_filter, write_filter_report
+from cascade import ModelCascade, attempts_jsonl, attempts_path, write_attempts
+from chapters import (
+    analysis_json_text,
+    analysis_paths,
+    iter_chapter_jsonl_files,
+    read_jsonl_as_text,
+    render_chapter_prompt,
+)
+from context_compactor import ContextCompactor, ContextStats
+from near_dup import ChapterText, NearDupIndex, ReusedChapter, find_reusable, register_book, write_reused
+from prompts import PromptBundle, load_prompts
+from validation import parse_paragraph_ids, read_paragraph_ids
+
+from analysis_loader import ChapterMeta, chapter_rows_from_analysis, iter_analysis_json_files, load_chapter_analysis
+from fingerprint import book_fingerprint, run_key, save_state
+
+from artifacts.store import ArtifactStore
+from llm_provider.hedging import Hedger
+from llm_provider.llm_config import ChatRunConfig, find_default_llm_config, load_chat_run_config
+from llm_provider.telemetry import TelemetryLog
+
+
+@dataclass
+class PipelineOptions:
+    llm_config: Optional[Path] = None  # 默认自动查找 llm.json
+    profile: Optional[str] = None
+    provider: Optional[str] = None
+    model: Optional[str] = None
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    context_budget: int = 1000
+    context_rolling: bool = False
+    # 调用模型前去掉水印/广告/重复段落（规则文件 + <book_root>/.boilerplate.json）
+    strip_boilerplate: bool = False
+    filter_rules: Optional[Path] = None
+    # 本地节奏指标（需要 numpy）：pacing_hints 追加到提示词末尾，pacing 在 Excel 中加“节奏指标”表
+    pacing_hints: bool = False
+    pacing: bool = False
+    # 近重复书目复用已有分析结果（索引默认 <book_root>/.near_dup.sqlite）；分析完成的书登记到索引
+    reuse_similar: bool = False
+    dedup_index: Optional[Path] = None
+    reuse_threshold: float = 0.8
+    max_chapters: int = 3
+    engine: str = "native"  # native | openpyxl
+    # 是否写出中间产物：第一阶段 <章序>_<章节名>.jsonl、第二阶段 analysis/*.json/raw/attempts。
+    # Excel 总是写出。
+    persist: bool = True
+    # 产物存储目录（artifacts.store，例如 book/.artifacts）：中间产物以相同的相对路径写进存储而不是 <小说目录>
+    store: Optional[Path] = None
+    book_root: Path = Path("book")
+    prompt_dir: Path = Path("prompt")
+    telemetry: bool = True
+    telemetry_log: Optional[Path] = None
+
+
+def add_option_arguments(parser: argparse.ArgumentParser) -> None:
+    """PipelineOptions 对应的命令行参数（python -m pipeline 与常驻服务共用）。"""
+    parser.add_argument("--profile", default=None, help="Profile name in llm.json")
+    parser.add_argument("--provider", default=None, help="Override provider name in llm.json/profile")
+    parser.add_argument("--model", default=None, help="Override model id")
+    parser.add_argument("--temperature", type=float, default=None, help="Override temperature")
+    parser.add_argument("--max-tokens", type=int, default=None, help="Override max_tokens")
+    parser.add_argument("--llm-config", type=Path, default=None, help="Path to llm.json (default: auto-detect)")
+    parser.add_argument("--context-budget", type=int, default=1000, help="Token budget for the previous-chapter summary")
+    parser.add_argument("--context-rolling", action="store_true", help="Also carry earlier chapters in the summary")
+    parser.add_argument(
+        "--strip-boilerplate", action="store_true", help="Drop watermark/ad/duplicate paragraphs before the LLM call"
+    )
+    parser.add_argument("--filter-rules", type=Path, default=None, help="Filter rules JSON for --strip-boilerplate")
+    parser.add_argument(
+        "--pacing-hints", action="store_true", help="Append local pacing metrics to each prompt (requires numpy)"
+    )
+    parser.add_argument("--pacing", action="store_true", help="Add a pacing-metrics sheet to the xlsx (requires numpy)")
+    parser.add_argument(
+        "--reuse-similar", action="store_true", help="Reuse analyses of near-duplicate books instead of calling the LLM"
+    )
+    parser.add_argument("--dedup-index", type=Path, default=None, help="Near-duplicate index path for --reuse-similar")
+    parser.add_argument("--reuse-threshold", type=float, default=0.8, help="Minimum similarity for --reuse-similar")
+    parser.add_argument("--engine", choices=("native", "openpyxl"), default="native", help="xlsx backend")
+    parser.add_argument(
+        "--no-persist",
+        action="store_true",
+        help="Keep chapters/analysis in memory only; write just the xlsx",
+    )
+    parser.add_argument(
+        "--store", type=Path, default=None, help="Persist chapters/analysis in an artifact store dir (e.g. book/.artifacts)"
+    )
+    parser.add_argument("--telemetry-log", type=Path, default=None, help="Per-call telemetry JSONL")
+    parser.add_argument("--no-telemetry", action="store_true", help="Do not write the telemetry log")
+
+
+def options_from_args(args: argparse.Namespace) -> PipelineOptions:
+    if args.store is not None and args.reuse_similar:
+        raise SystemExit("--store 不能与 --reuse-similar 同时使用（近重复复用读取的是目录中的分析结果）")
+    return PipelineOptions(
+        llm_config=args.llm_config,
+        profile=args.profile,
+        provider=args.provider,
+        model=args.model,
+        temperature=args.temperature,
+        max_tokens=args.max_tokens,
+        context_budget=args.context_budget,
+        context_rolling=args.context_rolling,
+        strip_boilerplate=args.strip_boilerplate,
+        filter_rules=args.filter_rules,
+        pacing_hints=args.pacing_hints,
+        pacing=args.pacing,
+        reuse_similar=args.reuse_similar,
+        dedup_index=args.dedup_index,
+        reuse_threshold=args.reuse_threshold,
+        engine=args.engine,
+        persist=not args.no_persist,
+        store=args.store,
+        telemetry=not args.no_telemetry,
+        telemetry_log=args.telemetry_log,
+    )
+
+
+@dataclass
+class BookChapter:
+    """一章在流水线中的全部数据：第一阶段的段落 -> 第二阶段的分析结果。"""
+
+    no: int
+    title: str
+    stem: str  # 文件名主干（<章序>_<章节名>），决定 analysis/ 下的输出文件名
+    jsonl: str  # 提示词里的章节 JSONL 文本（与第一阶段写出的文件内容一致）
+    paragraph_ids: List[int]
+    analysis: Optional[Dict[str, Any]] = None
+    tier: int = -1
+
+
+@dataclass
+class StageTimings:
+    extract_s: float = 0.0
+    analyze_s: float = 0.0
+    report_s: float = 0.0
+
+    @property
+    def total_s(self) -> float:
+        return self.extract_s + self.analyze_s + self.report_s
+
+    def add(self, other: "StageTimings") -> None:
+        self.extract_s += other.extract_s
+        self.analyze_s += other.analyze_s
+        self.report_s += other.report_s
+
+    def as_dict(self) -> Dict[str, float]:
+        return {
+            "extract_s": round(self.extract_s, 4),
+            "analyze_s": round(self.analyze_s, 4),
+            "report_s": round(self.report_s, 4),
+            "total_s": round(self.total_s, 4),
+        }
+
+
+@dataclass
+class BookResult:
+    name: str
+    novel_dir: Path
+    chapters: List[BookChapter] = field(default_factory=list)
+    xlsx_path: Optional[Path] = None
+    rows: int = 0
+    timings: StageTimings = field(default_factory=StageTimings)
+    error: str = ""
+
+    @property
+    def ok(self) -> bool:
+        return not self.error and self.xlsx_path is not None
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "book": self.name,
+            "ok": self.ok,
+            "chapters": len(self.chapters),
+            "rows": self.rows,
+            "xlsx": str(self.xlsx_path) if self.xlsx_path else None,
+            "error": self.error,
+            **self.timings.as_dict(),
+        }
+
+
+def _strip_quotes(s: str) -> str:
+    s = str(s or "").strip()
+    if (s.startswith('"') and s.endswith('"')) or (s.startswith("'") and s.endswith("'")):
+        s = s[1:-1].strip()
+    return s
+
+
+def resolve_input(source: Union[str, Path], *, book_root: Path = Path("book")) -> Tuple[Optional[Path], Path]:
+    """
+    输入 -> (epub 路径或 None, 小说目录)，规则与 run_all.sh 相同：
+    - book/书名.epub（任意路径的 .epub）：先提取，输出到 book/书名
+    - book/书名（已存在的目录）：跳过提取，读取已有的章节 JSONL（即使旁边有同名 epub）
+    - 书名（不含目录），且 book/书名.epub 存在：先提取，同第一条
+    - 书名（自动补齐为 book/书名）：跳过提取
+    """
+    p = Path(_strip_quotes(str(source)))
+    if p.suffix.lower() == ".epub":
+        if not p.is_file():
+            raise FileNotFoundError(f"未找到 epub 文件：{p}")
+        return p, book_root / p.stem
+    if p.is_dir():
+        return None, p
+    if len(p.parts) == 1:
+        cand_epub = book_root / f"{p.name}.epub"
+        if cand_epub.is_file():
+            return cand_epub, book_root / p.name
+    if (book_root / p.name).is_dir():
+        return None, book_root / p.name
+    raise FileNotFoundError(f"输入无效：{p}\n请传入：book/书名.epub 或 book/书名 或 书名")
+
+
+def _save_workbook(wb: Any, out_path: Path) -> Path:
+    try:
+        wb.save(out_path)
+        return out_path
+    except PermissionError:
+        # 目标文件正在被 Excel 打开时无法覆盖，改写到 <书名>_new.xlsx。
+        alt_path = out_path.with_name(f"{out_path.stem}_new{out_path.suffix}")
+        wb.save(alt_path)
+        return alt_path
+
+
+class Pipeline:
+    """
+    extract -> analyze -> report。构造时加载一次 LLM 配置、提示词和端点池，之后每本书复用。
+
+    log 接收进度文本（默认 print）；传 lambda s: None 可静默运行。
+    """
+
+    def __init__(self, options: Optional[PipelineOptions] = None, *, log: Callable[[str], None] = print) -> None:
+        self.options = options or PipelineOptions()
+        if self.options.store is not None and self.options.reuse_similar:
+            raise ValueError("store 与 reuse_similar 不能同时使用（近重复复用读取的是目录中的分析结果）")
+        self.log = log
+        self._run_cfg: Optional[ChatRunConfig] = None
+        self._cascade: Optional[ModelCascade] = None
+        self._prompts: Optional[PromptBundle] = None
+        self._telemetry: Optional[TelemetryLog] = None
+        self._para_filter: Optional[ParagraphFilter] = None
+        self._build_workbook: Optional[Callable[..., Any]] = None
+        self._chapter_hint: Optional[Callable[[str], str]] = None
+        self._store: Optional[ArtifactStore] = None
+
+    # -- 预热（首次需要时加载，之后复用） --
+
+    @property
+    def cascade(self) -> ModelCascade:
+        if self._cascade is None:
+            opts = self.options
+            llm_config_path = opts.llm_config or find_default_llm_config()
+            if llm_config_path is None:
+                raise FileNotFoundError("llm.json not found (create one or pass llm_config)")
+            run_cfg = load_chat_run_config(llm_config_path, profile=opts.profile, provider=opts.provider, model=opts.model)
+            for tier_cfg in run_cfg.tiers:
+                for ep in tier_cfg.pool:
+                    if ep.provider.type != "volc_ark":
+                        raise ValueError(f"Unsupported provider type: {ep.provider.type} (only volc_ark is implemented)")
+            hedger = None
+            if run_cfg.params.adaptive_timeout or run_cfg.params.hedge_budget > 0:
+                hedger = Hedger(
+                    budget_ratio=run_cfg.params.hedge_budget,
+                    hedge_percentile=run_cfg.params.hedge_percentile,
+                    adaptive_timeout=run_cfg.params.adaptive_timeout,
+                )
+            self._run_cfg = run_cfg
+            self._cascade = ModelCascade(run_cfg, hedger=hedger, temperature=opts.temperature, max_tokens=opts.max_tokens)
+            self.log(f"[流水线] 模型：{self._cascade.describe()}")
+        return self._cascade
+
+    @property
+    def prompts(self) -> PromptBundle:
+        if self._prompts is None:
+            self._prompts = load_prompts(self.options.prompt_dir)
+        return self._prompts
+
+    @property
+    def telemetry(self) -> Optional[TelemetryLog]:
+        if self._telemetry is None and self.options.telemetry:
+            self._telemetry = TelemetryLog.for_run("pipeline", path=self.options.telemetry_log)
+        return self._telemetry
+
+    @property
+    def para_filter(self) -> Optional[ParagraphFilter]:
+        if self._para_filter is None and self.options.strip_boilerplate:
+            self._para_filter = load_filter(self.options.filter_rules, self.options.book_root)
+        return self._para_filter
+
+    @property
+    def chapter_hint(self) -> Optional[Callable[[str], str]]:
+        if self._chapter_hint is None and self.options.pacing_hints:
+            from pacing.metrics import chapter_hint
+
+            self._chapter_hint = chapter_hint
+        return self._chapter_hint
+
+    @property
+    def store(self) -> Optional[ArtifactStore]:
+        """options.store 对应的产物存储（各线程共用一个对象，内部加锁）；未设置时为 None。"""
+        if self._store is None and self.options.store is not None:
+            self._store = ArtifactStore(self.options.store)
+        return self._store
+
+    def open_dedup_index(self) -> NearDupIndex:
+        """每次调用新开一个连接（SQLite 连接不能跨线程共用，常驻服务的工作线程各自打开）。"""
+        return NearDupIndex.for_library(self.options.book_root, self.options.dedup_index)
+
+    def warm_up(self) -> "Pipeline":
+        """提前加载配置、提示词与写出后端（常驻服务在接收任务前调用）。"""
+        _ = self.cascade, self.prompts, self.telemetry, self.para_filter, self.chapter_hint, self.store
+        _ = self._workbook_builder()
+        return self
+
+    def _workbook_builder(self) -> Callable[..., Any]:
+        if self._build_workbook is None:
+            if self.options.engine == "openpyxl":
+                from xlsx_writer import build_workbook
+            else:
+                from native_xlsx import build_workbook
+            self._build_workbook = build_workbook
+        return self._build_workbook
+
+    def resolve(self, source: Union[str, Path]) -> Tuple[Optional[Path], Path]:
+        """同 resolve_input；另外接受只存在于产物存储中的书名（不提取，章节从存储读取）。"""
+        try:
+            return resolve_input(source, book_root=self.options.book_root)
+        except FileNotFoundError:
+            name = Path(_strip_quotes(str(source))).name
+            if self.store is None or not self.store.has_book(name):
+                raise
+            return None, self.options.book_root / name
+
+    # -- 三个阶段 --
+
+    def extract(self, epub_path: Optional[Path], novel_dir: Path) -> List[BookChapter]:
+        """
+        第一阶段：从 EPUB 抽取前 max_chapters 章；epub_path 为 None 时读取 novel_dir 下已有的 JSONL
+        （设置了 options.store 且存储中有这本书时从存储读取）。
+        """
+        max_chapters = self.options.max_chapters
+        store = self.store
+        if epub_path is None and store is not None and store.has_book(novel_dir.name):
+            chapters = []
+            for e in store.entries(novel_dir.name, kind="chapter"):
+                if not 1 <= e.chapter <= max_chapters:
+                    continue
+                jsonl = store.get_text(novel_dir.name, e.path) or ""
+                title = e.stem.split("_", 1)[1] if "_" in e.stem else ""
+                chapters.append(
+                    BookChapter(
+                        no=e.chapter,
+                        title=title,
+                        stem=e.stem,
+                        jsonl=jsonl,
+                        paragraph_ids=parse_paragraph_ids(jsonl.splitlines()),
+                    )
+                )
+            return chapters
+        if epub_path is None:
+            chapters = []
+            for no, path in iter_chapter_jsonl_files(novel_dir):
+                if not 1 <= no <= max_chapters:
+                    continue
+                title = path.stem.split("_", 1)[1] if "_" in path.stem else ""
+                chapters.append(
+                    BookChapter(
+                        no=no,
+                        title=title,
+                        stem=path.stem,
+                        jsonl=read_jsonl_as_text(path),
+                        paragraph_ids=read_paragraph_ids(path),
+                    )
+                )
+            return chapters
+
+        extracted = extract_first_chapters(epub_path, max_chapters=max_chapters)
+        names = chapter_file_names(extracted)
+        chapters = [
+            BookChapter(
+                no=ch.no,
+                title=ch.title,
+                stem=Path(name).stem,
+                jsonl=chapter_jsonl(ch),
+                paragraph_ids=list(range(1, len(ch.paragraphs) + 1)),
+            )
+            for ch, name in zip(extracted, names)
+        ]
+        if self.options.persist and chapters and store is not None:
+            for c in chapters:
+                store.put(novel_dir.name, f"{c.stem}.jsonl", c.jsonl, commit=False)
+            store.commit()
+        elif self.options.persist and chapters:
+            novel_dir.mkdir(parents=True, exist_ok=True)
+            for c in chapters:
+                (novel_dir / f"{c.stem}.jsonl").write_text(c.jsonl, encoding="utf-8")
+        # 与第二阶段一致：只分析 1..max_chapters 章
+        return [c for c in chapters if 1 <= c.no <= max_chapters]
+
+    def analyze(self, book: str, chapters: Sequence[BookChapter], *, out_dir: Optional[Path] = None) -> None:
+        """
+        第二阶段：逐章调用模型，结果写回 chapter.analysis（第 2/3 章的提示词依赖上一章结果）。
+        out_dir 不为 None 时同时写出 analysis/*.json、raw、attempts、context_report.json（与 filter_report.json）；
+        设置了 options.store 时这些产物以 analysis/<文件名> 为键写进存储，不写文件。
+        某章全部尝试都无法解析时抛出 RuntimeError。
+        """
+        cascade = self.cascade
+        prompts = self.prompts
+        telemetry = self.telemetry
+        para_filter = self.para_filter
+        chapter_hint = self.chapter_hint
+        compactor = ContextCompactor(self.options.context_budget, rolling=self.options.context_rolling)
+        previous_results: List[Dict[str, Any]] = []
+        context_stats: List[ContextStats] = []
+        seen: Dict[str, Tuple[int, int]] = {}
+        filter_results: List[FilterResult] = []
+        store = self.store if out_dir is not None else None
+        if out_dir is not None and store is None:
+            out_dir.mkdir(parents=True, exist_ok=True)
+
+        def put_output(name: str, text: str) -> None:
+            if store is not None:
+                store.put(book, f"analysis/{name}", text)
+            else:
+                (out_dir / name).write_text(text, encoding="utf-8")
+
+        reused: Dict[int, ReusedChapter] = {}
+        if self.options.reuse_similar:
+            with self.open_dedup_index() as index:
+                reused = find_reusable(
+                    index,
+                    book,
+                    [ChapterText.from_jsonl(ch.no, ch.stem, ch.jsonl) for ch in chapters],
+                    threshold=self.options.reuse_threshold,
+                )
+            if reused:
+                self.log(f"[{book}] 复用近重复书目的分析结果：{len(reused)} 章（来源《{reused[min(reused)].source_book}》）")
+                if out_dir is not None:
+                    write_reused(out_dir, [reused[no] for no in sorted(reused)])
+
+        for ch in chapters:
+            if ch.no in reused:
+                ch.analysis = reused[ch.no].obj
+                previous_results.append(ch.analysis)
+                continue
+            previous_summary = ""
+            if previous_results:
+                previous_summary, ctx = compactor.build(previous_results, chapter_no=ch.no)
+                context_stats.append(ctx)
+            jsonl_content, paragraph_ids = ch.jsonl, ch.paragraph_ids
+            if para_filter is not None:
+                fr = para_filter.apply(ch.jsonl, chapter_no=ch.no, seen=seen)
+                jsonl_content, paragraph_ids = fr.jsonl, fr.paragraph_ids
+                filter_results.append(fr)
+            user_prompt = render_chapter_prompt(
+                prompts,
+                chapter_no=ch.no,
+                jsonl_content=jsonl_content,
+                previous_summary=previous_summary,
+                hints=chapter_hint(jsonl_content) if chapter_hint is not None else "",
+            )
+            json_path = raw_path = None
+            if out_dir is not None:
+                json_path, raw_path = analysis_paths(out_dir, Path(f"{ch.stem}.jsonl"))
+            outcome = cascade.analyze(
+                system=prompts.system_for(ch.no),
+                user_prompt=user_prompt,
+                paragraph_ids=paragraph_ids,
+                json_path=json_path if store is None else None,
+                raw_path=raw_path if store is None else None,
+                telemetry=telemetry,
+                call_ctx={"book": book, "chapter": ch.no, "profile": self.options.profile or ""},
+            )
+            if store is not None:
+                if outcome.content is not None:
+                    put_output(raw_path.name, outcome.content)
+                if outcome.obj is not None:
+                    put_output(json_path.name, analysis_json_text(outcome.obj))
+                put_output(attempts_path(json_path).name, attempts_jsonl(outcome.attempts, book=book, chapter=ch.no))
+            elif json_path is not None:
+                write_attempts(attempts_path(json_path), outcome.attempts, book=book, chapter=ch.no)
+            if outcome.obj is None:
+                raise RuntimeError(f"第{ch.no}章：模型输出无法解析为 JSON")
+            ch.analysis = outcome.obj
+            ch.tier = outcome.tier
+            previous_results.append(outcome.obj)
+
+        if out_dir is not None and filter_results:
+            if store is not None:
+                previous = store.get_text(book, f"analysis/{FILTER_REPORT_FILENAME}")
+                put_output(FILTER_REPORT_FILENAME, filter_report_json(filter_results, previous))
+            else:
+                write_filter_report(out_dir, filter_results)
+        if out_dir is not None and context_stats:
+            put_output(
+                "context_report.json",
+                json.dumps(
+                    {
+                        "budget_tokens": self.options.context_budget,
+                        "rolling": self.options.context_rolling,
+                        "chapters": [s.as_dict() for s in context_stats],
+                    },
+                    ensure_ascii=False,
+                    indent=2,
+                ),
+            )
+
+    def load_analysis(self, novel_dir: Path) -> List[BookChapter]:
+        """读取 <小说目录>/analysis 下已有的分析结果（只跑第三阶段时使用），章序与 run_phase3 相同。"""
+        store = self.store
+        if store is not None and store.has_book(novel_dir.name):
+            loaded = [
+                load_chapter_analysis(novel_dir / e.path, store.get_text(novel_dir.name, e.path))
+                for e in store.entries(novel_dir.name, kind="analysis")
+            ]
+        else:
+            loaded = [load_chapter_analysis(path) for path in iter_analysis_json_files(novel_dir / "analysis")]
+        return [
+            BookChapter(
+                no=meta.chapter_no,
+                title=meta.chapter_title,
+                stem=meta.source_path.stem,
+                jsonl="",
+                paragraph_ids=[],
+                analysis=obj,
+            )
+            for meta, obj in loaded
+        ]
+
+    def report(self, novel_dir: Path, chapters: Iterable[BookChapter], *, out_path: Optional[Path] = None) -> Tuple[Path, int]:
+        """
+        第三阶段：把各章分析结果写成 <小说目录>/<书名>.xlsx，返回 (实际输出路径, 行数)。
+        options.pacing 时另写“节奏指标”表（段落取自 chapter.jsonl，为空时读第一阶段的 JSONL 文件）。
+        """
+        out_path = out_path or (novel_dir / f"{novel_dir.name}.xlsx")
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        row_count = 0
+        analyzed: List[Tuple[BookChapter, ChapterMeta]] = []
+        for ch in chapters:
+            if ch.analysis is None:
+                continue
+            # 与第三阶段读文件时一致：章节标题取自文件名主干 <章序>_<章节名>
+            title = ch.stem.split("_", 1)[1] if "_" in ch.stem else ch.title
+            meta = ChapterMeta(chapter_no=ch.no, chapter_title=title, source_path=novel_dir / "analysis" / f"{ch.stem}.json")
+            analyzed.append((ch, meta))
+
+        def iter_rows():
+            nonlocal row_count
+            for ch, meta in analyzed:
+                for row in chapter_rows_from_analysis(meta, ch.analysis):
+                    row_count += 1
+                    yield row
+
+        extra: Dict[str, Any] = {}
+        if self.options.pacing:
+            from pacing_report import chapter_jsonl_text, pacing_rows
+
+            store = self.store
+            extra["pacing_rows"] = pacing_rows(
+                [(meta, ch.analysis, ch.jsonl or chapter_jsonl_text(novel_dir, meta, store)) for ch, meta in analyzed]
+            )
+        wb = self._workbook_builder()(rows=iter_rows(), **extra)
+        saved = _save_workbook(wb, out_path)
+        if hasattr(wb, "close"):
+            wb.close()
+        return saved, row_count
+
+    def record_fingerprint(self, res: BookResult) -> None:
+        """
+        落盘模式下记录第三阶段指纹：之后单独运行 run_phase3 时输入未变化即跳过。
+        reuse_similar 时同时把本书登记到近重复索引（此时三个阶段的文件都已在 <小说目录> 下）。
+        """
+        novel_dir = res.novel_dir
+        if not self.options.persist:
+            return
+        if self.store is not None:
+            # 与 run_phase3 --store 的指纹一致（存储中章节与分析结果的路径 + 内容哈希）
+            if res.xlsx_path == novel_dir / f"{novel_dir.name}.xlsx":
+                key = run_key(self.options.engine, "book", pacing=self.options.pacing)
+                fp = self.store.fingerprint(res.name)
+                save_state(res.xlsx_path, {"run": key, "books": {res.name: {"fingerprint": fp, "files": {}}}})
+            return
+        if self.options.reuse_similar:
+            with self.open_dedup_index() as index:
+                register_book(index, novel_dir, max_chapters=self.options.max_chapters)
+        if res.xlsx_path != novel_dir / f"{novel_dir.name}.xlsx":
+            return
+        fp, files = book_fingerprint(novel_dir, chapter_content=self.options.pacing)
+        key = run_key(self.options.engine, "book", pacing=self.options.pacing)
+        save_state(res.xlsx_path, {"run": key, "books": {res.name: {"fingerprint": fp, "files": files}}})
+
+    # -- 整本书 --
+
+    def run_book(self, source: Union[str, Path]) -> BookResult:
+        """跑完一本书的三个阶段；失败记录在 BookResult.error 中，不抛异常。"""
+        try:
+            epub_path, novel_dir = self.resolve(source)
+        except FileNotFoundError as e:
+            return BookResult(name=Path(str(source)).stem, novel_dir=Path(str(source)), error=str(e))
+        res = BookResult(name=novel_dir.name, novel_dir=novel_dir)
+        persist = self.options.persist
+        stage = "extract"
+        try:
+            t0 = time.perf_counter()
+            res.chapters = self.extract(epub_path, novel_dir)
+            res.timings.extract_s = time.perf_counter() - t0
+            if not res.chapters:
+                raise ValueError("未提取到章节" if epub_path else f"未找到章节 JSONL：{novel_dir}")
+
+            stage = "analyze"
+            t0 = time.perf_counter()
+            self.analyze(res.name, res.chapters, out_dir=(novel_dir / "analysis") if persist else None)
+            res.timings.analyze_s = time.perf_counter() - t0
+
+            stage = "report"
+            t0 = time.perf_counter()
+            res.xlsx_path, res.rows = self.report(novel_dir, res.chapters)
+            self.record_fingerprint(res)
+            res.timings.report_s = time.perf_counter() - t0
+        except Exception as e:  # noqa: BLE001 - one failed book must not stop a multi-book run
+            res.error = f"{stage}: {type(e).__name__}: {e}"[:300]
+        return res
+
+    def run(self, sources: Iterable[Union[str, Path]]) -> List[BookResult]:
+        results = []
+        for src in sources:
+            res = self.run_book(src)
+            t = res.timings
+            status = f"ERROR {res.error}" if res.error else f"行数={res.rows} 输出={res.xlsx_path}"
+            self.log(
+                f"[{res.name}] 提取={t.extract_s:.3f}s 分析={t.analyze_s:.3f}s 报表={t.report_s:.3f}s "
+                f"合计={t.total_s:.3f}s {status}"
+            )
+            results.append(res)
+        return results
@@ -0,0 +1,481 @@
+from __future__ import annotations
+
+"""
+多机共享的任务队列：一本书拆成 提取(1) / 分析(2) / 报表(3) 三个任务，记录在共享目录下的 SQLite 文件中。
+
+    python -m pipeline.jobqueue enqueue book                        # 书库中的每本书各登记三个任务
+    python -m pipeline.jobqueue work --concurrency 4 --profile fast # 每台机器启动一个（或多个）worker
+    python -m pipeline.jobqueue work --phases 1,3                   # 只领取提取与报表任务
+    python -m pipeline.jobqueue status
+    python -m pipeline.jobqueue retry                               # 失败的任务重新排队
+
+- 领取：在一个写事务（BEGIN IMMEDIATE）里选出可做的任务并写入租约（worker、到期时间），两个 worker 不会领到同一个任务；
+  上一阶段完成后下一阶段才可领取
+- 心跳：worker 每隔 lease/3 秒为手上的任务续约；进程崩溃或机器掉线后租约到期，任务被其他 worker 重新领取；
+  超过 max_attempts 次仍未完成的任务记为 failed
+- 原子输出：每个阶段先写到 <小说目录>/.staging-<阶段>-<随机串>/，确认租约仍归自己后，再逐个文件 os.replace
+  到正式位置并把任务标记为完成。读者看到的文件要么是旧的完整文件，要么是新的完整文件；
+  丢失租约的 worker 直接丢弃自己的暂存目录
+- 队列文件使用回滚日志（不用 WAL：WAL 依赖共享内存，不能跨机器使用）；要求共享文件系统支持文件锁
+  （NFSv4 / SMB 等）。租约到期时间用各机器的本地时钟，租约时长应远大于机器间的时钟偏差
+- 所有机器在同一个目录（共享的仓库目录）下运行，登记的路径是相对路径
+"""
+
+import argparse
+import os
+import shutil
+import socket
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+from pipeline.core import BookResult, Pipeline, add_option_arguments, options_from_args, resolve_input
+from pipeline.streaming import library_sources
+
+DEFAULT_DB = Path("book") / "queue.sqlite"
+PHASES = (1, 2, 3)
+PHASE_NAMES = {1: "提取", 2: "分析", 3: "报表"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS tasks (
+    book TEXT NOT NULL,
+    phase INTEGER NOT NULL,
+    source TEXT NOT NULL,
+    novel_dir TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    error TEXT NOT NULL DEFAULT '',
+    updated_at REAL NOT NULL,
+    PRIMARY KEY (book, phase)
+);
+CREATE INDEX IF NOT EXISTS tasks_status ON tasks(status, phase);
+"""
+
+
+@dataclass(frozen=True)
+class Task:
+    """一次领取：worker + attempts 作为租约凭证，过期后被重新领取的旧凭证无法再续约或提交。"""
+
+    book: str
+    phase: int
+    source: str  # epub 路径，或（没有 epub 的书）小说目录
+    novel_dir: str
+    attempts: int
+    worker: str
+
+
+class JobQueue:
+    """tasks 表的读写；每个线程使用自己的 SQLite 连接。"""
+
+    def __init__(self, db_path: Path = DEFAULT_DB, *, lease_s: float = 300.0, max_attempts: int = 3) -> None:
+        self.db_path = db_path
+        self.lease_s = lease_s
+        self.max_attempts = max(1, max_attempts)
+        self._local = threading.local()
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None：自动提交，事务由 BEGIN IMMEDIATE 显式开启
+            conn = sqlite3.connect(str(self.db_path), timeout=60.0, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode = DELETE")
+            conn.execute("PRAGMA busy_timeout = 60000")
+            self._local.conn = conn
+        return conn
+
+    def _write(self, sql: str, params: Sequence[object] = ()) -> int:
+        return self._conn().execute(sql, params).rowcount
+
+    # -- 登记 --
+
+    def enqueue(self, sources: Iterable[str], *, book_root: Path = Path("book"), force: bool = False) -> Tuple[int, List[str]]:
+        """登记书目，返回 (新登记的书数, 无效输入)。force=True 时已登记的书三个阶段全部重置为 pending。"""
+        now = time.time()
+        added = 0
+        invalid: List[str] = []
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for src in sources:
+                try:
+                    epub_path, novel_dir = resolve_input(src, book_root=book_root)
+                except FileNotFoundError:
+                    invalid.append(str(src))
+                    continue
+                source = str(epub_path or novel_dir)
+                if force:
+                    conn.execute("DELETE FROM tasks WHERE book = ?", (novel_dir.name,))
+                for phase in PHASES:
+                    # 没有 epub 的书（已有章节 JSONL）不需要提取
+                    status = "done" if phase == 1 and epub_path is None else "pending"
+                    cur = conn.execute(
+                        "INSERT OR IGNORE INTO tasks(book, phase, source, novel_dir, status, updated_at)"
+                        " VALUES (?, ?, ?, ?, ?, ?)",
+                        (novel_dir.name, phase, source, str(novel_dir), status, now),
+                    )
+                    added += cur.rowcount if phase == 1 else 0
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return added, invalid
+
+    def retry_failed(self) -> int:
+        return self._write(
+            "UPDATE tasks SET status = 'pending', attempts = 0, worker = NULL, lease_until = NULL, updated_at = ?"
+            " WHERE status = 'failed'",
+            (time.time(),),
+        )
+
+    # -- 领取 / 续约 / 完成 --
+
+    def claim(self, worker: str, phases: Sequence[int] = PHASES) -> Optional[Task]:
+        """领取一个可做的任务（优先靠后的阶段，让在途的书尽快完成）；没有时返回 None。"""
+        marks = ",".join("?" * len(phases))
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # 租约到期且次数用尽的任务不再重试
+            conn.execute(
+                "UPDATE tasks SET status = 'failed', error = 'lease expired: ' || COALESCE(worker, ''), updated_at = ?"
+                " WHERE status = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, now, self.max_attempts),
+            )
+            row = conn.execute(
+                f"""
+                SELECT t.* FROM tasks t
+                WHERE t.phase IN ({marks})
+                  AND (t.status = 'pending' OR (t.status = 'leased' AND t.lease_until < ?))
+                  AND (t.phase = 1 OR EXISTS (
+                        SELECT 1 FROM tasks p WHERE p.book = t.book AND p.phase = t.phase - 1 AND p.status = 'done'))
+                ORDER BY t.phase DESC, t.rowid
+                LIMIT 1
+                """,
+                (*phases, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None
+            conn.execute(
+                "UPDATE tasks SET status = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1, updated_at = ?"
+                " WHERE book = ? AND phase = ?",
+                (worker, now + self.lease_s, now, row["book"], row["phase"]),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return Task(row["book"], row["phase"], row["source"], row["novel_dir"], row["attempts"] + 1, worker)
+
+    def heartbeat(self, task: Task) -> bool:
+        """续约；租约已被他人接管（或任务已被重置）时返回 False。"""
+        now = time.time()
+        return (
+            self._write(
+                "UPDATE tasks SET lease_until = ?, updated_at = ?"
+                " WHERE book = ? AND phase = ? AND status = 'leased' AND worker = ? AND attempts = ?",
+                (now + self.lease_s, now, task.book, task.phase, task.worker, task.attempts),
+            )
+            == 1
+        )
+
+    def complete(self, task: Task) -> bool:
+        return (
+            self._write(
+                "UPDATE tasks SET status = 'done', error = '', lease_until = NULL, updated_at = ?"
+                " WHERE book = ? AND phase = ? AND status = 'leased' AND worker = ? AND attempts = ?",
+                (time.time(), task.book, task.phase, task.worker, task.attempts),
+            )
+            == 1
+        )
+
+    def fail(self, task: Task, error: str) -> None:
+        """本次失败：次数未用尽时放回 pending，否则记为 failed。"""
+        self._write(
+            "UPDATE tasks SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,"
+            " error = ?, worker = NULL, lease_until = NULL, updated_at = ?"
+            " WHERE book = ? AND phase = ? AND status = 'leased' AND worker = ? AND attempts = ?",
+            (self.max_attempts, error[:500], time.time(), task.book, task.phase, task.worker, task.attempts),
+        )
+
+    # -- 查询 --
+
+    def outstanding(self, phases: Sequence[int] = PHASES) -> int:
+        """这些阶段中还会被执行的任务数（前序阶段已失败的书不计）。"""
+        marks = ",".join("?" * len(phases))
+        return self._conn().execute(
+            f"""
+            SELECT COUNT(*) FROM tasks t
+            WHERE t.phase IN ({marks}) AND t.status IN ('pending', 'leased')
+              AND NOT EXISTS (SELECT 1 FROM tasks p WHERE p.book = t.book AND p.phase < t.phase AND p.status = 'failed')
+            """,
+            tuple(phases),
+        ).fetchone()[0]
+
+    def counts(self) -> Dict[int, Dict[str, int]]:
+        out: Dict[int, Dict[str, int]] = {p: {} for p in PHASES}
+        for row in self._conn().execute("SELECT phase, status, COUNT(*) AS n FROM tasks GROUP BY phase, status"):
+            out.setdefault(row["phase"], {})[row["status"]] = row["n"]
+        return out
+
+    def failures(self, limit: int = 20) -> List[sqlite3.Row]:
+        return self._conn().execute(
+            "SELECT book, phase, attempts, error FROM tasks WHERE status = 'failed' ORDER BY updated_at DESC LIMIT ?",
+            (limit,),
+        ).fetchall()
+
+
+class _LeaseLost(Exception):
+    """租约已被其他 worker 接管：本次结果不发布。"""
+
+
+def _publish(stage: Path, dest: Path) -> None:
+    """把暂存目录里的文件逐个原子替换到 dest（同一文件系统内 os.replace 是原子的）。"""
+    dest.mkdir(parents=True, exist_ok=True)
+    for f in sorted(stage.iterdir()):
+        if f.is_file():
+            os.replace(f, dest / f.name)
+
+
+class QueueWorker:
+    """
+    一个 worker 进程：concurrency 个线程各自领取并执行任务，共用一个已预热的 Pipeline；
+    另有一个心跳线程为所有在手的任务续约。
+    """
+
+    def __init__(
+        self,
+        pipe: Pipeline,
+        queue: JobQueue,
+        *,
+        phases: Sequence[int] = PHASES,
+        concurrency: int = 1,
+        worker_id: Optional[str] = None,
+        poll_s: float = 5.0,
+        exit_when_idle: bool = False,
+        log: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self.pipe = pipe
+        self.queue = queue
+        self.phases = tuple(sorted(set(phases)))
+        self.concurrency = max(1, concurrency)
+        self.worker_id = worker_id or f"{socket.gethostname()}-{os.getpid()}"
+        self.poll_s = poll_s
+        self.exit_when_idle = exit_when_idle
+        self.log = log or pipe.log
+        self._held: Set[Task] = set()
+        self._lost: Set[Task] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self.done = 0
+        self.failed = 0
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    # -- 执行一个阶段 --
+
+    def _execute(self, task: Task) -> None:
+        novel_dir = Path(task.novel_dir)
+        if task.attempts > 1:
+            # 之前的尝试（崩溃的 worker）留下的暂存目录；它们的租约已失效，结果不会再被发布
+            for old in novel_dir.glob(f".staging-{task.phase}-*"):
+                shutil.rmtree(old, ignore_errors=True)
+        stage = novel_dir / f".staging-{task.phase}-{uuid.uuid4().hex[:8]}"
+        stage.mkdir(parents=True)
+        pipe = self.pipe
+        try:
+            if task.phase == 1:
+                chapters = pipe.extract(Path(task.source), stage)
+                if not chapters:
+                    raise ValueError("未提取到章节")
+                outputs = [(stage, novel_dir)]
+            elif task.phase == 2:
+                chapters = pipe.extract(None, novel_dir)
+                if not chapters:
+                    raise ValueError(f"未找到章节 JSONL：{novel_dir}")
+                pipe.analyze(task.book, chapters, out_dir=stage / "analysis")
+                outputs = [(stage / "analysis", novel_dir / "analysis")]
+            else:
+                chapters = pipe.load_analysis(novel_dir)
+                if not chapters:
+                    raise ValueError(f"未找到分析 JSON：{novel_dir / 'analysis'}")
+                pipe.report(novel_dir, chapters, out_path=stage / f"{novel_dir.name}.xlsx")
+                outputs = [(stage, novel_dir)]
+
+            # 发布前确认租约仍归自己：续约成功后至少还有 lease_s 秒，足够完成文件替换
+            with self._lock:
+                lost = task in self._lost
+            if lost or not self.queue.heartbeat(task):
+                raise _LeaseLost()
+            for src, dest in outputs:
+                _publish(src, dest)
+            if task.phase == 3:
+                pipe.record_fingerprint(
+                    BookResult(name=task.book, novel_dir=novel_dir, xlsx_path=novel_dir / f"{novel_dir.name}.xlsx")
+                )
+            if not self.queue.complete(task):
+                raise _LeaseLost()
+        finally:
+            shutil.rmtree(stage, ignore_errors=True)
+
+    def _loop(self) -> None:
+        while not self._stop.is_set():
+            task = self.queue.claim(self.worker_id, self.phases)
+            if task is None:
+                if self.exit_when_idle and self.queue.outstanding(self.phases) == 0:
+                    return
+                self._stop.wait(self.poll_s)
+                continue
+            with self._lock:
+                self._held.add(task)
+            t0 = time.perf_counter()
+            label = f"[{task.book}] 阶段{task.phase}({PHASE_NAMES[task.phase]}) 第{task.attempts}次"
+            try:
+                self._execute(task)
+            except _LeaseLost:
+                self.log(f"{label} 租约已被接管，放弃本次结果")
+            except Exception as e:  # noqa: BLE001 - a failed task goes back to the queue
+                error = f"{type(e).__name__}: {e}"
+                self.queue.fail(task, error)
+                with self._lock:
+                    self.failed += 1
+                self.log(f"{label} ERROR {error[:300]}")
+            else:
+                with self._lock:
+                    self.done += 1
+                self.log(f"{label} 完成 {time.perf_counter() - t0:.3f}s")
+            finally:
+                with self._lock:
+                    self._held.discard(task)
+                    self._lost.discard(task)
+
+    def _heartbeat(self) -> None:
+        while not self._stop.wait(self.queue.lease_s / 3):
+            with self._lock:
+                held = list(self._held)
+            for task in held:
+                if not self.queue.heartbeat(task):
+                    with self._lock:
+                        if task in self._held:
+                            self._lost.add(task)
+
+    def run(self) -> Tuple[int, int]:
+        """运行到 stop()（或 exit_when_idle 时队列做完），返回 (完成数, 失败数)。"""
+        self.pipe.warm_up()
+        beat = threading.Thread(target=self._heartbeat, name="queue-heartbeat", daemon=True)
+        beat.start()
+        threads = [threading.Thread(target=self._loop, name=f"queue-{i}", daemon=True) for i in range(self.concurrency)]
+        for t in threads:
+            t.start()
+        try:
+            for t in threads:
+                while t.is_alive():
+                    t.join(0.5)
+        finally:
+            self._stop.set()
+            beat.join()
+        return self.done, self.failed
+
+
+def _print_status(queue: JobQueue) -> None:
+    counts = queue.counts()
+    for phase in PHASES:
+        c = counts.get(phase) or {}
+        print(
+            f"阶段{phase}({PHASE_NAMES[phase]}) 待处理={c.get('pending', 0)} 处理中={c.get('leased', 0)} "
+            f"完成={c.get('done', 0)} 失败={c.get('failed', 0)}"
+        )
+    for row in queue.failures():
+        print(f"  [失败] {row['book']} 阶段{row['phase']} 尝试{row['attempts']}次：{row['error']}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m pipeline.jobqueue",
+        description="Shared SQLite job queue for running the three phases on several machines.",
+    )
+    parser.add_argument("--db", type=Path, default=DEFAULT_DB, help=f"Queue file on the shared filesystem (default: {DEFAULT_DB})")
+    parser.add_argument("--lease", type=float, default=300.0, help="Lease seconds; a task is reclaimed after this long without a heartbeat")
+    parser.add_argument("--max-attempts", type=int, default=3, help="Attempts (failures or expired leases) before a task is marked failed")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_enq = sub.add_parser("enqueue", help="Register books (epub files, book dirs, or a library dir)")
+    p_enq.add_argument("inputs", nargs="+")
+    p_enq.add_argument("--force", action="store_true", help="Reset already registered books to pending")
+
+    p_work = sub.add_parser("work", help="Claim and run tasks until stopped")
+    p_work.add_argument("--phases", default="1,2,3", help="Comma-separated phases this worker takes, e.g. 2 or 1,3")
+    p_work.add_argument("--concurrency", type=int, default=1, help="Tasks run in parallel by this worker")
+    p_work.add_argument("--worker-id", default=None, help="Default: <hostname>-<pid>")
+    p_work.add_argument("--poll", type=float, default=5.0, help="Seconds to wait when no task is available")
+    p_work.add_argument("--exit-when-idle", action="store_true", help="Exit once no task for these phases remains")
+    add_option_arguments(p_work)
+
+    sub.add_parser("status", help="Task counts per phase and recent failures")
+    sub.add_parser("retry", help="Put failed tasks back to pending")
+    args = parser.parse_args(argv)
+
+    queue = JobQueue(args.db, lease_s=args.lease, max_attempts=args.max_attempts)
+    if args.command == "enqueue":
+        sources: List[str] = []
+        for s in args.inputs:
+            p = Path(s)
+            if p.is_dir() and not any(p.glob("*.jsonl")) and p.suffix.lower() != ".epub":
+                sources.extend(str(b) for b in library_sources(p))
+            else:
+                sources.append(s)
+        added, invalid = queue.enqueue(sources, force=args.force)
+        for s in invalid:
+            print(f"[队列] 输入无效，已跳过：{s}")
+        print(f"[队列] 新登记 {added} 本（共提交 {len(sources)} 本）：{args.db}")
+        return 1 if invalid else 0
+    if args.command == "status":
+        _print_status(queue)
+        return 0
+    if args.command == "retry":
+        print(f"[队列] 重新排队 {queue.retry_failed()} 个失败任务")
+        return 0
+
+    try:
+        phases = [int(x) for x in args.phases.split(",") if x.strip()]
+    except ValueError:
+        raise SystemExit(f"--phases 格式错误：{args.phases}") from None
+    if not phases or any(p not in PHASES for p in phases):
+        raise SystemExit(f"--phases 只能是 1、2、3 的组合：{args.phases}")
+    options = options_from_args(args)
+    if options.store is not None:
+        raise SystemExit("--store 暂不支持分布式模式（阶段之间通过共享目录里的文件交接）")
+    options.persist = True  # 阶段之间通过共享目录里的文件交接
+    worker = QueueWorker(
+        Pipeline(options),
+        queue,
+        phases=phases,
+        concurrency=args.concurrency,
+        worker_id=args.worker_id,
+        poll_s=args.poll,
+        exit_when_idle=args.exit_when_idle,
+    )
+    print(f"[队列] worker {worker.worker_id} 阶段={','.join(map(str, worker.phases))} 并发={worker.concurrency}")
+    try:
+        done, failed = worker.run()
+    except KeyboardInterrupt:
+        worker.stop()
+        print("[队列] 已停止：未完成的任务将在租约到期后由其他 worker 接管")
+        return 130
+    print(f"[队列] 完成 {done} 个任务，失败 {failed} 次")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,456 @@
+from __future__ import annotations
+
+"""
+常驻本地分析服务：配置、提示词、端点池与模型连接只加载一次，之后通过 HTTP 接收书目。
+
+Command:
+  python -m pipeline.service --port 8800 --workers 4 --profile fast
+
+接口（只监听 127.0.0.1，不依赖任何外部服务）：
+  POST /jobs                      {"source": "book/书名.epub"}（或 book/书名、书名）提交一本书
+  POST /jobs?name=书名.epub        请求体为 EPUB 文件本身：保存为 book/书名.epub 后排队
+  GET  /jobs                      全部任务（最近 max_jobs 个）
+  GET  /jobs/<id>                 任务状态与结果（行数、章节、各阶段耗时、错误）
+  GET  /jobs/<id>/xlsx            下载该书的 Excel
+  GET  /metrics                   队列深度、吞吐、排队/处理延迟分位数、各模型端点状态
+  GET  /healthz
+
+示例：
+  curl -s -X POST localhost:8800/jobs -d '{"source": "book/书名.epub"}'
+  curl -s -X POST "localhost:8800/jobs?name=书名.epub" --data-binary @书名.epub -H "Content-Type: application/epub+zip"
+  curl -s localhost:8800/jobs/<id>
+  curl -s -o 书名.xlsx localhost:8800/jobs/<id>/xlsx
+"""
+
+import argparse
+import json
+import math
+import os
+import queue
+import shutil
+import threading
+import time
+import urllib.parse
+import uuid
+from collections import OrderedDict, deque
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, BinaryIO, Deque, Dict, List, Optional, Tuple
+
+from pipeline.core import BookResult, Pipeline, StageTimings, add_option_arguments, options_from_args
+
+from llm_provider.volc_ark_chat import set_keep_alive
+
+_DONE = object()  # 工作线程退出标记
+_XLSX_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class JobError(ValueError):
+    """提交的任务无效（对应 HTTP 400）。"""
+
+
+@dataclass
+class Job:
+    id: str
+    source: str
+    name: str
+    status: str = "queued"  # queued | running | done | failed | cancelled
+    submitted_at: float = field(default_factory=time.time)
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    result: Optional[BookResult] = None
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def as_dict(self) -> Dict[str, Any]:
+        out: Dict[str, Any] = {
+            "id": self.id,
+            "source": self.source,
+            "book": self.name,
+            "status": self.status,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+        if self.started_at is not None:
+            out["queue_wait_s"] = round(self.started_at - self.submitted_at, 4)
+        if self.result is not None:
+            out["result"] = self.result.as_dict()
+            out["result"]["chapters"] = [{"no": c.no, "title": c.title, "tier": c.tier} for c in self.result.chapters]
+            out["xlsx_url"] = f"/jobs/{self.id}/xlsx" if self.result.ok else None
+        return out
+
+
+def _pct(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(p / 100.0 * len(ordered)) - 1))]
+
+
+def _latency(values: List[float]) -> Dict[str, float]:
+    return {
+        "count": len(values),
+        "p50": round(_pct(values, 50), 4),
+        "p95": round(_pct(values, 95), 4),
+        "max": round(max(values), 4) if values else 0.0,
+    }
+
+
+class AnalysisService:
+    """
+    任务队列 + workers 个工作线程，共用一个已预热的 Pipeline。
+
+    - 同一本书已在排队或处理中时，重复提交返回已有任务（避免两个线程同时写 book/<书名>/）
+    - 已结束的任务只保留最近 max_jobs 个；结果里不保留章节正文与分析 JSON（以磁盘文件为准）
+    """
+
+    def __init__(
+        self,
+        pipe: Pipeline,
+        *,
+        workers: int = 4,
+        max_jobs: int = 1000,
+        window_s: float = 300.0,
+    ) -> None:
+        self.pipe = pipe
+        self.workers = max(1, workers)
+        self.max_jobs = max(1, max_jobs)
+        self.window_s = window_s
+        self._jobs: "OrderedDict[str, Job]" = OrderedDict()
+        self._queue: "queue.Queue[object]" = queue.Queue()
+        self._lock = threading.Lock()
+        self._threads: List[threading.Thread] = []
+        self._started_at = time.time()
+        self.warm_up_s = 0.0
+        self._submitted = 0
+        self._done = 0
+        self._failed = 0
+        self._stages = StageTimings()
+        # 最近完成的任务：(完成时间, 排队等待, 处理耗时)
+        self._recent: Deque[Tuple[float, float, float]] = deque(maxlen=1000)
+
+    # -- 生命周期 --
+
+    def start(self) -> "AnalysisService":
+        t0 = time.perf_counter()
+        set_keep_alive(True)  # 工作线程与模型端点之间保持长连接
+        self.pipe.warm_up()
+        self.warm_up_s = time.perf_counter() - t0
+        self._started_at = time.time()
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"job-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self) -> None:
+        """不再处理排队中的任务（标记为 cancelled）；等待正在处理的书写完。"""
+        while True:
+            try:
+                job = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if isinstance(job, Job):
+                with self._lock:
+                    job.status = "cancelled"
+                    job.finished_at = time.time()
+        for _ in self._threads:
+            self._queue.put(_DONE)
+        for t in self._threads:
+            t.join()
+        self._threads = []
+
+    # -- 任务 --
+
+    def submit(self, source: str) -> Tuple[Job, bool]:
+        """排队一本书，返回 (任务, 是否新建)。输入无效时抛出 JobError。"""
+        try:
+            _, novel_dir = self.pipe.resolve(source)
+        except FileNotFoundError as e:
+            raise JobError(str(e)) from e
+        with self._lock:
+            return self._submit_locked(str(source), novel_dir.name)
+
+    def _submit_locked(self, source: str, name: str) -> Tuple[Job, bool]:
+        # 调用方持有 self._lock
+        for job in self._jobs.values():
+            if job.active and job.name == name:
+                return job, False
+        job = Job(id=uuid.uuid4().hex[:12], source=source, name=name)
+        self._jobs[job.id] = job
+        self._submitted += 1
+        self._prune()
+        self._queue.put(job)
+        return job, True
+
+    def submit_upload(self, filename: str, body: BinaryIO, length: int) -> Tuple[Job, bool]:
+        """
+        把上传的 EPUB 保存为 <book_root>/<书名>.epub（先写临时文件再替换），然后排队。
+        替换文件与排队在同一次加锁内完成：检查通过后到任务入队之前，不会有工作线程开始处理这本书。
+        """
+        name = Path(urllib.parse.unquote(filename or "")).name
+        if not name.lower().endswith(".epub") or name.startswith("."):
+            raise JobError("上传需要 ?name=<书名>.epub")
+        if length <= 0:
+            raise JobError("上传内容为空")
+        root = self.pipe.options.book_root
+        root.mkdir(parents=True, exist_ok=True)
+        target = root / name
+        busy = f"该书正在处理中，请稍后再上传：{target.stem}"
+        with self._lock:
+            # 提前拒绝，免得读完整个请求体；写完后还会再检查一次
+            if any(j.active and j.name == target.stem for j in self._jobs.values()):
+                raise JobError(busy)
+        tmp = root / f".{name}.{uuid.uuid4().hex[:8]}.part"
+        try:
+            with open(tmp, "wb") as f:
+                remaining = length
+                while remaining > 0:
+                    chunk = body.read(min(1 << 20, remaining))
+                    if not chunk:
+                        raise JobError("上传内容不完整")
+                    f.write(chunk)
+                    remaining -= len(chunk)
+            with self._lock:
+                if any(j.active and j.name == target.stem for j in self._jobs.values()):
+                    raise JobError(busy)
+                os.replace(tmp, target)
+                return self._submit_locked(str(target), target.stem)
+        finally:
+            if tmp.exists():
+                tmp.unlink()
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            return list(self._jobs.values())
+
+    def _prune(self) -> None:
+        # 调用方持有 self._lock
+        finished = [jid for jid, j in self._jobs.items() if not j.active]
+        for jid in finished[: max(0, len(self._jobs) - self.max_jobs)]:
+            del self._jobs[jid]
+
+    def _worker(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is _DONE:
+                return
+            assert isinstance(job, Job)
+            with self._lock:
+                job.status = "running"
+                job.started_at = time.time()
+            res = self.pipe.run_book(job.source)
+            for ch in res.chapters:
+                ch.jsonl = ""
+                ch.paragraph_ids = []
+                ch.analysis = None
+            finished = time.time()
+            t = res.timings
+            status = f"ERROR {res.error}" if res.error else f"行数={res.rows} 输出={res.xlsx_path}"
+            self.pipe.log(f"[服务] 任务 {job.id} [{res.name}] 合计={t.total_s:.3f}s {status}")
+            with self._lock:
+                job.result = res
+                job.finished_at = finished
+                job.status = "done" if res.ok else "failed"
+                if res.ok:
+                    self._done += 1
+                else:
+                    self._failed += 1
+                self._stages.add(t)
+                self._recent.append((finished, job.started_at - job.submitted_at, finished - job.started_at))
+
+    # -- 指标 --
+
+    def metrics(self) -> Dict[str, Any]:
+        now = time.time()
+        with self._lock:
+            states = [j.status for j in self._jobs.values()]
+            recent = list(self._recent)
+            counts = {"submitted": self._submitted, "done": self._done, "failed": self._failed}
+            stages = StageTimings(self._stages.extract_s, self._stages.analyze_s, self._stages.report_s)
+        uptime = max(1e-9, now - self._started_at)
+        window = [r for r in recent if r[0] >= now - self.window_s]
+        finished = counts["done"] + counts["failed"]
+        llm = []
+        cascade = self.pipe.cascade
+        for tier, (cfg, pool, cache) in enumerate(zip(cascade.tiers, cascade.pools, cascade.context_caches)):
+            row = {"tier": tier, "model": cfg.model, "endpoints": pool.snapshot()}
+            if cache is not None:
+                row["context_cache"] = cache.stats()
+            llm.append(row)
+        return {
+            "uptime_s": round(uptime, 1),
+            "warm_up_s": round(self.warm_up_s, 4),
+            "workers": self.workers,
+            "jobs": {
+                **counts,
+                "queued": states.count("queued"),
+                "running": states.count("running"),
+                "cancelled": states.count("cancelled"),
+            },
+            "throughput": {
+                "books_per_min": round(finished / uptime * 60, 3),
+                f"books_per_min_last_{int(self.window_s)}s": round(len(window) / min(uptime, self.window_s) * 60, 3),
+            },
+            "latency_s": {
+                "queue_wait": _latency([r[1] for r in recent]),
+                "processing": _latency([r[2] for r in recent]),
+                "end_to_end": _latency([r[1] + r[2] for r in recent]),
+            },
+            "stages_s": stages.as_dict(),
+            "llm": llm,
+        }
+
+
+def make_handler(service: AnalysisService, *, max_upload_bytes: int):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format: str, *args: Any) -> None:  # noqa: A002 - stdlib signature
+            pass
+
+        def _send(self, status: int, obj: Any) -> None:
+            body = json.dumps(obj, ensure_ascii=False, indent=2).encode("utf-8")
+            try:
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            except OSError:
+                pass
+
+        def _error(self, status: int, message: str) -> None:
+            self._send(status, {"error": message})
+
+        def _send_file(self, path: Path, content_type: str) -> None:
+            try:
+                f = open(path, "rb")
+            except OSError:
+                self._error(404, f"文件不存在：{path.name}")
+                return
+            with f:
+                size = os.fstat(f.fileno()).st_size
+                quoted = urllib.parse.quote(path.name)
+                try:
+                    self.send_response(200)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(size))
+                    self.send_header("Content-Disposition", f"attachment; filename*=UTF-8''{quoted}")
+                    self.end_headers()
+                    shutil.copyfileobj(f, self.wfile)
+                except OSError:
+                    pass
+
+        def do_GET(self) -> None:  # noqa: N802 - stdlib naming
+            parts = [p for p in urllib.parse.urlsplit(self.path).path.split("/") if p]
+            if parts == ["healthz"]:
+                self._send(200, {"ok": True})
+            elif parts == ["metrics"]:
+                self._send(200, service.metrics())
+            elif parts == ["jobs"]:
+                self._send(200, {"jobs": [j.as_dict() for j in service.jobs()]})
+            elif len(parts) in (2, 3) and parts[0] == "jobs":
+                job = service.get(parts[1])
+                if job is None:
+                    self._error(404, f"未找到任务：{parts[1]}")
+                elif len(parts) == 2:
+                    self._send(200, job.as_dict())
+                elif parts[2] != "xlsx":
+                    self._error(404, self.path)
+                elif job.active:
+                    self._send(409, {"error": "任务尚未完成", "status": job.status})
+                elif job.result is None or not job.result.ok or job.result.xlsx_path is None:
+                    self._send(409, {"error": "任务失败，没有 Excel", "status": job.status})
+                else:
+                    self._send_file(job.result.xlsx_path, _XLSX_TYPE)
+            else:
+                self._error(404, self.path)
+
+        def do_POST(self) -> None:  # noqa: N802 - stdlib naming
+            url = urllib.parse.urlsplit(self.path)
+            length = int(self.headers.get("Content-Length") or 0)
+            if url.path.rstrip("/") != "/jobs":
+                self.rfile.read(length)
+                self._error(404, self.path)
+                return
+            ctype = (self.headers.get("Content-Type") or "").split(";")[0].strip().lower()
+            try:
+                if ctype in ("application/epub+zip", "application/octet-stream"):
+                    if length > max_upload_bytes:
+                        self.close_connection = True
+                        self._error(413, f"EPUB 超过上限 {max_upload_bytes // (1 << 20)} MB")
+                        return
+                    name = (urllib.parse.parse_qs(url.query).get("name") or [""])[0]
+                    job, created = service.submit_upload(name, self.rfile, length)
+                else:
+                    try:
+                        req = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+                    except (UnicodeDecodeError, json.JSONDecodeError):
+                        raise JobError("请求体应为 JSON：{\"source\": \"book/书名.epub\"}") from None
+                    source = str(req.get("source") or "") if isinstance(req, dict) else ""
+                    if not source:
+                        raise JobError("缺少 source")
+                    job, created = service.submit(source)
+            except JobError as e:
+                self.close_connection = True  # 上传被拒绝时请求体可能还没读完
+                self._error(400, str(e))
+                return
+            except OSError as e:
+                self._error(500, f"{type(e).__name__}: {e}")
+                return
+            self._send(202 if created else 200, job.as_dict())
+
+    return Handler
+
+
+def make_server(
+    service: AnalysisService, host: str = "127.0.0.1", port: int = 8800, *, max_upload_mb: int = 200
+) -> ThreadingHTTPServer:
+    server = ThreadingHTTPServer((host, port), make_handler(service, max_upload_bytes=max_upload_mb << 20))
+    server.daemon_threads = True
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m pipeline.service",
+        description="Long-running local analysis service: warm config/prompts/connections, HTTP job queue.",
+    )
+    parser.add_argument("--host", default="127.0.0.1", help="Bind address (default: localhost only)")
+    parser.add_argument("--port", type=int, default=8800)
+    parser.add_argument("--workers", type=int, default=4, help="Books processed in parallel")
+    parser.add_argument("--max-jobs", type=int, default=1000, help="Finished jobs kept for status queries")
+    parser.add_argument("--max-upload-mb", type=int, default=200, help="Largest accepted EPUB upload")
+    add_option_arguments(parser)
+    args = parser.parse_args(argv)
+
+    service = AnalysisService(Pipeline(options_from_args(args)), workers=args.workers, max_jobs=args.max_jobs)
+    try:
+        service.start()
+    except (OSError, ValueError) as e:
+        raise SystemExit(f"[服务] 初始化失败：{e}") from e
+    server = make_server(service, args.host, args.port, max_upload_mb=args.max_upload_mb)
+    print(f"[服务] 预热 {service.warm_up_s:.3f}s，监听 http://{args.host}:{server.server_port}（workers={service.workers}）")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print("[服务] 停止：等待正在处理的书写完")
+        service.stop()
+        print(json.dumps(service.metrics()["jobs"], ensure_ascii=False))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,232 @@
+from __future__ import annotations
+
+"""
+书库级流式流水线：提取、分析、报表三个阶段同时运行，用有界队列衔接。
+
+    提取线程 ×E ──> [待分析队列 maxsize=Q] ──> 分析线程 ×C ──> [待报表队列 maxsize=Q] ──> 报表线程 ×R
+
+- 提取：多个线程并行解析 EPUB（或读取已有章节 JSONL），整本书的章节放入待分析队列
+- 分析：C 个线程并发调用模型（C 即同时进行的模型调用数）；第 2/3 章依赖上一章结果，
+  所以同一本书的章节由同一个线程依次分析，不同的书之间并行
+- 报表：一本书的章节全部分析完就立即写出它的 Excel，不等其他书
+- 背压：队列满时上游阻塞，在途的书目不超过 E + C + R + 2Q 本，内存不随书库规模增长
+- 每隔 interval 秒输出一行各阶段的队列深度、在途数量和吞吐
+"""
+
+import queue
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional, Tuple, Union
+
+from pipeline.core import BookChapter, BookResult, Pipeline
+
+_DONE = object()  # 队列结束标记
+
+
+def library_sources(root: Path) -> List[Path]:
+    """书库目录下的全部书：*.epub，加上没有对应 epub、但已有章节 JSONL 的书目录。"""
+    epubs = sorted(p for p in root.glob("*.epub") if p.is_file())
+    stems = {p.stem for p in epubs}
+    dirs = sorted(p for p in root.iterdir() if p.is_dir() and p.name not in stems and any(p.glob("*.jsonl")))
+    return epubs + dirs
+
+
+@dataclass
+class _Book:
+    index: int
+    result: BookResult
+    epub_path: Optional[Path] = None
+    chapters: List[BookChapter] = field(default_factory=list)
+
+
+@dataclass
+class StageCounters:
+    """各阶段的计数（各线程通过 add 更新，监控线程读取）。"""
+
+    extracted: int = 0
+    analyzing: int = 0
+    analyzed_chapters: int = 0
+    analyzed_books: int = 0
+    reporting: int = 0
+    reported: int = 0
+    failed: int = 0
+    started_at: float = field(default_factory=time.perf_counter)
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def add(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            setattr(self, name, getattr(self, name) + n)
+
+
+class StreamingPipeline:
+    """
+    用法：
+        pipe = Pipeline(PipelineOptions(...))
+        results = StreamingPipeline(pipe, llm_concurrency=8).run(library_sources(Path("book")))
+    """
+
+    def __init__(
+        self,
+        pipe: Pipeline,
+        *,
+        extract_workers: int = 2,
+        llm_concurrency: int = 4,
+        report_workers: int = 1,
+        queue_size: int = 8,
+        interval: float = 2.0,
+        log: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self.pipe = pipe
+        self.extract_workers = max(1, extract_workers)
+        self.llm_concurrency = max(1, llm_concurrency)
+        self.report_workers = max(1, report_workers)
+        self.queue_size = max(1, queue_size)
+        self.interval = interval
+        self.log = log or pipe.log
+        self.counters = StageCounters()
+        self._analyze_q: "queue.Queue[object]" = queue.Queue(maxsize=self.queue_size)
+        self._report_q: "queue.Queue[object]" = queue.Queue(maxsize=self.queue_size)
+        self._sources: "queue.Queue[Tuple[int, Union[str, Path]]]" = queue.Queue()
+        self._results: Dict[int, BookResult] = {}
+
+    # -- 各阶段 --
+
+    def _extract_worker(self) -> None:
+        while True:
+            try:
+                index, source = self._sources.get_nowait()
+            except queue.Empty:
+                return
+            try:
+                epub_path, novel_dir = self.pipe.resolve(source)
+            except FileNotFoundError as e:
+                self._finish(_Book(index, BookResult(name=Path(str(source)).stem, novel_dir=Path(str(source)), error=str(e))))
+                continue
+            book = _Book(index, BookResult(name=novel_dir.name, novel_dir=novel_dir), epub_path=epub_path)
+            t0 = time.perf_counter()
+            try:
+                book.chapters = self.pipe.extract(epub_path, novel_dir)
+                if not book.chapters:
+                    raise ValueError("未提取到章节" if epub_path else f"未找到章节 JSONL：{novel_dir}")
+            except Exception as e:  # noqa: BLE001 - one broken book must not stop the library
+                book.result.error = f"extract: {type(e).__name__}: {e}"[:300]
+                self._finish(book)
+                continue
+            finally:
+                book.result.timings.extract_s = time.perf_counter() - t0
+            self.counters.add("extracted")
+            self._analyze_q.put(book)  # 队列满时在这里阻塞（背压）
+
+    def _analyze_worker(self) -> None:
+        c = self.counters
+        persist = self.pipe.options.persist
+        while True:
+            book = self._analyze_q.get()
+            if book is _DONE:
+                return
+            assert isinstance(book, _Book)
+            c.add("analyzing")
+            t0 = time.perf_counter()
+            try:
+                novel_dir = book.result.novel_dir
+                self.pipe.analyze(book.result.name, book.chapters, out_dir=(novel_dir / "analysis") if persist else None)
+            except Exception as e:  # noqa: BLE001
+                book.result.error = f"analyze: {type(e).__name__}: {e}"[:300]
+            finally:
+                book.result.timings.analyze_s = time.perf_counter() - t0
+                c.add("analyzing", -1)
+            c.add("analyzed_chapters", sum(1 for ch in book.chapters if ch.analysis is not None))
+            if book.result.error:
+                self._finish(book)
+                continue
+            c.add("analyzed_books")
+            self._report_q.put(book)
+
+    def _report_worker(self) -> None:
+        c = self.counters
+        while True:
+            book = self._report_q.get()
+            if book is _DONE:
+                return
+            assert isinstance(book, _Book)
+            c.add("reporting")
+            t0 = time.perf_counter()
+            try:
+                book.result.xlsx_path, book.result.rows = self.pipe.report(book.result.novel_dir, book.chapters)
+                self.pipe.record_fingerprint(book.result)
+            except Exception as e:  # noqa: BLE001
+                book.result.error = f"report: {type(e).__name__}: {e}"[:300]
+            finally:
+                book.result.timings.report_s = time.perf_counter() - t0
+                c.add("reporting", -1)
+            c.add("reported")
+            self._finish(book)
+
+    def _finish(self, book: _Book) -> None:
+        if book.result.error:
+            self.counters.add("failed")
+        # 写完即释放章节正文与分析结果，只保留章节元数据，结果列表不随书库规模占用内存
+        for ch in book.chapters:
+            ch.jsonl = ""
+            ch.paragraph_ids = []
+            ch.analysis = None
+        book.result.chapters = book.chapters
+        self._results[book.index] = book.result
+
+    # -- 监控 --
+
+    def status_line(self) -> str:
+        c = self.counters
+        elapsed = max(1e-9, time.perf_counter() - c.started_at)
+        return (
+            f"[流式] 提取 待处理={self._sources.qsize()} 完成={c.extracted} | "
+            f"待分析 {self._analyze_q.qsize()}/{self.queue_size} 分析中={c.analyzing}/{self.llm_concurrency} "
+            f"完成={c.analyzed_chapters}章 ({c.analyzed_chapters / elapsed * 60:.1f} 章/min) | "
+            f"待报表 {self._report_q.qsize()}/{self.queue_size} 写出中={c.reporting} 完成={c.reported}本 "
+            f"({c.reported / elapsed * 60:.1f} 本/min) | 失败={c.failed} | {elapsed:.0f}s"
+        )
+
+    def _monitor(self, stop: threading.Event) -> None:
+        while not stop.wait(self.interval):
+            self.log(self.status_line())
+
+    # -- 运行 --
+
+    def run(self, sources: Iterable[Union[str, Path]]) -> List[BookResult]:
+        items = list(sources)
+        self.pipe.warm_up()  # 在启动线程之前加载配置，避免多个线程同时初始化
+        self.counters = StageCounters()
+        self._results = {}
+        for i, src in enumerate(items):
+            self._sources.put((i, src))
+
+        def start(target: Callable[[], None], n: int, name: str) -> List[threading.Thread]:
+            threads = [threading.Thread(target=target, name=f"{name}-{i}", daemon=True) for i in range(n)]
+            for t in threads:
+                t.start()
+            return threads
+
+        stop = threading.Event()
+        monitor = threading.Thread(target=self._monitor, args=(stop,), name="stream-monitor", daemon=True)
+        monitor.start()
+        extractors = start(self._extract_worker, self.extract_workers, "extract")
+        analyzers = start(self._analyze_worker, self.llm_concurrency, "analyze")
+        reporters = start(self._report_worker, self.report_workers, "report")
+        try:
+            for t in extractors:
+                t.join()
+            for _ in analyzers:
+                self._analyze_q.put(_DONE)
+            for t in analyzers:
+                t.join()
+            for _ in reporters:
+                self._report_q.put(_DONE)
+            for t in reporters:
+                t.join()
+        finally:
+            stop.set()
+            monitor.join()
+        self.log(self.status_line())
+        return [self._results[i] for i in range(len(items))]
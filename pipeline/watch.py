@@ -0,0 +1,381 @@
+from __future__ import annotations
+
+"""
+监视书库目录的常驻进程：编辑把 EPUB 放进 book/ 后自动处理，只补跑这本书缺少的阶段。
+
+Command:
+  python -m pipeline.watch book --workers 2 --profile fast
+  python -m pipeline.watch book --once            # 处理当前缺失的部分后退出（可放进计划任务）
+
+- 发现变化：Linux 上使用 inotify（阻塞等待事件，空闲时不占 CPU）；其他平台轮询目录本身的 mtime，
+  只有目录变化时才重新 stat 其中的 EPUB，另外每隔 --rescan 秒做一次完整检查（覆盖原地改写的文件）
+- 文件稳定：大小与 mtime 连续 --settle 秒不变才开始处理，避免读到正在复制的文件
+- 缺失阶段：没有章节 JSONL 或 EPUB 有变化 -> 1,2,3；有章节但缺分析 JSON -> 2,3；
+  分析结果与 Excel 的指纹不一致（见 phase3_excel/fingerprint.py）-> 3；都齐全 -> 跳过
+- 处理过的 EPUB（大小、mtime）记录在 <书库>/.watch_state.json，重启后不会重复处理
+"""
+
+import argparse
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Set, Tuple
+
+from chapters import analysis_paths, iter_chapter_jsonl_files
+from fingerprint import book_fingerprint, load_state, output_unchanged, run_key
+
+from pipeline.core import BookResult, Pipeline, add_option_arguments, options_from_args
+
+STATE_NAME = ".watch_state.json"
+_Stat = Tuple[int, int]  # (size, mtime_ns)
+
+
+class _Inotify:
+    """最小的 inotify 封装（ctypes 调用 libc），只监视一个目录。"""
+
+    IN_ATTRIB = 0x00000004
+    IN_CLOSE_WRITE = 0x00000008
+    IN_MOVED_FROM = 0x00000040
+    IN_MOVED_TO = 0x00000080
+    IN_DELETE = 0x00000200
+    IN_Q_OVERFLOW = 0x00004000
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self, path: Path) -> None:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = self.IN_CLOSE_WRITE | self.IN_MOVED_TO | self.IN_ATTRIB | self.IN_MOVED_FROM | self.IN_DELETE
+        if libc.inotify_add_watch(fd, os.fsencode(str(path)), mask) < 0:
+            err = ctypes.get_errno()
+            os.close(fd)
+            raise OSError(err, f"inotify_add_watch failed: {path}")
+        self.fd = fd
+
+    def read(self, timeout: Optional[float]) -> Optional[Set[str]]:
+        """等待事件，返回有变化的文件名；队列溢出时返回 None（需要完整检查）。"""
+        ready, _, _ = select.select([self.fd], [], [], timeout)
+        names: Set[str] = set()
+        if not ready:
+            return names
+        try:
+            buf = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return names
+        pos = 0
+        while pos + self._EVENT.size <= len(buf):
+            _, mask, _, length = self._EVENT.unpack_from(buf, pos)
+            pos += self._EVENT.size
+            name = buf[pos : pos + length].rstrip(b"\0")
+            pos += length
+            if mask & self.IN_Q_OVERFLOW:
+                return None
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+
+    def close(self) -> None:
+        os.close(self.fd)
+
+
+def _stat(path: Path) -> Optional[_Stat]:
+    try:
+        st = path.stat()
+    except OSError:
+        return None
+    return st.st_size, st.st_mtime_ns
+
+
+def _is_epub(name: str) -> bool:
+    return name.lower().endswith(".epub") and not name.startswith(".")
+
+
+class BookWatcher:
+    """
+    主线程负责发现变化与判断文件是否稳定，稳定的书交给 workers 个线程处理；
+    处理中的书再次变化时，处理完后会再检查一次。
+    """
+
+    def __init__(
+        self,
+        pipe: Pipeline,
+        root: Path,
+        *,
+        workers: int = 2,
+        settle_s: float = 2.0,
+        poll_s: float = 5.0,
+        rescan_s: float = 600.0,
+        use_inotify: bool = True,
+        log: Optional[Callable[[str], None]] = None,
+    ) -> None:
+        self.pipe = pipe
+        self.root = root
+        self.workers = max(1, workers)
+        self.settle_s = settle_s
+        self.poll_s = poll_s
+        self.rescan_s = rescan_s
+        self.use_inotify = use_inotify
+        self.log = log or pipe.log
+        self.state_path = root / STATE_NAME
+        self._processed: Dict[str, _Stat] = self._load_state()
+        self._pending: Dict[str, Tuple[_Stat, float]] = {}  # 书 -> (最近一次看到的 stat, 从何时起未变化)
+        self._running: Set[str] = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._startup = False
+        self.done = 0
+        self.failed = 0
+
+    # -- 处理记录 --
+
+    def _load_state(self) -> Dict[str, _Stat]:
+        try:
+            data = json.loads(self.state_path.read_text(encoding="utf-8"))
+            return {str(k): (int(v[0]), int(v[1])) for k, v in (data.get("epubs") or {}).items()}
+        except (OSError, ValueError, TypeError, IndexError, AttributeError):
+            return {}
+
+    def _save_state(self) -> None:
+        # 调用方持有 self._lock
+        tmp = self.state_path.with_name(f"{self.state_path.name}.tmp")
+        tmp.write_text(
+            json.dumps({"epubs": {k: list(v) for k, v in sorted(self._processed.items())}}, ensure_ascii=False),
+            encoding="utf-8",
+        )
+        os.replace(tmp, self.state_path)
+
+    # -- 判断缺失的阶段 --
+
+    def missing_phases(self, epub: Path, stat: _Stat) -> List[int]:
+        novel_dir = self.root / epub.stem
+        max_chapters = self.pipe.options.max_chapters
+        jsonls = []
+        if novel_dir.is_dir():
+            jsonls = [(no, p) for no, p in iter_chapter_jsonl_files(novel_dir) if 1 <= no <= max_chapters]
+        if not jsonls:
+            return [1, 2, 3]
+        seen = self._processed.get(epub.name)
+        if seen is not None and seen != stat:
+            return [1, 2, 3]
+        # 守护进程之前生成的书：EPUB 比章节文件新，说明 EPUB 已被替换
+        if seen is None and stat[1] > max(p.stat().st_mtime_ns for _, p in jsonls):
+            return [1, 2, 3]
+        analysis_dir = novel_dir / "analysis"
+        if any(not analysis_paths(analysis_dir, p)[0].exists() for _, p in jsonls):
+            return [2, 3]
+        xlsx = novel_dir / f"{novel_dir.name}.xlsx"
+        state = load_state(xlsx)
+        old = (state.get("books") or {}).get(novel_dir.name) or {}
+        pacing = self.pipe.options.pacing
+        fp, _ = book_fingerprint(novel_dir, old.get("files"), chapter_content=pacing)
+        if (
+            state.get("run") == run_key(self.pipe.options.engine, "book", pacing=pacing)
+            and old.get("fingerprint") == fp
+            and output_unchanged(xlsx, state)
+        ):
+            return []
+        return [3]
+
+    def process(self, name: str, stat: _Stat) -> None:
+        epub = self.root / name
+        novel_dir = self.root / epub.stem
+        pipe = self.pipe
+        phases: List[int] = []
+        t0 = time.perf_counter()
+        try:
+            phases = self.missing_phases(epub, stat)
+            if 2 in phases:
+                chapters = pipe.extract(epub if 1 in phases else None, novel_dir)
+                if not chapters:
+                    raise ValueError("未提取到章节")
+                pipe.analyze(novel_dir.name, chapters, out_dir=novel_dir / "analysis")
+            elif phases:
+                chapters = pipe.load_analysis(novel_dir)
+            if phases:
+                xlsx_path, rows = pipe.report(novel_dir, chapters)
+                pipe.record_fingerprint(BookResult(name=novel_dir.name, novel_dir=novel_dir, xlsx_path=xlsx_path))
+        except Exception as e:  # noqa: BLE001 - keep watching other books
+            with self._lock:
+                self.failed += 1
+            self.log(f"[监视] [{epub.stem}] 阶段 {','.join(map(str, phases))} ERROR {type(e).__name__}: {e}"[:400])
+            return
+        with self._lock:
+            if self._processed.get(name) != stat:
+                self._processed[name] = stat
+                self._save_state()
+            if phases:
+                self.done += 1
+        if phases:
+            self.log(
+                f"[监视] [{epub.stem}] 阶段 {','.join(map(str, phases))} 完成 {time.perf_counter() - t0:.3f}s "
+                f"行数={rows} 输出={xlsx_path}"
+            )
+
+    # -- 发现变化 --
+
+    def _touch(self, name: str, now: float) -> None:
+        """记录一个可能有变化的文件；stat 与上次处理时相同的不再排队。"""
+        path = self.root / name
+        st = _stat(path) if _is_epub(name) else None
+        if st is None or not path.is_file():
+            self._pending.pop(name, None)
+            return
+        prev = self._pending.get(name)
+        if prev is not None and prev[0] == st:
+            return
+        # 启动时已存在且早已写完的文件无需等待稳定
+        since = now - self.settle_s if now - st[1] / 1e9 >= self.settle_s else now
+        self._pending[name] = (st, since if prev is None else now)
+
+    def _scan(self, now: float) -> None:
+        names = {e.name for e in os.scandir(self.root) if _is_epub(e.name)}
+        for name in set(self._pending) - names:
+            self._pending.pop(name, None)
+        for name in names:
+            self._touch(name, now)
+
+    def _dispatch(self, pool: ThreadPoolExecutor, now: float) -> Optional[float]:
+        """把已稳定的书交给线程池，返回下一个待稳定文件还需等待的秒数。"""
+        wait: Optional[float] = None
+        for name, (st, since) in list(self._pending.items()):
+            with self._lock:
+                busy = name in self._running
+                handled = self._processed.get(name) == st
+            if busy:
+                wait = min(wait or self.settle_s, self.settle_s)
+                continue
+            remaining = since + self.settle_s - now
+            if remaining > 0:
+                wait = remaining if wait is None else min(wait, remaining)
+                continue
+            cur = _stat(self.root / name)
+            if cur != st:
+                self._touch(name, now)
+                wait = self.settle_s if wait is None else min(wait, self.settle_s)
+                continue
+            del self._pending[name]
+            if handled and not self._startup:
+                continue
+            with self._lock:
+                self._running.add(name)
+            pool.submit(self._run_one, name, st)
+        return wait
+
+    def _run_one(self, name: str, st: _Stat) -> None:
+        try:
+            self.process(name, st)
+        finally:
+            with self._lock:
+                self._running.discard(name)
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def idle(self) -> bool:
+        with self._lock:
+            return not self._pending and not self._running
+
+    def run(self, *, once: bool = False) -> Tuple[int, int]:
+        """一直运行到 stop()；once=True 时处理完当前缺失的部分即退出。返回 (处理的书数, 失败数)。"""
+        self.pipe.warm_up()
+        inotify: Optional[_Inotify] = None
+        if self.use_inotify and not once and sys.platform.startswith("linux"):
+            try:
+                inotify = _Inotify(self.root)
+            except (OSError, AttributeError) as e:
+                self.log(f"[监视] inotify 不可用，改为轮询：{e}")
+        mode = "inotify" if inotify is not None else ("单次检查" if once else f"轮询 {self.poll_s:g}s")
+        self.log(f"[监视] {self.root}（{mode}，workers={self.workers}）")
+
+        pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="watch")
+        try:
+            now = time.time()
+            self._startup = True  # 启动时对每本书都检查一次缺失的阶段
+            self._scan(now)
+            last_scan = now
+            dir_mtime = _stat(self.root)
+            wait = self._dispatch(pool, now)
+            self._startup = False
+            while not self._stop.is_set():
+                if once and self.idle():
+                    break
+                timeout = self.rescan_s if wait is None else wait
+                if inotify is not None:
+                    names = inotify.read(min(timeout, 1.0) if once else timeout)
+                    now = time.time()
+                    if names is None or now - last_scan >= self.rescan_s:
+                        self._scan(now)
+                        last_scan = now
+                    else:
+                        for name in names:
+                            self._touch(name, now)
+                else:
+                    self._stop.wait(min(timeout, 0.2 if once else self.poll_s))
+                    now = time.time()
+                    cur = _stat(self.root)
+                    if cur != dir_mtime or now - last_scan >= self.rescan_s:
+                        dir_mtime = cur
+                        self._scan(now)
+                        last_scan = now
+                    else:
+                        for name in list(self._pending):
+                            self._touch(name, now)
+                wait = self._dispatch(pool, now)
+        finally:
+            pool.shutdown(wait=True)
+            if inotify is not None:
+                inotify.close()
+        return self.done, self.failed
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m pipeline.watch",
+        description="Watch a book directory and run the missing phases for new or changed EPUBs.",
+    )
+    parser.add_argument("root", type=Path, nargs="?", default=Path("book"), help='Book directory (default: "book")')
+    parser.add_argument("--workers", type=int, default=2, help="Books processed in parallel")
+    parser.add_argument("--settle", type=float, default=2.0, help="Seconds a file must stay unchanged before processing")
+    parser.add_argument("--poll", type=float, default=5.0, help="Polling interval when inotify is unavailable")
+    parser.add_argument("--rescan", type=float, default=600.0, help="Seconds between full checks of every EPUB")
+    parser.add_argument("--no-inotify", action="store_true", help="Always poll")
+    parser.add_argument("--once", action="store_true", help="Process what is missing now, then exit")
+    add_option_arguments(parser)
+    args = parser.parse_args(argv)
+    if not args.root.is_dir():
+        raise SystemExit(f"未找到书库目录：{args.root}")
+
+    options = options_from_args(args)
+    if options.store is not None:
+        raise SystemExit("--store 暂不支持监视模式（缺失阶段的判断依赖磁盘上的中间文件）")
+    options.persist = True  # 缺失阶段的判断依赖磁盘上的中间文件
+    options.book_root = args.root
+    watcher = BookWatcher(
+        Pipeline(options),
+        args.root,
+        workers=args.workers,
+        settle_s=args.settle,
+        poll_s=args.poll,
+        rescan_s=args.rescan,
+        use_inotify=not args.no_inotify,
+    )
+    try:
+        done, failed = watcher.run(once=args.once)
+    except KeyboardInterrupt:
+        watcher.stop()
+        return 130
+    print(f"[监视] 处理 {done} 本，失败 {failed} 本")
+    return 0 if failed == 0 else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1 @@
+"""Opt-in profiling for the phase entry points (stage timings, peak memory, hot-path counters)."""
@@ -0,0 +1,347 @@
+"""Per-run profile: stage wall/CPU time, tracemalloc peaks, hot-path counters, optional cProfile.
+
+Entry points add `--perf-profile PATH` (see `add_perf_arguments`) and run under
+`profile_run`; each run appends one JSON record to PATH, so a batch of runs
+(e.g. run_all over a library) aggregates into one file:
+
+  {"ts", "entry", "argv", "host", "pid", "wall_s", "cpu_s", "peak_mem_bytes", "max_rss_kb", "error",
+   "stages": {"<name>": {"calls", "wall_s", "cpu_s", "peak_mem_bytes"}},
+   "counters": {"<name>": n}, "cprofile": {"path", "top": [...]}}
+
+Hot code reports through the module-level `stage()` / `add()`, which are no-ops
+unless a profile is active, so unprofiled runs pay nothing but a None check.
+
+Command:
+  python -m profiling.perf logs/perf.jsonl --by entry
+"""
+
+from __future__ import annotations
+
+import argparse
+import cProfile
+import json
+import math
+import os
+import pstats
+import socket
+import sys
+import threading
+import time
+import tracemalloc
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from pathlib import Path
+from typing import Any, ContextManager, Dict, Iterator, List, Optional
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - Windows
+    resource = None  # type: ignore[assignment]
+
+_active: Optional["PerfProfile"] = None
+
+
+def active() -> Optional["PerfProfile"]:
+    return _active
+
+
+def add(name: str, n: int = 1) -> None:
+    """Bump a hot-path counter of the active profile (no-op when profiling is off)."""
+    prof = _active
+    if prof is not None:
+        prof.add(name, n)
+
+
+def stage(name: str) -> ContextManager[Any]:
+    """Time a stage of the active profile (no-op when profiling is off)."""
+    prof = _active
+    return prof.stage(name) if prof is not None else nullcontext()
+
+
+class _Stage:
+    __slots__ = ("calls", "wall_s", "cpu_s", "peak")
+
+    def __init__(self) -> None:
+        self.calls = 0
+        self.wall_s = 0.0
+        self.cpu_s = 0.0
+        self.peak = 0
+
+
+class PerfProfile:
+    """One profiled run. Stages may nest; same-named stages accumulate (e.g. one per chapter)."""
+
+    def __init__(self, entry: str, *, trace_memory: bool = True, cprofile_path: Optional[Path] = None) -> None:
+        self.entry = entry
+        self.trace_memory = trace_memory
+        self.cprofile_path = cprofile_path
+        self.counters: Dict[str, int] = defaultdict(int)
+        self.stages: Dict[str, _Stage] = {}
+        self.error = ""
+        self._open: List[List[int]] = []  # peak accumulators of the stages currently open (plus the run)
+        self._lock = threading.Lock()
+        self._profiler: Optional[cProfile.Profile] = None
+        self._t0 = self._c0 = 0.0
+        self.wall_s = self.cpu_s = 0.0
+        self.peak_mem_bytes: Optional[int] = None
+        self._run_peak = [0]
+        self._started_tracemalloc = False
+
+    def add(self, name: str, n: int = 1) -> None:
+        with self._lock:
+            self.counters[name] += n
+
+    def _fold_peak(self) -> None:
+        # tracemalloc keeps one global peak: fold it into every open stage, then restart it,
+        # so each stage sees the peak reached while it was open.
+        if not self.trace_memory:
+            return
+        peak = tracemalloc.get_traced_memory()[1]
+        for acc in self._open:
+            if peak > acc[0]:
+                acc[0] = peak
+        tracemalloc.reset_peak()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        acc = [0]
+        with self._lock:
+            self._fold_peak()
+            self._open.append(acc)
+        t0, c0 = time.perf_counter(), time.process_time()
+        try:
+            yield
+        finally:
+            wall, cpu = time.perf_counter() - t0, time.process_time() - c0
+            with self._lock:
+                self._fold_peak()
+                # by identity: accumulators are one-element lists and may compare equal
+                self._open = [a for a in self._open if a is not acc]
+                st = self.stages.get(name)
+                if st is None:
+                    st = self.stages[name] = _Stage()
+                st.calls += 1
+                st.wall_s += wall
+                st.cpu_s += cpu
+                st.peak = max(st.peak, acc[0])
+
+    def start(self) -> "PerfProfile":
+        global _active
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracemalloc = True
+        self._open = [self._run_peak]
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+        if self.cprofile_path is not None:
+            self._profiler = cProfile.Profile()
+            self._profiler.enable()
+        _active = self
+        self._t0, self._c0 = time.perf_counter(), time.process_time()
+        return self
+
+    def stop(self) -> None:
+        global _active
+        self.wall_s = time.perf_counter() - self._t0
+        self.cpu_s = time.process_time() - self._c0
+        if self._profiler is not None:
+            self._profiler.disable()
+        _active = None
+        with self._lock:
+            self._fold_peak()
+        if self.trace_memory:
+            self.peak_mem_bytes = self._run_peak[0]
+            if self._started_tracemalloc:
+                tracemalloc.stop()
+
+    def _cprofile_summary(self, top: int = 25) -> Optional[Dict[str, Any]]:
+        if self._profiler is None or self.cprofile_path is None:
+            return None
+        self.cprofile_path.parent.mkdir(parents=True, exist_ok=True)
+        self._profiler.dump_stats(str(self.cprofile_path))
+        stats = pstats.Stats(self._profiler)
+        rows = []
+        for (filename, line, func), (_, ncalls, tottime, cumtime, _) in stats.stats.items():  # type: ignore[attr-defined]
+            rows.append(
+                {
+                    "func": f"{Path(filename).name}:{line}({func})",
+                    "ncalls": ncalls,
+                    "tottime_s": round(tottime, 6),
+                    "cumtime_s": round(cumtime, 6),
+                }
+            )
+        rows.sort(key=lambda r: r["cumtime_s"], reverse=True)
+        return {"path": str(self.cprofile_path), "top": rows[:top]}
+
+    def as_dict(self) -> Dict[str, Any]:
+        max_rss_kb = None
+        if resource is not None:
+            max_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            if sys.platform == "darwin":
+                max_rss_kb //= 1024  # bytes on macOS
+        return {
+            "ts": round(time.time(), 3),
+            "entry": self.entry,
+            "argv": sys.argv[1:],
+            "host": socket.gethostname(),
+            "pid": os.getpid(),
+            "wall_s": round(self.wall_s, 6),
+            "cpu_s": round(self.cpu_s, 6),
+            "peak_mem_bytes": self.peak_mem_bytes,
+            "max_rss_kb": max_rss_kb,
+            "error": self.error,
+            "stages": {
+                name: {
+                    "calls": st.calls,
+                    "wall_s": round(st.wall_s, 6),
+                    "cpu_s": round(st.cpu_s, 6),
+                    "peak_mem_bytes": st.peak if self.trace_memory else None,
+                }
+                for name, st in self.stages.items()
+            },
+            "counters": dict(sorted(self.counters.items())),
+            "cprofile": self._cprofile_summary(),
+        }
+
+
+def add_perf_arguments(parser: argparse.ArgumentParser) -> None:
+    parser.add_argument(
+        "--perf-profile",
+        type=Path,
+        default=None,
+        help="Append this run's stage timings/peak memory/counters as one JSON line to this file",
+    )
+    parser.add_argument("--perf-cprofile", type=Path, default=None, help="Also run cProfile and dump pstats here")
+    parser.add_argument("--perf-no-memory", action="store_true", help="Skip tracemalloc (it slows Python code down)")
+
+
+@contextmanager
+def profile_run(entry: str, args: argparse.Namespace) -> Iterator[Optional[PerfProfile]]:
+    """Profile the body when --perf-profile/--perf-cprofile was given; writes the record on exit."""
+    out: Optional[Path] = getattr(args, "perf_profile", None)
+    cprofile_path: Optional[Path] = getattr(args, "perf_cprofile", None)
+    if out is None and cprofile_path is None:
+        yield None
+        return
+    prof = PerfProfile(
+        entry, trace_memory=not getattr(args, "perf_no_memory", False), cprofile_path=cprofile_path
+    ).start()
+    try:
+        yield prof
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            prof.error = f"SystemExit: {e.code}"
+        raise
+    except BaseException as e:
+        prof.error = f"{type(e).__name__}: {e}"[:300]
+        raise
+    finally:
+        prof.stop()
+        record = prof.as_dict()
+        if out is not None:
+            out.parent.mkdir(parents=True, exist_ok=True)
+            with out.open("a", encoding="utf-8") as f:
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+# -- summary --
+
+
+def iter_records(paths: List[Path]) -> Iterator[Dict[str, Any]]:
+    for path in paths:
+        files = sorted(path.glob("*.jsonl")) if path.is_dir() else [path]
+        for f in files:
+            with f.open(encoding="utf-8") as fh:
+                for line in fh:
+                    line = line.strip()
+                    if line:
+                        try:
+                            yield json.loads(line)
+                        except json.JSONDecodeError:
+                            continue
+
+
+def _pct(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[max(0, min(len(ordered) - 1, math.ceil(p / 100.0 * len(ordered)) - 1))]
+
+
+def summarize(records: List[Dict[str, Any]], *, by: str = "entry") -> List[Dict[str, Any]]:
+    """One row per group: run count, wall/CPU stats, max peak memory, per-stage totals and counter sums."""
+    groups: Dict[str, List[Dict[str, Any]]] = defaultdict(list)
+    for rec in records:
+        groups[str(rec.get(by, ""))].append(rec)
+    out = []
+    for key, recs in sorted(groups.items()):
+        walls = [float(r.get("wall_s") or 0.0) for r in recs]
+        stages: Dict[str, Dict[str, float]] = defaultdict(lambda: {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0, "peak_mem_bytes": 0})
+        counters: Dict[str, int] = defaultdict(int)
+        for r in recs:
+            for name, st in (r.get("stages") or {}).items():
+                agg = stages[name]
+                agg["calls"] += st.get("calls") or 0
+                agg["wall_s"] += st.get("wall_s") or 0.0
+                agg["cpu_s"] += st.get("cpu_s") or 0.0
+                agg["peak_mem_bytes"] = max(agg["peak_mem_bytes"], st.get("peak_mem_bytes") or 0)
+            for name, n in (r.get("counters") or {}).items():
+                counters[name] += n
+        peaks = [r["peak_mem_bytes"] for r in recs if r.get("peak_mem_bytes") is not None]
+        out.append(
+            {
+                by: key,
+                "runs": len(recs),
+                "errors": sum(1 for r in recs if r.get("error")),
+                "wall_s": round(sum(walls), 4),
+                "wall_p50_s": round(_pct(walls, 50), 4),
+                "wall_p95_s": round(_pct(walls, 95), 4),
+                "cpu_s": round(sum(float(r.get("cpu_s") or 0.0) for r in recs), 4),
+                "peak_mem_bytes": max(peaks) if peaks else None,
+                "stages": {
+                    name: {k: (round(v, 4) if isinstance(v, float) else v) for k, v in st.items()}
+                    for name, st in sorted(stages.items(), key=lambda kv: -kv[1]["wall_s"])
+                },
+                "counters": dict(sorted(counters.items())),
+            }
+        )
+    return out
+
+
+def format_summary(rows: List[Dict[str, Any]], *, by: str = "entry") -> str:
+    lines = []
+    for row in rows:
+        peak = row["peak_mem_bytes"]
+        lines.append(
+            f"{by}={row[by]} runs={row['runs']} errors={row['errors']} wall={row['wall_s']}s "
+            f"(p50 {row['wall_p50_s']}s, p95 {row['wall_p95_s']}s) cpu={row['cpu_s']}s "
+            f"peak={'-' if peak is None else f'{peak / (1 << 20):.1f}MiB'}"
+        )
+        for name, st in row["stages"].items():
+            mem = st["peak_mem_bytes"]
+            lines.append(
+                f"  stage {name:<16} calls={st['calls']:<6} wall={st['wall_s']:<10} cpu={st['cpu_s']:<10} "
+                f"peak={f'{mem / (1 << 20):.1f}MiB' if mem else '-'}"
+            )
+        for name, n in row["counters"].items():
+            lines.append(f"  count {name:<24} {n}")
+    return "\n".join(lines)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Aggregate --perf-profile JSONL records across runs.")
+    parser.add_argument("paths", type=Path, nargs="+", help="JSONL files or directories")
+    parser.add_argument("--by", default="entry", help="Group key: entry, host, ... (default: entry)")
+    parser.add_argument("--json", action="store_true", help="Print JSON instead of text")
+    args = parser.parse_args(argv)
+
+    rows = summarize(list(iter_records(args.paths)), by=args.by)
+    if args.json:
+        print(json.dumps(rows, ensure_ascii=False, indent=2))
+    else:
+        print(format_summary(rows, by=args.by))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
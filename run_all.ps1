@@ -1,6 +1,10 @@
 ﻿param(
   [Parameter(Mandatory = $true, Position = 0)]
-  [string]$InputPath
+  [string]$InputPath,
+
+  # 其余参数原样传给 python -m pipeline(例如 --profile fast).
+  [Parameter(ValueFromRemainingArguments = $true)]
+  [string[]]$PipelineArgs = @()
 )
 
 Set-StrictMode -Version Latest
@@ -20,57 +24,11 @@ if (-not (Test-Path -LiteralPath "llm.json") -and (Test-Path -LiteralPath "llm.e
   Write-Host "[提示] 未找到 llm.json, 已从 llm.example.json 复制生成, 请检查并完善 provider/profile 等配置."
 }
 
-function Resolve-Input([string]$p) {
-  $p = $p.Trim()
-  if (($p.StartsWith('"') -and $p.EndsWith('"')) -or ($p.StartsWith("'") -and $p.EndsWith("'"))) {
-    $p = $p.Substring(1, $p.Length - 2).Trim()
-  }
-
-  # 1) 传入的是 .epub 路径
-  if ($p.ToLower().EndsWith(".epub")) {
-    $name = [System.IO.Path]::GetFileNameWithoutExtension($p)
-    return @{ Kind = "epub"; EpubPath = $p; NovelDir = (Join-Path "book" $name) }
-  }
-
-  # 2) 传入的是一个已存在的目录(例如 book/书名)
-  if (Test-Path -LiteralPath $p -PathType Container) {
-    return @{ Kind = "dir"; NovelDir = $p }
-  }
-
-  # 3) 传入的是书名(默认到 book/书名 目录)
-  $candDir = Join-Path "book" $p
-  if (Test-Path -LiteralPath $candDir -PathType Container) {
-    return @{ Kind = "dir"; NovelDir = $candDir }
-  }
-
-  # 4) 传入的是书名, 且 book/书名.epub 存在
-  $candEpub = Join-Path "book" ($p + ".epub")
-  if (Test-Path -LiteralPath $candEpub -PathType Leaf) {
-    return @{ Kind = "epub"; EpubPath = $candEpub; NovelDir = (Join-Path "book" $p) }
-  }
-
-  throw "输入不合法: $p`n请传入: book\书名.epub 或 book\书名 或 书名"
+# 三个阶段在同一个 Python 进程中完成(pipeline/), 输入可以是 book\书名.epub / book\书名 / 书名.
+Write-Host "[流水线] 提取 -> 分析 -> 导出 Excel: $InputPath"
+& python -m pipeline $InputPath @PipelineArgs
+if ($LASTEXITCODE -ne 0) {
+  throw "python 执行失败(exit=$LASTEXITCODE): python -m pipeline $InputPath"
 }
 
-function Invoke-Python([string[]]$PyArgs) {
-  & python @PyArgs
-  if ($LASTEXITCODE -ne 0) {
-    throw "python 执行失败(exit=$LASTEXITCODE): python $($PyArgs -join ' ')"
-  }
-}
-
-$resolved = Resolve-Input $InputPath
-$novelDir = $resolved.NovelDir
-
-if ($resolved.Kind -eq "epub") {
-  Write-Host "[第一阶段] 提取前三章: $($resolved.EpubPath)"
-  Invoke-Python @("phase1_extract\extract_three_chapters.py", $resolved.EpubPath)
-}
-
-Write-Host "[第二阶段] 生成分析: $novelDir"
-Invoke-Python @("phase2_analysis\run_phase2.py", $novelDir)
-
-Write-Host "[第三阶段] 导出 Excel: $novelDir"
-Invoke-Python @("phase3_excel\run_phase3.py", $novelDir)
-
 Write-Host "[完成] 三个阶段均已完成."